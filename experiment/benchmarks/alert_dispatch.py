@@ -0,0 +1,164 @@
+"""
+Benchmark of the alert processing of the DownloadManager.
+
+Dispatches a mix of session-wide and per-torrent alerts, for the handles of many torrents in a real libtorrent
+session, to the downloads they belong to. The alerts processed per second, and the longest time the event loop is
+blocked while processing a large batch of alerts, are compared to the previous process_alert, which converted the
+infohash of every alert and compared the alert type to every session-wide alert type.
+"""
+import asyncio
+import os
+import random
+import time
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from tribler_core.components.libtorrent.download_manager import download_manager as dlmgr_module
+from tribler_core.components.libtorrent.download_manager.download import Download
+from tribler_core.components.libtorrent.download_manager.download_config import DownloadConfig
+from tribler_core.components.libtorrent.download_manager.download_manager import DownloadManager
+from tribler_core.components.libtorrent.settings import LibtorrentSettings
+from tribler_core.components.libtorrent.torrentdef import TorrentDefNoMetainfo
+from tribler_core.components.libtorrent.utils.libtorrent_helper import libtorrent as lt
+from tribler_core.utilities.unicode import hexlify
+from tribler_core.utilities.utilities import random_infohash
+
+BENCHMARK_NUM_DOWNLOADS = int(os.environ.get('BENCHMARK_NUM_DOWNLOADS', 1000))
+BENCHMARK_NUM_ALERTS = int(os.environ.get('BENCHMARK_NUM_ALERTS', 200000))
+
+# Per-torrent alert types, and the session-wide alert types, in the proportions of a busy session
+TORRENT_ALERT_TYPES = ['piece_finished_alert'] * 8 + ['block_finished_alert'] * 8 + \
+                      ['tracker_reply_alert', 'stats_alert', 'peer_connect_alert']
+SESSION_ALERT_TYPES = ['peer_disconnected_alert', 'dht_pkt_alert']
+
+
+class LegacyDownloadManager(DownloadManager):
+    """
+    A download manager with the previous alert processing.
+    """
+
+    def process_alert(self, alert, hops=0):
+        alert_type = alert.__class__.__name__
+
+        if alert_type == 'state_update_alert':
+            for status in alert.status:
+                infohash = dlmgr_module.unhexlify(str(status.info_hash))
+                if infohash not in self.downloads:
+                    continue
+                self.downloads[infohash].update_lt_status(status)
+
+        infohash = dlmgr_module.unhexlify(str(alert.handle.info_hash() if hasattr(alert, 'handle')
+                                              and alert.handle.is_valid() else getattr(alert, 'info_hash', '')))
+        download = self.downloads.get(infohash)
+        if download:
+            is_process_alert = (download.handle and download.handle.is_valid()) \
+                               or (not download.handle and alert_type == 'add_torrent_alert') \
+                               or (download.handle and alert_type == 'torrent_removed_alert')
+            if is_process_alert:
+                # Download.process_alert used to check the category of every alert
+                alert.category()
+                download.process_alert(alert, alert_type)
+
+        if alert_type == 'listen_succeeded_alert':
+            self.listen_ports[hops] = getattr(alert, "port", alert.endpoint[1])
+        elif alert_type == 'peer_disconnected_alert' and self.notifier:
+            self.notifier.notify('peer_disconnected', alert.pid.to_bytes())
+        elif alert_type == 'session_stats_alert':
+            pass
+        elif alert_type == "dht_pkt_alert" and self.dht_health_manager:
+            self.dht_health_manager.process_dht_pkt_alert(alert)
+
+    def _task_process_alerts(self):
+        for hops, ltsession in list(self.ltsessions.items()):
+            if ltsession:
+                for alert in ltsession.pop_alerts():
+                    self.process_alert(alert, hops=hops)
+
+
+def create_handles(ltsession):
+    handles = []
+    for _ in range(BENCHMARK_NUM_DOWNLOADS):
+        params = lt.add_torrent_params()
+        params.info_hashes = lt.info_hash_t(lt.sha1_hash(random_infohash()))
+        params.save_path = '.'
+        params.flags = lt.torrent_flags.paused
+        handles.append(ltsession.add_torrent(params))
+    return handles
+
+
+def create_alerts(handles):
+    alert_classes = {alert_type: type(alert_type, (object,), {'category': lambda self: 0})
+                     for alert_type in TORRENT_ALERT_TYPES + SESSION_ALERT_TYPES}
+    pid = SimpleNamespace(to_bytes=lambda: b'a' * 20)
+    alerts = []
+    for _ in range(BENCHMARK_NUM_ALERTS):
+        if random.random() < 0.9:
+            alert = alert_classes[random.choice(TORRENT_ALERT_TYPES)]()
+            alert.handle = random.choice(handles)
+            alert.piece_index = 0
+            alert.url = 'http://tracker.example/announce'
+            alert.num_peers = 0
+        else:
+            alert = alert_classes[random.choice(SESSION_ALERT_TYPES)]()
+            alert.pid = pid
+        alerts.append(alert)
+    return alerts
+
+
+def create_download_manager(dlmgr_class, handles):
+    notifier = SimpleNamespace(notify=lambda *_: None)
+    dlmgr = dlmgr_class(config=LibtorrentSettings(), state_dir=None, notifier=notifier, peer_mid=b"0000")
+    dlmgr.dht_health_manager = SimpleNamespace(process_dht_pkt_alert=lambda _: None)
+    for handle in handles:
+        infohash = bytes.fromhex(str(handle.info_hash()))
+        download = Download(TorrentDefNoMetainfo(infohash, hexlify(infohash)), download_manager=dlmgr,
+                            config=DownloadConfig(), checkpoint_disabled=True)
+        download.handle = handle
+        dlmgr.downloads[infohash] = download
+    return dlmgr
+
+
+async def measure(dlmgr, alerts):
+    # Alerts per second of process_alert
+    start_time = time.time()
+    for alert in alerts:
+        dlmgr.process_alert(alert, hops=0)
+    alerts_per_second = len(alerts) / (time.time() - start_time)
+
+    # The longest time the event loop is blocked while all alerts are popped at once
+    batches = [alerts]
+    dlmgr.ltsessions[0] = Mock(pop_alerts=lambda: batches.pop() if batches else [])
+    dlmgr._alert_notify_loop = asyncio.get_event_loop()  # pylint: disable=protected-access
+    start_time = time.time()
+    dlmgr._task_process_alerts()  # pylint: disable=protected-access
+    longest_block = time.time() - start_time
+    while batches or dlmgr.pending_alerts.get(0):
+        start_time = time.time()
+        await asyncio.sleep(0)
+        longest_block = max(longest_block, time.time() - start_time)
+    dlmgr.ltsessions.clear()
+    return alerts_per_second, longest_block
+
+
+async def main():
+    random.seed(42)
+    settings = {'enable_dht': False, 'enable_lsd': False, 'enable_upnp': False, 'enable_natpmp': False,
+                'listen_interfaces': '127.0.0.1:0'}
+    ltsession = lt.session(settings)
+    handles = create_handles(ltsession)
+    alerts = create_alerts(handles)
+
+    print(f"{BENCHMARK_NUM_DOWNLOADS} downloads, {BENCHMARK_NUM_ALERTS} alerts")
+    for name, dlmgr_class in (("Previous alert processing", LegacyDownloadManager),
+                              ("Dispatch table", DownloadManager)):
+        dlmgr = create_download_manager(dlmgr_class, handles)
+        alerts_per_second, longest_block = await measure(dlmgr, alerts)
+        print(f"{name}: {alerts_per_second:.0f} alerts per second, "
+              f"event loop blocked for at most {longest_block * 1000:.0f} ms")
+        for download in dlmgr.downloads.values():
+            await download.shutdown_task_manager()
+        await dlmgr.shutdown_task_manager()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,117 @@
+"""
+Benchmark of loading download checkpoints at startup.
+
+Writes synthetic checkpoints of single-file torrents, of which a fraction is stopped by the user, and loads them into a
+DownloadManager with a real libtorrent session. The time until load_checkpoints returns (after which the REST API is
+started) and the time until all downloads that are not stopped have been added to libtorrent are compared to the
+previous load_checkpoints, which loaded the checkpoints one at a time and slept 10 ms in between.
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+from asyncio import gather, sleep
+from binascii import unhexlify
+from pathlib import Path
+from unittest.mock import Mock
+
+from ipv8.taskmanager import task
+
+from tribler_core.components.libtorrent.download_manager.download_config import DownloadConfig
+from tribler_core.components.libtorrent.download_manager.download_manager import DownloadManager
+from tribler_core.components.libtorrent.settings import LibtorrentSettings
+from tribler_core.components.libtorrent.utils.libtorrent_helper import libtorrent as lt
+from tribler_core.utilities.unicode import hexlify
+
+BENCHMARK_NUM_CHECKPOINTS = [int(n) for n in os.environ.get('BENCHMARK_NUM_CHECKPOINTS', '1000,5000,10000').split(',')]
+BENCHMARK_STOPPED_FRACTION = float(os.environ.get('BENCHMARK_STOPPED_FRACTION', 0.5))
+BENCHMARK_NUM_PIECES = int(os.environ.get('BENCHMARK_NUM_PIECES', 400))
+BENCHMARK_LEGACY_MAX_CHECKPOINTS = int(os.environ.get('BENCHMARK_LEGACY_MAX_CHECKPOINTS', 5000))
+
+PIECE_SIZE = 256 * 1024
+
+
+class LegacyDownloadManager(DownloadManager):
+    """
+    A download manager that loads the checkpoints one at a time, and adds every download to libtorrent.
+    """
+
+    async def load_checkpoints(self):
+        for filename in self.get_checkpoint_dir().glob('*.conf'):
+            self.load_checkpoint(filename)
+            await sleep(.01)
+
+    def start_download(self, *args, lazy=False, **kwargs):  # pylint: disable=unused-argument
+        return super().start_download(*args, **kwargs)
+
+    @task
+    async def start_handle(self, download, atp):
+        # The previous start_handle looked for an existing handle in a map of all torrents in the session
+        ltsession = self.get_session(download.config.get_hops())
+        known = {unhexlify(str(handle.info_hash())): handle for handle in ltsession.get_torrents()}
+        known.get(download.get_def().get_infohash())
+        return await super().start_handle(download, atp)
+
+
+def create_metainfo(index):
+    info = {b'name': f'file{index}.bin'.encode(), b'length': BENCHMARK_NUM_PIECES * PIECE_SIZE,
+            b'piece length': PIECE_SIZE, b'pieces': os.urandom(20 * BENCHMARK_NUM_PIECES)}
+    return {b'announce': b'http://tracker.example/announce', b'info': info}
+
+
+def write_checkpoints(directory, num_checkpoints):
+    checkpoint_dir = directory / 'dlcheckpoints'
+    checkpoint_dir.mkdir()
+    for index in range(num_checkpoints):
+        metainfo = create_metainfo(index)
+        infohash = lt.torrent_info(metainfo).info_hash().to_bytes()
+        config = DownloadConfig(state_dir=directory)
+        config.set_dest_dir(directory / 'downloads')
+        config.set_metainfo(metainfo)
+        config.set_engineresumedata({b'file-format': b'libtorrent resume file', b'file-version': 1,
+                                     b'info-hash': infohash, b'save_path': str(directory / 'downloads').encode()})
+        config.set_user_stopped(random.random() < BENCHMARK_STOPPED_FRACTION)
+        config.write(checkpoint_dir / f'{hexlify(infohash)}.conf')
+
+
+def create_download_manager(dlmgr_class, state_dir):
+    config = LibtorrentSettings(dht=False, upnp=False, natpmp=False, lsd=False, dht_readiness_timeout=0)
+    dlmgr = dlmgr_class(config=config, state_dir=state_dir, notifier=Mock(), peer_mid=b"0000")
+    dlmgr.metadata_tmpdir = state_dir / 'metadata_tmpdir'
+    dlmgr.metadata_tmpdir.mkdir(exist_ok=True)
+    dlmgr.initialize()
+    return dlmgr
+
+
+async def measure(dlmgr_class, state_dir):
+    dlmgr = create_download_manager(dlmgr_class, state_dir)
+    start_time = time.time()
+    await dlmgr.load_checkpoints()
+    loaded = time.time() - start_time
+    active = [download for download in dlmgr.get_downloads() if not download.config.get_user_stopped()]
+    await gather(*[download.future_added for download in active])
+    resumed = time.time() - start_time
+    num_handles = len(dlmgr.get_session().get_torrents())
+    await dlmgr.shutdown(timeout=1)
+    return loaded, resumed, num_handles
+
+
+async def main():
+    random.seed(42)
+    for num_checkpoints in BENCHMARK_NUM_CHECKPOINTS:
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = Path(tmp)
+            write_checkpoints(directory, num_checkpoints)
+            print(f"{num_checkpoints} checkpoints, {BENCHMARK_STOPPED_FRACTION:.0%} stopped")
+            for name, dlmgr_class in (("Serial loading", LegacyDownloadManager),
+                                      ("Batched loading", DownloadManager)):
+                if dlmgr_class is LegacyDownloadManager and num_checkpoints > BENCHMARK_LEGACY_MAX_CHECKPOINTS:
+                    continue
+                loaded, resumed, num_handles = await measure(dlmgr_class, directory)
+                print(f"{name}: load_checkpoints returned after {loaded:.2f} s, "
+                      f"all downloads resumed after {resumed:.2f} s, {num_handles} torrents in libtorrent")
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
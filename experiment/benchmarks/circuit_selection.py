@@ -0,0 +1,211 @@
+"""
+Benchmark of the assignment of BitTorrent peers to circuits.
+
+Simulates an anonymous download with in-process TriblerTunnelCommunity instances: an originator with one 1-hop circuit
+to each of 4 exit nodes, and 24 local UDP peers that upload to every address that keeps requesting data from them. The
+exit nodes can send a limited number of bytes per second to the originator, and one of them only a tenth of that.
+The SOCKS5 client requests data from all peers through the TunnelDispatcher of the originator, and the aggregate
+download throughput is reported for random circuit selection (the previous behaviour) and for the CircuitScheduler.
+"""
+import asyncio
+import os
+import random
+import time
+from types import SimpleNamespace
+
+from ipv8.peer import Peer
+from ipv8.test.mocking.ipv8 import MockIPv8
+
+from tribler_core.components.tunnel.community.circuit_scheduler import CircuitScheduler
+from tribler_core.components.tunnel.community.dispatcher import TunnelDispatcher
+from tribler_core.components.tunnel.community.tunnel_community import TriblerTunnelCommunity
+from tribler_core.components.tunnel.settings import TunnelCommunitySettings
+
+BENCHMARK_NUM_PEERS = int(os.environ.get('BENCHMARK_NUM_PEERS', 24))
+BENCHMARK_PEER_RATE = int(os.environ.get('BENCHMARK_PEER_RATE', 15 * 1024))
+BENCHMARK_EXIT_RATES = [int(rate) * 1024
+                        for rate in os.environ.get('BENCHMARK_EXIT_RATES', '100,100,100,10').split(',')]
+BENCHMARK_DURATION = float(os.environ.get('BENCHMARK_DURATION', 40))
+BENCHMARK_SEEDS = [int(seed) for seed in os.environ.get('BENCHMARK_SEEDS', '1,2,3').split(',')]
+
+PACKET_SIZE = 1000
+# Looks like a uTP packet, so that the exit nodes allow it
+PACKET = b'\x01\x00' + b'\x00' * (PACKET_SIZE - 2)
+TICK = 0.01
+REQUEST_INTERVAL = 0.25
+# Peers stop uploading to an address that did not send them a request for this many seconds
+PEER_TIMEOUT = 1.0
+
+
+class RandomCircuitScheduler(CircuitScheduler):
+    """
+    Picks a random circuit for every new destination, as the TunnelDispatcher did before.
+    """
+
+    def select(self, circuits):
+        return random.choice(circuits)
+
+
+class LegacyTunnelDispatcher(TunnelDispatcher):
+    """
+    The previous dispatcher, which pinned every destination to a random circuit.
+    """
+
+    def __init__(self, tunnels):
+        super().__init__(tunnels)
+        self.scheduler = RandomCircuitScheduler()
+
+    def balance_circuits(self):
+        pass
+
+
+class UploadingPeer(asyncio.DatagramProtocol):
+    """
+    A BitTorrent peer that uploads at a fixed rate to every address that recently sent it a request.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.downloaders = {}
+        self.budget = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.downloaders[addr] = time.time() + PEER_TIMEOUT
+
+    def upload(self):
+        now = time.time()
+        self.downloaders = {addr: timeout for addr, timeout in self.downloaders.items() if timeout > now}
+        self.budget += BENCHMARK_PEER_RATE * TICK
+        while self.budget >= PACKET_SIZE and self.downloaders:
+            self.budget -= PACKET_SIZE
+            for addr in self.downloaders:
+                self.transport.sendto(PACKET, addr)
+        if not self.downloaders:
+            self.budget = 0
+
+
+class RateLimiter:
+    """
+    Drops the packets that an exit node sends beyond its rate, like a congested link.
+    """
+
+    def __init__(self, send_packet, rate):
+        self.send_packet = send_packet
+        self.rate = rate
+        self.budget = 0
+        self.last_time = time.time()
+
+    def __call__(self, peer, packet):
+        now = time.time()
+        self.budget = min(self.rate * TICK * 10, self.budget + (now - self.last_time) * self.rate)
+        self.last_time = now
+        if self.budget < len(packet):
+            return len(packet)
+        self.budget -= len(packet)
+        return self.send_packet(peer, packet)
+
+
+class FakeConnection:
+    """
+    A Socks5Connection and its UDP connection, which count the bytes that are sent to the SOCKS5 client.
+    """
+
+    def __init__(self, socks_server):
+        self.socksserver = socks_server
+        self.received = 0
+        self.udp_connection = SimpleNamespace(socksconnection=self, send_datagram=self.send_datagram)
+
+    def send_datagram(self, data):
+        self.received += len(data)
+        return True
+
+
+def create_node(exit_node=False):
+    node = MockIPv8("curve25519", TriblerTunnelCommunity, config=TunnelCommunitySettings(exitnode_enabled=exit_node),
+                    settings={'remove_tunnel_delay': 0, 'max_circuits': 0})
+    node.overlay.bandwidth_community = None
+    return node
+
+
+async def create_circuits():
+    originator = create_node()
+    exits = [create_node(exit_node=True) for _ in BENCHMARK_EXIT_RATES]
+    for node in exits:
+        for first, second in ((originator, node), (node, originator)):
+            peer = Peer(second.my_peer.public_key, second.my_peer.address)
+            first.network.add_verified_peer(peer)
+            first.network.discover_services(peer, [TriblerTunnelCommunity.community_id])
+            first.overlay.walk_to(second.endpoint.wan_address)
+    await asyncio.sleep(0.5)
+
+    circuits = []
+    for node, rate in zip(exits, BENCHMARK_EXIT_RATES):
+        required_exit = originator.network.get_verified_by_public_key_bin(node.my_peer.public_key.key_to_bin())
+        circuit = originator.overlay.create_circuit(1, required_exit=required_exit)
+        await asyncio.wait_for(circuit.ready, 10)
+        circuits.append(circuit)
+        node.overlay.send_packet = RateLimiter(node.overlay.send_packet, rate)
+    return originator, exits, circuits
+
+
+async def measure(dispatcher_class, seed):
+    random.seed(seed)
+    originator, exits, circuits = await create_circuits()
+    loop = asyncio.get_event_loop()
+    peers = []
+    for _ in range(BENCHMARK_NUM_PEERS):
+        transport, peer = await loop.create_datagram_endpoint(UploadingPeer, local_addr=('127.0.0.1', 0))
+        peers.append((transport.get_extra_info('sockname'), peer))
+
+    await originator.overlay.dispatcher.shutdown_task_manager()
+    dispatcher = originator.overlay.dispatcher = dispatcher_class(originator.overlay)
+    socks_server = SimpleNamespace()
+    dispatcher.set_socks_servers([socks_server])
+    connection = FakeConnection(socks_server)
+
+    start_time = time.time()
+    half_time, half_received = None, 0
+    next_request = 0
+    for tick in range(int(BENCHMARK_DURATION / TICK)):
+        now = time.time()
+        if now >= next_request:
+            next_request = now + REQUEST_INTERVAL
+            for address, _ in peers:
+                dispatcher.on_socks5_udp_data(connection.udp_connection,
+                                              SimpleNamespace(destination=address, data=PACKET[:20]))
+        for _, peer in peers:
+            peer.upload()
+        if half_time is None and now - start_time >= BENCHMARK_DURATION / 2:
+            half_time, half_received = now, connection.received
+        await asyncio.sleep(max(0.0, start_time + (tick + 1) * TICK - time.time()))
+    end_time = time.time()
+
+    loads = [sum(1 for c in dispatcher.con_to_cir[connection].values() if c is circuit) for circuit in circuits]
+    for _, peer in peers:
+        peer.transport.close()
+    for node in [originator] + exits:
+        await node.stop()
+    return (connection.received / (end_time - start_time) / 1024,
+            (connection.received - half_received) / (end_time - half_time) / 1024, loads)
+
+
+async def main():
+    print(f"{BENCHMARK_NUM_PEERS} peers uploading {BENCHMARK_PEER_RATE // 1024} KB/s each, exit nodes sending "
+          f"{', '.join(str(rate // 1024) for rate in BENCHMARK_EXIT_RATES)} KB/s, {BENCHMARK_DURATION:.0f} s")
+    for name, dispatcher_class in (("Random circuit selection", LegacyTunnelDispatcher),
+                                   ("CircuitScheduler", TunnelDispatcher)):
+        results = []
+        for seed in BENCHMARK_SEEDS:
+            total, steady, loads = await measure(dispatcher_class, seed)
+            results.append((total, steady))
+            print(f"{name} (seed {seed}): {total:.0f} KB/s overall, {steady:.0f} KB/s in the second half, "
+                  f"peers per circuit {loads}")
+        print(f"{name}: {sum(r[0] for r in results) / len(results):.0f} KB/s overall, "
+              f"{sum(r[1] for r in results) / len(results):.0f} KB/s in the second half on average")
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,84 @@
+"""
+Benchmark of the processing of libtorrent dht_pkt_alerts by the DHTHealthManager.
+
+Compares decoding every DHT packet (as DownloadManager.process_alert used to do) to the pre-filtering
+DHTHealthManager.process_dht_pkt_alert, for a mix of regular DHT traffic and BEP33 messages.
+"""
+import asyncio
+import os
+import random
+from timeit import timeit
+from unittest.mock import Mock
+
+from tribler_core.components.libtorrent.download_manager.dht_health_manager import DHTHealthManager
+from tribler_core.components.libtorrent.utils.libtorrent_helper import libtorrent as lt
+from tribler_core.utilities.utilities import bdecode_compat, random_infohash
+
+BENCHMARK_NUM_ALERTS = int(os.environ.get('BENCHMARK_NUM_ALERTS', 100000))
+BENCHMARK_NUM_LOOKUPS = int(os.environ.get('BENCHMARK_NUM_LOOKUPS', 100))
+BENCHMARK_BEP33_RATIO = float(os.environ.get('BENCHMARK_BEP33_RATIO', 0.05))
+
+
+class FakeDHTPktAlert:
+    def __init__(self, packet, incoming):
+        self.pkt_buf = lt.bencode(packet)
+        self.incoming = incoming
+
+    def __str__(self):
+        return ('<== ' if self.incoming else '==> ') + repr(self.pkt_buf)
+
+
+def create_alerts(infohashes):
+    alerts = []
+    for index in range(BENCHMARK_NUM_ALERTS):
+        transaction_id = index.to_bytes(4, 'big')
+        infohash = random.choice(infohashes)
+        if random.random() < BENCHMARK_BEP33_RATIO / 2:
+            query = {b'y': b'q', b'q': b'get_peers', b't': transaction_id,
+                     b'a': {b'id': random_infohash(), b'info_hash': infohash, b'scrape': 1}}
+            alerts.append(FakeDHTPktAlert(query, incoming=False))
+        elif random.random() < BENCHMARK_BEP33_RATIO / 2:
+            response = {b'y': b'r', b't': transaction_id,
+                        b'r': {b'id': random_infohash(), b'BFsd': os.urandom(256), b'BFpe': os.urandom(256)}}
+            alerts.append(FakeDHTPktAlert(response, incoming=True))
+        else:
+            response = {b'y': b'r', b't': transaction_id,
+                        b'r': {b'id': random_infohash(), b'nodes': os.urandom(26 * 8)}}
+            alerts.append(FakeDHTPktAlert(response, incoming=random.random() < 0.5))
+    return alerts
+
+
+def process_alert_decode_all(manager, alert):
+    # The processing of dht_pkt_alerts as it was done in DownloadManager.process_alert
+    incoming = str(alert).startswith('<==')
+    decoded = bdecode_compat(alert.pkt_buf)
+    if not decoded:
+        return
+    if not incoming and decoded.get(b'y') == b'q' \
+            and decoded.get(b'q') == b'get_peers' and decoded[b'a'].get(b'scrape') == 1:
+        manager.requesting_bloomfilters(decoded[b't'], decoded[b'a'][b'info_hash'])
+    if incoming and b'r' in decoded and b'BFsd' in decoded[b'r'] and b'BFpe' in decoded[b'r']:
+        manager.received_bloomfilters(decoded[b't'], decoded[b'r'][b'BFsd'], decoded[b'r'][b'BFpe'])
+
+
+async def main():
+    manager = DHTHealthManager(Mock())
+    infohashes = [random_infohash() for _ in range(BENCHMARK_NUM_LOOKUPS)]
+    for infohash in infohashes:
+        manager.get_health(infohash, timeout=3600)
+    alerts = create_alerts(infohashes)
+
+    decode_all_time = timeit(lambda: [process_alert_decode_all(manager, alert) for alert in alerts], number=1)
+    filtered_time = timeit(lambda: [manager.process_dht_pkt_alert(alert) for alert in alerts], number=1)
+    print(f"Decode all alerts: {BENCHMARK_NUM_ALERTS / decode_all_time:.0f} alerts/s")
+    print(f"Pre-filtered alerts: {BENCHMARK_NUM_ALERTS / filtered_time:.0f} alerts/s")
+
+    bloomfilters = [os.urandom(256) for _ in range(1000)]
+    size_time = timeit(lambda: [DHTHealthManager.get_size_from_bloomfilter(bf) for bf in bloomfilters], number=10)
+    print(f"Bloom filter size estimation: {10000 / size_time:.0f} filters/s")
+
+    await manager.shutdown_task_manager()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,109 @@
+"""
+Benchmark of the downloads endpoint of the REST API.
+
+Simulates a GUI that polls the downloads endpoint while libtorrent reports state changes for a fraction of many
+seeding downloads. The time per request is compared between rebuilding the records of all downloads (as the endpoint
+used to do), reusing the cached records of the unchanged downloads, and only returning the changed downloads.
+"""
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from ipv8.keyvault.crypto import default_eccrypto
+
+from pony.orm import db_session
+
+from tribler_core.components.libtorrent.download_manager.download import Download
+from tribler_core.components.libtorrent.download_manager.download_config import DownloadConfig
+from tribler_core.components.libtorrent.restapi.downloads_endpoint import DownloadsEndpoint
+from tribler_core.components.libtorrent.settings import LibtorrentSettings
+from tribler_core.components.libtorrent.torrentdef import TorrentDefNoMetainfo
+from tribler_core.components.libtorrent.utils.libtorrent_helper import libtorrent as lt
+from tribler_core.components.metadata_store.db.store import MetadataStore
+from tribler_core.utilities.utilities import random_infohash
+
+BENCHMARK_NUM_DOWNLOADS = int(os.environ.get('BENCHMARK_NUM_DOWNLOADS', 5000))
+BENCHMARK_NUM_PEERS = int(os.environ.get('BENCHMARK_NUM_PEERS', 20))
+BENCHMARK_CHANGED_FRACTION = float(os.environ.get('BENCHMARK_CHANGED_FRACTION', 0.05))
+BENCHMARK_NUM_REQUESTS = int(os.environ.get('BENCHMARK_NUM_REQUESTS', 20))
+
+
+def create_lt_status():
+    return SimpleNamespace(state=lt.torrent_status.seeding, paused=False, error='', progress=1.0, pieces=[],
+                           upload_rate=random.randint(0, 10000), download_rate=0,
+                           upload_payload_rate=random.randint(0, 10000), download_payload_rate=0,
+                           total_upload=random.randint(0, 10 ** 9), total_download=0, total_done=10 ** 9,
+                           all_time_upload=random.randint(0, 10 ** 9), finished_time=random.randint(0, 10 ** 6),
+                           list_peers=BENCHMARK_NUM_PEERS, list_seeds=0)
+
+
+def create_handle():
+    peers = [lt.peer_info() for _ in range(BENCHMARK_NUM_PEERS)]
+    return SimpleNamespace(is_valid=lambda: True, trackers=lambda: [{'url': 'http://tracker.example/announce'}],
+                           get_peer_info=lambda: peers)
+
+
+def create_downloads(mds, dlmgr):
+    downloads = []
+    with db_session:
+        for index in range(BENCHMARK_NUM_DOWNLOADS):
+            infohash = random_infohash()
+            mds.TorrentMetadata(infohash=infohash, title=f'Torrent {index}')
+            download = Download(TorrentDefNoMetainfo(infohash, f'torrent{index}'), download_manager=dlmgr,
+                                config=DownloadConfig(), checkpoint_disabled=True)
+            download.handle = create_handle()
+            download.update_lt_status(create_lt_status())
+            downloads.append(download)
+    return downloads
+
+
+async def measure(endpoint, downloads, clear_cache=False, diff=False):
+    version = None
+    returned = []
+    durations = []
+    for _ in range(BENCHMARK_NUM_REQUESTS):
+        # Libtorrent reports the state of the downloads that changed since the previous state_update_alert
+        for download in random.sample(downloads, int(len(downloads) * BENCHMARK_CHANGED_FRACTION)):
+            download.update_lt_status(create_lt_status())
+        if clear_cache:
+            endpoint.download_records.clear()
+            endpoint.download_names.clear()
+
+        query = {'since': str(version)} if diff and version is not None else {}
+        start_time = time.time()
+        response = await endpoint.get_downloads(Mock(query=query))
+        durations.append(time.time() - start_time)
+        returned.append(len(json.loads(response.body._value)["downloads"]))  # pylint: disable=protected-access
+        version = endpoint.state_version
+    # Skip the first request, which fills the cache
+    return sum(durations[1:]) / (len(durations) - 1), sum(returned[1:]) / (len(returned) - 1)
+
+
+async def main():
+    random.seed(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        mds = MetadataStore(db_filename=Path(tmp) / 'metadata.db', channels_dir=Path(tmp) / 'channels',
+                            my_key=default_eccrypto.generate_key("curve25519"), disable_sync=True)
+        dlmgr = Mock(config=LibtorrentSettings())
+        downloads = create_downloads(mds, dlmgr)
+        dlmgr.get_downloads = lambda: downloads
+        endpoint = DownloadsEndpoint(dlmgr, metadata_store=mds)
+
+        print(f"{BENCHMARK_NUM_DOWNLOADS} downloads, {BENCHMARK_CHANGED_FRACTION:.0%} changed per request")
+        for name, kwargs in (("Rebuild all records", {'clear_cache': True}),
+                             ("Cached records", {}),
+                             ("Changes since the previous version", {'diff': True})):
+            duration, returned = await measure(endpoint, downloads, **kwargs)
+            print(f"{name}: {duration * 1000:.1f} ms per request, {returned:.0f} downloads per response")
+
+        mds.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,85 @@
+"""
+Benchmark of HTTP tracker checks against a local fake tracker.
+
+Compares creating a new aiohttp session (and thus a new TCP connection) for every tracker check, scraping
+a single infohash per check, to checking over pooled keep-alive sessions with batched multi-infohash scrapes.
+"""
+import asyncio
+import os
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from aiohttp import web
+
+from libtorrent import bencode
+
+from tribler_core.components.torrent_checker.torrent_checker.torrentchecker_session import (
+    HttpSessionPool,
+    HttpTrackerSession,
+)
+from tribler_core.utilities.utilities import random_infohash
+
+BENCHMARK_NUM_INFOHASHES = int(os.environ.get('BENCHMARK_NUM_INFOHASHES', 2000))
+BENCHMARK_INFOHASHES_PER_CHECK = int(os.environ.get('BENCHMARK_INFOHASHES_PER_CHECK', 200))
+BENCHMARK_CONCURRENCY = int(os.environ.get('BENCHMARK_CONCURRENCY', 10))
+
+
+async def scrape(request):
+    # Infohashes are binary, so they can not be taken from request.query, which is decoded as UTF-8
+    query = parse_qsl(urlsplit(request.raw_path).query, encoding='latin-1')
+    infohashes = [value.encode('latin-1') for key, value in query if key == 'info_hash']
+    files = {infohash: {b'complete': 10, b'downloaded': 20, b'incomplete': 5} for infohash in infohashes}
+    return web.Response(body=bencode({b'files': files}))
+
+
+async def start_fake_tracker():
+    app = web.Application()
+    app.add_routes([web.get('/scrape', scrape)])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]  # pylint: disable=protected-access
+
+
+async def run_checks(port, infohashes, infohashes_per_check, session_pool):
+    batches = [infohashes[i:i + infohashes_per_check] for i in range(0, len(infohashes), infohashes_per_check)]
+    semaphore = asyncio.Semaphore(BENCHMARK_CONCURRENCY)
+
+    async def check(batch):
+        async with semaphore:
+            session = HttpTrackerSession("http://127.0.0.1/announce", ("127.0.0.1", port), "/announce", 10, None,
+                                         session_pool=session_pool)
+            for infohash in batch:
+                session.add_infohash(infohash)
+            await session.connect_to_tracker()
+            await session.cleanup()
+
+    start_time = time.time()
+    await asyncio.gather(*[check(batch) for batch in batches])
+    return len(batches), time.time() - start_time
+
+
+async def main():
+    runner, port = await start_fake_tracker()
+    infohashes = [random_infohash() for _ in range(BENCHMARK_NUM_INFOHASHES)]
+
+    checks, duration = await run_checks(port, infohashes, 1, None)
+    print(f"New session per check, 1 infohash per scrape: {checks / duration:.0f} checks/s, "
+          f"{len(infohashes) / duration:.0f} infohashes/s")
+
+    pool = HttpSessionPool()
+    checks, duration = await run_checks(port, infohashes, 1, pool)
+    print(f"Pooled sessions, 1 infohash per scrape: {checks / duration:.0f} checks/s, "
+          f"{len(infohashes) / duration:.0f} infohashes/s")
+
+    checks, duration = await run_checks(port, infohashes, BENCHMARK_INFOHASHES_PER_CHECK, pool)
+    print(f"Pooled sessions, {BENCHMARK_INFOHASHES_PER_CHECK} infohashes per check: "
+          f"{checks / duration:.0f} checks/s, {len(infohashes) / duration:.0f} infohashes/s")
+
+    await pool.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
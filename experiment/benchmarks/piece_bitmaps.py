@@ -0,0 +1,123 @@
+"""
+Benchmark of the piece bitmap and availability computations of a download.
+
+Adds a torrent with 100k pieces to a real libtorrent session, and measures the time that the consumers of one status
+update take: the pieces bitmask of the downloads endpoint (get_pieces=1), the number of completed pieces, the
+availability with 50 connected leechers, and the stream reading the piece bitmap for 20 chunk reads. These are compared
+to the previous code, which read the Python list of booleans from libtorrent for every call and computed the availability
+from the piece lists of all peers.
+"""
+import base64
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from ipv8.util import int2byte
+
+from tribler_core.components.libtorrent.download_manager.download_state import DownloadState
+from tribler_core.components.libtorrent.download_manager.piece_bitmap import PieceBitmap
+from tribler_core.components.libtorrent.utils.libtorrent_helper import libtorrent as lt
+
+BENCHMARK_NUM_PIECES = int(os.environ.get('BENCHMARK_NUM_PIECES', 100000))
+BENCHMARK_NUM_PEERS = int(os.environ.get('BENCHMARK_NUM_PEERS', 50))
+BENCHMARK_NUM_READS = int(os.environ.get('BENCHMARK_NUM_READS', 20))
+BENCHMARK_REPEAT = int(os.environ.get('BENCHMARK_REPEAT', 5))
+
+PIECE_SIZE = 16 * 1024
+
+
+def legacy_pieces_base64(status):
+    bitstr = b""
+    for bit in status.pieces:
+        bitstr += b'1' if bit else b'0'
+
+    encoded_str = b""
+    for i in range(0, len(bitstr), 8):
+        encoded_str += int2byte(int(bitstr[i:i + 8].ljust(8, b'0'), 2))
+    return base64.b64encode(encoded_str)
+
+
+def legacy_availability(lt_status, peers):
+    nr_seeders_complete = 0
+    merged_bitfields = [0] * len(lt_status.pieces)
+    for peer in peers:
+        completed = peer.get('completed', 0)
+        have = peer.get('have', [])
+        if completed == 1 or have and all(have):
+            nr_seeders_complete += 1
+        elif have and len(have) == len(merged_bitfields):
+            for i in range(len(have)):
+                if have[i]:
+                    merged_bitfields[i] += 1
+    nr_leechers_complete = min(merged_bitfields)
+    nr_more_than_min = len([x for x in merged_bitfields if x > nr_leechers_complete])
+    return nr_seeders_complete + nr_leechers_complete + float(nr_more_than_min) / len(merged_bitfields)
+
+
+def measure(function):
+    start_time = time.perf_counter()
+    for _ in range(BENCHMARK_REPEAT):
+        result = function()
+    return (time.perf_counter() - start_time) / BENCHMARK_REPEAT * 1000, result
+
+
+def main():
+    rand = random.Random(42)
+    info = {b'name': b'large.bin', b'piece length': PIECE_SIZE, b'length': BENCHMARK_NUM_PIECES * PIECE_SIZE,
+            b'pieces': os.urandom(20 * BENCHMARK_NUM_PIECES)}
+    session = lt.session({'enable_dht': False, 'enable_lsd': False, 'enable_upnp': False, 'enable_natpmp': False})
+    with tempfile.TemporaryDirectory() as tmp:
+        handle = session.add_torrent({'ti': lt.torrent_info({b'info': info}), 'save_path': tmp,
+                                      'flags': lt.torrent_flags.seed_mode})
+        lt_status = handle.status()
+        print(f"Torrent with {len(lt_status.pieces)} pieces, {BENCHMARK_NUM_PEERS} connected leechers")
+
+        peers = [{'completed': 0.5, 'have': [rand.random() < 0.5 for _ in range(BENCHMARK_NUM_PIECES)]}
+                 for _ in range(BENCHMARK_NUM_PEERS)]
+        piece_availability = [sum(counts) for counts in zip(*(peer['have'] for peer in peers))]
+        mock_handle = SimpleNamespace(is_valid=lambda: True, piece_availability=piece_availability.copy)
+        download = SimpleNamespace(handle=mock_handle, get_peerlist=lambda: peers)
+
+        def legacy_stream_reads():
+            return [lt_status.pieces[piece] for piece in range(BENCHMARK_NUM_READS)]
+
+        def stream_reads(state):
+            return [state.get_pieces_complete()[piece] for piece in range(BENCHMARK_NUM_READS)]
+
+        legacy = {
+            'pieces bitmask': lambda: legacy_pieces_base64(handle.status()),
+            'completed pieces': lambda: (len(lt_status.pieces), sum(lt_status.pieces)),
+            'availability': lambda: legacy_availability(lt_status, peers),
+            'stream reads': legacy_stream_reads,
+        }
+        legacy_total = 0
+        for name, function in legacy.items():
+            duration, _ = measure(function)
+            legacy_total += duration
+            print(f"Previous {name}: {duration:.1f} ms")
+
+        def status_update():
+            # All consumers share the state, and its bitmap, until the next status update
+            state = DownloadState(download, lt_status, None)
+            return (state.get_pieces_complete().to_base64(), state.get_pieces_total_complete(),
+                    state.get_availability(), stream_reads(state))
+
+        duration, (bitmask, completed, availability, _) = measure(status_update)
+        assert bitmask == legacy_pieces_base64(lt_status)
+        assert completed == (BENCHMARK_NUM_PIECES, BENCHMARK_NUM_PIECES)
+        assert abs(availability - legacy_availability(lt_status, peers)) < 1e-9
+        print(f"Previous status update total: {legacy_total:.1f} ms, PieceBitmap status update total: "
+              f"{duration:.1f} ms")
+
+        pieces = lt_status.pieces
+        list_size = sys.getsizeof(pieces)
+        bitmap_size = sys.getsizeof(PieceBitmap.from_pieces(pieces))
+        print(f"Memory of the piece bitmap: {list_size / 1024:.0f} KB as a list, {bitmap_size / 1024:.0f} KB as a "
+              f"PieceBitmap")
+
+
+if __name__ == "__main__":
+    main()
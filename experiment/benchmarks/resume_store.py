@@ -0,0 +1,173 @@
+"""
+Benchmark of storing and loading download checkpoints.
+
+Checkpoints a number of seeding downloads in rounds, as happens when libtorrent reports that their resume data changed,
+and counts the write system calls and the bytes written per round (from /proc/self/io). Then loads the checkpoints
+into a DownloadManager with a real libtorrent session, and measures the time until load_checkpoints returns and the
+time until all downloads that are not stopped have been added to libtorrent.
+Both are compared to the previous checkpoints, which were stored in a .conf file per download.
+"""
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+from asyncio import as_completed, gather
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from tribler_core.components.libtorrent.download_manager.download import Download
+from tribler_core.components.libtorrent.download_manager.download_config import DownloadConfig
+from tribler_core.components.libtorrent.download_manager.download_manager import DownloadManager
+from tribler_core.components.libtorrent.download_manager.resume_store import ResumeStore
+from tribler_core.components.libtorrent.settings import LibtorrentSettings
+from tribler_core.components.libtorrent.torrentdef import TorrentDef
+from tribler_core.utilities.unicode import hexlify
+
+BENCHMARK_NUM_DOWNLOADS = [int(n) for n in os.environ.get('BENCHMARK_NUM_DOWNLOADS', '1000,5000').split(',')]
+BENCHMARK_NUM_ROUNDS = int(os.environ.get('BENCHMARK_NUM_ROUNDS', 5))
+BENCHMARK_STOPPED_FRACTION = float(os.environ.get('BENCHMARK_STOPPED_FRACTION', 0.5))
+BENCHMARK_NUM_PIECES = int(os.environ.get('BENCHMARK_NUM_PIECES', 400))
+
+PIECE_SIZE = 256 * 1024
+
+
+class LegacyDownload(Download):
+    """
+    A download that writes its checkpoint, including the metainfo, to a .conf file.
+    """
+
+    def on_save_resume_data_alert(self, alert):
+        resume_data = alert.resume_data
+        self.config.set_metainfo(self.tdef.get_metainfo())
+        self.config.set_engineresumedata(resume_data)
+        basename = hexlify(resume_data[b'info-hash']) + '.conf'
+        filename = self.dlmgr.get_checkpoint_dir() / basename
+        self.config.config['download_defaults']['name'] = self.tdef.get_name_as_unicode()
+        self.config.write(str(filename))
+
+
+class LegacyDownloadManager(DownloadManager):
+    """
+    A download manager that loads the checkpoints from the .conf files, without moving them into the resume store.
+    """
+
+    async def load_checkpoints(self):
+        loop = asyncio.get_event_loop()
+        filenames = list(self.get_checkpoint_dir().glob('*.conf'))
+        for batch_future in as_completed([loop.run_in_executor(None, self.read_checkpoints, batch)
+                                          for batch in self.split_checkpoints(filenames)]):
+            for _, checkpoint in await batch_future:
+                if checkpoint:
+                    self.resume_checkpoint(*checkpoint)
+
+
+def read_io_counters():
+    with open('/proc/self/io') as io_file:
+        return {key: int(value) for key, value in (line.split(': ') for line in io_file)}
+
+
+def create_downloads(download_class, directory, num_downloads, dlmgr):
+    downloads = []
+    for index in range(num_downloads):
+        info = {b'name': f'file{index}.bin'.encode(), b'length': BENCHMARK_NUM_PIECES * PIECE_SIZE,
+                b'piece length': PIECE_SIZE, b'pieces': os.urandom(20 * BENCHMARK_NUM_PIECES)}
+        tdef = TorrentDef.load_from_dict({b'announce': b'http://tracker.example/announce', b'info': info})
+        config = DownloadConfig(state_dir=directory)
+        config.set_dest_dir(directory / 'downloads')
+        config.set_user_stopped(random.random() < BENCHMARK_STOPPED_FRACTION)
+        download = download_class(tdef, download_manager=dlmgr, config=config, checkpoint_disabled=True)
+        download.checkpoint_disabled = False
+        downloads.append(download)
+    return downloads
+
+
+def create_resume_data(download, uploaded):
+    return {b'file-format': b'libtorrent resume file', b'file-version': 1,
+            b'info-hash': download.tdef.get_infohash(), b'save_path': str(download.config.get_dest_dir()).encode(),
+            b'pieces': b'\x01' * BENCHMARK_NUM_PIECES, b'total_uploaded': uploaded, b'total_downloaded': 0,
+            b'seeding_time': uploaded, b'active_time': uploaded, b'finished_time': uploaded,
+            b'trackers': [[b'http://tracker.example/announce']], b'peers': os.urandom(6 * 50)}
+
+
+def measure_checkpointing(downloads, flush):
+    # The first round writes the checkpoints of new downloads, the other rounds are the steady state
+    rounds = []
+    for uploaded in range(BENCHMARK_NUM_ROUNDS + 1):
+        before = read_io_counters()
+        start_time = time.time()
+        for download in downloads:
+            download.on_save_resume_data_alert(SimpleNamespace(resume_data=create_resume_data(download, uploaded)))
+        flush()
+        duration = time.time() - start_time
+        after = read_io_counters()
+        rounds.append((after['syscw'] - before['syscw'], after['wchar'] - before['wchar'], duration))
+    steady_state = rounds[1:]
+    return [sum(values) / len(steady_state) for values in zip(*steady_state)]
+
+
+def create_download_manager(dlmgr_class, state_dir):
+    config = LibtorrentSettings(dht=False, upnp=False, natpmp=False, lsd=False, dht_readiness_timeout=0)
+    dlmgr = dlmgr_class(config=config, state_dir=state_dir, notifier=Mock(), peer_mid=b"0000")
+    dlmgr.metadata_tmpdir = state_dir / 'metadata_tmpdir'
+    dlmgr.metadata_tmpdir.mkdir(exist_ok=True)
+    dlmgr.initialize()
+    return dlmgr
+
+
+async def measure_loading(dlmgr_class, state_dir):
+    dlmgr = create_download_manager(dlmgr_class, state_dir)
+    start_time = time.time()
+    await dlmgr.load_checkpoints()
+    loaded = time.time() - start_time
+    active = [download for download in dlmgr.get_downloads() if not download.config.get_user_stopped()]
+    await gather(*[download.future_added for download in active])
+    resumed = time.time() - start_time
+    num_downloads = len(dlmgr.get_downloads())
+    await dlmgr.shutdown(timeout=1)
+    return loaded, resumed, num_downloads
+
+
+async def main():
+    random.seed(42)
+    for num_downloads in BENCHMARK_NUM_DOWNLOADS:
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = Path(tmp)
+            print(f"{num_downloads} seeding downloads, {BENCHMARK_NUM_PIECES} pieces each")
+
+            conf_dir = directory / 'conf' / 'dlcheckpoints'
+            conf_dir.mkdir(parents=True)
+            dlmgr = SimpleNamespace(get_checkpoint_dir=lambda: conf_dir)
+            downloads = create_downloads(LegacyDownload, directory, num_downloads, dlmgr)
+            syscw, wchar, duration = measure_checkpointing(downloads, lambda: None)
+            print(f"Checkpoint files: {syscw:.0f} write calls and {wchar / 1024 ** 2:.1f} MB written per round, "
+                  f"{duration:.2f} s on the event loop")
+
+            store_dir = directory / 'store' / 'dlcheckpoints'
+            store_dir.mkdir(parents=True)
+            store = ResumeStore(store_dir / 'resume.db')
+            # The benchmark flushes the store itself after every round, also for the new downloads
+            dlmgr = SimpleNamespace(resume_store=store, flush_resume_store=None,
+                                    register_anonymous_task=lambda *_: None)
+            downloads = create_downloads(Download, directory, num_downloads, dlmgr)
+            syscw, wchar, duration = measure_checkpointing(downloads, store.flush)
+            store.close()
+            print(f"Resume store: {syscw:.0f} write calls and {wchar / 1024 ** 2:.1f} MB written per round, "
+                  f"{duration:.2f} s on the event loop")
+
+            for name, dlmgr_class, source in (("Checkpoint files", LegacyDownloadManager, 'conf'),
+                                              ("Moving checkpoint files into the resume store", DownloadManager,
+                                               'conf'),
+                                              ("Resume store", DownloadManager, 'store')):
+                state_dir = directory / 'state'
+                shutil.rmtree(state_dir, ignore_errors=True)
+                shutil.copytree(directory / source, state_dir)
+                loaded, resumed, loaded_downloads = await measure_loading(dlmgr_class, state_dir)
+                print(f"{name}: load_checkpoints returned after {loaded:.2f} s, "
+                      f"all downloads resumed after {resumed:.2f} s, {loaded_downloads} downloads loaded")
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
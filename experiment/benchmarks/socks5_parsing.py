@@ -0,0 +1,75 @@
+"""
+Microbenchmark of the parsing of SOCKS5 UDP datagrams.
+
+Feeds SOCKS5 UDP datagrams, as libtorrent sends them over a UDP associate, to SocksUDPConnection.datagram_received, with
+an output stream that only counts the requests. Reports the datagrams per second for IPv4 and domain name destinations
+and payloads of different sizes, comparing the fast-path parser (unpack_udp_packet) to unpacking a UdpPacket with the
+socks5_serializer, which copies the payload of every datagram.
+"""
+import os
+import time
+from types import SimpleNamespace
+
+from ipv8.messaging.interfaces.udp.endpoint import DomainAddress
+from ipv8.messaging.serialization import PackError
+
+from tribler_core.components.socks_servers.socks5.conversion import UdpPacket, socks5_serializer
+from tribler_core.components.socks_servers.socks5.udp_connection import SocksUDPConnection
+
+BENCHMARK_NUM_DATAGRAMS = int(os.environ.get('BENCHMARK_NUM_DATAGRAMS', 200000))
+BENCHMARK_PAYLOAD_SIZES = [int(size) for size in os.environ.get('BENCHMARK_PAYLOAD_SIZES', '20,1400').split(',')]
+
+SOURCE = ('127.0.0.1', 6881)
+
+
+class LegacySocksUDPConnection(SocksUDPConnection):
+    """
+    The previous SocksUDPConnection, which unpacked every datagram with the socks5_serializer.
+    """
+
+    def datagram_received(self, data, source):
+        if self.remote_udp_address == source:
+            try:
+                request, _ = socks5_serializer.unpack_serializable(UdpPacket, data)
+            except PackError:
+                return False
+            if request.frag == 0 and request.destination:
+                return self.socksconnection.socksserver.output_stream.on_socks5_udp_data(self, request)
+        return False
+
+
+def measure(connection_class, datagrams):
+    received = []
+
+    def on_socks5_udp_data(_, request):
+        received.append(len(request.data))
+        return True
+
+    output_stream = SimpleNamespace(on_socks5_udp_data=on_socks5_udp_data)
+    socks_connection = SimpleNamespace(socksserver=SimpleNamespace(output_stream=output_stream))
+    connection = connection_class(socks_connection, SOURCE)
+    datagram_received = connection.datagram_received
+
+    start_time = time.perf_counter()
+    for data in datagrams:
+        datagram_received(data, SOURCE)
+    duration = time.perf_counter() - start_time
+    assert len(received) == len(datagrams)
+    return len(datagrams) / duration
+
+
+def main():
+    for address in [('10.0.0.1', 6881), DomainAddress('tracker.example.com', 80)]:
+        for size in BENCHMARK_PAYLOAD_SIZES:
+            packet = socks5_serializer.pack_serializable(UdpPacket(0, 0, address, os.urandom(size)))
+            # Every datagram is a separate bytes object, as it is when it is read from the socket
+            datagrams = [bytes(bytearray(packet)) for _ in range(BENCHMARK_NUM_DATAGRAMS)]
+            kind = 'domain' if isinstance(address, DomainAddress) else 'IPv4'
+            legacy = measure(LegacySocksUDPConnection, datagrams)
+            fast = measure(SocksUDPConnection, datagrams)
+            print(f"{kind} destination, {size} byte payload: {legacy:,.0f} datagrams/s with the serializer, "
+                  f"{fast:,.0f} datagrams/s with unpack_udp_packet ({fast / legacy:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Benchmark of the piece priority planner of streams.
+
+Simulates a stream of a large file with several active chunks (cursors) that advance one piece at a time, and
+compares the time per Stream.updateprios call, and the number of priorities and deadlines pushed to libtorrent,
+to the previous planner that searched every cursor buffer for every missing piece and pushed all priorities.
+"""
+import asyncio
+import os
+import random
+import time
+from unittest.mock import Mock
+
+from tribler_core.components.libtorrent.download_manager.stream import DEADLINE_PRIO_MAP, MIN_PIECE_PRIO, Stream
+
+BENCHMARK_NUM_PIECES = int(os.environ.get('BENCHMARK_NUM_PIECES', 50000))
+BENCHMARK_NUM_CURSORS = int(os.environ.get('BENCHMARK_NUM_CURSORS', 8))
+BENCHMARK_BUFFER_PIECES = int(os.environ.get('BENCHMARK_BUFFER_PIECES', 30))
+BENCHMARK_NUM_UPDATES = int(os.environ.get('BENCHMARK_NUM_UPDATES', 200))
+
+
+class LegacyStream(Stream):
+    """
+    A stream with the previous piece priority planner.
+    """
+
+    async def updateprios(self):  # pylint: disable=too-many-branches
+        if not self.enabled:
+            return
+
+        def _updateprio(piece, prio, deadline=None):
+            if not curr_prio == prio:
+                piecepriorities[piece] = prio
+                if deadline is not None:
+                    self._Stream__setdeadline(piece, deadline * 10)
+                    diffmap[piece] = f"{piece}:{deadline * 10}:{curr_prio}->{prio}"
+                else:
+                    self._Stream__resetdeadline(piece)
+                    diffmap[piece] = f"{piece}:-:{curr_prio}->{prio}"
+
+        def _find_deadline(piece):
+            deadline = None
+            cursor = None
+            for startbyte in self.cursorpiecemap:
+                paused, cursorpieces = self.cursorpiecemap[startbyte]
+                if not paused and piece in cursorpieces and \
+                        (deadline is None or cursorpieces.index(piece) < deadline):
+                    deadline = cursorpieces.index(piece)
+                    cursor = startbyte
+            return deadline, cursor
+
+        piecepriorities = self._Stream__getpieceprios()
+        if not piecepriorities:
+            return
+        diffmap = {}
+        staticbuff = False
+        for piece in self.iterpieces(have=False):
+            curr_prio = piecepriorities[piece]
+            if piece in self.footerpieces:
+                _updateprio(piece, 7, 0)
+                staticbuff = True
+            elif piece in self.headerpieces:
+                _updateprio(piece, 7, 1)
+                staticbuff = True
+            elif piece in self.prebuffpieces:
+                _updateprio(piece, 7, 2)
+                staticbuff = True
+            else:
+                if staticbuff:
+                    _updateprio(piece, 0)
+                else:
+                    deadline, cursor = _find_deadline(piece)
+                    if cursor is not None:
+                        if deadline < len(DEADLINE_PRIO_MAP):
+                            _updateprio(piece, DEADLINE_PRIO_MAP[deadline], deadline)
+                        else:
+                            _updateprio(piece, 1, deadline)
+                    else:
+                        _updateprio(piece, MIN_PIECE_PRIO)
+        if diffmap:
+            self._logger.debug("Current Prios: %s", [(x, piecepriorities[x]) for x in self.iterpieces(have=False)])
+            self._Stream__setpieceprios(piecepriorities)
+
+
+class FakeDownload:
+    """
+    Keeps the piece states, priorities and deadlines of a download, and counts what is pushed to it.
+    """
+
+    def __init__(self, num_pieces):
+        self.pieces_complete = [False] * num_pieces
+        self.priorities = [4] * num_pieces
+        self.pushed_priorities = 0
+        self.pushed_deadlines = 0
+
+    def get_piece_priorities(self):
+        return list(self.priorities)
+
+    def set_piece_priorities(self, priorities):
+        self.pushed_priorities += len(priorities)
+        if priorities and isinstance(priorities[0], tuple):
+            for piece, prio in priorities:
+                self.priorities[piece] = prio
+        else:
+            self.priorities[:len(priorities)] = priorities
+
+    def set_piece_deadline(self, *_):
+        self.pushed_deadlines += 1
+
+
+def create_stream(stream_class, download):
+    stream = stream_class(Mock())
+    stream._Stream__prepare_coro.close()  # pylint: disable=protected-access
+    stream.infohash = b'a' * 20
+    stream.fileindex = 0
+    stream.firstpiece = 0
+    stream.lastpiece = len(download.priorities) - 1
+    lt_status = Mock(get_pieces_complete=lambda: download.pieces_complete)
+    stream._Stream__lt_state = lambda: lt_status
+    stream._Stream__getpieceprios = download.get_piece_priorities
+    stream._Stream__setpieceprios = download.set_piece_priorities
+    stream._Stream__setdeadline = download.set_piece_deadline
+    stream._Stream__resetdeadline = download.set_piece_deadline
+    return stream
+
+
+async def run(stream_class, cursor_starts):
+    download = FakeDownload(BENCHMARK_NUM_PIECES)
+    stream = create_stream(stream_class, download)
+    positions = list(cursor_starts)
+    for cursor, position in enumerate(positions):
+        stream.cursorpiecemap[cursor] = [False, list(range(position, position + BENCHMARK_BUFFER_PIECES))]
+    await stream.updateprios()
+    download.pushed_priorities = download.pushed_deadlines = 0
+
+    start_time = time.time()
+    for update in range(BENCHMARK_NUM_UPDATES):
+        # The next piece of one of the chunks finishes, and the chunk moves on
+        cursor = update % len(positions)
+        download.pieces_complete[positions[cursor]] = True
+        positions[cursor] += 1
+        stream.cursorpiecemap[cursor][1] = list(range(positions[cursor], positions[cursor] + BENCHMARK_BUFFER_PIECES))
+        await stream.updateprios()
+    duration = time.time() - start_time
+    return duration, download.pushed_priorities, download.pushed_deadlines
+
+
+async def main():
+    random.seed(42)
+    cursor_starts = random.sample(range(BENCHMARK_NUM_PIECES - BENCHMARK_BUFFER_PIECES - BENCHMARK_NUM_UPDATES),
+                                  BENCHMARK_NUM_CURSORS)
+    print(f"{BENCHMARK_NUM_PIECES} pieces, {BENCHMARK_NUM_CURSORS} cursors "
+          f"with {BENCHMARK_BUFFER_PIECES} pieces each, {BENCHMARK_NUM_UPDATES} updates")
+    for name, stream_class in (("Previous planner", LegacyStream), ("Diff planner", Stream)):
+        duration, priorities, deadlines = await run(stream_class, cursor_starts)
+        print(f"{name}: {duration / BENCHMARK_NUM_UPDATES * 1000:.2f} ms per update, "
+              f"{priorities / BENCHMARK_NUM_UPDATES:.1f} priorities and "
+              f"{deadlines / BENCHMARK_NUM_UPDATES:.1f} deadlines pushed per update")
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
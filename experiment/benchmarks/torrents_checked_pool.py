@@ -0,0 +1,49 @@
+"""
+Benchmark of the selection of torrents to gossip by the Popularity Community.
+
+Compares the incremental `TorrentsCheckedPool` to selecting popular and random torrents
+from a plain list of all checked torrents on every gossip tick.
+"""
+import heapq
+import os
+import random
+import time
+from timeit import timeit
+
+from tribler_core.components.torrent_checker.torrent_checker.torrents_checked_pool import TorrentsCheckedPool
+from tribler_core.utilities.utilities import random_infohash
+
+BENCHMARK_NUM_TORRENTS = int(os.environ.get('BENCHMARK_NUM_TORRENTS', 10000))
+BENCHMARK_NUM_SELECTIONS = int(os.environ.get('BENCHMARK_NUM_SELECTIONS', 1000))
+GOSSIP_TORRENT_COUNT = 10
+
+
+def select_from_list(torrents):
+    alive = {t for t in torrents if t[1] > 0}
+    popular = set(heapq.nlargest(GOSSIP_TORRENT_COUNT, alive, key=lambda t: t[1]))
+    rest = alive - popular
+    return popular, set(random.sample(list(rest), min(GOSSIP_TORRENT_COUNT, len(rest))))
+
+
+def select_from_pool(pool):
+    return pool.popular(GOSSIP_TORRENT_COUNT), pool.random(GOSSIP_TORRENT_COUNT, include_popular=False)
+
+
+def main():
+    now = int(time.time())
+    torrents = [(random_infohash(), random.randint(0, 1000), random.randint(0, 1000), now)
+                for _ in range(BENCHMARK_NUM_TORRENTS)]
+
+    pool = TorrentsCheckedPool()
+    update_time = timeit(lambda: [pool.update(*torrent) for torrent in torrents], number=1)
+    print(f"Pool updates: {BENCHMARK_NUM_TORRENTS / update_time:.0f} updates/s "
+          f"({len(pool)} of {BENCHMARK_NUM_TORRENTS} torrents kept)")
+
+    list_time = timeit(lambda: select_from_list(torrents), number=BENCHMARK_NUM_SELECTIONS)
+    pool_time = timeit(lambda: select_from_pool(pool), number=BENCHMARK_NUM_SELECTIONS)
+    print(f"List selection: {list_time / BENCHMARK_NUM_SELECTIONS * 1e6:.1f} us/selection")
+    print(f"Pool selection: {pool_time / BENCHMARK_NUM_SELECTIONS * 1e6:.1f} us/selection")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark of the cell crypto of relays and exit nodes.
+
+Builds 2-hop circuits between in-process TriblerTunnelCommunity instances (an originator, a relay and an exit node),
+and runs the IPv8 speed test over them, as experiment/tunnel_community/speed_test_exit.py does over the real network.
+Reports the throughput, the MB transferred per CPU second of the process (MB/s per core), and the CPU time spent on the
+event loop thread, with the crypto of the relay and the exit node on the event loop and on a CellCryptoPipeline.
+"""
+import asyncio
+import os
+import time
+
+from ipv8.messaging.anonymization.tunnel import PEER_FLAG_SPEED_TEST
+from ipv8.messaging.anonymization.utils import run_speed_test
+from ipv8.peer import Peer
+from ipv8.test.mocking.ipv8 import MockIPv8
+
+from tribler_core.components.tunnel.community.crypto_pipeline import CellCryptoPipeline
+from tribler_core.components.tunnel.community.tunnel_community import TriblerTunnelCommunity
+from tribler_core.components.tunnel.settings import TunnelCommunitySettings
+
+BENCHMARK_NUM_MB = int(os.environ.get('BENCHMARK_NUM_MB', 20))
+BENCHMARK_WORKERS = [int(n) for n in os.environ.get('BENCHMARK_WORKERS', '0,1,2').split(',')]
+BENCHMARK_WINDOW = int(os.environ.get('BENCHMARK_WINDOW', 200))
+
+
+def create_node():
+    node = MockIPv8("curve25519", TriblerTunnelCommunity, config=TunnelCommunitySettings(),
+                    settings={'remove_tunnel_delay': 0, 'max_circuits': 0})
+    node.overlay.bandwidth_community = None
+    return node
+
+
+async def create_circuit(num_workers):
+    nodes = [create_node() for _ in range(3)]
+    nodes[2].overlay.settings.peer_flags.add(PEER_FLAG_SPEED_TEST)
+    for node in nodes[1:]:
+        if num_workers:
+            node.overlay.crypto_pipeline = CellCryptoPipeline(node.overlay.crypto, num_workers)
+    for node in nodes:
+        for other in nodes:
+            if other is not node:
+                node.network.add_verified_peer(Peer(other.my_peer.public_key, other.my_peer.address))
+                node.network.discover_services(Peer(other.my_peer.public_key, other.my_peer.address),
+                                               [TriblerTunnelCommunity.community_id])
+    for node in nodes:
+        for other in nodes:
+            if other is not node:
+                node.overlay.walk_to(other.endpoint.wan_address)
+    await asyncio.sleep(0.5)
+    circuit = nodes[0].overlay.create_circuit(2, exit_flags=[PEER_FLAG_SPEED_TEST])
+    await asyncio.wait_for(circuit.ready, 10)
+    return nodes, circuit
+
+
+async def measure(num_workers):
+    nodes, circuit = await create_circuit(num_workers)
+    start_time, start_cpu, start_loop_cpu = time.time(), time.process_time(), time.thread_time()
+    await run_speed_test(nodes[0].overlay, circuit, 0, 1024, BENCHMARK_NUM_MB * 1024, window=BENCHMARK_WINDOW)
+    duration = time.time() - start_time
+    cpu = time.process_time() - start_cpu
+    loop_cpu = time.thread_time() - start_loop_cpu
+    transferred = circuit.bytes_down / 1024 ** 2
+    for node in nodes:
+        await node.stop()
+    return transferred, duration, cpu, loop_cpu
+
+
+async def main():
+    print(f"{BENCHMARK_NUM_MB} MB through a 2-hop circuit, {os.cpu_count()} CPUs")
+    for num_workers in BENCHMARK_WORKERS:
+        transferred, duration, cpu, loop_cpu = await measure(num_workers)
+        name = f"CellCryptoPipeline with {num_workers} workers" if num_workers else "Crypto on the event loop"
+        print(f"{name}: {transferred / duration:.1f} MB/s, {transferred / cpu:.1f} MB per CPU second, "
+              f"{loop_cpu:.1f} of {cpu:.1f} CPU seconds on the event loop thread")
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
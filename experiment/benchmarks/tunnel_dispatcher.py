@@ -0,0 +1,140 @@
+"""
+Benchmark of the TunnelDispatcher at a fixed throughput.
+
+Builds a 1-hop circuit between two in-process TriblerTunnelCommunity instances, and feeds SOCKS5 UDP datagrams of
+1200 bytes to the dispatcher of the originator in bursts every 10 ms, as libtorrent does, while the same number of
+datagrams comes back from the circuit. Packets that leave the originator are counted instead of sent, so the CPU time
+of the process is spent on the dispatcher and the originator. The packets per second and the CPU usage are compared to
+the previous dispatcher, which sent every datagram over the circuit right away and packed every UdpPacket.
+"""
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+from ipv8.messaging.anonymization.tunnel import CIRCUIT_STATE_READY, PEER_FLAG_EXIT_BT
+from ipv8.peer import Peer
+from ipv8.test.mocking.ipv8 import MockIPv8
+
+from tribler_core.components.socks_servers.socks5.conversion import UdpPacket, socks5_serializer
+from tribler_core.components.tunnel.community.dispatcher import TunnelDispatcher
+from tribler_core.components.tunnel.community.tunnel_community import TriblerTunnelCommunity
+from tribler_core.components.tunnel.settings import TunnelCommunitySettings
+
+BENCHMARK_PACKETS_PER_SECOND = int(os.environ.get('BENCHMARK_PACKETS_PER_SECOND', 2000))
+BENCHMARK_DURATION = float(os.environ.get('BENCHMARK_DURATION', 10))
+BENCHMARK_NUM_DESTINATIONS = int(os.environ.get('BENCHMARK_NUM_DESTINATIONS', 50))
+
+PACKET_SIZE = 1200
+TICK = 0.01
+
+
+class LegacyTunnelDispatcher(TunnelDispatcher):
+    """
+    The previous dispatcher, which sent data over the circuit for every datagram and packed every UdpPacket.
+    """
+
+    def on_incoming_from_tunnel(self, community, circuit, origin, data):
+        connection = self.cid_to_con[circuit.circuit_id]
+        packet = socks5_serializer.pack_serializable(UdpPacket(0, 0, origin, data))
+        connection.udp_connection.send_datagram(packet)
+        return True
+
+    def on_socks5_udp_data(self, udp_connection, request):
+        connection = udp_connection.socksconnection
+        try:
+            circuit = self.con_to_cir[connection][request.destination]
+        except KeyError:
+            circuit = self.select_circuit(connection, request)
+            if circuit is None:
+                return False
+        if circuit.state != CIRCUIT_STATE_READY:
+            return False
+        self.tunnels.send_data(circuit.peer, circuit.circuit_id, request.destination, ('0.0.0.0', 0), request.data)
+        return True
+
+
+class FakeConnection:
+    """
+    A Socks5Connection and its UDP connection, which count the datagrams that are sent to the SOCKS5 client.
+    """
+
+    def __init__(self, socks_server, send_datagram):
+        self.socksserver = socks_server
+        self.udp_connection = SimpleNamespace(socksconnection=self, send_datagram=send_datagram)
+
+
+def create_node(exit_node=False):
+    node = MockIPv8("curve25519", TriblerTunnelCommunity, config=TunnelCommunitySettings(exitnode_enabled=exit_node),
+                    settings={'remove_tunnel_delay': 0, 'max_circuits': 0})
+    node.overlay.bandwidth_community = None
+    return node
+
+
+async def create_circuit():
+    nodes = [create_node(), create_node(exit_node=True)]
+    for node, other in (nodes, reversed(nodes)):
+        peer = Peer(other.my_peer.public_key, other.my_peer.address)
+        node.network.add_verified_peer(peer)
+        node.network.discover_services(peer, [TriblerTunnelCommunity.community_id])
+        node.overlay.walk_to(other.endpoint.wan_address)
+    await asyncio.sleep(0.5)
+    circuit = nodes[0].overlay.create_circuit(1, exit_flags=[PEER_FLAG_EXIT_BT])
+    await asyncio.wait_for(circuit.ready, 10)
+    return nodes, circuit
+
+
+async def measure(dispatcher_class):
+    nodes, circuit = await create_circuit()
+    community = nodes[0].overlay
+    sent = {'tunnel': 0, 'socks': 0}
+
+    def send_packet(_, packet):
+        sent['tunnel'] += 1
+        return len(packet)
+
+    def send_datagram(_):
+        sent['socks'] += 1
+        return True
+
+    community.send_packet = send_packet
+    dispatcher = dispatcher_class(community)
+    socks_server = SimpleNamespace()
+    connection = FakeConnection(socks_server, send_datagram)
+    dispatcher.set_socks_servers([socks_server])
+    dispatcher.cid_to_con[circuit.circuit_id] = connection
+
+    destinations = [(f'10.0.0.{index + 1}', 6881) for index in range(BENCHMARK_NUM_DESTINATIONS)]
+    data = os.urandom(PACKET_SIZE)
+    packets_per_tick = int(BENCHMARK_PACKETS_PER_SECOND * TICK)
+    num_ticks = int(BENCHMARK_DURATION / TICK)
+
+    start_time, start_cpu = time.time(), time.process_time()
+    for tick in range(num_ticks):
+        for index in range(packets_per_tick):
+            destination = destinations[(tick * packets_per_tick + index) % len(destinations)]
+            dispatcher.on_socks5_udp_data(connection.udp_connection,
+                                          SimpleNamespace(destination=destination, data=data))
+            dispatcher.on_incoming_from_tunnel(community, circuit, destination, data)
+        await asyncio.sleep(max(0.0, start_time + (tick + 1) * TICK - time.time()))
+    duration = time.time() - start_time
+    cpu = time.process_time() - start_cpu
+
+    await dispatcher.shutdown_task_manager()
+    for node in nodes:
+        await node.stop()
+    return sent, duration, cpu
+
+
+async def main():
+    print(f"{BENCHMARK_PACKETS_PER_SECOND} datagrams of {PACKET_SIZE} bytes per second in each direction, "
+          f"for {BENCHMARK_DURATION:.0f} s")
+    for name, dispatcher_class in (("Previous dispatcher", LegacyTunnelDispatcher),
+                                   ("Send queues and packed headers", TunnelDispatcher)):
+        sent, duration, cpu = await measure(dispatcher_class)
+        print(f"{name}: {sent['tunnel'] / duration:.0f} packets/s into the circuit, "
+              f"{sent['socks'] / duration:.0f} packets/s to the SOCKS5 client, CPU {cpu / duration:.1%}")
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
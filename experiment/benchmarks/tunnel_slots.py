@@ -0,0 +1,150 @@
+"""
+Benchmark of the slot allocation of exit nodes under circuit churn.
+
+Creates an in-process TriblerTunnelCommunity with many slots, of which the random slots are taken by long-lived
+circuits, and replays 10k circuit create and destroy events. A created circuit competes for a slot with a random token
+balance (on_token_balance), possibly kicking out the circuit with the lowest balance, and a destroyed circuit releases
+its slot (clean_from_slots). Reports the time spent on these calls per event, comparing the heap of competing slots to
+scanning the lists of slots, as TriblerTunnelCommunity did before.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from asyncio import Future
+
+from ipv8.test.mocking.ipv8 import MockIPv8
+
+from tribler_core.components.tunnel.community.caches import BalanceRequestCache
+from tribler_core.components.tunnel.community.tunnel_community import DESTROY_REASON_BALANCE, TriblerTunnelCommunity
+from tribler_core.components.tunnel.settings import TunnelCommunitySettings
+
+BENCHMARK_NUM_EVENTS = int(os.environ.get('BENCHMARK_NUM_EVENTS', 10000))
+BENCHMARK_SLOTS = [int(slots) for slots in os.environ.get('BENCHMARK_SLOTS', '15,150,1500').split(',')]
+BENCHMARK_SEED = int(os.environ.get('BENCHMARK_SEED', 1))
+
+
+class BenchmarkTunnelCommunity(TriblerTunnelCommunity):
+    """
+    A TriblerTunnelCommunity that keeps track of the circuits that are kicked out, instead of removing them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.kicked = []
+
+    def remove_relay(self, circuit_id, additional_info='', remove_now=False, destroy=False, got_destroy_from=None,
+                     both_sides=True):
+        self.kicked.append(circuit_id)
+
+    def remove_exit_socket(self, circuit_id, additional_info='', remove_now=False, destroy=False):
+        pass
+
+
+class LegacyTunnelCommunity(BenchmarkTunnelCommunity):
+    """
+    The previous slot allocation, which scanned the lists of slots.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.competing_slots = [(0, None)] * self.config.competing_slots
+        self.random_slots = [None] * self.config.random_slots
+
+    def on_token_balance(self, circuit_id, balance):
+        cache = self.request_cache.pop("balance-request", circuit_id)
+
+        lowest_balance = sys.maxsize
+        lowest_index = -1
+        for ind, tup in enumerate(self.competing_slots):
+            if not tup[1]:
+                self.competing_slots[ind] = (balance, circuit_id)
+                cache.balance_future.set_result(True)
+                return
+
+            if tup[0] < lowest_balance:
+                lowest_balance = tup[0]
+                lowest_index = ind
+
+        if balance > lowest_balance:
+            old_circuit_id = self.competing_slots[lowest_index][1]
+            self.competing_slots[lowest_index] = (balance, circuit_id)
+            self.remove_relay(old_circuit_id, destroy=DESTROY_REASON_BALANCE)
+            self.remove_exit_socket(old_circuit_id, destroy=DESTROY_REASON_BALANCE)
+            cache.balance_future.set_result(True)
+        else:
+            cache.balance_future.set_result(False)
+
+    def clean_from_slots(self, circuit_id):
+        for ind, slot in enumerate(self.random_slots):
+            if slot == circuit_id:
+                self.random_slots[ind] = None
+
+        for ind, tup in enumerate(self.competing_slots):
+            if tup[1] == circuit_id:
+                self.competing_slots[ind] = (0, None)
+
+
+def create_community(community_class, num_slots):
+    config = TunnelCommunitySettings(competing_slots=num_slots, random_slots=num_slots // 3)
+    node = MockIPv8("curve25519", community_class, config=config, settings={'max_circuits': 0})
+    node.overlay.bandwidth_community = None
+    community = node.overlay
+    for circuit_id in range(num_slots // 3):
+        if isinstance(community.random_slots, list):
+            community.random_slots[circuit_id] = circuit_id
+        else:
+            community.random_slots.take(circuit_id)
+    return node
+
+
+def measure(community_class, num_slots):
+    node = create_community(community_class, num_slots)
+    community = node.overlay
+    rng = random.Random(BENCHMARK_SEED)
+    active = []
+    circuit_id = num_slots
+    duration = 0.0
+    accepted = 0
+    for _ in range(BENCHMARK_NUM_EVENTS):
+        if active and rng.random() < 0.5:
+            index = rng.randrange(len(active))
+            active[index], active[-1] = active[-1], active[index]
+            removed = active.pop()
+            start_time = time.perf_counter()
+            community.clean_from_slots(removed)
+            duration += time.perf_counter() - start_time
+        else:
+            circuit_id += 1
+            cache = BalanceRequestCache(community, circuit_id, Future())
+            community.request_cache.add(cache)
+            start_time = time.perf_counter()
+            community.on_token_balance(circuit_id, rng.randint(-10 ** 9, 10 ** 9))
+            duration += time.perf_counter() - start_time
+            if cache.balance_future.result():
+                accepted += 1
+                active.append(circuit_id)
+            if community.kicked:
+                kicked = set(community.kicked)
+                community.kicked = []
+                active = [active_id for active_id in active if active_id not in kicked]
+    return node, duration / BENCHMARK_NUM_EVENTS, accepted
+
+
+async def main():
+    print(f"{BENCHMARK_NUM_EVENTS} circuit create and destroy events")
+    for num_slots in BENCHMARK_SLOTS:
+        results = {}
+        for name, community_class in (("Scanning the slots", LegacyTunnelCommunity),
+                                      ("Heap of competing slots", BenchmarkTunnelCommunity)):
+            node, duration, accepted = measure(community_class, num_slots)
+            results[name] = (duration, accepted)
+            await node.stop()
+        print(f"{num_slots} competing and {num_slots // 3} random slots: " + ", ".join(
+            f"{name} {duration * 1e6:.1f} us per event ({accepted} circuits accepted)"
+            for name, (duration, accepted) in results.items()))
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,122 @@
+"""
+Benchmark of the VOD startup and seek latency.
+
+Streams a file from a local, upload-limited libtorrent seeder and measures how long stream chunks take to return
+their first bytes, after starting the stream and after seeking. Waiting for pieces through piece_finished_alerts
+is compared to polling for the pieces every second, as StreamChunk.read used to do.
+"""
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import Mock
+
+from tribler_common.simpledefs import DLSTATUS_SEEDING
+
+from tribler_core.components.libtorrent.download_manager.download_config import DownloadConfig
+from tribler_core.components.libtorrent.download_manager.download_manager import DownloadManager
+from tribler_core.components.libtorrent.download_manager.stream import Stream, StreamChunk
+from tribler_core.components.libtorrent.settings import LibtorrentSettings
+from tribler_core.components.libtorrent.torrentdef import TorrentDef
+from tribler_core.components.libtorrent.utils.libtorrent_helper import libtorrent as lt
+
+BENCHMARK_FILE_SIZE = int(os.environ.get('BENCHMARK_FILE_SIZE', 64 * 1024 * 1024))
+BENCHMARK_PIECE_SIZE = int(os.environ.get('BENCHMARK_PIECE_SIZE', 256 * 1024))
+BENCHMARK_UPLOAD_RATE = int(os.environ.get('BENCHMARK_UPLOAD_RATE', 2 * 1024))  # KiB/s
+BENCHMARK_NUM_SEEKS = int(os.environ.get('BENCHMARK_NUM_SEEKS', 10))
+
+
+async def poll_for_piece(self, piece, timeout=None):  # pylint: disable=unused-argument
+    await asyncio.sleep(1)
+
+
+def create_video(directory):
+    video = directory / 'video.mkv'
+    with open(video, 'wb') as f:
+        for _ in range(BENCHMARK_FILE_SIZE // (1024 * 1024)):
+            f.write(os.urandom(1024 * 1024))
+
+    fs = lt.file_storage()
+    lt.add_files(fs, str(video))
+    # Libtorrent 2.0 creates hybrid v1/v2 torrents by default, which Tribler does not support yet
+    torrent = lt.create_torrent(fs, BENCHMARK_PIECE_SIZE, flags=getattr(lt.create_torrent, 'v1_only', 0))
+    lt.set_piece_hashes(torrent, str(directory))
+    return TorrentDef.load_from_memory(lt.bencode(torrent.generate()))
+
+
+def create_download_manager(state_dir):
+    config = LibtorrentSettings()
+    config.dht = False
+    config.upnp = False
+    config.natpmp = False
+    config.lsd = False
+    dlmgr = DownloadManager(config=config, state_dir=state_dir, notifier=Mock(), peer_mid=b"0000")
+    dlmgr.metadata_tmpdir = state_dir / 'metadata_tmpdir'
+    dlmgr.metadata_tmpdir.mkdir(parents=True)
+    dlmgr.initialize()
+    return dlmgr
+
+
+async def measure_first_bytes(stream, position):
+    start_time = time.time()
+    async with StreamChunk(stream, position) as chunk:
+        await chunk.read()
+    return time.time() - start_time
+
+
+async def measure(directory, tdef, seeder):
+    dlmgr = create_download_manager(directory / 'leecher_state')
+    config = DownloadConfig()
+    config.set_dest_dir(directory / 'leecher_downloads')
+    download = dlmgr.start_download(tdef=tdef, config=config)
+    download.add_stream()
+    download.add_peer(("127.0.0.1", seeder.libtorrent_port))
+    await download.stream.enable(0, 0)
+
+    startup = await measure_first_bytes(download.stream, 0)
+
+    # Players only seek once the header, footer and prebuffer have been downloaded
+    stream = download.stream
+    while stream.headerprogress < 1 or stream.footerprogress < 1 or stream.prebuffprogress < 1:
+        await asyncio.sleep(0.1)
+    seeks = []
+    for _ in range(BENCHMARK_NUM_SEEKS):
+        # Seek to a piece that has not been downloaded yet
+        missing = list(stream.iterpieces(have=False))
+        if not missing:
+            break
+        seeks.append(await measure_first_bytes(stream, random.choice(missing) * stream.piecelen))
+
+    await dlmgr.shutdown()
+    return startup, statistics.median(seeks) if seeks else 0.0
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        tdef = create_video(directory)
+
+        seeder = create_download_manager(directory / 'seeder_state')
+        config = DownloadConfig()
+        config.set_dest_dir(directory)
+        upload = seeder.start_download(tdef=tdef, config=config)
+        await upload.wait_for_status(DLSTATUS_SEEDING)
+        upload.set_max_upload_rate(BENCHMARK_UPLOAD_RATE)
+
+        random.seed(42)
+        startup, seek = await measure(directory / 'events', tdef, seeder)
+        print(f"Piece finished alerts: startup {startup:.2f}s, median seek {seek:.2f}s")
+
+        Stream.waitforpiece = poll_for_piece
+        random.seed(42)
+        startup, seek = await measure(directory / 'polling', tdef, seeder)
+        print(f"Polling every second: startup {startup:.2f}s, median seek {seek:.2f}s")
+
+        await seeder.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
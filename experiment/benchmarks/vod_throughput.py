@@ -0,0 +1,119 @@
+"""
+Benchmark of the VOD HTTP endpoint throughput.
+
+Streams a fully downloaded file through the stream endpoint of the REST API to curl, and measures the throughput and
+the CPU time of the Tribler process per GB served. Sending the file with sendfile is compared to sending the pieces
+that are read ahead in a thread, and to reading and sending one piece at a time.
+"""
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import Mock
+
+from aiohttp import web
+
+from tribler_common.simpledefs import DLSTATUS_SEEDING
+
+from tribler_core.components.libtorrent.download_manager import stream as stream_module
+from tribler_core.components.libtorrent.download_manager.download_config import DownloadConfig
+from tribler_core.components.libtorrent.download_manager.download_manager import DownloadManager
+from tribler_core.components.libtorrent.download_manager.stream import StreamChunk
+from tribler_core.components.libtorrent.restapi.downloads_endpoint import DownloadsEndpoint
+from tribler_core.components.libtorrent.settings import LibtorrentSettings
+from tribler_core.components.libtorrent.torrentdef import TorrentDef
+from tribler_core.components.libtorrent.utils.libtorrent_helper import libtorrent as lt
+from tribler_core.utilities.unicode import hexlify
+
+BENCHMARK_FILE_SIZE = int(os.environ.get('BENCHMARK_FILE_SIZE', 4 * 1024 * 1024 * 1024))
+BENCHMARK_PIECE_SIZE = int(os.environ.get('BENCHMARK_PIECE_SIZE', 4 * 1024 * 1024))
+
+GB = 1024 * 1024 * 1024
+
+
+async def no_sendfile(*_):
+    raise NotImplementedError
+
+
+def create_video(directory):
+    video = directory / 'video.mkv'
+    block = os.urandom(1024 * 1024)
+    with open(video, 'wb') as f:
+        for _ in range(BENCHMARK_FILE_SIZE // len(block)):
+            f.write(block)
+
+    fs = lt.file_storage()
+    lt.add_files(fs, str(video))
+    # Libtorrent 2.0 creates hybrid v1/v2 torrents by default, which Tribler does not support yet
+    torrent = lt.create_torrent(fs, BENCHMARK_PIECE_SIZE, flags=getattr(lt.create_torrent, 'v1_only', 0))
+    lt.set_piece_hashes(torrent, str(directory))
+    return TorrentDef.load_from_memory(lt.bencode(torrent.generate()))
+
+
+def create_download_manager(state_dir):
+    config = LibtorrentSettings()
+    config.dht = False
+    config.upnp = False
+    config.natpmp = False
+    config.lsd = False
+    dlmgr = DownloadManager(config=config, state_dir=state_dir, notifier=Mock(), peer_mid=b"0000")
+    dlmgr.metadata_tmpdir = state_dir / 'metadata_tmpdir'
+    dlmgr.metadata_tmpdir.mkdir(parents=True)
+    dlmgr.initialize()
+    return dlmgr
+
+
+async def start_rest_api(dlmgr):
+    app = web.Application()
+    app.add_subapp('/downloads', DownloadsEndpoint(dlmgr).app)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]  # pylint: disable=protected-access
+
+
+async def measure(url):
+    start_cpu = time.process_time()
+    start_time = time.time()
+    curl = await asyncio.create_subprocess_exec('curl', '-s', '-o', os.devnull, '-H', 'Range: bytes=0-',
+                                                '-w', '%{size_download}', url, stdout=asyncio.subprocess.PIPE)
+    output, _ = await curl.communicate()
+    duration = time.time() - start_time
+    size = int(output)
+    return size / duration / 1024 / 1024, (time.process_time() - start_cpu) / (size / GB)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        tdef = create_video(directory)
+
+        dlmgr = create_download_manager(directory / 'state')
+        config = DownloadConfig()
+        config.set_dest_dir(directory)
+        download = dlmgr.start_download(tdef=tdef, config=config)
+        await download.wait_for_status(DLSTATUS_SEEDING)
+
+        runner, port = await start_rest_api(dlmgr)
+        url = f'http://127.0.0.1:{port}/downloads/{hexlify(tdef.get_infohash())}/stream/0'
+
+        throughput, cpu = await measure(url)
+        print(f"Sendfile: {throughput:.0f} MB/s, {cpu:.2f} CPU seconds per GB")
+
+        StreamChunk.sendfile = no_sendfile
+        throughput, cpu = await measure(url)
+        print(f"Readahead of {stream_module.READAHEAD_PIECES} pieces: {throughput:.0f} MB/s, "
+              f"{cpu:.2f} CPU seconds per GB")
+
+        stream_module.READAHEAD_PIECES = 0
+        throughput, cpu = await measure(url)
+        print(f"One piece at a time: {throughput:.0f} MB/s, {cpu:.2f} CPU seconds per GB")
+
+        await runner.cleanup()
+        await dlmgr.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -46,21 +46,33 @@ class BandwidthAccountingCommunity(TriblerCommunity):
         self.add_message_handler(BandwidthTransactionQueryPayload, self.received_query)
 
         self.register_task("query_peers", self.query_random_peer, interval=self.settings.outgoing_query_interval)
+        self.register_task("flush_transactions", self.database.flush_transactions,
+                           interval=self.settings.transaction_flush_interval)
 
         self.logger.info("Started bandwidth accounting community with public key %s", hexlify(self.my_pk))
 
-    def construct_signed_transaction(self, peer: Peer, amount: int) -> BandwidthTransactionData:
+    def construct_transaction(self, peer: Peer, amount: int) -> BandwidthTransactionData:
         """
-        Construct a new signed bandwidth transaction.
+        Construct a new bandwidth transaction, that still has to be signed.
         :param peer: The counterparty of the transaction.
         :param amount: The amount of bytes to payout.
-        :return A signed BandwidthTransaction.
+        :return An unsigned BandwidthTransaction.
         """
         peer_pk = peer.public_key.key_to_bin()
         latest_tx = self.database.get_latest_transaction(self.my_pk, peer_pk)
         total_amount = latest_tx.amount + amount if latest_tx else amount
         next_seq_num = latest_tx.sequence_number + 1 if latest_tx else 1
-        tx = BandwidthTransactionData(next_seq_num, self.my_pk, peer_pk, EMPTY_SIGNATURE, EMPTY_SIGNATURE, total_amount)
+        return BandwidthTransactionData(next_seq_num, self.my_pk, peer_pk, EMPTY_SIGNATURE, EMPTY_SIGNATURE,
+                                        total_amount)
+
+    def construct_signed_transaction(self, peer: Peer, amount: int) -> BandwidthTransactionData:
+        """
+        Construct a new signed bandwidth transaction.
+        :param peer: The counterparty of the transaction.
+        :param amount: The amount of bytes to payout.
+        :return A signed BandwidthTransaction.
+        """
+        tx = self.construct_transaction(peer, amount)
         tx.sign(self.my_peer.key, as_a=True)
         return tx
 
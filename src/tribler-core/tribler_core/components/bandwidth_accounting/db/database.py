@@ -1,5 +1,7 @@
+from collections import OrderedDict
+from functools import wraps
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 from pony.orm import Database, count, db_session, select, sum
 
@@ -8,12 +10,25 @@ from tribler_core.components.bandwidth_accounting.db.transaction import Bandwidt
 from tribler_core.utilities.utilities import MEMORY_DB
 
 
+def flush_queued_transactions(method):
+    """
+    Decorator for the methods of BandwidthDatabase that read transactions, to write the queued transactions to the
+    database first.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.flush_transactions()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
 class BandwidthDatabase:
     """
     Simple database that stores bandwidth transactions in Tribler as a work graph.
     """
     CURRENT_DB_VERSION = 9
     MAX_HISTORY_ITEMS = 100  # The maximum number of history items to store.
+    MAX_CACHED_TRANSACTIONS = 10000  # The maximum number of latest transactions that are kept in memory.
 
     def __init__(self, db_path: Union[Path, type(MEMORY_DB)], my_pub_key: bytes,
                  store_all_transactions: bool = False) -> None:
@@ -26,6 +41,11 @@ class BandwidthDatabase:
         """
         self.my_pub_key = my_pub_key
         self.store_all_transactions = store_all_transactions
+        # The latest transaction (or None) between the pairs of public keys that we recently looked up or stored,
+        # least recently used first, and the transactions that are queued to be written to the database in a single
+        # batch by flush_transactions.
+        self.latest_transactions: Dict[Tuple[bytes, bytes], Optional[BandwidthTransactionData]] = OrderedDict()
+        self.queued_transactions: List[BandwidthTransactionData] = []
 
         self.database = Database()
         # This attribute is internally called by Pony on startup, though pylint cannot detect it
@@ -68,6 +88,7 @@ class BandwidthDatabase:
                                                 public_key_b=transaction.public_key_b,
                                                 sequence_number=transaction.sequence_number)
 
+    @flush_queued_transactions
     @db_session
     def get_my_latest_transactions(self, limit: Optional[int] = None) -> List[BandwidthTransactionData]:
         """
@@ -83,17 +104,90 @@ class BandwidthDatabase:
             results.append(BandwidthTransactionData.from_db(db_tx))
         return results
 
-    @db_session
     def get_latest_transaction(self, public_key_a: bytes, public_key_b: bytes) -> BandwidthTransactionData:
         """
         Return the latest transaction between two parties, or None if no such transaction exists.
+        The transaction is only read from the database once, after which it is kept in memory until it is one of the
+        least recently used transactions.
         :param public_key_a: The public key of the party transferring the bandwidth.
         :param public_key_b: The public key of the party receiving the bandwidth.
         :return The latest transaction between the two specified parties, or None if no such transaction exists.
         """
-        db_obj = self.BandwidthTransaction.get(public_key_a=public_key_a, public_key_b=public_key_b)
-        return BandwidthTransactionData.from_db(db_obj) if db_obj else None
+        key = (public_key_a, public_key_b)
+        if key in self.latest_transactions:
+            self.latest_transactions.move_to_end(key)
+            return self.latest_transactions[key]
+        with db_session:
+            db_obj = self.BandwidthTransaction.get(public_key_a=public_key_a, public_key_b=public_key_b)
+            latest_tx = BandwidthTransactionData.from_db(db_obj) if db_obj else None
+        self.latest_transactions[key] = latest_tx
+        self.trim_latest_transactions()
+        return latest_tx
+
+    def update_latest_transaction(self, transaction: BandwidthTransactionData) -> bool:
+        """
+        Keep a transaction in memory as the latest transaction between its parties, unless we already know of a
+        transaction between them with a higher sequence number.
+        :param transaction: The transaction to keep.
+        :return: True if the transaction is the latest one, False otherwise.
+        """
+        latest_tx = self.get_latest_transaction(transaction.public_key_a, transaction.public_key_b)
+        if latest_tx and latest_tx.sequence_number > transaction.sequence_number:
+            return False
+        self.latest_transactions[(transaction.public_key_a, transaction.public_key_b)] = transaction
+        return True
+
+    def trim_latest_transactions(self) -> None:
+        """
+        Forget the least recently used latest transactions once we keep more than MAX_CACHED_TRANSACTIONS of them.
+        Queued transactions are kept, because the database does not have them yet.
+        """
+        if len(self.latest_transactions) <= self.MAX_CACHED_TRANSACTIONS:
+            return
+        excess = len(self.latest_transactions) - self.MAX_CACHED_TRANSACTIONS
+        queued = {(tx.public_key_a, tx.public_key_b) for tx in self.queued_transactions}
+        evicted = []
+        for key in self.latest_transactions:
+            if len(evicted) == excess:
+                break
+            if key not in queued:
+                evicted.append(key)
+        for key in evicted:
+            del self.latest_transactions[key]
+
+    def queue_transaction(self, transaction: BandwidthTransactionData) -> bool:
+        """
+        Queue a transaction to be written to the database by the next call to flush_transactions. Until then, the
+        transaction is only kept in memory, as the latest transaction between its parties. The queue is flushed
+        periodically and on shutdown, so a crash loses the transactions of at most one flush interval.
+        Transactions in which we give bandwidth are written right away instead, since we pick their sequence numbers:
+        if we lost them in a crash, we would sign other transactions with the same sequence numbers afterwards.
+        :param transaction: The transaction to store.
+        :return: True if the transaction is queued or written, False if we already know of a later transaction.
+        """
+        if not self.update_latest_transaction(transaction):
+            return False
+        if transaction.public_key_a == self.my_pub_key:
+            self.BandwidthTransaction.insert(transaction)
+        else:
+            self.queued_transactions.append(transaction)
+        return True
+
+    def flush_transactions(self) -> None:
+        """
+        Write the queued transactions to the database in a single database transaction, so that either all or none
+        of them are persisted. If writing them fails, the transactions remain queued.
+        """
+        if not self.queued_transactions:
+            return
+        transactions, self.queued_transactions = self.queued_transactions, []
+        try:
+            self.BandwidthTransaction.insert_batch(transactions)
+        except Exception:
+            self.queued_transactions = transactions + self.queued_transactions
+            raise
 
+    @flush_queued_transactions
     @db_session
     def get_latest_transactions(self, public_key: bytes, limit: Optional[int] = 100) -> List[BandwidthTransactionData]:
         """
@@ -107,6 +201,7 @@ class BandwidthDatabase:
             .limit(limit)
         return [BandwidthTransactionData.from_db(db_txn) for db_txn in db_txs]
 
+    @flush_queued_transactions
     @db_session
     def get_total_taken(self, public_key: bytes) -> int:
         """
@@ -117,6 +212,7 @@ class BandwidthDatabase:
         return sum(transaction.amount for transaction in self.BandwidthTransaction
                    if transaction.public_key_a == public_key)
 
+    @flush_queued_transactions
     @db_session
     def get_total_given(self, public_key: bytes) -> int:
         """
@@ -127,6 +223,7 @@ class BandwidthDatabase:
         return sum(transaction.amount for transaction in self.BandwidthTransaction
                    if transaction.public_key_b == public_key)
 
+    @flush_queued_transactions
     @db_session
     def get_balance(self, public_key: bytes) -> int:
         """
@@ -143,6 +240,7 @@ class BandwidthDatabase:
         """
         return self.get_balance(self.my_pub_key)
 
+    @flush_queued_transactions
     @db_session
     def get_num_peers_helped(self, public_key: bytes) -> int:
         """
@@ -153,6 +251,7 @@ class BandwidthDatabase:
         result = list(select(count(g.public_key_b) for g in self.BandwidthTransaction if g.public_key_a == public_key))
         return result[0]
 
+    @flush_queued_transactions
     @db_session
     def get_num_peers_helped_by(self, public_key: bytes) -> int:
         """
@@ -163,6 +262,7 @@ class BandwidthDatabase:
         result = list(select(count(g.public_key_a) for g in self.BandwidthTransaction if g.public_key_b == public_key))
         return result[0]
 
+    @flush_queued_transactions
     @db_session
     def get_history(self) -> List:
         """
@@ -177,6 +277,7 @@ class BandwidthDatabase:
 
     def shutdown(self) -> None:
         """
-        Shutdown the database.
+        Shutdown the database, after writing the queued transactions to it.
         """
+        self.flush_transactions()
         self.database.disconnect()
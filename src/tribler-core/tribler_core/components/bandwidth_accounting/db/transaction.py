@@ -9,7 +9,7 @@ from __future__ import annotations
 
 import time
 from dataclasses import dataclass, field
-from typing import Dict
+from typing import Dict, List
 
 from ipv8.keyvault.crypto import default_eccrypto
 from ipv8.keyvault.keys import Key
@@ -148,20 +148,46 @@ def define_binding(bandwidth_database):
             Remove the last transaction with that specific counterparty while doing so.
             :param transaction: The transaction to insert in the database.
             """
+            cls.insert_batch([transaction])
+
+        @classmethod
+        @db_session(optimistic=False)
+        def insert_batch(cls, transactions: List[BandwidthTransaction]) -> None:
+            """
+            Insert BandwidthTransaction objects in the database, in a single database transaction.
+            Remove the last transaction with their specific counterparties while doing so.
+            :param transactions: The transactions to insert in the database.
+            """
             if not bandwidth_database.store_all_transactions:
-                # Make sure to only store the latest pairwise transaction.
-                for tx in cls.select(
-                    lambda c: c.public_key_a == transaction.public_key_a and
-                        c.public_key_b == transaction.public_key_b):
-                    tx.delete()
-                db.commit()
-                cls(**transaction.get_db_kwargs())
-            elif not bandwidth_database.has_transaction(transaction):
-                # We store all transactions and it does not exist yet - insert it.
-                cls(**transaction.get_db_kwargs())
-
-            if transaction.public_key_a == bandwidth_database.my_pub_key or \
-                    transaction.public_key_b == bandwidth_database.my_pub_key:
+                # Make sure to only store the latest pairwise transactions.
+                latest_txs = {}
+                for transaction in transactions:
+                    key = (transaction.public_key_a, transaction.public_key_b)
+                    if key not in latest_txs or latest_txs[key].sequence_number <= transaction.sequence_number:
+                        latest_txs[key] = transaction
+                transactions = list(latest_txs.values())
+
+            update_history = False
+            for transaction in transactions:
+                if not bandwidth_database.store_all_transactions:
+                    for tx in cls.select(
+                        lambda c: c.public_key_a == transaction.public_key_a and
+                            c.public_key_b == transaction.public_key_b):
+                        tx.delete()
+                    db.flush()
+                    cls(**transaction.get_db_kwargs())
+                elif not bandwidth_database.has_transaction(transaction):
+                    # We store all transactions and it does not exist yet - insert it.
+                    cls(**transaction.get_db_kwargs())
+
+                if (transaction.public_key_a, transaction.public_key_b) in bandwidth_database.latest_transactions:
+                    bandwidth_database.update_latest_transaction(transaction)
+
+                if transaction.public_key_a == bandwidth_database.my_pub_key or \
+                        transaction.public_key_b == bandwidth_database.my_pub_key:
+                    update_history = True
+
+            if update_history:
                 # Update the balance history
                 timestamp = int(round(time.time() * 1000))
                 db.BandwidthHistory(timestamp=timestamp, balance=bandwidth_database.get_my_balance())
@@ -7,3 +7,6 @@ class BandwidthAccountingSettings(TriblerConfigSection):
     testnet: bool = Field(default=False, env='BANDWIDTH_TESTNET')
     outgoing_query_interval: int = 30  # The interval at which we send out queries to other peers, in seconds.
     max_tx_returned_in_query: int = 10  # The maximum number of bandwidth transactions to return in response to a query.
+    # The interval at which we store queued transactions of other payers, in seconds. A crash loses at most one
+    # interval of them. Transactions in which we pay are stored right away.
+    transaction_flush_interval: int = 5
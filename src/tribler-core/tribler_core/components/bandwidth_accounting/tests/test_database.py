@@ -169,3 +169,111 @@ def test_history(bandwidth_db):
 
     history = bandwidth_db.get_history()
     assert len(history) == 2
+
+
+def test_queue_transactions(bandwidth_db):
+    """
+    Test whether queued transactions are kept in memory, until they are written to the database in a single batch
+    """
+    tx1 = BandwidthTransactionData(1, b"a", b"b", EMPTY_SIGNATURE, EMPTY_SIGNATURE, 3000)
+    tx2 = BandwidthTransactionData(2, b"a", b"b", EMPTY_SIGNATURE, EMPTY_SIGNATURE, 4000)
+    tx3 = BandwidthTransactionData(1, b"a", b"c", EMPTY_SIGNATURE, EMPTY_SIGNATURE, 5000)
+    assert bandwidth_db.queue_transaction(tx1)
+    assert bandwidth_db.queue_transaction(tx2)
+    assert bandwidth_db.queue_transaction(tx3)
+    assert not bandwidth_db.queue_transaction(tx1)
+
+    assert bandwidth_db.get_latest_transaction(b"a", b"b") == tx2
+    with db_session:
+        assert not bandwidth_db.BandwidthTransaction.select().count()
+
+    bandwidth_db.flush_transactions()
+    assert not bandwidth_db.queued_transactions
+    with db_session:
+        assert bandwidth_db.BandwidthTransaction.select().count() == 2
+        assert bandwidth_db.has_transaction(tx2)
+        assert bandwidth_db.has_transaction(tx3)
+
+
+def test_queue_own_transaction(bandwidth_db):
+    """
+    Test whether the transactions in which we give bandwidth are written to the database right away
+    """
+    tx = BandwidthTransactionData(1, bandwidth_db.my_pub_key, b"a", EMPTY_SIGNATURE, EMPTY_SIGNATURE, 3000)
+    assert bandwidth_db.queue_transaction(tx)
+    assert not bandwidth_db.queued_transactions
+    with db_session:
+        assert bandwidth_db.has_transaction(tx)
+
+
+def test_read_flushes_queued_transactions(bandwidth_db):
+    """
+    Test whether reading the transactions from the database includes the queued transactions
+    """
+    tx = BandwidthTransactionData(1, b"a", bandwidth_db.my_pub_key, EMPTY_SIGNATURE, EMPTY_SIGNATURE, 3000)
+    bandwidth_db.queue_transaction(tx)
+
+    assert bandwidth_db.get_my_balance() == 3000
+    assert bandwidth_db.get_my_latest_transactions() == [tx]
+    assert len(bandwidth_db.get_history()) == 1
+
+
+def test_flush_transactions_failure(bandwidth_db):
+    """
+    Test whether a failure to write a batch of queued transactions stores none of them, and keeps them queued
+    """
+    tx1 = BandwidthTransactionData(1, b"a", b"b", EMPTY_SIGNATURE, EMPTY_SIGNATURE, 3000)
+    tx2 = BandwidthTransactionData(1, b"a", b"c", EMPTY_SIGNATURE, EMPTY_SIGNATURE, None)
+    bandwidth_db.queue_transaction(tx1)
+    bandwidth_db.queue_transaction(tx2)
+
+    with pytest.raises(Exception):
+        bandwidth_db.flush_transactions()
+    assert bandwidth_db.queued_transactions == [tx1, tx2]
+    with db_session:
+        assert not bandwidth_db.has_transaction(tx1)
+
+    tx2.amount = 4000
+    bandwidth_db.flush_transactions()
+    with db_session:
+        assert bandwidth_db.has_transaction(tx1)
+        assert bandwidth_db.has_transaction(tx2)
+
+
+def test_latest_transaction_cache(bandwidth_db):
+    """
+    Test whether the latest transaction between two parties is only read from the database once
+    """
+    tx1 = BandwidthTransactionData(1, b"a", b"b", EMPTY_SIGNATURE, EMPTY_SIGNATURE, 3000)
+    bandwidth_db.BandwidthTransaction.insert(tx1)
+    assert bandwidth_db.get_latest_transaction(b"a", b"b") == tx1
+
+    with db_session:
+        bandwidth_db.BandwidthTransaction.select().delete()
+    assert bandwidth_db.get_latest_transaction(b"a", b"b") == tx1
+
+    # Inserting a transaction updates the cache, unless it is older than the cached one
+    tx2 = BandwidthTransactionData(2, b"a", b"b", EMPTY_SIGNATURE, EMPTY_SIGNATURE, 4000)
+    bandwidth_db.BandwidthTransaction.insert(tx2)
+    assert bandwidth_db.get_latest_transaction(b"a", b"b") == tx2
+    assert not bandwidth_db.update_latest_transaction(tx1)
+    assert bandwidth_db.get_latest_transaction(b"a", b"b") == tx2
+
+
+def test_latest_transaction_cache_limit(bandwidth_db):
+    """
+    Test whether the least recently used latest transactions are forgotten once the cache is full, unless they are
+    queued
+    """
+    bandwidth_db.MAX_CACHED_TRANSACTIONS = 2
+    queued_tx = BandwidthTransactionData(1, b"a", b"b", EMPTY_SIGNATURE, EMPTY_SIGNATURE, 3000)
+    bandwidth_db.queue_transaction(queued_tx)
+    bandwidth_db.get_latest_transaction(b"a", b"c")
+    bandwidth_db.get_latest_transaction(b"a", b"d")
+    assert list(bandwidth_db.latest_transactions) == [(b"a", b"b"), (b"a", b"d")]
+
+    bandwidth_db.flush_transactions()
+    bandwidth_db.get_latest_transaction(b"a", b"d")
+    bandwidth_db.get_latest_transaction(b"a", b"e")
+    assert list(bandwidth_db.latest_transactions) == [(b"a", b"d"), (b"a", b"e")]
+    assert bandwidth_db.get_latest_transaction(b"a", b"b") == queued_tx
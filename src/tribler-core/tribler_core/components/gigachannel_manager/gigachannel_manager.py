@@ -10,6 +10,7 @@ from tribler_common.simpledefs import DLSTATUS_SEEDING, NTFY
 
 from tribler_core.components.libtorrent.download_manager.download_config import DownloadConfig
 from tribler_core.components.libtorrent.download_manager.download_manager import DownloadManager
+from tribler_core.components.libtorrent.download_manager.metainfo_request_queue import METAINFO_PRIORITY_CHANNEL
 from tribler_core.components.libtorrent.torrentdef import TorrentDef
 from tribler_core.components.metadata_store.db.orm_bindings.channel_node import COMMITTED
 from tribler_core.components.metadata_store.db.serialization import CHANNEL_TORRENT
@@ -248,7 +249,8 @@ class GigaChannelManager(TaskManager):
         :param channel: The channel metadata ORM object.
         """
 
-        metainfo = await self.download_manager.get_metainfo(bytes(channel.infohash), timeout=60, hops=0)
+        metainfo = await self.download_manager.get_metainfo(bytes(channel.infohash), timeout=60, hops=0,
+                                                            priority=METAINFO_PRIORITY_CHANNEL)
         if metainfo is None:
             # Timeout looking for the channel metainfo. Probably, there are no seeds.
             # TODO: count the number of tries we had with the channel, so we can stop trying eventually
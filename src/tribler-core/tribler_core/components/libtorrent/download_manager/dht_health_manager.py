@@ -1,28 +1,51 @@
+import heapq
 import math
+import time
 from asyncio import Future
 
 from ipv8.taskmanager import TaskManager
 
 from tribler_core.components.libtorrent.utils.libtorrent_helper import libtorrent as lt
 from tribler_core.utilities.unicode import hexlify
+from tribler_core.utilities.utilities import bdecode_compat
+
+BLOOMFILTER_SIZE = 256  # The size (in bytes) of the BEP33 bloom filters
+
+# The number of set bits in every possible byte value
+POPCOUNT_TABLE = bytes(bin(value).count('1') for value in range(256))
+
+# Byte sequences that bencoded BEP33 get_peers queries and responses must contain.
+# These are used to filter out the DHT packets we are not interested in, without having to decode them.
+BEP33_QUERY_MARKERS = (b'9:get_peers', b'6:scrapei1e')
+BEP33_RESPONSE_MARKERS = (b'4:BFsd', b'4:BFpe')
 
 
 class DHTHealthManager(TaskManager):
     """
     This class manages BEP33 health requests to the libtorrent DHT.
+
+    The bloom filters of a lookup are kept as integers, so merging incoming bloom filters is a single OR operation.
+    All lookups share a single timeout task that fires when the earliest lookup expires.
     """
 
-    def __init__(self, lt_session):
+    def __init__(self, lt_session, subscribe_alerts=None, unsubscribe_alerts=None):
         """
         Initialize the DHT health manager.
         :param lt_session: The session used to perform health lookups.
+        :param subscribe_alerts: Called when the first lookup starts, to let the session generate DHT log alerts.
+        :param unsubscribe_alerts: Called when the last outstanding lookup has finished.
         """
         TaskManager.__init__(self)
         self.lookup_futures = {}    # Map from binary infohash to future
-        self.bf_seeders = {}        # Map from infohash to (final) seeders bloomfilter
-        self.bf_peers = {}          # Map from infohash to (final) peers bloomfilter
+        self.bf_seeders = {}        # Map from infohash to (final) seeders bloomfilter, as an integer
+        self.bf_peers = {}          # Map from infohash to (final) peers bloomfilter, as an integer
         self.outstanding = {}       # Map from transaction_id to infohash
+        self.transactions = {}      # Map from infohash to the set of its outstanding transaction_ids
+        self.lookup_deadlines = []  # Heap of (deadline, infohash)
+        self.timeout_scheduled_at = None  # The deadline at which the shared timeout task fires next
         self.lt_session = lt_session
+        self.subscribe_alerts = subscribe_alerts
+        self.unsubscribe_alerts = unsubscribe_alerts
 
     def get_health(self, infohash, timeout=15):
         """
@@ -34,34 +57,63 @@ class DHTHealthManager(TaskManager):
         if infohash in self.lookup_futures:
             return self.lookup_futures[infohash]
 
+        if not self.lookup_futures and self.subscribe_alerts:
+            self.subscribe_alerts()
         lookup_future = Future()
         self.lookup_futures[infohash] = lookup_future
-        self.bf_seeders[infohash] = bytearray(256)
-        self.bf_peers[infohash] = bytearray(256)
+        self.bf_seeders[infohash] = 0
+        self.bf_peers[infohash] = 0
+        self.transactions[infohash] = set()
 
         # Perform a get_peers request. This should result in get_peers responses with the BEP33 bloom filters.
         self.lt_session.dht_get_peers(lt.sha1_hash(bytes(infohash)))
 
-        self.register_task(f"lookup_{hexlify(infohash)}", self.finalize_lookup, infohash, delay=timeout)
+        heapq.heappush(self.lookup_deadlines, (time.time() + timeout, infohash))
+        self.schedule_lookup_timeout()
 
         return lookup_future
 
+    def schedule_lookup_timeout(self):
+        """
+        Make sure the shared timeout task fires at the earliest deadline of the outstanding lookups.
+        """
+        if not self.lookup_deadlines:
+            return
+        deadline = self.lookup_deadlines[0][0]
+        if self.timeout_scheduled_at is not None and self.timeout_scheduled_at <= deadline:
+            return
+        self.timeout_scheduled_at = deadline
+        self.register_anonymous_task("lookup_timeout", self.finalize_expired_lookups, deadline,
+                                     delay=max(0.0, deadline - time.time()))
+
+    def finalize_expired_lookups(self, scheduled_at=None):
+        """
+        Finalize all the lookups that have expired, and schedule the next shared timeout.
+        """
+        if scheduled_at == self.timeout_scheduled_at:
+            self.timeout_scheduled_at = None
+
+        now = time.time()
+        while self.lookup_deadlines and self.lookup_deadlines[0][0] <= now:
+            _, infohash = heapq.heappop(self.lookup_deadlines)
+            self.finalize_lookup(infohash)
+
+        self.schedule_lookup_timeout()
+
     def finalize_lookup(self, infohash):
         """
         Finalize the lookup of the provided infohash and invoke the appropriate deferred.
         :param infohash: The infohash of the lookup we finialize.
         """
-        for transaction_id in [key for key, value in self.outstanding.items() if value == infohash]:
+        for transaction_id in self.transactions.pop(infohash, ()):
             self.outstanding.pop(transaction_id, None)
 
         if infohash not in self.lookup_futures:
             return
 
         # Determine the seeders/peers
-        bf_seeders = self.bf_seeders.pop(infohash)
-        bf_peers = self.bf_peers.pop(infohash)
-        seeders = DHTHealthManager.get_size_from_bloomfilter(bf_seeders)
-        peers = DHTHealthManager.get_size_from_bloomfilter(bf_peers)
+        seeders = DHTHealthManager.get_size_from_bloomfilter(self.bf_seeders.pop(infohash))
+        peers = DHTHealthManager.get_size_from_bloomfilter(self.bf_peers.pop(infohash))
         if not self.lookup_futures[infohash].done():
             self.lookup_futures[infohash].set_result({
                 "DHT": [{
@@ -72,6 +124,8 @@ class DHTHealthManager(TaskManager):
             })
 
         self.lookup_futures.pop(infohash, None)
+        if not self.lookup_futures and self.unsubscribe_alerts:
+            self.unsubscribe_alerts()
 
     @staticmethod
     def combine_bloomfilters(bf1, bf2):
@@ -82,37 +136,24 @@ class DHTHealthManager(TaskManager):
         :return: A bytearray with the combined bloomfilter.
         """
         final_bf_len = min(len(bf1), len(bf2))
-        final_bf = bytearray(final_bf_len)
-        for bf_index in range(final_bf_len):
-            final_bf[bf_index] = bf1[bf_index] | bf2[bf_index]
-        return final_bf
+        combined = int.from_bytes(bf1[:final_bf_len], 'big') | int.from_bytes(bf2[:final_bf_len], 'big')
+        return bytearray(combined.to_bytes(final_bf_len, 'big'))
 
     @staticmethod
     def get_size_from_bloomfilter(bf):
         """
         Return the estimated number of items in the bloom filter.
-        :param bf: The bloom filter of which we estimate the size.
+        :param bf: The bloom filter of which we estimate the size, either as bytes or as an integer.
         :return: A rounded integer, approximating the number of items in the filter.
         """
-        def tobits(s):
-            result = []
-            for c in s:
-                num = ord(c) if isinstance(c, str) else c
-                bits = bin(num)[2:]
-                bits = '00000000'[len(bits):] + bits
-                result.extend([int(b) for b in bits])
-            return result
-
-        bits_array = tobits(bytes(bf))
-        total_zeros = 0
-        for bit in bits_array:
-            if bit == 0:
-                total_zeros += 1
+        if isinstance(bf, int):
+            bf = bf.to_bytes(BLOOMFILTER_SIZE, 'big')
 
+        m = len(bf) * 8
+        total_zeros = m - sum(bytes(bf).translate(POPCOUNT_TABLE))
         if total_zeros == 0:
             return 6000  # The maximum capacity of the bloom filter used in BEP33
 
-        m = 256 * 8
         c = min(m - 1, total_zeros)
         return int(math.log(c / float(m)) / (2 * math.log(1 - 1 / float(m))))
 
@@ -123,13 +164,17 @@ class DHTHealthManager(TaskManager):
         :param transaction_id: The ID of the query
         :param infohash: The infohash for which the query was sent.
         """
+        previous_infohash = self.outstanding.pop(transaction_id, None)
+        if previous_infohash in self.transactions:
+            # Libtorrent is reusing the transaction_id, possibly for an infohash that we're not interested in.
+            self.transactions[previous_infohash].discard(transaction_id)
+
         if infohash in self.lookup_futures:
             self.outstanding[transaction_id] = infohash
-        elif transaction_id in self.outstanding:
-            # Libtorrent is reusing the transaction_id, and is now using it for a infohash that we're not interested in.
-            self.outstanding.pop(transaction_id, None)
+            self.transactions.setdefault(infohash, set()).add(transaction_id)
 
-    def received_bloomfilters(self, transaction_id,  bf_seeds=bytearray(256), bf_peers=bytearray(256)):
+    def received_bloomfilters(self, transaction_id, bf_seeds=bytes(BLOOMFILTER_SIZE),
+                              bf_peers=bytes(BLOOMFILTER_SIZE)):
         """
         We have received bloom filters from the libtorrent DHT. Register the bloom filters and process them.
         :param transaction_id: The ID of the query for which we are receiving the bloom filter.
@@ -141,5 +186,39 @@ class DHTHealthManager(TaskManager):
             self._logger.info("Could not find lookup infohash for incoming BEP33 bloomfilters")
             return
 
-        self.bf_seeders[infohash] = DHTHealthManager.combine_bloomfilters(self.bf_seeders[infohash], bf_seeds)
-        self.bf_peers[infohash] = DHTHealthManager.combine_bloomfilters(self.bf_peers[infohash], bf_peers)
+        self.bf_seeders[infohash] |= int.from_bytes(bf_seeds[:BLOOMFILTER_SIZE], 'big')
+        self.bf_peers[infohash] |= int.from_bytes(bf_peers[:BLOOMFILTER_SIZE], 'big')
+
+    def process_dht_pkt_alert(self, alert):
+        """
+        Process a raw DHT packet from libtorrent and extract BEP33 queries/responses from it.
+        Packets that can not be BEP33 messages are dropped before being decoded.
+        :param alert: The dht_pkt_alert to process.
+        """
+        if not self.lookup_futures:
+            return
+
+        pkt_buf = alert.pkt_buf
+        is_query = all(marker in pkt_buf for marker in BEP33_QUERY_MARKERS)
+        is_response = not is_query and all(marker in pkt_buf for marker in BEP33_RESPONSE_MARKERS)
+        if not is_query and not is_response:
+            return
+
+        # Unfortunately, the Python bindings don't have a direction attribute.
+        # So, we'll have to resort to using the string representation of the alert instead.
+        incoming = str(alert).startswith('<==')
+        if is_query == incoming:
+            return
+
+        decoded = bdecode_compat(pkt_buf)
+        if not decoded:
+            return
+
+        # We are sending a raw DHT message - notify the DHTHealthManager of the outstanding request.
+        if is_query and decoded.get(b'y') == b'q' \
+                and decoded.get(b'q') == b'get_peers' and decoded[b'a'].get(b'scrape') == 1:
+            self.requesting_bloomfilters(decoded[b't'], decoded[b'a'][b'info_hash'])
+
+        # We received a raw DHT message - decode it and check whether it is a BEP33 message.
+        if is_response and b'r' in decoded and b'BFsd' in decoded[b'r'] and b'BFpe' in decoded[b'r']:
+            self.received_bloomfilters(decoded[b't'], decoded[b'r'][b'BFsd'], decoded[b'r'][b'BFpe'])
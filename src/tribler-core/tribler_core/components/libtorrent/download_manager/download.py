@@ -3,14 +3,13 @@ A wrapper around a libtorrent download.
 
 Author(s): Arno Bakker, Egbert Bouman
 """
-import base64
 import logging
 from asyncio import CancelledError, Future, iscoroutine, sleep, wait_for
 from collections import defaultdict
 from typing import Optional
 
 from ipv8.taskmanager import TaskManager, task
-from ipv8.util import int2byte, succeed
+from ipv8.util import succeed
 
 from tribler_common.osutils import fix_filebasename
 from tribler_common.simpledefs import DLSTATUS_SEEDING, DLSTATUS_STOPPED, DOWNLOAD, NTFY
@@ -60,13 +59,18 @@ class Download(TaskManager):
         # Libtorrent status
         self.lt_status = None
         self.error = None
+        self.state = None
         self.pause_after_next_hashcheck = False
         self.checkpoint_after_next_hashcheck = False
         self.tracker_status = {}  # {url: [num_peers, status_str]}
+        self.state_version = 0  # Increased whenever libtorrent reports a change in the state of this download
         self.checkpoint_disabled = self.dummy
 
         self.futures = defaultdict(list)
         self.alert_handlers = defaultdict(list)
+        self.piece_futures = {}  # Map from piece index to a future that fires once the piece has been downloaded
+        self.piece_alerts_hops = None  # The hops of the session we get piece_finished_alerts from, if subscribed
+        self.lazy = False  # Whether the torrent has yet to be added to libtorrent once its handle is needed
 
         self.future_added = self.wait_for_alert('add_torrent_alert', lambda a: a.handle)
         self.future_removed = self.wait_for_alert('torrent_removed_alert')
@@ -84,7 +88,8 @@ class Download(TaskManager):
                           'state_changed_alert': self.on_state_changed_alert,
                           'torrent_error_alert': self.on_torrent_error_alert,
                           'add_torrent_alert': self.on_add_torrent_alert,
-                          'torrent_removed_alert': self.on_torrent_removed_alert}
+                          'torrent_removed_alert': self.on_torrent_removed_alert,
+                          'piece_finished_alert': self.on_piece_finished_alert}
 
         for alert_type, alert_handler in alert_handlers.items():
             self.register_alert_handler(alert_type, alert_handler)
@@ -145,7 +150,11 @@ class Download(TaskManager):
         if self.handle and self.handle.is_valid():
             return succeed(self.handle)
 
-        return self.wait_for_alert('add_torrent_alert', lambda a: a.handle)
+        future = self.wait_for_alert('add_torrent_alert', lambda a: a.handle)
+        if self.lazy:
+            self.lazy = False
+            self.dlmgr.start_handle(self, self.get_atp())
+        return future
 
     def get_atp(self):
         save_path = self.config.get_dest_dir()
@@ -220,16 +229,9 @@ class Download(TaskManager):
     @check_handle(b'')
     def get_pieces_base64(self):
         """
-        Returns a base64 encoded bitmask of the pieces that we have.
+        Returns a base64 encoded bitmask of the pieces that we have, as of the last status update.
         """
-        bitstr = b""
-        for bit in self.handle.status().pieces:
-            bitstr += b'1' if bit else b'0'
-
-        encoded_str = b""
-        for i in range(0, len(bitstr), 8):
-            encoded_str += int2byte(int(bitstr[i:i + 8].ljust(8, b'0'), 2))
-        return base64.b64encode(encoded_str)
+        return self.get_state().get_pieces_complete().to_base64()
 
     def post_alert(self, alert_type, alert_dict=None):
         alert_dict = alert_dict or {}
@@ -238,7 +240,9 @@ class Download(TaskManager):
         return self.process_alert(alert, alert_type)
 
     def process_alert(self, alert, alert_type):
-        if alert.category() in [lt.alert.category_t.error_notification, lt.alert.category_t.performance_warning]:
+        self.state_version += 1
+        if self._logger.isEnabledFor(logging.DEBUG) and \
+                alert.category() in [lt.alert.category_t.error_notification, lt.alert.category_t.performance_warning]:
             self._logger.debug("Got alert: %s", alert)
 
         for handler in self.alert_handlers.get(alert_type, []):
@@ -267,7 +271,7 @@ class Download(TaskManager):
     def on_save_resume_data_alert(self, alert):
         """
         Callback for the alert that contains the resume data of a specific download.
-        This resume data will be written to a file on disk.
+        This resume data will be written to the resume store of the download manager.
         """
         self._logger.debug(f'On save resume data alert: {alert}')
         if self.checkpoint_disabled:
@@ -286,15 +290,16 @@ class Download(TaskManager):
             'url': self.tdef.get_url()
         } if isinstance(self.tdef, TorrentDefNoMetainfo) else self.tdef.get_metainfo()
 
-        self.config.set_metainfo(metainfo)
         self.config.set_engineresumedata(resume_data)
 
-        # Save it to file
-        basename = hexlify(resume_data[b'info-hash']) + '.conf'
-        filename = self.dlmgr.get_checkpoint_dir() / basename
+        # Save it to the resume store
         self.config.config['download_defaults']['name'] = self.tdef.get_name_as_unicode()  # store name (for debugging)
-        self.config.write(str(filename))
-        self._logger.debug('Saving download config to file %s', filename)
+        new = self.dlmgr.resume_store.save(resume_data[b'info-hash'], self.config.write_defaults(),
+                                           lt.bencode(resume_data), lt.bencode(metainfo))
+        if new:
+            # New downloads are written right away, so that they are not lost if Tribler stops before the next flush
+            self.dlmgr.register_anonymous_task('flush_resume_store', self.dlmgr.flush_resume_store)
+        self._logger.debug('Saving download config of %s to the resume store', hexlify(resume_data[b'info-hash']))
 
     def on_tracker_reply_alert(self, alert):
         self.tracker_status[alert.url] = [alert.num_peers, 'Working']
@@ -377,7 +382,51 @@ class Download(TaskManager):
         self._logger.debug("Removing %s", self.tdef.get_name())
         self.handle = None
 
+    def on_piece_finished_alert(self, alert):
+        future = self.piece_futures.pop(alert.piece_index, None)
+        if future and not future.done():
+            future.set_result(None)
+        self.update_piece_alerts()
+
+    def resolve_piece_futures(self):
+        """
+        Fire the futures of all pieces that we have. Pieces found during a hash check, for instance,
+        do not result in a piece_finished_alert.
+        """
+        for piece in [piece for piece in self.piece_futures if self.have_piece(piece)]:
+            future = self.piece_futures.pop(piece)
+            if not future.done():
+                future.set_result(None)
+        self.update_piece_alerts()
+
+    def wait_for_piece(self, piece):
+        """
+        Return a future that fires once the given piece has been downloaded.
+        The future is shared by all callers waiting for the same piece, so callers should not cancel it.
+        """
+        future = self.piece_futures.get(piece)
+        if future is None:
+            future = self.piece_futures[piece] = Future()
+            self.update_piece_alerts()
+        return future
+
+    def update_piece_alerts(self):
+        """
+        Libtorrent only generates piece_finished_alerts while we are subscribed to them. We subscribe while
+        we are waiting for pieces, or while we are streaming.
+        """
+        wanted = bool(self.piece_futures) or (self.stream is not None and self.stream.enabled)
+        if wanted == (self.piece_alerts_hops is not None) or not self.dlmgr:
+            return
+        if wanted:
+            self.piece_alerts_hops = self.config.get_hops()
+            self.dlmgr.subscribe_alerts(lt.alert.category_t.piece_progress_notification, self.piece_alerts_hops)
+        else:
+            self.dlmgr.unsubscribe_alerts(lt.alert.category_t.piece_progress_notification, self.piece_alerts_hops)
+            self.piece_alerts_hops = None
+
     def on_torrent_checked_alert(self, _):
+        self.resolve_piece_futures()
         if self.pause_after_next_hashcheck:
             self.pause_after_next_hashcheck = False
             self.handle.pause()
@@ -387,6 +436,7 @@ class Download(TaskManager):
 
     @check_handle()
     def on_torrent_finished_alert(self, _):
+        self.resolve_piece_futures()
         self.update_lt_status(self.handle.status())
         self.checkpoint()
         if self.get_state().get_total_transferred(DOWNLOAD) > 0 and self.stream is not None:
@@ -398,7 +448,10 @@ class Download(TaskManager):
     def update_lt_status(self, lt_status):
         """ Update libtorrent stats and check if the download should be stopped."""
         self.lt_status = lt_status
+        self.state_version += 1
         self._stop_if_finished()
+        if self.dlmgr is not None:
+            self.dlmgr.update_download_state(self)
 
     def _stop_if_finished(self):
         state = self.get_state()
@@ -449,9 +502,13 @@ class Download(TaskManager):
 
     def get_state(self):
         """ Returns a snapshot of the current state of the download
+        The snapshot is only created again after the libtorrent status or the error changes.
         @return DownloadState
         """
-        return DownloadState(self, self.lt_status, self.error)
+        state = self.state
+        if not state or state.lt_status is not self.lt_status or state.error is not self.error:
+            state = self.state = DownloadState(self, self.lt_status, self.error)
+        return state
 
     @task
     async def save_resume_data(self, timeout=10):
@@ -601,6 +658,10 @@ class Download(TaskManager):
             for future, _, _ in futures:
                 future.cancel()
         self.futures.clear()
+        for future in self.piece_futures.values():
+            future.cancel()
+        self.piece_futures.clear()
+        self.update_piece_alerts()
         await self.shutdown_task_manager()
 
     def stop(self, user_stopped=None):
@@ -622,6 +683,9 @@ class Download(TaskManager):
         if self.handle and self.handle.is_valid():
             self.handle.set_upload_mode(self.get_upload_mode())
             self.handle.resume()
+        elif self.lazy:
+            # The download is resumed once it has been added to libtorrent
+            self.get_handle()
 
     def get_content_dest(self):
         """ Returns the file to which the downloaded content is saved. """
@@ -642,9 +706,7 @@ class Download(TaskManager):
         if not self.handle or not self.handle.is_valid():
             # Libtorrent hasn't received or initialized this download yet
             # 1. Check if we have data for this infohash already (don't overwrite it if we do!)
-            basename = hexlify(self.tdef.get_infohash()) + '.conf'
-            filename = Path(self.dlmgr.get_checkpoint_dir() / basename)
-            if not filename.is_file():
+            if self.tdef.get_infohash() not in self.dlmgr.resume_store:
                 # 2. If there is no saved data for this infohash, checkpoint it without data so we do not
                 #    lose it when we crash or restart before the download becomes known.
                 resume_data = self.config.get_engineresumedata() or {
@@ -654,7 +716,7 @@ class Download(TaskManager):
                 }
                 self.post_alert('save_resume_data_alert', dict(resume_data=resume_data))
             else:
-                self._logger.warning("Either file does not exist or is not file")
+                self._logger.debug("Not overwriting the stored checkpoint of an unknown download")
             return succeed(None)
         return self.save_resume_data()
 
@@ -730,6 +792,10 @@ class Download(TaskManager):
     def set_piece_priorities(self, piece_priorities):
         self.handle.prioritize_pieces(piece_priorities)
 
+    @check_handle(False)
+    def have_piece(self, piece):
+        return self.handle.have_piece(piece)
+
     @check_handle([])
     def get_piece_priorities(self):
         return self.handle.piece_priorities()
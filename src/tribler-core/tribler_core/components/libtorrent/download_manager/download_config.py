@@ -41,6 +41,24 @@ class DownloadConfig:
         return DownloadConfig(ConfigObj(infile=Path.fix_win_long_file(config_path), file_error=True,
                                         configspec=str(CONFIG_SPEC_PATH), default_encoding='utf-8'))
 
+    @staticmethod
+    def load_defaults(defaults, engineresumedata):
+        """
+        Load a config from a checkpoint in the resume store.
+        :param defaults: The download_defaults section, as returned by write_defaults.
+        :param engineresumedata: The bencoded libtorrent resume data.
+        """
+        config = DownloadConfig(ConfigObj(defaults.decode('utf-8').splitlines(), configspec=str(CONFIG_SPEC_PATH),
+                                          default_encoding='utf-8'))
+        config.config['state']['engineresumedata'] = base64.b64encode(engineresumedata).decode('utf-8')
+        return config
+
+    def write_defaults(self):
+        """
+        Returns the download_defaults section of this config as bytes. The state is stored separately.
+        """
+        return '\n'.join(ConfigObj({'download_defaults': self.config['download_defaults']}).write()).encode('utf-8')
+
     def copy(self):
         return DownloadConfig(ConfigObj(self.config, configspec=str(CONFIG_SPEC_PATH), default_encoding='utf-8'),
                               state_dir=self.state_dir)
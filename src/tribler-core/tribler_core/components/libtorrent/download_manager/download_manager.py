@@ -7,11 +7,13 @@ import asyncio
 import logging
 import os
 import time as timemod
-from asyncio import CancelledError, gather, iscoroutine, shield, sleep, wait_for
+from asyncio import CancelledError, as_completed, gather, iscoroutine, shield, wait_for
 from binascii import unhexlify
+from collections import Counter, defaultdict, deque
 from copy import deepcopy
+from functools import partial
 from shutil import rmtree
-from typing import List, Optional
+from typing import Callable, List, Optional
 
 from ipv8.taskmanager import TaskManager, task
 
@@ -22,6 +24,12 @@ from tribler_common.utilities import uri_to_path
 from tribler_core.components.libtorrent.download_manager.dht_health_manager import DHTHealthManager
 from tribler_core.components.libtorrent.download_manager.download import Download
 from tribler_core.components.libtorrent.download_manager.download_config import DownloadConfig
+from tribler_core.components.libtorrent.download_manager.metainfo_cache import MetainfoCache
+from tribler_core.components.libtorrent.download_manager.metainfo_request_queue import (
+    METAINFO_PRIORITY_USER,
+    MetainfoRequestQueue,
+)
+from tribler_core.components.libtorrent.download_manager.resume_store import ResumeStore
 from tribler_core.components.libtorrent.settings import DownloadDefaultsSettings, LibtorrentSettings
 from tribler_core.components.libtorrent.torrentdef import TorrentDef, TorrentDefNoMetainfo
 from tribler_core.components.libtorrent.utils import torrent_utils
@@ -36,7 +44,30 @@ from tribler_core.version import version_id
 SOCKS5_PROXY_DEF = 2
 
 LTSTATE_FILENAME = "lt.state"
+RESUME_STORE_FILENAME = "resume.db"
+# The interval (in seconds) at which buffered checkpoints are written to the resume store, and at which it is compacted
+RESUME_STORE_FLUSH_INTERVAL = 10
+RESUME_STORE_COMPACT_INTERVAL = 60 * 60
+# The directory (inside the checkpoint directory) to which the checkpoint files of previous versions are moved once
+# they are in the resume store, so that a previous version of Tribler can still load them
+CHECKPOINT_BACKUP_DIRNAME = "backup"
 METAINFO_CACHE_PERIOD = 5 * 60
+# The maximum size (in bytes) of the bencoded metainfo that is cached in memory, and of the gzipped metainfo that is
+# spilled to the metainfo cache directory once it is evicted from memory
+METAINFO_CACHE_SIZE = 32 * 1024 * 1024
+METAINFO_SPILL_SIZE = 256 * 1024 * 1024
+# The time (in seconds) after which metainfo that was spilled by a previous session is removed
+METAINFO_SPILL_PERIOD = 30 * 24 * 60 * 60
+METAINFO_CACHE_DIRNAME = "metainfo_cache"
+# The maximum number of swarms that are joined for metainfo lookups at the same time
+MAX_METAINFO_REQUESTS = 25
+# The maximum time (in seconds) spent on processing alerts before yielding to the event loop
+ALERT_PROCESSING_TIME_SLICE = 0.05
+# The number of checkpoints that are read by a worker thread in one go, and started before yielding to the event loop
+CHECKPOINT_BATCH_SIZE = 100
+# The maximum number of torrents that are being added to libtorrent at the same time. Adding more torrents at once
+# could overflow the alert queue of libtorrent, which drops the add_torrent_alerts we are waiting for.
+MAX_PENDING_TORRENT_ADDS = 100
 DEFAULT_DHT_ROUTERS = [
     ("dht.libtorrent.org", 25401),
     ("router.bittorrent.com", 6881),
@@ -93,24 +124,50 @@ class DownloadManager(TaskManager):
         self.set_download_rate_limit(0)
 
         self.downloads = {}
+        self.resume_store = None
 
         self.metadata_tmpdir = None
         # Dictionary that maps infohashes to download instances. These include only downloads that have
         # been made specifically for fetching metainfo, and will be removed afterwards.
         self.metainfo_requests = {}
-        self.metainfo_cache = {}  # Dictionary that maps infohashes to cached metainfo items
+        spill_dir = self.state_dir / METAINFO_CACHE_DIRNAME if self.state_dir else None
+        self.metainfo_cache = MetainfoCache(METAINFO_CACHE_SIZE, METAINFO_CACHE_PERIOD, spill_dir=spill_dir,
+                                            max_spill_size=METAINFO_SPILL_SIZE, max_spill_age=METAINFO_SPILL_PERIOD)
+        self.metainfo_queue = MetainfoRequestQueue(MAX_METAINFO_REQUESTS)
 
         self.default_alert_mask = lt.alert.category_t.error_notification | lt.alert.category_t.status_notification | \
                                   lt.alert.category_t.storage_notification | lt.alert.category_t.performance_warning | \
                                   lt.alert.category_t.tracker_notification | lt.alert.category_t.debug_notification
+        # Alert categories that are only generated while they are subscribed to (such as piece progress and DHT
+        # log alerts), as a map from hops to a counter of subscriptions per alert category
+        self.alert_subscriptions = defaultdict(Counter)
+        # Map from alert type to the method that handles the alerts of that type for the entire session
+        self.alert_handlers = {'state_update_alert': self.on_state_update_alert,
+                               'torrent_removed_alert': self.on_torrent_removed_alert,
+                               'listen_succeeded_alert': self.on_listen_succeeded_alert,
+                               'peer_disconnected_alert': self.on_peer_disconnected_alert,
+                               'session_stats_alert': self.on_session_stats_alert,
+                               'dht_pkt_alert': self.on_dht_pkt_alert}
+        # Map from torrent handle to infohash, so we don't have to convert the infohash of every alert
+        self.handle_infohashes = {}
+        # Alerts that have been popped from the libtorrent sessions but not processed yet, as a map from hops to deque
+        self.pending_alerts = {}
         self.session_stats_callback = None
         self.state_cb_count = 0
+        # Callbacks that are invoked with (download, status) when a download is added, removed (status None), or
+        # changes its status or hop count. The last published (status, hops) tuple of every download is kept in
+        # published_states, so that the listeners are only invoked for actual changes.
+        self.download_state_listeners: List[Callable] = []
+        self.published_states = {}
+
+        self._alert_notify_loop = None
+        self._alert_notify_scheduled = False
+        self._torrent_add_semaphore = None
 
         # Status of libtorrent session to indicate if it can safely close and no pending writes to disk exists.
         self.lt_session_shutdown_ready = {}
         self._dht_ready_task = None
         self.dht_readiness_timeout = self.config.dht_readiness_timeout if not self.dummy_mode else 0
-        self._last_states_list = []
 
     @property
     def libtorrent_port(self):
@@ -128,6 +185,7 @@ class DownloadManager(TaskManager):
     def initialize(self):
         # Create the checkpoints directory
         (self.state_dir / STATEDIR_CHECKPOINT_DIR).mkdir(exist_ok=True)
+        self.resume_store = ResumeStore(self.get_checkpoint_dir() / RESUME_STORE_FILENAME)
 
         # Start upnp
         if self.config.upnp:
@@ -135,9 +193,12 @@ class DownloadManager(TaskManager):
 
         if has_bep33_support() and self.download_defaults.number_hops <= len(self.socks_listen_ports or []):
             # Also listen to DHT log notifications - we need the dht_pkt_alert and extract the BEP33 bloom filters
-            dht_health_session = self.get_session(self.download_defaults.number_hops)
-            dht_health_session.set_alert_mask(self.default_alert_mask | lt.alert.category_t.dht_log_notification)
-            self.dht_health_manager = DHTHealthManager(dht_health_session)
+            hops = self.download_defaults.number_hops
+            dht_log = lt.alert.category_t.dht_log_notification
+            self.dht_health_manager = DHTHealthManager(
+                self.get_session(hops),
+                subscribe_alerts=partial(self.subscribe_alerts, dht_log, hops),
+                unsubscribe_alerts=partial(self.unsubscribe_alerts, dht_log, hops))
 
         # Make temporary directory for metadata collecting through DHT
         self.metadata_tmpdir = self.metadata_tmpdir or Path.mkdtemp(suffix='tribler_metainfo_tmpdir')
@@ -147,10 +208,24 @@ class DownloadManager(TaskManager):
         if self.dht_readiness_timeout > 0 and self.config.dht:
             self._dht_ready_task = self.register_task("check_dht_ready", self._check_dht_ready)
         self.register_task("request_torrent_updates", self._request_torrent_updates, interval=1)
+        if self.metainfo_cache.spill_dir:
+            self.register_task('load_metainfo_cache', self.metainfo_cache.load_spilled)
         self.register_task('task_cleanup_metacache', self._task_cleanup_metainfo_cache, interval=60, delay=0)
+        self.register_task('flush_resume_store', self.flush_resume_store, interval=RESUME_STORE_FLUSH_INTERVAL)
+        self.register_task('compact_resume_store', self.compact_resume_store,
+                           interval=RESUME_STORE_COMPACT_INTERVAL, delay=0)
 
         self.set_download_states_callback(self.sesscb_states_callback)
 
+    async def flush_resume_store(self):
+        """
+        Write the buffered checkpoints to the resume store without blocking the event loop.
+        """
+        await asyncio.get_event_loop().run_in_executor(None, self.resume_store.flush)
+
+    async def compact_resume_store(self):
+        await asyncio.get_event_loop().run_in_executor(None, self.resume_store.compact)
+
     def notify_shutdown_state(self, state):
         self.notifier.notify(NTFY.TRIBLER_SHUTDOWN_STATE.value, state)
 
@@ -172,6 +247,11 @@ class DownloadManager(TaskManager):
             await asyncio.sleep(1)
 
         await self.shutdown_task_manager()
+        await self.metainfo_cache.shutdown()
+
+        if self.resume_store:
+            self.resume_store.close()
+            self.resume_store = None
 
         if self.dht_health_manager:
             await self.dht_health_manager.shutdown_task_manager()
@@ -184,7 +264,11 @@ class DownloadManager(TaskManager):
         if self.has_session() and self.config.upnp:
             self.get_session().stop_upnp()
 
+        # Popped alerts are no longer valid once their session is gone
+        self.pending_alerts.clear()
         for ltsession in self.ltsessions.values():
+            if self._alert_notify_loop and hasattr(ltsession, 'set_alert_notify'):
+                ltsession.set_alert_notify(lambda: None)
             del ltsession
         self.ltsessions = None
 
@@ -253,7 +337,13 @@ class DownloadManager(TaskManager):
             self.update_ip_filter(ltsession, ['1.1.1.1'])
 
         self.set_session_settings(ltsession, settings)
-        ltsession.set_alert_mask(self.default_alert_mask)
+        ltsession.set_alert_mask(self.get_alert_mask(hops))
+
+        # Process the alerts as soon as libtorrent posts them, rather than on the next run of process_alerts.
+        # Among others, this wakes up streams waiting for a piece the moment the piece is downloaded.
+        if not self.dummy_mode and hasattr(ltsession, 'set_alert_notify'):
+            self._alert_notify_loop = asyncio.get_event_loop()
+            ltsession.set_alert_notify(self._on_alert_notify)
 
         if hops == 0:
             proxy_settings = DownloadManager.get_libtorrent_proxy_settings(self.config)
@@ -354,21 +444,66 @@ class DownloadManager(TaskManager):
         libtorrent_rate = self.get_session(hops).download_rate_limit()
         return 0 if libtorrent_rate == -1 else (-1 if libtorrent_rate == 1 else libtorrent_rate / 1024)
 
+    def get_alert_mask(self, hops=0):
+        """
+        Return the alert mask for the session with the given number of hops: the default alert categories,
+        and the categories that are subscribed to.
+        """
+        alert_mask = self.default_alert_mask
+        for category, subscriptions in self.alert_subscriptions[hops].items():
+            if subscriptions > 0:
+                alert_mask |= category
+        return alert_mask
+
+    def subscribe_alerts(self, category, hops=0):
+        """
+        Let the session with the given number of hops generate the alerts of the given category, until
+        unsubscribe_alerts is called as often as this method.
+        """
+        subscriptions = self.alert_subscriptions[hops]
+        subscriptions[category] += 1
+        if subscriptions[category] == 1:
+            self.update_alert_mask(hops)
+
+    def unsubscribe_alerts(self, category, hops=0):
+        subscriptions = self.alert_subscriptions[hops]
+        if subscriptions[category] <= 0:
+            return
+        subscriptions[category] -= 1
+        if subscriptions[category] == 0:
+            self.update_alert_mask(hops)
+
+    def update_alert_mask(self, hops=0):
+        ltsession = self.ltsessions.get(hops) if self.ltsessions else None
+        if ltsession:
+            ltsession.set_alert_mask(self.get_alert_mask(hops))
+
+    def get_alert_infohash(self, alert):
+        """
+        Return the infohash of the torrent that an alert is about, or an empty string if there is none.
+        The infohashes of the torrent handles are cached.
+        """
+        handle = getattr(alert, 'handle', None)
+        if handle is not None:
+            infohash = self.handle_infohashes.get(handle)
+            if infohash is not None:
+                return infohash
+            if handle.is_valid():
+                if len(self.handle_infohashes) > 2 * len(self.downloads) + 100:
+                    # Handles of torrents that were removed without a torrent_removed_alert
+                    self.handle_infohashes.clear()
+                infohash = self.handle_infohashes[handle] = unhexlify(str(handle.info_hash()))
+                return infohash
+        return unhexlify(str(getattr(alert, 'info_hash', '')))
+
     def process_alert(self, alert, hops=0):
         alert_type = alert.__class__.__name__
+        infohash = self.get_alert_infohash(alert)
+
+        handler = self.alert_handlers.get(alert_type)
+        if handler:
+            handler(alert, hops)
 
-        # Periodically, libtorrent will send us a state_update_alert, which contains the torrent status of
-        # all torrents changed since the last time we received this alert.
-        if alert_type == 'state_update_alert':
-            for status in alert.status:
-                infohash = unhexlify(str(status.info_hash))
-                if infohash not in self.downloads:
-                    self._logger.debug("Got state_update for unknown torrent %s", hexlify(infohash))
-                    continue
-                self.downloads[infohash].update_lt_status(status)
-
-        infohash = unhexlify(str(alert.handle.info_hash() if hasattr(alert, 'handle') and alert.handle.is_valid()
-                                 else getattr(alert, 'info_hash', '')))
         download = self.downloads.get(infohash)
         if download:
             is_process_alert = (download.handle and download.handle.is_valid()) \
@@ -381,45 +516,43 @@ class DownloadManager(TaskManager):
         elif infohash:
             self._logger.debug("Got alert for unknown download %s: %s", hexlify(infohash), alert)
 
-        if alert_type == 'listen_succeeded_alert':
-            # The ``port`` attribute was added in libtorrent 1.1.14.
-            # Older versions (most notably libtorrent 1.1.13 - the default  on Ubuntu 20.04) do not have this attribute.
-            # We use the now-deprecated ``endpoint`` attribute for these older versions.
-            self.listen_ports[hops] = getattr(alert, "port", alert.endpoint[1])
-
-        elif alert_type == 'peer_disconnected_alert' and self.notifier:
+    def on_state_update_alert(self, alert, _):
+        # Periodically, libtorrent will send us a state_update_alert, which contains the torrent status of
+        # all torrents changed since the last time we received this alert.
+        for status in alert.status:
+            infohash = unhexlify(str(status.info_hash))
+            if infohash not in self.downloads:
+                self._logger.debug("Got state_update for unknown torrent %s", hexlify(infohash))
+                continue
+            self.downloads[infohash].update_lt_status(status)
+
+    def on_torrent_removed_alert(self, alert, _):
+        self.handle_infohashes.pop(alert.handle, None)
+
+    def on_listen_succeeded_alert(self, alert, hops):
+        # The ``port`` attribute was added in libtorrent 1.1.14.
+        # Older versions (most notably libtorrent 1.1.13 - the default  on Ubuntu 20.04) do not have this attribute.
+        # We use the now-deprecated ``endpoint`` attribute for these older versions.
+        self.listen_ports[hops] = getattr(alert, "port", alert.endpoint[1])
+
+    def on_peer_disconnected_alert(self, alert, _):
+        if self.notifier:
             self.notifier.notify(NTFY.PEER_DISCONNECTED_EVENT.value, alert.pid.to_bytes())
 
-        elif alert_type == 'session_stats_alert':
-            queued_disk_jobs = alert.values['disk.queued_disk_jobs']
-            queued_write_bytes = alert.values['disk.queued_write_bytes']
-            num_write_jobs = alert.values['disk.num_write_jobs']
-
-            if queued_disk_jobs == queued_write_bytes == num_write_jobs == 0:
-                self.lt_session_shutdown_ready[hops] = True
-
-            if self.session_stats_callback:
-                self.session_stats_callback(alert)
+    def on_session_stats_alert(self, alert, hops):
+        queued_disk_jobs = alert.values['disk.queued_disk_jobs']
+        queued_write_bytes = alert.values['disk.queued_write_bytes']
+        num_write_jobs = alert.values['disk.num_write_jobs']
 
-        elif alert_type == "dht_pkt_alert":
-            # Unfortunately, the Python bindings don't have a direction attribute.
-            # So, we'll have to resort to using the string representation of the alert instead.
-            incoming = str(alert).startswith('<==')
-            decoded = bdecode_compat(alert.pkt_buf)
-            if not decoded:
-                return
+        if queued_disk_jobs == queued_write_bytes == num_write_jobs == 0:
+            self.lt_session_shutdown_ready[hops] = True
 
-            # We are sending a raw DHT message - notify the DHTHealthManager of the outstanding request.
-            if not incoming and decoded.get(b'y') == b'q' \
-                    and decoded.get(b'q') == b'get_peers' and decoded[b'a'].get(b'scrape') == 1:
-                self.dht_health_manager.requesting_bloomfilters(decoded[b't'],
-                                                                decoded[b'a'][b'info_hash'])
+        if self.session_stats_callback:
+            self.session_stats_callback(alert)
 
-            # We received a raw DHT message - decode it and check whether it is a BEP33 message.
-            if incoming and b'r' in decoded and b'BFsd' in decoded[b'r'] and b'BFpe' in decoded[b'r']:
-                self.dht_health_manager.received_bloomfilters(decoded[b't'],
-                                                              bytearray(decoded[b'r'][b'BFsd']),
-                                                              bytearray(decoded[b'r'][b'BFpe']))
+    def on_dht_pkt_alert(self, alert, _):
+        if self.dht_health_manager:
+            self.dht_health_manager.process_dht_pkt_alert(alert)
 
     def update_ip_filter(self, lt_session, ip_addresses):
         self._logger.debug('Updating IP filter %s', ip_addresses)
@@ -429,43 +562,68 @@ class DownloadManager(TaskManager):
             ip_filter.add_rule(ip, ip, 0)
         lt_session.set_ip_filter(ip_filter)
 
-    async def get_metainfo(self, infohash, timeout=30, hops=None, url=None):
+    async def get_metainfo(self, infohash, timeout=30, hops=None, url=None, priority=METAINFO_PRIORITY_USER):
         """
         Lookup metainfo for a given infohash. The mechanism works by joining the swarm for the infohash connecting
         to a few peers, and downloading the metadata for the torrent.
+        At most MAX_METAINFO_REQUESTS swarms are joined for metainfo lookups at the same time. Other lookups wait in
+        order of priority.
         :param infohash: The (binary) infohash to lookup metainfo for.
         :param timeout: A timeout in seconds.
         :param hops: the number of tunnel hops to use for this lookup. If None, use config default.
         :param url: Optional URL. Can contain trackers info, etc.
+        :param priority: One of the METAINFO_PRIORITY values, the lowest value goes first.
         :return: The metainfo
         """
         infohash_hex = hexlify(infohash)
-        if infohash in self.metainfo_cache:
+        metainfo = await self.metainfo_cache.get(infohash)
+        if metainfo:
             self._logger.info('Returning metainfo from cache for %s', infohash_hex)
-            return self.metainfo_cache[infohash]['meta_info']
+            return metainfo
+
+        start_time = timemod.time()
+        if infohash not in self.metainfo_requests and infohash not in self.downloads:
+            try:
+                await wait_for(self.metainfo_queue.acquire(infohash, priority), timeout)
+            except asyncio.TimeoutError:
+                self._logger.info('Metainfo request for %s timed out in the queue', infohash_hex)
+                self.metainfo_queue.add_latency(timemod.time() - start_time, False)
+                return None
+            timeout -= timemod.time() - start_time
 
         self._logger.info('Trying to fetch metainfo for %s', infohash_hex)
         if infohash in self.metainfo_requests:
+            # Join the lookup that is already running, instead of starting another one
             download = self.metainfo_requests[infohash][0]
             self.metainfo_requests[infohash][1] += 1
+            self.metainfo_cache.stats['joined_requests'] += 1
         elif infohash in self.downloads:
+            # The download was added while the request was waiting in the queue
+            self.metainfo_queue.release(infohash)
             download = self.downloads[infohash]
         else:
-            tdef = TorrentDefNoMetainfo(infohash, 'metainfo request', url=url)
-            dcfg = DownloadConfig()
-            dcfg.set_hops(hops or self.download_defaults.number_hops)
-            dcfg.set_upload_mode(True)  # Upload mode should prevent libtorrent from creating files
-            dcfg.set_dest_dir(self.metadata_tmpdir)
+            download = None
             try:
+                tdef = TorrentDefNoMetainfo(infohash, 'metainfo request', url=url)
+                dcfg = DownloadConfig()
+                dcfg.set_hops(hops or self.download_defaults.number_hops)
+                dcfg.set_upload_mode(True)  # Upload mode should prevent libtorrent from creating files
+                dcfg.set_dest_dir(self.metadata_tmpdir)
                 download = self.start_download(tdef=tdef, config=dcfg, hidden=True, checkpoint_disabled=True)
             except TypeError:
-                return
+                return None
+            finally:
+                # Free the slot if the lookup could not be started
+                if download is None:
+                    self.metainfo_queue.release(infohash)
             self.metainfo_requests[infohash] = [download, 1]
 
         try:
             metainfo = download.tdef.get_metainfo() or await wait_for(shield(download.future_metainfo), timeout)
             self._logger.info('Successfully retrieved metainfo for %s', infohash_hex)
-            self.metainfo_cache[infohash] = {'time': timemod.time(), 'meta_info': metainfo}
+            # Requests that joined a lookup get the same metainfo, which only has to be cached once
+            if infohash not in self.metainfo_cache:
+                self.metainfo_cache.put(infohash, metainfo)
         except (CancelledError, asyncio.TimeoutError):
             metainfo = None
             self._logger.info('Failed to retrieve metainfo for %s', infohash_hex)
@@ -473,29 +631,70 @@ class DownloadManager(TaskManager):
         if infohash in self.metainfo_requests:
             self.metainfo_requests[infohash][1] -= 1
             if self.metainfo_requests[infohash][1] <= 0:
-                await self.remove_download(download, remove_content=True)
-                self.metainfo_requests.pop(infohash, None)
+                try:
+                    await self.remove_download(download, remove_content=True)
+                finally:
+                    self.metainfo_requests.pop(infohash, None)
+                    self.metainfo_queue.release(infohash)
+
+        self.metainfo_queue.add_latency(timemod.time() - start_time, metainfo is not None)
 
         return metainfo
 
     def _task_cleanup_metainfo_cache(self):
-        oldest_time = timemod.time() - METAINFO_CACHE_PERIOD
-
-        for info_hash, cache_entry in list(self.metainfo_cache.items()):
-            last_time = cache_entry['time']
-            if last_time < oldest_time:
-                del self.metainfo_cache[info_hash]
+        self.metainfo_cache.expire()
+        self._logger.debug('Metainfo cache statistics: %s', self.metainfo_cache.get_stats())
 
     def _request_torrent_updates(self):
         for ltsession in self.ltsessions.values():
             if ltsession:
                 ltsession.post_torrent_updates(0xffffffff)
 
+    def _on_alert_notify(self):
+        """
+        Libtorrent calls this method from one of its own threads when alerts are waiting in an empty alert queue.
+        """
+        if self._alert_notify_scheduled:
+            return
+        self._alert_notify_scheduled = True
+        try:
+            self._alert_notify_loop.call_soon_threadsafe(self._process_notified_alerts)
+        except RuntimeError:
+            # The event loop is closed
+            pass
+
+    def _process_notified_alerts(self):
+        self._alert_notify_scheduled = False
+        if self.ltsessions and not self._shutdown:
+            self._task_process_alerts()
+
     def _task_process_alerts(self):
+        """
+        Process the alerts of all libtorrent sessions. If this takes longer than ALERT_PROCESSING_TIME_SLICE,
+        we yield to the event loop and continue with the remaining alerts afterwards.
+        """
+        deadline = timemod.time() + ALERT_PROCESSING_TIME_SLICE
         for hops, ltsession in list(self.ltsessions.items()):
-            if ltsession:
-                for alert in ltsession.pop_alerts():
-                    self.process_alert(alert, hops=hops)
+            if not ltsession:
+                continue
+            while True:
+                pending = self.pending_alerts.get(hops)
+                if not pending:
+                    # Alerts are only valid until the next call to pop_alerts,
+                    # so we only pop new alerts once the previous ones have been processed.
+                    pending = self.pending_alerts[hops] = deque(ltsession.pop_alerts())
+                    if not pending:
+                        break
+                while pending:
+                    self.process_alert(pending.popleft(), hops=hops)
+                    if timemod.time() > deadline:
+                        self._schedule_alert_processing()
+                        return
+
+    def _schedule_alert_processing(self):
+        if not self._alert_notify_scheduled:
+            self._alert_notify_scheduled = True
+            asyncio.get_event_loop().call_soon(self._process_notified_alerts)
 
     def _map_call_on_ltsessions(self, hops, funcname, *args, **kwargs):
         if hops is None:
@@ -512,8 +711,9 @@ class DownloadManager(TaskManager):
             name, infohash, _ = parse_magnetlink(uri)
             if infohash is None:
                 raise RuntimeError("Missing infohash")
-            if infohash in self.metainfo_cache:
-                tdef = TorrentDef.load_from_dict(self.metainfo_cache[infohash]['meta_info'])
+            metainfo = await self.metainfo_cache.get(infohash)
+            if metainfo:
+                tdef = TorrentDef.load_from_dict(metainfo)
             else:
                 tdef = TorrentDefNoMetainfo(infohash, "Unknown name" if name is None else name, url=uri)
             return self.start_download(tdef=tdef, config=config)
@@ -522,7 +722,12 @@ class DownloadManager(TaskManager):
             return self.start_download(torrent_file=argument, config=config)
         raise Exception("invalid uri")
 
-    def start_download(self, torrent_file=None, tdef=None, config=None, checkpoint_disabled=False, hidden=False):
+    def start_download(self, torrent_file=None, tdef=None, config=None, checkpoint_disabled=False, hidden=False,
+                       lazy=False):
+        """
+        Start a download. If lazy is set, the torrent is only added to libtorrent once the handle of the download
+        is needed, for instance when the download is resumed.
+        """
         self._logger.debug("Starting download: filename: %s, torrent def: %s", torrent_file, tdef)
 
         # the priority of the parameters is: (1) tdef, (2) torrent_file.
@@ -566,13 +771,15 @@ class DownloadManager(TaskManager):
                             state_dir=self.state_dir,
                             download_manager=self,
                             dummy=self.dummy_mode)
-        atp = download.get_atp()
         # Keep metainfo downloads in self.downloads for now because we will need to remove it later,
         # and removing the download at this point will stop us from receiving any further alerts.
         if infohash not in self.metainfo_requests or self.metainfo_requests[infohash][0] == download:
             self.downloads[infohash] = download
-        if not self.dummy_mode:
-            self.start_handle(download, atp)
+            self.update_download_state(download)
+        if lazy and not self.dummy_mode:
+            download.lazy = True
+        elif not self.dummy_mode:
+            self.start_handle(download, download.get_atp())
         return download
 
     @task
@@ -595,9 +802,8 @@ class DownloadManager(TaskManager):
             await self.remove_download(metainfo_dl, remove_content=True, remove_checkpoint=False)
             self.downloads[infohash] = download
 
-        known = {unhexlify(str(h.info_hash())): h for h in ltsession.get_torrents()}
-        existing_handle = known.get(infohash)
-        if existing_handle:
+        existing_handle = ltsession.find_torrent(lt.sha1_hash(infohash))
+        if existing_handle.is_valid():
             # Reuse existing handle
             self._logger.debug("Reusing handle %s", hexlify(infohash))
             download.post_alert('add_torrent_alert', dict(handle=existing_handle))
@@ -616,7 +822,11 @@ class DownloadManager(TaskManager):
                     await wait_for(shield(self._dht_ready_task), timeout=self.dht_readiness_timeout)
                 except asyncio.TimeoutError:
                     self._logger.warning("Timeout waiting for libtorrent DHT getting enough peers")
-            ltsession.async_add_torrent(encode_atp(atp))
+            if self._torrent_add_semaphore is None:
+                self._torrent_add_semaphore = asyncio.Semaphore(MAX_PENDING_TORRENT_ADDS)
+            async with self._torrent_add_semaphore:
+                ltsession.async_add_torrent(encode_atp(atp))
+                return await download.future_added
         return await download.future_added
 
     def get_libtorrent_version(self):
@@ -670,6 +880,10 @@ class DownloadManager(TaskManager):
 
     async def remove_download(self, download, remove_content=False, remove_checkpoint=True):
         infohash = download.get_def().get_infohash()
+        if download.lazy and remove_content and download.get_def().get_metainfo():
+            # Libtorrent never got to know this download. We add it, so that libtorrent removes its content
+            # according to its own view on the files (which takes sanitized and renamed files into account).
+            await download.get_handle()
         handle = download.handle
 
         # Note that the following block of code needs to be able to deal with multiple simultaneous
@@ -691,11 +905,46 @@ class DownloadManager(TaskManager):
 
         if infohash in self.downloads and self.downloads[infohash] == download:
             self.downloads.pop(infohash)
+            self.publish_download_state(download, None)
             if remove_checkpoint:
                 self.remove_config(infohash)
         else:
             self._logger.debug("Cannot remove unknown download")
 
+    def add_download_state_listener(self, callback):
+        self.download_state_listeners.append(callback)
+
+    def remove_download_state_listener(self, callback):
+        if callback in self.download_state_listeners:
+            self.download_state_listeners.remove(callback)
+
+    def update_download_state(self, download):
+        """
+        Publish the status of a download to the download state listeners, if it changed. This is called whenever
+        libtorrent updates the status of the download.
+        """
+        infohash = download.get_def().get_infohash()
+        if self.downloads.get(infohash) is download:
+            self.publish_download_state(download, download.get_state().get_status())
+
+    def publish_download_state(self, download, status):
+        infohash = download.get_def().get_infohash()
+        if status is None:
+            if self.published_states.pop(infohash, None) is None:
+                return
+        else:
+            state = (status, download.config.get_hops())
+            if self.published_states.get(infohash) == state:
+                return
+            self.published_states[infohash] = state
+
+        for callback in list(self.download_state_listeners):
+            # An error in one of the listeners should not stop the others
+            try:
+                callback(download, status)
+            except Exception as e:  # pylint: disable=broad-except
+                self._logger.exception("Error in download state listener: %s", e)
+
     def get_download(self, infohash):
         return self.downloads.get(infohash, None)
 
@@ -809,42 +1058,126 @@ class DownloadManager(TaskManager):
                         self.notifier.notify(NTFY.TRIBLER_TORRENT_PEER_UPDATE.value,
                                              unhexlify(peer["id"]), infohash, peer["dtotal"])
 
-        if self.state_cb_count % 4 == 0:
-            self._last_states_list = states_list
+    async def load_checkpoints(self):
+        """
+        Load the checkpoints of all downloads from the resume store. Checkpoint files of previous versions are copied
+        into the resume store first, after which they are moved to a backup directory. The checkpoints are parsed in
+        batches by the threads of the default executor, and the downloads of a batch are started as soon as it has been
+        parsed.
+        """
+        loop = asyncio.get_event_loop()
+        filenames = list(self.get_checkpoint_dir().glob('*.conf'))
+        migrated = []
+        for batch_future in as_completed([loop.run_in_executor(None, self.read_checkpoints, batch)
+                                          for batch in self.split_checkpoints(filenames)]):
+            for filename, checkpoint in await batch_future:
+                # Checkpoint files that cannot be read are left alone
+                if checkpoint:
+                    self.migrate_checkpoint(*checkpoint)
+                    migrated.append(filename)
+        # The checkpoint files are only moved once their checkpoints have been written to the resume store
+        await loop.run_in_executor(None, self.resume_store.flush)
+        if migrated:
+            await loop.run_in_executor(None, self.backup_checkpoints, migrated)
+
+        rows = await loop.run_in_executor(None, self.resume_store.get_checkpoints)
+        for batch_future in as_completed([loop.run_in_executor(None, self.parse_checkpoints, batch)
+                                          for batch in self.split_checkpoints(rows)]):
+            for checkpoint in await batch_future:
+                if checkpoint:
+                    self.resume_checkpoint(*checkpoint)
 
-    def get_last_download_states(self):
-        return self._last_states_list
+    @staticmethod
+    def split_checkpoints(checkpoints):
+        return [checkpoints[index:index + CHECKPOINT_BATCH_SIZE]
+                for index in range(0, len(checkpoints), CHECKPOINT_BATCH_SIZE)]
 
-    async def load_checkpoints(self):
-        for filename in self.get_checkpoint_dir().glob('*.conf'):
-            self.load_checkpoint(filename)
-            await sleep(.01)
+    def backup_checkpoints(self, filenames):
+        """
+        Move checkpoint files of previous versions out of the way, without losing them on a downgrade.
+        """
+        backup_dir = self.get_checkpoint_dir() / CHECKPOINT_BACKUP_DIRNAME
+        backup_dir.mkdir(exist_ok=True)
+        for filename in filenames:
+            try:
+                os.replace(filename, backup_dir / filename.name)
+            except OSError as e:
+                self._logger.warning("Cannot move checkpoint %s to %s: %s", filename, backup_dir, e)
 
-    def load_checkpoint(self, filename):
+    def read_checkpoints(self, filenames):
+        return [(filename, self.read_checkpoint(filename)) for filename in filenames]
+
+    def parse_checkpoints(self, rows):
+        return [self.parse_checkpoint(*row) for row in rows]
+
+    def read_checkpoint(self, filename):
+        """
+        Read the download config and the torrent definition from a checkpoint file.
+        This method does not touch the state of the download manager, so it can be called from any thread.
+        :return: A (config, tdef) tuple, or None if the checkpoint could not be read.
+        """
         try:
             config = DownloadConfig.load(filename)
         except Exception:
             self._logger.exception("Could not open checkpoint file %s", filename)
-            return
+            return None
+
+        tdef = self.restore_tdef(config.get_metainfo(), filename)
+        return (config, tdef) if tdef else None
+
+    def parse_checkpoint(self, infohash, defaults, resume_data, metainfo):
+        """
+        Parse the download config and the torrent definition of a checkpoint in the resume store.
+        Like read_checkpoint, this method can be called from any thread.
+        :return: A (config, tdef) tuple, or None if the checkpoint could not be parsed.
+        """
+        try:
+            config = DownloadConfig.load_defaults(defaults, resume_data)
+        except Exception:
+            self._logger.exception("Could not parse checkpoint %s", hexlify(infohash))
+            return None
 
-        metainfo = config.get_metainfo()
+        tdef = self.restore_tdef(bdecode_compat(metainfo) if metainfo else None, hexlify(infohash))
+        return (config, tdef) if tdef else None
+
+    def restore_tdef(self, metainfo, checkpoint):
         if not metainfo:
-            self._logger.error("Could not resume checkpoint %s; metainfo not found", filename)
-            return
+            self._logger.error("Could not resume checkpoint %s; metainfo not found", checkpoint)
+            return None
         if not isinstance(metainfo, dict):
             self._logger.error("Could not resume checkpoint %s; metainfo is not dict %s %s",
-                               filename, type(metainfo), repr(metainfo))
-            return
+                               checkpoint, type(metainfo), repr(metainfo))
+            return None
 
         try:
             url = metainfo.get(b'url', None)
             url = url.decode('utf-8') if url else url
-            tdef = (TorrentDefNoMetainfo(metainfo[b'infohash'], metainfo[b'name'], url)
+            return (TorrentDefNoMetainfo(metainfo[b'infohash'], metainfo[b'name'], url)
                     if b'infohash' in metainfo else TorrentDef.load_from_dict(metainfo))
         except (KeyError, ValueError) as e:
             self._logger.exception("Could not restore tdef from metainfo dict: %s %s ", e, metainfo)
-            return
+            return None
+
+    def migrate_checkpoint(self, config, tdef):
+        """
+        Copy the checkpoint file of a previous version into the resume store.
+        """
+        self.resume_store.save(tdef.get_infohash(), config.write_defaults(), lt.bencode(config.get_engineresumedata()),
+                               lt.bencode(config.get_metainfo()))
 
+    def load_checkpoint(self, filename):
+        """
+        Start the download of a checkpoint file.
+        """
+        checkpoint = self.read_checkpoint(filename)
+        if checkpoint:
+            self.resume_checkpoint(*checkpoint)
+
+    def resume_checkpoint(self, config, tdef):
+        """
+        Start the download of a checkpoint. Downloads that are stopped by the user are only added to libtorrent
+        once they are needed.
+        """
         if config.get_bootstrap_download():
             # In case the download is marked as bootstrap, remove it if its infohash does not
             # match the configured bootstrap infohash
@@ -854,29 +1187,26 @@ class DownloadManager(TaskManager):
 
         config.state_dir = self.state_dir
         if config.get_dest_dir() == '':  # removed torrent ignoring
-            self._logger.info("Removing checkpoint %s destdir is %s", filename, config.get_dest_dir())
-            os.remove(filename)
+            self._logger.info("Removing checkpoint %s destdir is %s", hexlify(tdef.get_infohash()),
+                              config.get_dest_dir())
+            self.remove_config(tdef.get_infohash())
             return
 
         try:
             if self.download_exists(tdef.get_infohash()):
                 self._logger.info("Not resuming checkpoint because download has already been added")
             else:
-                self.start_download(tdef=tdef, config=config)
+                # Without resume data, stopped downloads are checked by libtorrent before they are paused again
+                lazy = config.get_user_stopped() and bool(config.get_engineresumedata())
+                self.start_download(tdef=tdef, config=config, lazy=lazy)
         except Exception:
             self._logger.exception("Not resume checkpoint due to exception while adding download")
 
     def remove_config(self, infohash):
         if infohash not in self.downloads:
-            try:
-                basename = hexlify(infohash) + '.conf'
-                filename = self.get_checkpoint_dir() / basename
-                self._logger.debug("Removing download checkpoint %s", filename)
-                if os.access(filename, os.F_OK):
-                    os.remove(filename)
-            except:
-                # Show must go on
-                self._logger.exception("Could not remove state")
+            self._logger.debug("Removing download checkpoint %s", hexlify(infohash))
+            if self.resume_store:
+                self.resume_store.remove(infohash)
         else:
             self._logger.warning("Download is back, restarted? Cancelling removal! %s", hexlify(infohash))
 
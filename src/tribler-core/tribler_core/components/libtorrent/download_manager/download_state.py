@@ -17,6 +17,8 @@ from tribler_common.simpledefs import (
     UPLOAD,
 )
 
+from tribler_core.components.libtorrent.download_manager.piece_bitmap import PieceBitmap
+
 # Map used to convert libtorrent -> Tribler download status
 DLSTATUS_MAP = [DLSTATUS_WAITING4HASHCHECK,
                 DLSTATUS_HASHCHECKING,
@@ -49,11 +51,24 @@ class DownloadState:
         self.download = download
         self.lt_status = lt_status
         self.error = error
+        self.pieces = None
+        self.resume_data = None
 
     def get_download(self):
         """ Returns the Download object of which this is the state """
         return self.download
 
+    def get_resume_data(self):
+        """ Returns the libtorrent resume data that is stored in the config of the download. The getters fall back
+        to the resume data when libtorrent has no status for the download, e.g. when a stopped download is not added
+        to libtorrent until it is resumed.
+        @return The resume data as a dictionary, which is empty if there is none.
+        """
+        if self.resume_data is None:
+            resume_data = self.download.config.get_engineresumedata()
+            self.resume_data = resume_data if isinstance(resume_data, dict) else {}
+        return self.resume_data
+
     def get_progress(self):
         """ The general progress of the Download as a percentage. When status is
          * DLSTATUS_HASHCHECKING it is the percentage of already downloaded
@@ -61,7 +76,10 @@ class DownloadState:
          * DLSTATUS_DOWNLOADING/SEEDING it is the percentage downloaded.
         @return Progress as a float (0..1).
         """
-        return self.lt_status.progress if self.lt_status else 0
+        if self.lt_status:
+            return self.lt_status.progress
+        pieces = self.get_pieces_complete()
+        return pieces.num_complete() / len(pieces) if pieces else 0
 
     def get_status(self):
         """ Returns the status of the torrent.
@@ -109,18 +127,21 @@ class DownloadState:
         @return The amount in bytes.
         """
         if not self.lt_status:
-            return 0
+            return self.get_resume_data().get(b'total_uploaded' if direct == UPLOAD else b'total_downloaded', 0)
         elif direct == UPLOAD:
             return self.lt_status.total_upload
         return self.lt_status.total_download
 
     def get_seeding_ratio(self):
-        if self.lt_status and self.lt_status.total_done > 0:
-            return self.lt_status.all_time_upload / float(self.lt_status.total_done)
-        return 0
+        if self.lt_status:
+            if self.lt_status.total_done > 0:
+                return self.lt_status.all_time_upload / float(self.lt_status.total_done)
+            return 0
+        total_done = self.get_progress() * self.download.get_def().get_length()
+        return self.get_resume_data().get(b'total_uploaded', 0) / total_done if total_done > 0 else 0
 
     def get_seeding_time(self):
-        return self.lt_status.finished_time if self.lt_status else 0
+        return self.lt_status.finished_time if self.lt_status else self.get_resume_data().get(b'finished_time', 0)
 
     def get_eta(self):
         """
@@ -144,19 +165,26 @@ class DownloadState:
         return seeds, total - seeds
 
     def get_pieces_complete(self):
-        """ Returns a list of booleans indicating whether we have completely
+        """ Returns a bitmap indicating whether we have completely
         received that piece of the content. The list of pieces for which
         we provide this info depends on which files were selected for download
         using DownloadConfig.set_selected_files().
-        @return A list of booleans
+        The bitmap is converted from the libtorrent status once, and shared by all users of this state.
+        @return A PieceBitmap
         """
-        return self.lt_status.pieces if self.lt_status else []
+        if self.pieces is None:
+            if self.lt_status:
+                self.pieces = PieceBitmap.from_pieces(self.lt_status.pieces)
+            else:
+                self.pieces = PieceBitmap.from_resume_data(self.get_resume_data().get(b'pieces', b''))
+        return self.pieces
 
     def get_pieces_total_complete(self):
         """ Returns the number of total and completed pieces
         @return A tuple containing two integers, total and completed nr of pieces
         """
-        return (len(self.lt_status.pieces), sum(self.lt_status.pieces)) if self.lt_status else (0, 0)
+        pieces = self.get_pieces_complete()
+        return len(pieces), pieces.num_complete()
 
     def get_files_completion(self):
         """ Returns a list of filename, progress tuples indicating the progress
@@ -189,8 +217,16 @@ class DownloadState:
         if not self.lt_status:
             return 0  # We do not have any info for this download so we cannot accurately get its availability
 
+        # Libtorrent counts the connected peers that have each piece, as long as we are not seeding
+        handle = self.download.handle
+        availability = handle.piece_availability() if handle and handle.is_valid() else []
+        if availability:
+            nr_complete = min(availability)
+            nr_more_than_min = len(availability) - availability.count(nr_complete)
+            return nr_complete + nr_more_than_min / len(availability)
+
         nr_seeders_complete = 0
-        merged_bitfields = [0] * len(self.lt_status.pieces)
+        merged_bitfields = [0] * len(self.get_pieces_complete())
 
         peers = self.get_peerlist()
         for peer in peers:
@@ -0,0 +1,242 @@
+import gzip
+import logging
+import time
+from asyncio import get_event_loop
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from ipv8.taskmanager import TaskManager
+
+from tribler_core.components.libtorrent.utils.libtorrent_helper import libtorrent as lt
+from tribler_core.utilities.unicode import hexlify
+from tribler_core.utilities.utilities import bdecode_compat
+
+SPILL_SUFFIX = '.torrent.gz'
+
+
+class MetainfoCache(TaskManager):
+    """
+    This class caches the metainfo of torrents that has been looked up, so repeated lookups do not join the swarm again.
+
+    The cache keeps the most recently used metainfo in memory, up to a total bencoded size. Metainfo that is evicted
+    from memory, because the cache is full or because it has not been used for a while, is spilled to gzipped
+    .torrent files in the spill directory, which is also bounded in size. The files in the spill directory are
+    compressed, written, read and removed by a worker thread, so the event loop does not wait for the disk.
+    """
+
+    def __init__(self, max_size, max_age, spill_dir=None, max_spill_size=0, max_spill_age=None):
+        """
+        Initialize the metainfo cache.
+        :param max_size: The maximum total size (in bytes) of the bencoded metainfo kept in memory.
+        :param max_age: The time (in seconds) after which unused metainfo is evicted from memory.
+        :param spill_dir: The directory to spill evicted metainfo to, or None to drop evicted metainfo.
+        :param max_spill_size: The maximum total size (in bytes) of the files in the spill directory.
+        :param max_spill_age: The time (in seconds) after which spilled files of previous sessions are removed, or None
+        to keep them.
+        """
+        super().__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.max_size = max_size
+        self.max_age = max_age
+        self.spill_dir = spill_dir
+        self.max_spill_size = max_spill_size
+        self.max_spill_age = max_spill_age
+
+        self.entries = OrderedDict()  # Map from infohash to (last use time, metainfo, size), least recently used first
+        self.size = 0
+        self.spilling = {}  # Map from infohash to the metainfo that is being written to the spill directory
+        self.spilled = OrderedDict()  # Map from infohash to the size of its spill file, oldest first
+        self.spill_size = 0
+        self.stats = Counter()
+
+        # A single thread does the file I/O, so the operations on a spill file happen in the order they are scheduled
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="MetainfoCache") if spill_dir else None
+
+    def run_io(self, func, *args):
+        return get_event_loop().run_in_executor(self.executor, func, *args)
+
+    async def load_spilled(self):
+        """
+        Find the metainfo that was spilled by previous sessions. Files that are older than max_spill_age, or that are
+        not named after an infohash, are removed, and so are the oldest files if the spill directory is too large.
+        """
+        files = await self.run_io(self.scan_spill_dir)
+        loaded = OrderedDict((infohash, size) for _, infohash, size in sorted(files)
+                             if infohash not in self.entries and infohash not in self.spilling
+                             and infohash not in self.spilled)
+        # The files that were spilled by this session, while we were scanning, are the most recent ones
+        loaded.update(self.spilled)
+        self.spilled = loaded
+        self.spill_size = sum(self.spilled.values())
+        self.trim_spilled()
+
+    def scan_spill_dir(self):
+        self.spill_dir.mkdir(exist_ok=True)
+        oldest_time = time.time() - self.max_spill_age if self.max_spill_age is not None else None
+        files = []
+        for path in self.spill_dir.glob('*' + SPILL_SUFFIX):
+            try:
+                stat = path.stat()
+                if oldest_time is None or stat.st_mtime >= oldest_time:
+                    files.append((stat.st_mtime, bytes.fromhex(path.name[:-len(SPILL_SUFFIX)]), stat.st_size))
+                    continue
+            except ValueError:
+                pass
+            except OSError:
+                continue
+            self.remove_spill_file(path)
+        return files
+
+    def __contains__(self, infohash):
+        return infohash in self.entries or infohash in self.spilling or infohash in self.spilled
+
+    def __len__(self):
+        return len(self.entries) + len(self.spilling) + len(self.spilled)
+
+    def get_spill_path(self, infohash):
+        return self.spill_dir / (hexlify(infohash) + SPILL_SUFFIX)
+
+    def remove_spilled(self, infohash):
+        self.spill_size -= self.spilled.pop(infohash)
+        self.run_io(self.remove_spill_file, self.get_spill_path(infohash))
+
+    def trim_spilled(self):
+        while self.spill_size > self.max_spill_size:
+            self.remove_spilled(next(iter(self.spilled)))
+
+    def remove_spill_file(self, path):
+        try:
+            path.unlink(missing_ok=True)
+        except OSError:
+            self._logger.exception("Could not remove spilled metainfo %s", path)
+
+    def read_spill_file(self, path):
+        try:
+            return gzip.decompress(path.read_bytes())
+        except (OSError, EOFError):
+            self._logger.exception("Could not read spilled metainfo %s", path)
+            return None
+
+    def write_spill_file(self, path, metainfo):
+        """
+        Write the metainfo to a spill file.
+        :return: The size of the spill file, or None if it was not written.
+        """
+        data = gzip.compress(lt.bencode(metainfo))
+        if len(data) > self.max_spill_size:
+            return None
+        try:
+            path.parent.mkdir(exist_ok=True)
+            path.write_bytes(data)
+        except OSError:
+            self._logger.exception("Could not spill metainfo %s", path)
+            return None
+        return len(data)
+
+    async def get(self, infohash):
+        """
+        Get the metainfo of a torrent, from memory or from the spill directory.
+        :return: The metainfo dictionary, or None if it is not cached.
+        """
+        entry = self.entries.get(infohash)
+        if entry:
+            self.entries[infohash] = (time.time(), entry[1], entry[2])
+            self.entries.move_to_end(infohash)
+            self.stats['hits'] += 1
+            return entry[1]
+
+        metainfo = self.spilling.get(infohash)
+        if metainfo is not None:
+            self.stats['hits'] += 1
+            self.put(infohash, metainfo)
+            return metainfo
+
+        if infohash in self.spilled:
+            read = self.run_io(self.read_spill_file, self.get_spill_path(infohash))
+            # The spill file is removed after it has been read
+            self.remove_spilled(infohash)
+            encoded = await read
+            metainfo = bdecode_compat(encoded) if encoded else None
+            if isinstance(metainfo, dict):
+                self.stats['spill_hits'] += 1
+                self.put(infohash, metainfo, encoded)
+                return metainfo
+
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, infohash, metainfo, encoded=None):
+        """
+        Add the metainfo of a torrent to the cache, and evict the least recently used metainfo if the cache is full.
+        :param encoded: The bencoded metainfo, if it is available already.
+        """
+        self.pop(infohash)
+        encoded = encoded or lt.bencode(metainfo)
+        self.entries[infohash] = (time.time(), metainfo, len(encoded))
+        self.size += len(encoded)
+        while self.size > self.max_size and len(self.entries) > 1:
+            self.evict(*self.entries.popitem(last=False))
+
+    def pop(self, infohash):
+        if infohash in self.entries:
+            self.size -= self.entries.pop(infohash)[2]
+        self.spilling.pop(infohash, None)
+        if infohash in self.spilled:
+            self.remove_spilled(infohash)
+
+    def evict(self, infohash, entry):
+        _, metainfo, size = entry
+        self.size -= size
+        self.stats['evictions'] += 1
+        if not self.spill_dir:
+            return
+        self.spilling[infohash] = metainfo
+        self.register_anonymous_task('spill_metainfo', self.spill, infohash, metainfo)
+
+    async def spill(self, infohash, metainfo):
+        """
+        Write evicted metainfo to the spill directory, unless it is used or removed in the meantime.
+        """
+        path = self.get_spill_path(infohash)
+        size = await self.run_io(self.write_spill_file, path, metainfo)
+        if self.spilling.get(infohash) is not metainfo:
+            # The metainfo was put back into memory, or removed, while it was being written
+            if size and infohash not in self.spilling and infohash not in self.spilled:
+                self.run_io(self.remove_spill_file, path)
+            return
+
+        del self.spilling[infohash]
+        if size:
+            self.spilled[infohash] = size
+            self.spill_size += size
+            self.trim_spilled()
+
+    def expire(self):
+        """
+        Evict the metainfo that has not been used for max_age seconds from memory.
+        """
+        oldest_time = time.time() - self.max_age
+        while self.entries:
+            last_used, _, _ = next(iter(self.entries.values()))
+            if last_used >= oldest_time:
+                break
+            self.evict(*self.entries.popitem(last=False))
+
+    def get_stats(self):
+        lookups = self.stats['hits'] + self.stats['spill_hits'] + self.stats['misses']
+        return {'entries': len(self.entries),
+                'size': self.size,
+                'spilled_entries': len(self.spilling) + len(self.spilled),
+                'spill_size': self.spill_size,
+                'hits': self.stats['hits'],
+                'spill_hits': self.stats['spill_hits'],
+                'misses': self.stats['misses'],
+                'joined_requests': self.stats['joined_requests'],
+                'evictions': self.stats['evictions'],
+                'hit_rate': (self.stats['hits'] + self.stats['spill_hits']) / lookups if lookups else 0}
+
+    async def shutdown(self):
+        await self.shutdown_task_manager()
+        if self.executor:
+            # Let the pending file operations finish, without blocking the event loop
+            await get_event_loop().run_in_executor(None, self.executor.shutdown)
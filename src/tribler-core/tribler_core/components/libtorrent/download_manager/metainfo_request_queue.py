@@ -0,0 +1,103 @@
+import heapq
+import itertools
+from asyncio import Future, shield
+from collections import deque
+
+# The number of recent requests of which the latency is kept
+LATENCY_HISTORY_SIZE = 1000
+# The priorities of metainfo lookups: lookups requested by the user go first, and background lookups go last
+METAINFO_PRIORITY_USER = 0
+METAINFO_PRIORITY_CHANNEL = 1
+METAINFO_PRIORITY_BACKGROUND = 2
+
+
+class MetainfoRequestQueue:
+    """
+    This class limits the number of infohashes for which metainfo is looked up at the same time.
+
+    Every infohash that is looked up takes one slot, regardless of the number of requests for it. Requests for an
+    infohash that does not have a slot wait in a queue, and the waiting infohash with the highest priority (the lowest
+    number) gets the next free slot. Requests with an urgent priority, such as those of the user, get a slot right
+    away, even if that exceeds the maximum. The queue also keeps the latency of recent requests.
+    """
+
+    def __init__(self, max_active, urgent_priority=METAINFO_PRIORITY_USER):
+        """
+        Initialize the queue.
+        :param max_active: The maximum number of infohashes that have a slot, unless there are urgent requests.
+        :param urgent_priority: Requests with this priority, or a higher priority, never wait.
+        """
+        self.max_active = max_active
+        self.urgent_priority = urgent_priority
+        self.active = set()         # The infohashes that have a slot
+        # Map from infohash to [future, number of waiting requests, priority, whether a request got the slot]
+        self.waiting = {}
+        self.queue = []             # Heap of (priority, sequence number, infohash)
+        self.counter = itertools.count()
+        self.latencies = deque(maxlen=LATENCY_HISTORY_SIZE)
+        self.completed = 0
+        self.failed = 0
+
+    async def acquire(self, infohash, priority):
+        """
+        Wait until the infohash has a slot.
+        """
+        if infohash in self.active:
+            return
+        if len(self.active) < self.max_active or priority <= self.urgent_priority:
+            self.grant(infohash)
+            return
+
+        if infohash not in self.waiting:
+            self.waiting[infohash] = [Future(), 0, priority, False]
+            heapq.heappush(self.queue, (priority, next(self.counter), infohash))
+        waiting = self.waiting[infohash]
+        if priority < waiting[2]:
+            # The old entry in the queue is skipped once it is popped
+            waiting[2] = priority
+            heapq.heappush(self.queue, (priority, next(self.counter), infohash))
+        waiting[1] += 1
+        try:
+            await shield(waiting[0])
+            waiting[3] = True
+        finally:
+            waiting[1] -= 1
+            if not waiting[1] and not waiting[3]:
+                if waiting[0].done():
+                    # All requests were cancelled after the infohash got a slot
+                    self.release(infohash)
+                else:
+                    self.waiting.pop(infohash)
+
+    def grant(self, infohash):
+        self.active.add(infohash)
+        waiting = self.waiting.pop(infohash, None)
+        if waiting:
+            waiting[0].set_result(None)
+
+    def release(self, infohash):
+        """
+        Free the slot of an infohash, and give it to the waiting infohash with the highest priority.
+        """
+        self.active.discard(infohash)
+        while self.queue and len(self.active) < self.max_active:
+            priority, _, next_infohash = heapq.heappop(self.queue)
+            waiting = self.waiting.get(next_infohash)
+            if waiting and waiting[2] == priority:
+                self.grant(next_infohash)
+
+    def add_latency(self, latency, success):
+        self.latencies.append(latency)
+        if success:
+            self.completed += 1
+        else:
+            self.failed += 1
+
+    def get_stats(self):
+        latencies = sorted(self.latencies)
+        return {'active': len(self.active),
+                'queued': len(self.waiting),
+                'completed': self.completed,
+                'failed': self.failed,
+                'latency_median': latencies[len(latencies) // 2] if latencies else 0,
+                'latency_95th_percentile': latencies[len(latencies) * 95 // 100] if latencies else 0}
@@ -0,0 +1,47 @@
+import base64
+
+# Translation tables from libtorrent piece values to 0/1, and from 0/1 to the ASCII digits used for packing
+_BOOL_TABLE = bytes([0] + [1] * 255)
+# Translation table from the piece flags in libtorrent resume data, of which the lowest bit is set if we have the piece
+_HAVE_TABLE = bytes(value & 1 for value in range(256))
+_DIGIT_TABLE = bytes([ord('0'), ord('1')] + [0] * 254)
+
+
+class PieceBitmap(bytes):
+    """
+    A compact bitmap of the pieces of a torrent that we have, with one byte (0 or 1) per piece.
+
+    Libtorrent returns piece bitmaps as Python lists of booleans, which are built again every time they are read.
+    A PieceBitmap is converted once and stores a byte per piece instead of a pointer per piece, and counting,
+    searching and packing the pieces runs in C.
+    """
+
+    @classmethod
+    def from_pieces(cls, pieces):
+        """
+        Create a bitmap from a sequence of booleans, such as torrent_status.pieces or peer_info.pieces.
+        """
+        return cls(bytes(pieces).translate(_BOOL_TABLE))
+
+    @classmethod
+    def from_resume_data(cls, pieces):
+        """
+        Create a bitmap from the pieces field of libtorrent resume data, which has a byte of flags per piece.
+        """
+        return cls(bytes(pieces).translate(_HAVE_TABLE))
+
+    def num_complete(self):
+        return self.count(1)
+
+    def all_complete(self):
+        return 0 not in self
+
+    def to_base64(self):
+        """
+        Pack the bitmap into bits, with the first piece in the most significant bit, and return it base64 encoded.
+        """
+        if not self:
+            return b''
+        num_bytes = (len(self) + 7) // 8
+        bits = self.translate(_DIGIT_TABLE).ljust(num_bytes * 8, b'0')
+        return base64.b64encode(int(bits, 2).to_bytes(num_bytes, 'big'))
@@ -0,0 +1,144 @@
+import logging
+import sqlite3
+from hashlib import sha1
+from threading import Lock
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (infohash BLOB PRIMARY KEY, config BLOB NOT NULL, resume_data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS metainfo (infohash BLOB PRIMARY KEY, metainfo BLOB NOT NULL);
+"""
+
+# Larger pages take fewer writes per flush, as most checkpoints in a flush are rewritten at the same time
+PAGE_SIZE = 16 * 1024
+# The store is compacted if more than this fraction of the database pages is unused
+COMPACTION_FREE_FRACTION = 0.25
+
+
+class ResumeStore:
+    """
+    This class stores the checkpoints of all downloads in a single SQLite database.
+
+    A checkpoint consists of the download config, the libtorrent resume data and the metainfo of the torrent.
+    Checkpoints are buffered in memory and written to the database in a single transaction when the store is flushed.
+    The metainfo of a torrent rarely changes, so it is stored in a separate table and only written when it changes.
+
+    The store can be flushed and compacted from a worker thread, while checkpoints are saved on the event loop.
+    """
+
+    def __init__(self, db_path):
+        """
+        Open the resume store, and create its tables if they do not exist yet.
+        :param db_path: The path of the SQLite database file.
+        """
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.db_path = db_path
+        self.connection = sqlite3.connect(str(db_path), isolation_level=None, check_same_thread=False)
+        # The page size only applies to new databases
+        self.connection.execute(f"PRAGMA page_size = {PAGE_SIZE}")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.closed = False
+        self.db_lock = Lock()       # Held while the connection is used
+        self.pending_lock = Lock()  # Held while the buffered checkpoints are changed
+        self.pending = {}           # Map from infohash to the (config, resume_data) to write, or None to delete it
+        self.pending_metainfo = {}  # Map from infohash to the metainfo to write
+        self.metainfo_digests = {}  # Map from infohash to the digest of the stored metainfo
+        # The infohashes of all checkpoints, including the buffered ones, so that lookups do not touch the database
+        self.infohashes = {infohash for infohash, in self.connection.execute("SELECT infohash FROM checkpoints")}
+
+    def __contains__(self, infohash):
+        return infohash in self.infohashes
+
+    def save(self, infohash, config, resume_data, metainfo):
+        """
+        Buffer the checkpoint of a download until the next flush.
+        :param infohash: The binary infohash of the download.
+        :param config: The download config, as returned by DownloadConfig.write_defaults.
+        :param resume_data: The bencoded libtorrent resume data.
+        :param metainfo: The bencoded metainfo of the torrent.
+        :return: True if the store did not have a checkpoint of this download yet, False otherwise.
+        """
+        new = infohash not in self.infohashes
+        self.infohashes.add(infohash)
+        with self.pending_lock:
+            self.pending[infohash] = (config, resume_data)
+            digest = sha1(metainfo).digest()
+            if self.metainfo_digests.get(infohash) != digest:
+                self.metainfo_digests[infohash] = digest
+                self.pending_metainfo[infohash] = metainfo
+        return new
+
+    def remove(self, infohash):
+        self.infohashes.discard(infohash)
+        with self.pending_lock:
+            self.pending[infohash] = None
+            self.pending_metainfo.pop(infohash, None)
+            self.metainfo_digests.pop(infohash, None)
+
+    def flush(self):
+        """
+        Write all buffered checkpoints to the database in a single transaction.
+        """
+        with self.db_lock:
+            with self.pending_lock:
+                if self.closed or not self.pending and not self.pending_metainfo:
+                    return
+                pending, self.pending = self.pending, {}
+                pending_metainfo, self.pending_metainfo = self.pending_metainfo, {}
+
+            removed = [(infohash,) for infohash, checkpoint in pending.items() if checkpoint is None]
+            saved = [(infohash, *checkpoint) for infohash, checkpoint in pending.items() if checkpoint is not None]
+            try:
+                with self.connection:
+                    self.connection.execute("BEGIN")
+                    self.connection.executemany("DELETE FROM checkpoints WHERE infohash = ?", removed)
+                    self.connection.executemany("DELETE FROM metainfo WHERE infohash = ?", removed)
+                    self.connection.executemany("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)", saved)
+                    self.connection.executemany("INSERT OR REPLACE INTO metainfo VALUES (?, ?)",
+                                                pending_metainfo.items())
+            except sqlite3.Error:
+                # Buffer the checkpoints again, unless they were saved or removed again in the meantime
+                with self.pending_lock:
+                    self.pending = {**pending, **self.pending}
+                    self.pending_metainfo = {**pending_metainfo, **self.pending_metainfo}
+                raise
+        self._logger.debug("Flushed %d checkpoints and %d removals", len(saved), len(removed))
+
+    def get_checkpoints(self):
+        """
+        Get all stored checkpoints, including the buffered ones.
+        :return: A list of (infohash, config, resume_data, metainfo) tuples.
+        """
+        self.flush()
+        with self.db_lock:
+            checkpoints = self.connection.execute("SELECT checkpoints.infohash, config, resume_data, metainfo "
+                                                  "FROM checkpoints LEFT JOIN metainfo "
+                                                  "ON checkpoints.infohash = metainfo.infohash").fetchall()
+        with self.pending_lock:
+            for infohash, _, _, metainfo in checkpoints:
+                if metainfo is not None:
+                    self.metainfo_digests[infohash] = sha1(metainfo).digest()
+        return checkpoints
+
+    def compact(self):
+        """
+        Reclaim the space of removed checkpoints once a large part of the database is unused, and truncate the
+        write-ahead log.
+        """
+        self.flush()
+        with self.db_lock:
+            if self.closed:
+                return
+            page_count = self.connection.execute("PRAGMA page_count").fetchone()[0]
+            freelist_count = self.connection.execute("PRAGMA freelist_count").fetchone()[0]
+            if freelist_count > page_count * COMPACTION_FREE_FRACTION:
+                self._logger.info("Compacting resume store (%d of %d pages unused)", freelist_count, page_count)
+                self.connection.execute("VACUUM")
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        self.flush()
+        with self.db_lock:
+            self.connection.close()
+            self.closed = True
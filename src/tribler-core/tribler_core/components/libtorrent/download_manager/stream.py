@@ -18,7 +18,9 @@ for a given fileindex of a torrent
 """
 
 import logging
-from asyncio import sleep
+from asyncio import TimeoutError as AsyncTimeoutError, get_event_loop, shield, sleep, wait_for
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
 
 from tribler_common.simpledefs import DLSTATUS_DOWNLOADING, DLSTATUS_SEEDING
 
@@ -49,6 +51,14 @@ STREAM_PAUSE_TIME = 1
 # never use 0 priority because when streams are paused
 # we still want lt to download the pieces not important for the stream
 MIN_PIECE_PRIO = 1
+# chunks waiting for a piece are woken up by the piece_finished_alert of the piece. In case the alert gets lost,
+# or the chunk gets closed in the meantime, the waiting chunk checks its state again after this many seconds.
+PIECE_WAIT_TIMEOUT = 5
+# the number of downloaded pieces that a chunk reads ahead in the background, while the current piece is being sent.
+READAHEAD_PIECES = 4
+# the maximum number of bytes that is sent with a single sendfile call. Sending in parts lets the stream
+# update the dynamic buffer of the chunk, and pause the chunk in case the client stops reading.
+STREAM_SENDFILE_SIZE = 4 * 1024 * 1024
 
 
 class NotStreamingError(Exception):
@@ -86,6 +96,10 @@ class Stream:  # pylint: disable=too-many-instance-attributes
         #                                 <-------------------- dynamic buffer pieces -------------------->
         # {int:startbyte: [bool:ispaused, list:piecestobuffer 'according to the cursor of the related chunk']
         self.cursorpiecemap = {}
+        # the deadlines of the pieces as they were last set in libtorrent
+        self.piecedeadlines = {}
+        # whether the static buffers are complete, so only the pieces in the dynamic buffers can change priority
+        self.dynamicbuffering = False
         self.fileindex = None
         # when first initiate this instance does not have related callback ready,
         # this coro will be awaited when the stream is enabled. If never enabled,
@@ -122,6 +136,9 @@ class Stream:  # pylint: disable=too-many-instance-attributes
         self.__setdeadline = download.set_piece_deadline
         self.__resetdeadline = download.reset_piece_deadline
         self.__resumedownload = download.resume
+        self.__havepiece = download.have_piece
+        self.__waitforpiece = download.wait_for_piece
+        self.__updatepiecealerts = download.update_piece_alerts
 
     async def enable(self, fileindex=0, prebufpos=None):
         """
@@ -151,6 +168,8 @@ class Stream:  # pylint: disable=too-many-instance-attributes
         # which means after below line, stream.enaled = True
         if fileindex != self.fileindex:
             self.fileindex = fileindex
+            # while streaming, the download needs the piece_finished_alerts of libtorrent
+            self.__updatepiecealerts()
         elif self.enabled:
             # if already there is a state with the same file index do nothing
             if prebufpos is not None:
@@ -223,10 +242,27 @@ class Stream:  # pylint: disable=too-many-instance-attributes
     @check_vod([])
     def pieceshave(self):
         """
-        Get a list of Booleans indicating that individual pieces of the selected fileindex has been downloaded or not
+        Get a PieceBitmap indicating that individual pieces of the selected fileindex has been downloaded or not
         """
         return self.__lt_state().get_pieces_complete()
 
+    @check_vod(False)
+    def havepiece(self, piece):
+        """
+        Checks if the given piece has been downloaded, without building the piece bitmap of the whole torrent
+        """
+        return self.__havepiece(piece)
+
+    async def waitforpiece(self, piece, timeout=PIECE_WAIT_TIMEOUT):
+        """
+        Waits until the given piece has been downloaded, or until the timeout expires
+        """
+        if not self.enabled:
+            return
+        # the piece future is shared between the chunks, so it should not be cancelled on timeout
+        with suppress(AsyncTimeoutError):
+            await wait_for(shield(self.__waitforpiece(piece)), timeout)
+
     @check_vod(True)
     def disable(self):
         """
@@ -239,6 +275,7 @@ class Stream:  # pylint: disable=too-many-instance-attributes
         self.cursorpiecemap = {}
         self.resetprios()
         self.__setselectedfiles(self.enabledfiles)
+        self.__updatepiecealerts()
 
     def close(self):
         """
@@ -271,6 +308,15 @@ class Stream:  # pylint: disable=too-many-instance-attributes
         piece = self.mapfile(self.fileindex, byte_begin, 0).piece
         return piece
 
+    @check_vod(0)
+    def piecetobyte(self, piece):
+        """
+        Finds the position in the file of the first byte of the piece,
+        this is negative for the first piece if the file does not start at a piece boundary
+        """
+        request = self.mapfile(self.fileindex, 0, 0)
+        return (piece - request.piece) * self.piecelen - request.start
+
     @check_vod(0)
     def calculateprogress(self, pieces, consec):
         """
@@ -309,95 +355,111 @@ class Stream:  # pylint: disable=too-many-instance-attributes
             elif consec:
                 break
 
-    async def updateprios(self):  # pylint: disable=too-many-branches
+    def cursordeadlines(self):
+        """
+        Maps the pieces in the dynamic buffers of the active chunks to their deadline.
+        The deadline of a piece is its index in the closest buffer that contains it.
+        """
+        deadlines = {}
+        for paused, cursorpieces in self.cursorpiecemap.values():
+            if paused:
+                continue
+            for deadline, piece in enumerate(cursorpieces):
+                if deadlines.get(piece, deadline) >= deadline:
+                    deadlines[piece] = deadline
+        return deadlines
+
+    def staticdeadlines(self):
+        """
+        Maps the pieces of the static buffers to their deadline: 0 for the footer, 1 for the header
+        and 2 for the prebuffer pieces.
+        """
+        deadlines = dict.fromkeys(self.prebuffpieces, 2)
+        deadlines.update(dict.fromkeys(self.headerpieces, 1))
+        deadlines.update(dict.fromkeys(self.footerpieces, 0))
+        return deadlines
+
+    async def updateprios(self):
         """
         This async function controls how the individual piece priority and deadline is configured.
         This method is called when a stream in enabled, and when a chunk reads the stream each time.
-        The performance of this method is crucical since it gets called quite frequently
+        The performance of this method is crucical since it gets called quite frequently. Once the static buffers
+        are complete, only the pieces in the current and previous dynamic buffers are visited, and only the
+        priorities and deadlines that changed are pushed to libtorrent.
         """
         if not self.enabled:
             return
 
-        def _updateprio(piece, prio, deadline=None):
-            """
-            Utility function to update piece priorities
-            """
-            if not curr_prio == prio:
-                piecepriorities[piece] = prio
-                if deadline is not None:
-                    # it is cool to step deadlines with 10ms interval but in realty there is no need.
-                    self.__setdeadline(piece, deadline * 10)
-                    diffmap[piece] = f"{piece}:{deadline * 10}:{curr_prio}->{prio}"
-                else:
-                    self.__resetdeadline(piece)
-                    diffmap[piece] = f"{piece}:-:{curr_prio}->{prio}"
-
-        def _find_deadline(piece):
-            """
-            Find the cursor which has this piece closest to its start
-            Returns the deadline for the piece and the cursor startbyte
-            """
-            # if piece is not in piecemaps, then there is no deadline
-            # if piece in piecemaps, then the deadline is the index of the related piecemap
-            deadline = None
-            cursor = None
-            for startbyte in self.cursorpiecemap:
-                paused, cursorpieces = self.cursorpiecemap[startbyte]
-                if not paused and piece in cursorpieces and \
-                        (deadline is None or cursorpieces.index(piece) < deadline):
-                    deadline = cursorpieces.index(piece)
-                    cursor = startbyte
-            return deadline, cursor
-
         # current priorities
         piecepriorities = self.__getpieceprios()
         if not piecepriorities:
             # this case might happen when hop count is changing.
             return
-        # a map holds the changes, used only for logging purposes
-        diffmap = {}
+
+        pieceshave = self.pieceshave
+        staticdeadlines = self.staticdeadlines()
+        cursordeadlines = self.cursordeadlines()
+        if self.dynamicbuffering and all(pieceshave[piece] for piece in staticdeadlines):
+            # only the pieces that are, or were, in the dynamic buffers can change
+            pieces = sorted(cursordeadlines.keys() | self.piecedeadlines.keys())
+        else:
+            pieces = range(self.firstpiece, self.lastpiece + 1)
+        # list of (piece, prio) tuples of the pieces which priority has changed
+        priodiff = []
         # flag that holds if we are in static buffering phase of dynamic buffering
         staticbuff = False
-        for piece in self.iterpieces(have=False):
-            # current piece prio
-            curr_prio = piecepriorities[piece]
-            if piece in self.footerpieces:
-                _updateprio(piece, 7, 0)
-                staticbuff = True
-            elif piece in self.headerpieces:
-                _updateprio(piece, 7, 1)
-                staticbuff = True
-            elif piece in self.prebuffpieces:
-                _updateprio(piece, 7, 2)
+        for piece in pieces:
+            if pieceshave[piece]:
+                # libtorrent drops the deadline of a piece once it is downloaded
+                self.piecedeadlines.pop(piece, None)
+                continue
+            deadline = staticdeadlines.get(piece)
+            if deadline is not None:
+                prio = 7
                 staticbuff = True
+            elif staticbuff:
+                prio = 0
             else:
-                if staticbuff:
-                    _updateprio(piece, 0)
+                # dynamic buffering
+                deadline = cursordeadlines.get(piece)
+                if deadline is None:
+                    # the piece is not in buffer zone, set to min prio without deadline
+                    prio = MIN_PIECE_PRIO
+                elif deadline < len(DEADLINE_PRIO_MAP):
+                    # get prio according to deadline
+                    prio = DEADLINE_PRIO_MAP[deadline]
                 else:
-                    # dynamic buffering
-                    deadline, cursor = _find_deadline(piece)
-                    if cursor is not None:
-                        if deadline < len(DEADLINE_PRIO_MAP):
-                            # get prio according to deadline
-                            _updateprio(piece, DEADLINE_PRIO_MAP[deadline], deadline)
-                        else:
-                            # the deadline is outside of map, set piece prio 1 with the deadline
-                            # buffer size is bigger then prio_map
-                            _updateprio(piece, 1, deadline)
-                    else:
-                        # the piece is not in buffer zone, set to min prio without deadline
-                        _updateprio(piece, MIN_PIECE_PRIO)
-        if diffmap:
-            # log stuff
-            self._logger.info("Piece Piority changed: %s", repr(diffmap))
+                    # the deadline is outside of map, set piece prio 1 with the deadline
+                    # buffer size is bigger then prio_map
+                    prio = 1
+
+            if piecepriorities[piece] != prio:
+                priodiff.append((piece, prio))
+            if self.piecedeadlines.get(piece) != deadline:
+                self.updatedeadline(piece, deadline)
+
+        if priodiff:
+            self._logger.info("Piece Piority changed for %d pieces", len(priodiff))
+            self._logger.debug("Piece Piority changes: %s", repr(priodiff))
             self._logger.debug("Header Pieces: %s", repr(self.headerpieces))
             self._logger.debug("Footer Pieces: %s", repr(self.footerpieces))
             self._logger.debug("Prebuff Pieces: %s", repr(self.prebuffpieces))
             for startbyte in self.cursorpiecemap:
                 self._logger.debug("Cursor '%s' Pieces: %s", startbyte, repr(self.cursorpiecemap[startbyte]))
-            # BELOW LINE WILL BE REMOVED, Most of the above are for debugging to be cleaned
-            self._logger.debug("Current Prios: %s", [(x, piecepriorities[x]) for x in self.iterpieces(have=False)])
-            self.__setpieceprios(piecepriorities)
+            self.__setpieceprios(priodiff)
+        self.dynamicbuffering = not staticbuff
+
+    def updatedeadline(self, piece, deadline):
+        """
+        Sets or resets the deadline of a piece in libtorrent, and keeps track of it
+        """
+        if deadline is None:
+            self.__resetdeadline(piece)
+            self.piecedeadlines.pop(piece, None)
+        else:
+            # it is cool to step deadlines with 10ms interval but in realty there is no need.
+            self.__setdeadline(piece, deadline * 10)
+            self.piecedeadlines[piece] = deadline
 
     def resetprios(self, pieces=None, prio=None):
         """
@@ -405,12 +467,15 @@ class Stream:  # pylint: disable=too-many-instance-attributes
         If no pieces are provided, resets every piece for the fileindex
         """
         prio = prio if prio is not None else 4
-        piecepriorities = self.__getpieceprios()
+        self.dynamicbuffering = False
         if pieces is None:
-            pieces = list(range(len(piecepriorities)))
+            pieces = list(range(len(self.__getpieceprios())))
+            self.__setpieceprios([prio] * len(pieces))
+        else:
+            self.__setpieceprios([(piece, prio) for piece in pieces])
         for piece in pieces:
             self.__resetdeadline(piece)
-        self.__setpieceprios([prio] * len(pieces))
+            self.piecedeadlines.pop(piece, None)
 
 
 class StreamChunk:
@@ -431,6 +496,9 @@ class StreamChunk:
         self.file = None
         self.startpos = startpos
         self.__seekpos = self.startpos
+        # the pieces being read ahead, as a map from their position in the file to the future of their data
+        self.readahead = {}
+        self.executor = None
 
     @property
     def seekpos(self):
@@ -452,9 +520,15 @@ class StreamChunk:
         Opens the file in the filesystem until its ready and seeks to the seekpos position
         """
         while not self.stream.filename.exists():
-            await sleep(1)
+            # waitforpiece returns immediately if the stream is disabled, so we would never yield to the event loop
+            if not self.stream.enabled:
+                raise NotStreamingError()
+            # libtorrent creates the file once it writes the first piece of it
+            await self.stream.waitforpiece(self.stream.bytetopiece(self.seekpos))
         self.file = open(self.stream.filename, 'rb')
         self.file.seek(self.seekpos)
+        # a single reader thread, so the reads of this chunk do not interleave on the file
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="StreamChunk")
 
     @property
     def isclosed(self):
@@ -537,6 +611,12 @@ class StreamChunk:
         Closes the chunk grecefully, also unregisters the cursor pieces from the stream instance
         and resets the releavent piece prios.
         """
+        for future in self.readahead.values():
+            future.cancel()
+        self.readahead = {}
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            self.executor = None
         if self.file:
             self.file.close()
             self.file = None
@@ -544,9 +624,10 @@ class StreamChunk:
             pieces = self.stream.cursorpiecemap.pop(self.startpos)
             self.stream.resetprios(pieces[1], MIN_PIECE_PRIO)
 
-    async def read(self):
+    async def __waitforseekpos(self):
         """
-        Reads 1 piece that contains the seekpos.
+        Updates the dynamic buffer of this chunk, and waits until the piece that contains the seekpos is downloaded.
+        Returns the piece, or None if there is nothing left to read.
         """
         if not self.file and self.isstarted:
             await self.open()
@@ -558,23 +639,88 @@ class StreamChunk:
         if self.isclosed or piece > self.stream.lastpiece or not self.isstarted:
             self.close()
             self._logger.debug('Chunk %s: Got no bytes, file is closed', self.startpos)
-            return b''
+            return None
 
         # wait until we download what we want, then read the localfile
         # experiment a garbage write mechanism here if the torrent read is too slow
-        piece = self.stream.bytetopiece(self.seekpos)
         while True:
-            pieces_have = self.stream.pieceshave
             if piece == -1:
                 self.close()
-                return b''
-            if (0 <= piece < len(pieces_have) and pieces_have[piece]) or not self.isstarted:
+                return None
+            if not self.isstarted or self.stream.havepiece(piece):
                 break
             self._logger.debug('Chunk %s, Waiting piece %s', self.startpos, piece)
-            await sleep(1)
+            await self.stream.waitforpiece(piece)
+        return None if self.isclosed else piece
+
+    @staticmethod
+    def __readfile(file, position, size):
+        file.seek(position)
+        return file.read(size)
+
+    def __readat(self, position, size):
+        """
+        Returns the future of the data at the position in the file, which may have been read ahead already
+        """
+        for readpos in [readpos for readpos in self.readahead if readpos < position]:
+            # the chunk has moved past these pieces
+            self.readahead.pop(readpos).cancel()
+        future = self.readahead.pop(position, None)
+        if future is None:
+            future = get_event_loop().run_in_executor(self.executor, self.__readfile, self.file, position, size)
+        return future
+
+    def __readahead(self, startpiece):
+        """
+        Starts reading the downloaded pieces from startpiece on in the background, up to READAHEAD_PIECES pieces
+        """
+        for piece in range(startpiece, min(startpiece + READAHEAD_PIECES, self.stream.lastpiece + 1)):
+            if not self.stream.havepiece(piece):
+                break
+            position = max(0, self.stream.piecetobyte(piece))
+            if position not in self.readahead:
+                size = self.stream.piecetobyte(piece + 1) - position
+                self.readahead[position] = get_event_loop().run_in_executor(self.executor, self.__readfile,
+                                                                            self.file, position, size)
+
+    async def read(self):
+        """
+        Reads the piece that contains the seekpos, from the seekpos on.
+        The downloaded pieces after it are read ahead in the background.
+        """
+        piece = await self.__waitforseekpos()
+        if piece is None:
+            return b''
 
-        result = self.file.read(self.stream.piecelen)
+        result = await self.__readat(self.seekpos, self.stream.piecetobyte(piece + 1) - self.seekpos)
         self._logger.debug('Chunk %s: Got bytes %s-%s, %s bytes, piecelen: %s',
                            self.startpos, self.seekpos, self.seekpos + len(result), len(result), self.stream.piecelen)
-        self.__seekpos = self.file.tell()
+        self.__seekpos += len(result)
+        self.__readahead(piece + 1)
         return result
+
+    async def contiguousbytes(self, maxbytes):
+        """
+        Waits until the piece that contains the seekpos is downloaded, and returns the number of bytes from the seekpos
+        on that are downloaded contiguously, up to maxbytes. Returns 0 if there is nothing left to read.
+        """
+        piece = await self.__waitforseekpos()
+        if piece is None:
+            return 0
+
+        endpiece = piece + 1
+        while endpiece <= self.stream.lastpiece and self.stream.piecetobyte(endpiece) - self.seekpos < maxbytes \
+                and self.stream.havepiece(endpiece):
+            endpiece += 1
+        available = min(self.stream.piecetobyte(endpiece), self.stream.filesize) - self.seekpos
+        return max(0, min(available, maxbytes))
+
+    async def sendfile(self, transport, count):
+        """
+        Sends count bytes from the seekpos on straight from the file to the transport, without copying them into
+        Python. Raises SendfileNotAvailableError or NotImplementedError if the transport does not support this.
+        """
+        sent = await get_event_loop().sendfile(transport, self.file, self.seekpos, count, fallback=False)
+        self._logger.debug('Chunk %s: Sent bytes %s-%s', self.startpos, self.seekpos, self.seekpos + sent)
+        self.__seekpos += sent
+        return sent
@@ -1,5 +1,13 @@
-from asyncio import CancelledError, TimeoutError as AsyncTimeoutError, wait_for
+from asyncio import (
+    CancelledError,
+    SendfileNotAvailableError,
+    TimeoutError as AsyncTimeoutError,
+    ensure_future,
+    shield,
+    wait_for,
+)
 from binascii import unhexlify
+from collections import OrderedDict, namedtuple
 from contextlib import suppress
 from pathlib import PurePosixPath
 
@@ -23,7 +31,11 @@ from tribler_common.simpledefs import (
 
 from tribler_core.components.libtorrent.download_manager.download_config import DownloadConfig
 from tribler_core.components.libtorrent.download_manager.download_manager import DownloadManager
-from tribler_core.components.libtorrent.download_manager.stream import STREAM_PAUSE_TIME, StreamChunk
+from tribler_core.components.libtorrent.download_manager.stream import (
+    STREAM_PAUSE_TIME,
+    STREAM_SENDFILE_SIZE,
+    StreamChunk,
+)
 from tribler_core.components.libtorrent.utils.libtorrent_helper import libtorrent as lt
 from tribler_core.components.restapi.rest.rest_endpoint import (
     HTTP_BAD_REQUEST,
@@ -38,6 +50,13 @@ from tribler_core.utilities.path_util import Path
 from tribler_core.utilities.unicode import ensure_unicode, hexlify
 from tribler_core.utilities.utilities import froze_it
 
+# The number of removed downloads that are remembered, to report them to clients that request the changes since
+# an earlier version of the downloads.
+MAX_REMOVED_DOWNLOADS = 1000
+
+# The cached JSON record of a download. The record is only recreated when the key changes.
+DownloadRecord = namedtuple('DownloadRecord', ['key', 'version', 'json'])
+
 
 def _safe_extended_peer_info(ext_peer_info):
     """
@@ -91,6 +110,17 @@ class DownloadsEndpoint(RESTEndpoint):
         self.mds = metadata_store
         self.tunnel_community = tunnel_community
 
+        # Map from infohash to the DownloadRecord of the download
+        self.download_records = {}
+        # Map from infohash to a (tdef, name) tuple, since looking up download names in the database is costly
+        self.download_names = {}
+        # Increased whenever the record of a download changes, or a download is removed
+        self.state_version = 0
+        # Map from the infohash of a removed download to the state version at which it was removed
+        self.removed_downloads = OrderedDict()
+        # The state version of the last removal that is no longer remembered
+        self.removed_downloads_forgotten = 0
+
         self.app.on_shutdown.append(self.on_shutdown)
 
     async def on_shutdown(self, _):
@@ -186,10 +216,19 @@ class DownloadsEndpoint(RESTEndpoint):
             'description': 'Flag indicating whether or not to include files',
             'type': 'boolean',
             'required': False
+        },
+            {
+            'in': 'query',
+            'name': 'since',
+            'description': 'Only include the downloads that changed since this version of the downloads',
+            'type': 'integer',
+            'required': False
         }],
         responses={
             200: {
                 "schema": schema(DownloadsResponse={
+                    'version': Integer,
+                    'removed': [String],
                     'downloads': schema(Download={
                         'name': String,
                         'progress': Float,
@@ -230,98 +269,34 @@ class DownloadsEndpoint(RESTEndpoint):
                     "in bytes. The estimated time assumed is given in seconds.\n\n"
                     "Detailed information about peers and pieces is only requested when the get_peers and/or "
                     "get_pieces flag is set. Note that setting this flag has a negative impact on performance "
-                    "and should only be used in situations where this data is required. "
+                    "and should only be used in situations where this data is required.\n\n"
+                    "The response contains the version of the downloads. When this version is passed as the since "
+                    "parameter, only the downloads that changed since are returned, together with the infohashes of "
+                    "the removed downloads. If the removals since that version are no longer known, all downloads "
+                    "are returned without the removed field."
     )
     async def get_downloads(self, request):
         get_peers = request.query.get('get_peers', '0') == '1'
         get_pieces = request.query.get('get_pieces', '0') == '1'
         get_files = request.query.get('get_files', '0') == '1'
+        try:
+            since = int(request.query['since']) if 'since' in request.query else None
+        except ValueError:
+            return RESTResponse({"error": "since must be an integer"}, status=HTTP_BAD_REQUEST)
+        # We can only report the changes since a version if we still know which downloads were removed since
+        is_diff = since is not None and since >= self.removed_downloads_forgotten
 
         downloads_json = []
-        downloads = self.download_manager.get_downloads()
-        for download in downloads:
-            if download.hidden and not download.config.get_channel_download():
-                # We still want to send channel downloads since they are displayed in the GUI
+        for download, record in self.update_download_records():
+            if is_diff and record.version <= since:
                 continue
-            state = download.get_state()
-            tdef = download.get_def()
-
-            # Create tracker information of the download
-            tracker_info = []
-            for url, url_info in download.get_tracker_status().items():
-                tracker_info.append({"url": url, "peers": url_info[0], "status": url_info[1]})
-
-            num_seeds, num_peers = state.get_num_seeds_peers()
-            num_connected_seeds, num_connected_peers = download.get_num_connected_seeds_peers()
-
-            if download.config.get_channel_download():
-                download_name = self.mds.ChannelMetadata.get_channel_name_cached(
-                    tdef.get_name_utf8(), tdef.get_infohash())
-            elif self.mds is None:
-                download_name = tdef.get_name_utf8()
-            else:
-                download_name = self.mds.TorrentMetadata.get_torrent_title(tdef.get_infohash()) or \
-                    tdef.get_name_utf8()
-
-            download_status = get_extended_status(
-                self.tunnel_community, download) if self.tunnel_community else download.get_state().get_status()
-
-            download_json = {
-                "name": download_name,
-                "progress": state.get_progress(),
-                "infohash": hexlify(tdef.get_infohash()),
-                "speed_down": state.get_current_payload_speed(DOWNLOAD),
-                "speed_up": state.get_current_payload_speed(UPLOAD),
-                "status": dlstatus_strings[download_status],
-                "size": tdef.get_length(),
-                "eta": state.get_eta(),
-                "num_peers": num_peers,
-                "num_seeds": num_seeds,
-                "num_connected_peers": num_connected_peers,
-                "num_connected_seeds": num_connected_seeds,
-                "total_up": state.get_total_transferred(UPLOAD),
-                "total_down": state.get_total_transferred(DOWNLOAD),
-                "ratio": state.get_seeding_ratio(),
-                "trackers": tracker_info,
-                "hops": download.config.get_hops(),
-                "anon_download": download.get_anon_mode(),
-                "safe_seeding": download.config.get_safe_seeding(),
-                # Maximum upload/download rates are set for entire sessions
-                "max_upload_speed": DownloadManager.get_libtorrent_max_upload_rate(self.download_manager.config),
-                "max_download_speed": DownloadManager.get_libtorrent_max_download_rate(self.download_manager.config),
-                "destination": str(download.config.get_dest_dir()),
-                "availability": state.get_availability(),
-                "total_pieces": tdef.get_nr_pieces(),
-                "vod_mode": download.stream and download.stream.enabled,
-                "error": repr(state.get_error()) if state.get_error() else "",
-                "time_added": download.config.get_time_added(),
-                "channel_download": download.config.get_channel_download()
-            }
-            if download.stream:
-                download_json.update({
-                    "vod_prebuffering_progress": download.stream.prebuffprogress,
-                    "vod_prebuffering_progress_consec": download.stream.prebuffprogress_consec,
-                    "vod_header_progress": download.stream.headerprogress,
-                    "vod_footer_progress": download.stream.footerprogress,
-
-                })
+            download_json = record.json
+            if get_peers or get_pieces or get_files:
+                download_json = dict(download_json)
 
             # Add peers information if requested
             if get_peers:
-                peer_list = state.get_peerlist()
-                for peer_info in peer_list:  # Remove have field since it is very large to transmit.
-                    del peer_info['have']
-                    if 'extended_version' in peer_info:
-                        peer_info['extended_version'] = _safe_extended_peer_info(peer_info['extended_version'])
-                    # Does this peer represent a hidden services circuit?
-                    if peer_info.get('port') == CIRCUIT_ID_PORT and self.tunnel_community:
-                        tc = self.tunnel_community
-                        circuit_id = tc.ip_to_circuit_id(peer_info['ip'])
-                        circuit = tc.circuits.get(circuit_id, None)
-                        if circuit:
-                            peer_info['circuit'] = circuit_id
-
-                download_json["peers"] = peer_list
+                download_json["peers"] = self.get_peers_info_json(download)
 
             # Add piece information if requested
             if get_pieces:
@@ -332,7 +307,148 @@ class DownloadsEndpoint(RESTEndpoint):
                 download_json["files"] = self.get_files_info_json(download)
 
             downloads_json.append(download_json)
-        return RESTResponse({"downloads": downloads_json})
+
+        response = {"downloads": downloads_json, "version": self.state_version}
+        if is_diff:
+            response["removed"] = [hexlify(infohash) for infohash, version in self.removed_downloads.items()
+                                   if version > since]
+        return RESTResponse(response)
+
+    def update_download_records(self):
+        """
+        Update the cached records of the downloads that changed, and forget the records of the removed downloads.
+        :return: a list of (download, record) tuples of the downloads to show in the GUI.
+        """
+        # Maximum upload/download rates are set for entire sessions
+        max_upload_speed = DownloadManager.get_libtorrent_max_upload_rate(self.download_manager.config)
+        max_download_speed = DownloadManager.get_libtorrent_max_download_rate(self.download_manager.config)
+
+        result = []
+        shown = set()
+        for download in self.download_manager.get_downloads():
+            if download.hidden and not download.config.get_channel_download():
+                # We still want to send channel downloads since they are displayed in the GUI
+                continue
+            infohash = download.get_def().get_infohash()
+            shown.add(infohash)
+            download_status = get_extended_status(
+                self.tunnel_community, download) if self.tunnel_community else download.get_state().get_status()
+
+            record = self.download_records.get(infohash)
+            key = (download, download.state_version, download_status, max_upload_speed, max_download_speed)
+            # The buffers of downloads that are being streamed change without the state of the download changing
+            if record is None or record.key != key or download.stream:
+                download_json = self.get_download_json(download, download_status, max_upload_speed,
+                                                       max_download_speed)
+                if record is None or record.json != download_json:
+                    self.state_version += 1
+                    record = DownloadRecord(key, self.state_version, download_json)
+                    self.removed_downloads.pop(infohash, None)
+                else:
+                    record = record._replace(key=key)
+                self.download_records[infohash] = record
+            result.append((download, record))
+
+        for infohash in self.download_records.keys() - shown:
+            self.download_records.pop(infohash)
+            self.download_names.pop(infohash, None)
+            self.state_version += 1
+            self.removed_downloads[infohash] = self.state_version
+            if len(self.removed_downloads) > MAX_REMOVED_DOWNLOADS:
+                _, self.removed_downloads_forgotten = self.removed_downloads.popitem(last=False)
+        return result
+
+    def get_download_name(self, download):
+        """
+        Return the name of a download to show in the GUI. The name is cached until the download gets new metadata.
+        """
+        tdef = download.get_def()
+        infohash = tdef.get_infohash()
+        cached_tdef, download_name = self.download_names.get(infohash, (None, None))
+        if cached_tdef is tdef:
+            return download_name
+
+        if download.config.get_channel_download():
+            download_name = self.mds.ChannelMetadata.get_channel_name_cached(tdef.get_name_utf8(), infohash)
+        elif self.mds is None:
+            download_name = tdef.get_name_utf8()
+        else:
+            download_name = self.mds.TorrentMetadata.get_torrent_title(infohash) or tdef.get_name_utf8()
+        self.download_names[infohash] = (tdef, download_name)
+        return download_name
+
+    def get_download_json(self, download, download_status, max_upload_speed, max_download_speed):
+        """
+        Return the JSON record of a download, without the peers, pieces and files.
+        """
+        state = download.get_state()
+        tdef = download.get_def()
+
+        # Create tracker information of the download
+        tracker_info = []
+        for url, url_info in download.get_tracker_status().items():
+            tracker_info.append({"url": url, "peers": url_info[0], "status": url_info[1]})
+
+        num_seeds, num_peers = state.get_num_seeds_peers()
+        num_connected_seeds, num_connected_peers = download.get_num_connected_seeds_peers()
+
+        download_json = {
+            "name": self.get_download_name(download),
+            "progress": state.get_progress(),
+            "infohash": hexlify(tdef.get_infohash()),
+            "speed_down": state.get_current_payload_speed(DOWNLOAD),
+            "speed_up": state.get_current_payload_speed(UPLOAD),
+            "status": dlstatus_strings[download_status],
+            "size": tdef.get_length(),
+            "eta": state.get_eta(),
+            "num_peers": num_peers,
+            "num_seeds": num_seeds,
+            "num_connected_peers": num_connected_peers,
+            "num_connected_seeds": num_connected_seeds,
+            "total_up": state.get_total_transferred(UPLOAD),
+            "total_down": state.get_total_transferred(DOWNLOAD),
+            "ratio": state.get_seeding_ratio(),
+            "trackers": tracker_info,
+            "hops": download.config.get_hops(),
+            "anon_download": download.get_anon_mode(),
+            "safe_seeding": download.config.get_safe_seeding(),
+            "max_upload_speed": max_upload_speed,
+            "max_download_speed": max_download_speed,
+            "destination": str(download.config.get_dest_dir()),
+            "availability": state.get_availability(),
+            "total_pieces": tdef.get_nr_pieces(),
+            "vod_mode": download.stream and download.stream.enabled,
+            "error": repr(state.get_error()) if state.get_error() else "",
+            "time_added": download.config.get_time_added(),
+            "channel_download": download.config.get_channel_download()
+        }
+        if download.stream:
+            download_json.update({
+                "vod_prebuffering_progress": download.stream.prebuffprogress,
+                "vod_prebuffering_progress_consec": download.stream.prebuffprogress_consec,
+                "vod_header_progress": download.stream.headerprogress,
+                "vod_footer_progress": download.stream.footerprogress,
+
+            })
+        return download_json
+
+    def get_peers_info_json(self, download):
+        """
+        Return the peers of a download as JSON.
+        """
+        peer_list = download.get_state().get_peerlist()
+        for peer_info in peer_list:  # Remove have field since it is very large to transmit.
+            del peer_info['have']
+            if 'extended_version' in peer_info:
+                peer_info['extended_version'] = _safe_extended_peer_info(peer_info['extended_version'])
+            # Does this peer represent a hidden services circuit?
+            if peer_info.get('port') == CIRCUIT_ID_PORT and self.tunnel_community:
+                tc = self.tunnel_community
+                circuit_id = tc.ip_to_circuit_id(peer_info['ip'])
+                circuit = tc.circuits.get(circuit_id, None)
+                if circuit:
+                    peer_info['circuit'] = circuit_id
+        return peer_list
 
     @docs(
         tags=["Libtorrent"],
@@ -630,30 +746,33 @@ class DownloadsEndpoint(RESTEndpoint):
                                                'Content-Length': f'{stop - start}',
                                                'Content-Range': f'{start}-{stop}/{download.stream.filesize}'})
         response.force_close()
-        with suppress(CancelledError, ConnectionResetError):
+        with suppress(CancelledError, ConnectionError):
             async with StreamChunk(download.stream, start) as chunk:
                 await response.prepare(request)
                 bytes_todo = stop - start
                 bytes_done = 0
                 self._logger.info('Got range request for %s-%s (%s bytes)', start, stop, bytes_todo)
-                while not request.transport.is_closing():
+                use_sendfile = True
+                while bytes_done < bytes_todo and request.transport and not request.transport.is_closing():
                     if chunk.seekpos >= download.stream.filesize:
                         break
-                    data = await chunk.read()
-                    try:
-                        if len(data) == 0:
+                    if use_sendfile:
+                        # Send the contiguous range of downloaded bytes straight from the file
+                        count = await chunk.contiguousbytes(min(bytes_todo - bytes_done, STREAM_SENDFILE_SIZE))
+                        if count == 0:
                             break
-                        if bytes_done + len(data) > bytes_todo:
-                            # if we have more data than we need
-                            endlen = bytes_todo - bytes_done
-                            if endlen != 0:
-                                await wait_for(response.write(data[:endlen]), STREAM_PAUSE_TIME)
-
-                                bytes_done += endlen
+                        sending = ensure_future(chunk.sendfile(request.transport, count))
+                    else:
+                        # The transport does not support sendfile, so we send the data that the chunk reads (ahead)
+                        data = await chunk.read()
+                        if len(data) == 0:
                             break
-                        await wait_for(response.write(data), STREAM_PAUSE_TIME)
-                        bytes_done += len(data)
-
+                        # If we have more data than we need, only send the part that we need
+                        data = data[:bytes_todo - bytes_done]
+                        count = len(data)
+                        sending = ensure_future(response.write(data))
+                    try:
+                        await wait_for(shield(sending), STREAM_PAUSE_TIME)
                         if chunk.resume():
                             self._logger.debug("Stream %s-%s is resumed, starting sequential buffer", start, stop)
                     except AsyncTimeoutError:
@@ -662,4 +781,12 @@ class DownloadsEndpoint(RESTEndpoint):
                         # there is no need to keep sequenial buffer if there are other chunks waiting for prios
                         if chunk.pause():
                             self._logger.debug("Stream %s-%s is paused, stopping sequential buffer", start, stop)
+                        await sending
+                    except (NotImplementedError, SendfileNotAvailableError):
+                        self._logger.info("Sendfile is not available, streaming %s-%s with readahead", start, stop)
+                        use_sendfile = False
+                        continue
+                    finally:
+                        sending.cancel()
+                    bytes_done += count
                 return response
@@ -6,7 +6,7 @@ from aiohttp_apispec import docs
 
 from ipv8.REST.schema import schema
 
-from marshmallow.fields import Integer
+from marshmallow.fields import Float, Integer
 
 from tribler_core.components.libtorrent.download_manager.download_manager import DownloadManager
 from tribler_core.components.restapi.rest.rest_endpoint import RESTEndpoint, RESTResponse
@@ -26,7 +26,9 @@ class LibTorrentEndpoint(RESTEndpoint):
 
     def setup_routes(self):
         self.app.add_routes([web.get('/settings', self.get_libtorrent_settings),
-                             web.get('/session', self.get_libtorrent_session_info)])
+                             web.get('/session', self.get_libtorrent_session_info),
+                             web.get('/metainfo_cache', self.get_metainfo_cache_stats),
+                             web.get('/metainfo_requests', self.get_metainfo_request_stats)])
 
     @docs(
         tags=["Libtorrent"],
@@ -102,3 +104,36 @@ class LibTorrentEndpoint(RESTEndpoint):
         self.download_manager.ltsessions[hop].post_session_stats()
         stats = await session_stats
         return RESTResponse({'hop': hop, 'session': stats})
+
+    @docs(
+        tags=["Libtorrent"],
+        summary="Return the statistics of the metainfo cache.",
+        responses={
+            200: {
+                'description': 'Return the size and the hit rate of the metainfo cache',
+                "schema": schema(MetainfoCacheStatsResponse={'entries': Integer, 'size': Integer,
+                                                             'spilled_entries': Integer, 'spill_size': Integer,
+                                                             'hits': Integer, 'spill_hits': Integer,
+                                                             'misses': Integer, 'joined_requests': Integer,
+                                                             'evictions': Integer, 'hit_rate': Float})
+            }
+        }
+    )
+    async def get_metainfo_cache_stats(self, _):
+        return RESTResponse(self.download_manager.metainfo_cache.get_stats())
+
+    @docs(
+        tags=["Libtorrent"],
+        summary="Return the statistics of the metainfo lookups.",
+        responses={
+            200: {
+                'description': 'Return the number of running and queued metainfo lookups, and their latency',
+                "schema": schema(MetainfoRequestStatsResponse={'active': Integer, 'queued': Integer,
+                                                               'completed': Integer, 'failed': Integer,
+                                                               'latency_median': Float,
+                                                               'latency_95th_percentile': Float})
+            }
+        }
+    )
+    async def get_metainfo_request_stats(self, _):
+        return RESTResponse(self.download_manager.metainfo_queue.get_stats())
@@ -11,6 +11,7 @@ import pytest
 from tribler_common.simpledefs import DLSTATUS_CIRCUITS, DLSTATUS_DOWNLOADING, DLSTATUS_EXIT_NODES, DLSTATUS_STOPPED
 
 from tribler_core.components.libtorrent.download_manager.download_state import DownloadState
+from tribler_core.components.libtorrent.download_manager.stream import StreamChunk
 from tribler_core.components.libtorrent.restapi.downloads_endpoint import DownloadsEndpoint, get_extended_status
 from tribler_core.components.restapi.rest.base_api_test import do_request
 from tribler_core.components.restapi.rest.rest_manager import error_middleware
@@ -151,7 +152,7 @@ async def test_get_downloads_no_downloads(mock_dlmgr, rest_api):
     Testing whether the API returns an empty list when downloads are fetched but no downloads are active
     """
     result = await do_request(rest_api, 'downloads?get_peers=1&get_pieces=1',
-                              expected_code=200, expected_json={"downloads": []})
+                              expected_code=200, expected_json={"downloads": [], "version": 0})
     assert result["downloads"] == []
 
 
@@ -164,6 +165,53 @@ async def test_get_downloads(mock_dlmgr, test_download, rest_api):
     assert len(downloads["downloads"]) == 1
 
 
+async def test_get_downloads_cached(mock_dlmgr, test_download, rest_api):
+    """
+    Testing whether the record of a download is only recreated when the state of the download changes
+    """
+    mock_dlmgr.get_downloads = lambda: [test_download]
+    test_download.get_tracker_status = Mock(return_value={})
+
+    await do_request(rest_api, 'downloads', expected_code=200)
+    await do_request(rest_api, 'downloads', expected_code=200)
+    assert test_download.get_tracker_status.call_count == 1
+
+    test_download.state_version += 1
+    await do_request(rest_api, 'downloads', expected_code=200)
+    assert test_download.get_tracker_status.call_count == 2
+
+
+async def test_get_downloads_since(mock_dlmgr, test_download, rest_api):
+    """
+    Testing whether the API only returns the downloads that changed since a version
+    """
+    mock_dlmgr.get_downloads = lambda: [test_download]
+    result = await do_request(rest_api, 'downloads', expected_code=200)
+    version = result["version"]
+    assert len(result["downloads"]) == 1
+
+    result = await do_request(rest_api, f'downloads?since={version}', expected_code=200,
+                              expected_json={"downloads": [], "version": version, "removed": []})
+
+    test_download.config.set_hops(2)
+    test_download.state_version += 1
+    result = await do_request(rest_api, f'downloads?since={version}', expected_code=200)
+    assert result["version"] > version
+    assert [download["hops"] for download in result["downloads"]] == [2]
+
+    mock_dlmgr.get_downloads = lambda: []
+    result = await do_request(rest_api, f'downloads?since={version}', expected_code=200)
+    assert result["downloads"] == []
+    assert result["removed"] == [test_download.infohash]
+
+
+async def test_get_downloads_since_invalid(rest_api):
+    """
+    Testing whether the API returns error 400 if the since parameter is not a version
+    """
+    await do_request(rest_api, 'downloads?since=abc', expected_code=400)
+
+
 async def test_start_download_no_uri(rest_api):
     """
     Testing whether an error is returned when we start a torrent download and do not pass any URI
@@ -475,12 +523,8 @@ async def test_stream_download_out_of_bounds_file(mock_dlmgr, mock_handle, test_
                      headers={'range': 'bytes=0-'}, expected_code=500, request_type='GET')
 
 
-async def test_stream_download(mock_dlmgr, mock_handle, test_download, rest_api, tmp_path):
-    """
-    Testing whether the API returns code 206 if we stream a non-existent download
-    """
-    mock_dlmgr.get_download = lambda _: test_download
-
+@pytest.fixture
+def mock_stream(test_download, tmp_path):
     with open(tmp_path / "dummy.txt", "w") as stream_file:
         stream_file.write("a" * 500)
 
@@ -492,20 +536,56 @@ async def test_stream_download(mock_dlmgr, mock_handle, test_download, rest_api,
     stream.enable = lambda *_, **__: succeed(None)
     stream.filesize = 500
     stream.piecelen = 32
-    stream.seek = lambda _: succeed(None)
     stream.iterpieces = lambda *_, **__: [1]
     stream.prebuffsize = 0
-    stream.lastpiece = 1
-    stream.bytetopiece = lambda _: 1
-    stream.pieceshave = [1, 2]
+    stream.lastpiece = 15
+    stream.bytetopiece = lambda byte: byte // 32
+    stream.piecetobyte = lambda piece: piece * 32
+    stream.havepiece = lambda _: True
+    stream.pieceshave = [True] * 16
     stream.updateprios = lambda: succeed(None)
     stream.cursorpiecemap = {}
     stream.get_byte_progress = lambda _: 1
-    stream.read = lambda _: succeed('a' * 500)
     test_download.stream = stream
+    return stream
+
+
+async def test_stream_download(mock_dlmgr, mock_stream, test_download, rest_api):
+    """
+    Testing whether the API returns code 206 if we stream a download
+    """
+    mock_dlmgr.get_download = lambda _: test_download
+
+    response = await do_request(rest_api, f'downloads/{test_download.infohash}/stream/0',
+                                headers={'range': 'bytes=0-'}, expected_code=206, json_response=False)
+    assert response == b'a' * 500
+
+
+async def test_stream_download_range(mock_dlmgr, mock_stream, test_download, rest_api):
+    """
+    Testing whether the API only returns the requested range of the file
+    """
+    mock_dlmgr.get_download = lambda _: test_download
+
+    response = await do_request(rest_api, f'downloads/{test_download.infohash}/stream/0',
+                                headers={'range': 'bytes=40-99'}, expected_code=206, json_response=False)
+    assert response == b'a' * 60
+
+
+async def test_stream_download_readahead(mock_dlmgr, mock_stream, test_download, rest_api, monkeypatch):
+    """
+    Testing whether the API streams the data that is read (ahead) if the transport does not support sendfile
+    """
+    mock_dlmgr.get_download = lambda _: test_download
+
+    async def mock_sendfile(*_):
+        raise NotImplementedError
+
+    monkeypatch.setattr(StreamChunk, 'sendfile', mock_sendfile)
 
-    await do_request(rest_api, f'downloads/{test_download.infohash}/stream/0',
-                     headers={'range': 'bytes=0-'}, expected_code=206, json_response=False)
+    response = await do_request(rest_api, f'downloads/{test_download.infohash}/stream/0',
+                                headers={'range': 'bytes=0-'}, expected_code=206, json_response=False)
+    assert response == b'a' * 500
 
 
 async def test_change_hops(mock_dlmgr, test_download, rest_api):
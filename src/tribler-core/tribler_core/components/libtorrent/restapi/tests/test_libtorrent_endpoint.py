@@ -98,3 +98,21 @@ async def test_get_stats_for_uninitialized_session(rest_api):
     response_dict = await do_request(rest_api, 'libtorrent/session?hop=%d' % hop, expected_code=200)
     assert response_dict['hop'] == hop
     assert response_dict['session'] == {}
+
+
+async def test_get_metainfo_cache_stats(mock_dlmgr, rest_api):
+    """
+    Tests getting the statistics of the metainfo cache.
+    """
+    mock_dlmgr.metainfo_cache.get_stats = lambda: {'hits': 3, 'misses': 1, 'hit_rate': 0.75}
+    response_dict = await do_request(rest_api, 'libtorrent/metainfo_cache', expected_code=200)
+    assert response_dict == {'hits': 3, 'misses': 1, 'hit_rate': 0.75}
+
+
+async def test_get_metainfo_request_stats(mock_dlmgr, rest_api):
+    """
+    Tests getting the statistics of the metainfo lookups.
+    """
+    mock_dlmgr.metainfo_queue.get_stats = lambda: {'active': 2, 'queued': 5}
+    response_dict = await do_request(rest_api, 'libtorrent/metainfo_requests', expected_code=200)
+    assert response_dict == {'active': 2, 'queued': 5}
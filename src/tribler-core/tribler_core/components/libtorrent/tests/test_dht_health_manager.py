@@ -1,11 +1,12 @@
-from asyncio import Future
 from binascii import unhexlify
+from unittest.mock import patch
 
 from asynctest import Mock
 
 import pytest
 
 from tribler_core.components.libtorrent.download_manager.dht_health_manager import DHTHealthManager
+from tribler_core.components.libtorrent.utils.libtorrent_helper import libtorrent as lt
 from tribler_core.utilities.unicode import hexlify
 
 
@@ -34,6 +35,23 @@ async def test_existing_get_health(dht_health_manager):
     await lookup_future
 
 
+@pytest.mark.asyncio
+async def test_dht_log_alert_subscription(dht_health_manager):
+    """
+    Test whether the DHT log alerts are only subscribed to while there are outstanding lookups
+    """
+    dht_health_manager.subscribe_alerts = Mock()
+    dht_health_manager.unsubscribe_alerts = Mock()
+    lookup_futures = [dht_health_manager.get_health(infohash, timeout=0.1) for infohash in (b'a' * 20, b'b' * 20)]
+    dht_health_manager.subscribe_alerts.assert_called_once()
+
+    dht_health_manager.finalize_lookup(b'a' * 20)
+    dht_health_manager.unsubscribe_alerts.assert_not_called()
+    dht_health_manager.finalize_lookup(b'b' * 20)
+    dht_health_manager.unsubscribe_alerts.assert_called_once()
+    assert all(lookup_future.done() for lookup_future in lookup_futures)
+
+
 @pytest.mark.asyncio
 async def test_combine_bloom_filters(dht_health_manager):
     """
@@ -80,12 +98,80 @@ async def test_receive_bloomfilters(dht_health_manager):
     assert not dht_health_manager.bf_seeders
     assert not dht_health_manager.bf_peers
 
-    dht_health_manager.lookup_futures[infohash] = Future()
-    dht_health_manager.bf_seeders[infohash] = bytearray(256)
-    dht_health_manager.bf_peers[infohash] = bytearray(256)
+    dht_health_manager.get_health(infohash, timeout=0.1)
     dht_health_manager.requesting_bloomfilters(transaction_id, infohash)
     dht_health_manager.received_bloomfilters(transaction_id,
-                                             bf_seeds=bytearray(b'\xee' * 256),
+                                             bf_seeds=bytearray(b'\x0e' * 256),
+                                             bf_peers=bytearray(b'\x0f' * 256))
+    dht_health_manager.received_bloomfilters(transaction_id,
+                                             bf_seeds=bytearray(b'\xe0' * 256),
                                              bf_peers=bytearray(b'\xff' * 256))
-    assert dht_health_manager.bf_seeders[infohash] == bytearray(b'\xee' * 256)
-    assert dht_health_manager.bf_peers[infohash] == bytearray(b'\xff' * 256)
+    assert dht_health_manager.bf_seeders[infohash] == int.from_bytes(b'\xee' * 256, 'big')
+    assert dht_health_manager.bf_peers[infohash] == int.from_bytes(b'\xff' * 256, 'big')
+
+    response = await dht_health_manager.get_health(infohash)
+    assert response['DHT'][0]['seeders'] == dht_health_manager.get_size_from_bloomfilter(b'\xee' * 256)
+    assert response['DHT'][0]['leechers'] == 6000
+    assert not dht_health_manager.outstanding
+    assert not dht_health_manager.transactions
+
+
+@pytest.mark.asyncio
+async def test_shared_lookup_timeout(dht_health_manager):
+    """
+    Test whether concurrent lookups with different timeouts all finish in order
+    """
+    slow_lookup = dht_health_manager.get_health(b'a' * 20, timeout=0.3)
+    fast_lookup = dht_health_manager.get_health(b'b' * 20, timeout=0.1)
+
+    await fast_lookup
+    assert not slow_lookup.done()
+    await slow_lookup
+    assert not dht_health_manager.lookup_deadlines
+    assert not dht_health_manager.lookup_futures
+
+
+def create_dht_pkt_alert(packet, incoming):
+    alert = Mock(pkt_buf=lt.bencode(packet))
+    alert.__str__ = Mock(return_value='<== ...' if incoming else '==> ...')
+    return alert
+
+
+@pytest.mark.asyncio
+async def test_process_dht_pkt_alert(dht_health_manager):
+    """
+    Test whether BEP33 queries and responses are extracted from raw DHT packets
+    """
+    infohash = b'a' * 20
+    query = {b'y': b'q', b'q': b'get_peers', b't': b'ab', b'a': {b'info_hash': infohash, b'scrape': 1}}
+    response = {b'y': b'r', b't': b'ab', b'r': {b'BFsd': b'\x01' * 256, b'BFpe': b'\x02' * 256}}
+
+    # We are not looking up anything, so the packets are ignored
+    dht_health_manager.process_dht_pkt_alert(create_dht_pkt_alert(query, incoming=False))
+    assert not dht_health_manager.outstanding
+
+    dht_health_manager.get_health(infohash, timeout=0.1)
+
+    # Incoming queries are sent by other nodes
+    dht_health_manager.process_dht_pkt_alert(create_dht_pkt_alert(query, incoming=True))
+    assert not dht_health_manager.outstanding
+
+    dht_health_manager.process_dht_pkt_alert(create_dht_pkt_alert(query, incoming=False))
+    assert dht_health_manager.outstanding == {b'ab': infohash}
+
+    dht_health_manager.process_dht_pkt_alert(create_dht_pkt_alert(response, incoming=True))
+    assert dht_health_manager.bf_seeders[infohash] == int.from_bytes(b'\x01' * 256, 'big')
+    assert dht_health_manager.bf_peers[infohash] == int.from_bytes(b'\x02' * 256, 'big')
+
+
+@pytest.mark.asyncio
+async def test_process_dht_pkt_alert_not_bep33(dht_health_manager):
+    """
+    Test whether DHT packets that are no BEP33 messages are not decoded
+    """
+    dht_health_manager.get_health(b'a' * 20, timeout=0.1)
+    alert = create_dht_pkt_alert({b'y': b'q', b'q': b'ping', b't': b'ab', b'a': {}}, incoming=False)
+
+    with patch(f'{DHTHealthManager.__module__}.bdecode_compat') as bdecode:
+        dht_health_manager.process_dht_pkt_alert(alert)
+        bdecode.assert_not_called()
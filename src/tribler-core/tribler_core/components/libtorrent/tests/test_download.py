@@ -14,7 +14,6 @@ from tribler_core.components.libtorrent.download_manager.download_config import
 from tribler_core.tests.tools.base_test import MockObject
 from tribler_core.tests.tools.common import TESTS_DATA_DIR
 from tribler_core.components.libtorrent.utils.torrent_utils import get_info_from_handle
-from tribler_core.utilities.unicode import hexlify
 from tribler_core.utilities.utilities import bdecode_compat
 
 
@@ -50,10 +49,11 @@ async def test_save_resume(mock_handle, test_download, test_tdef):
 
     alert = Mock(resume_data={b'info-hash': test_tdef.get_infohash()})
     await test_download.save_resume_data()
-    basename = hexlify(test_tdef.get_infohash()) + '.conf'
-    filename = test_download.dlmgr.get_checkpoint_dir() / basename
-    dcfg = DownloadConfig.load(str(filename))
-    assert test_tdef.get_infohash(), dcfg.get_engineresumedata().get(b'info-hash')
+    [(infohash, defaults, resume_data, metainfo)] = test_download.dlmgr.resume_store.get_checkpoints()
+    assert infohash == test_tdef.get_infohash()
+    dcfg = DownloadConfig.load_defaults(defaults, resume_data)
+    assert dcfg.get_engineresumedata().get(b'info-hash') == test_tdef.get_infohash()
+    assert bdecode_compat(metainfo) == test_tdef.get_metainfo()
 
 
 def test_move_storage(mock_handle, test_download, test_tdef, test_tdef_no_metainfo):
@@ -80,9 +80,7 @@ def test_move_storage(mock_handle, test_download, test_tdef, test_tdef_no_metain
 @pytest.mark.asyncio
 async def test_save_checkpoint(test_download, test_tdef):
     await test_download.checkpoint()
-    basename = hexlify(test_tdef.get_infohash()) + '.conf'
-    filename = Path(test_download.dlmgr.get_checkpoint_dir() / basename)
-    assert filename.is_file()
+    assert test_tdef.get_infohash() in test_download.dlmgr.resume_store
 
 
 def test_selected_files(mock_handle, test_download):
@@ -340,6 +338,50 @@ def test_torrent_checked_alert(mock_handle, test_download):
     assert mocked_pause_checkpoint.called
 
 
+def test_wait_for_piece(test_download):
+    """
+    Testing whether the futures of the pieces that are waited for fire when the pieces are finished
+    """
+    future = test_download.wait_for_piece(3)
+    assert test_download.wait_for_piece(3) is future
+    other_future = test_download.wait_for_piece(4)
+
+    mock_alert = Mock(piece_index=3, category=lambda: lt.alert.category_t.piece_progress_notification)
+    test_download.process_alert(mock_alert, 'piece_finished_alert')
+    assert future.done()
+    assert not other_future.done()
+    assert list(test_download.piece_futures) == [4]
+
+
+def test_piece_alert_subscription(test_download):
+    """
+    Testing whether the download only subscribes to piece alerts while it is waiting for pieces
+    """
+    category = lt.alert.category_t.piece_progress_notification
+    test_download.wait_for_piece(3)
+    test_download.wait_for_piece(4)
+    test_download.dlmgr.subscribe_alerts.assert_called_once_with(category, 0)
+
+    test_download.on_piece_finished_alert(Mock(piece_index=3))
+    test_download.dlmgr.unsubscribe_alerts.assert_not_called()
+    test_download.on_piece_finished_alert(Mock(piece_index=4))
+    test_download.dlmgr.unsubscribe_alerts.assert_called_once_with(category, 0)
+    assert test_download.piece_alerts_hops is None
+
+
+def test_torrent_checked_alert_resolves_pieces(mock_handle, test_download):
+    """
+    Testing whether the futures of pieces found during a hash check fire after the torrent checked alert
+    """
+    test_download.checkpoint = lambda: succeed(None)
+    mock_handle.have_piece = lambda piece: piece == 1
+    future_have, future_missing = test_download.wait_for_piece(1), test_download.wait_for_piece(2)
+
+    test_download.process_alert(Mock(category=lambda: None), 'torrent_checked_alert')
+    assert future_have.done()
+    assert not future_missing.done()
+
+
 def test_tracker_reply_alert(test_download):
     """
     Testing the tracker reply alert in Download
@@ -351,16 +393,45 @@ def test_tracker_reply_alert(test_download):
     assert test_download.tracker_status['http://google.com'] == [42, 'Working']
 
 
+def test_state_version(test_download):
+    """
+    Testing whether the state version of a download changes when libtorrent reports on the download
+    """
+    version = test_download.state_version
+    test_download.post_alert('tracker_reply_alert', {'url': 'http://google.com', 'num_peers': 42})
+    assert test_download.state_version > version
+
+    version = test_download.state_version
+    test_download.update_lt_status(Mock())
+    assert test_download.state_version > version
+
+
+def test_get_state_cached(test_download):
+    """
+    Testing whether the state of a download is only created again after the libtorrent status changes
+    """
+    test_download.update_lt_status(Mock(pieces=[True, False]))
+    state = test_download.get_state()
+    assert test_download.get_state() is state
+    assert test_download.get_state().get_pieces_complete() is state.get_pieces_complete()
+
+    test_download.update_lt_status(Mock(pieces=[True, True]))
+    assert test_download.get_state() is not state
+
+
 def test_get_pieces_bitmask(mock_handle, test_download):
     """
     Testing whether a correct pieces bitmask is returned when requested
     """
-    test_download.handle.status().pieces = [True, False, True, False, False]
+    test_download.update_lt_status(Mock(pieces=[True, False, True, False, False]))
     assert test_download.get_pieces_base64() == b"oA=="
 
-    test_download.handle.status().pieces = [True * 16]
+    test_download.update_lt_status(Mock(pieces=[True * 16]))
     assert test_download.get_pieces_base64() == b"gA=="
 
+    test_download.update_lt_status(Mock(pieces=[True] * 9))
+    assert test_download.get_pieces_base64() == b"/4A="
+
 
 @pytest.mark.asyncio
 async def test_resume_data_failed(test_download):
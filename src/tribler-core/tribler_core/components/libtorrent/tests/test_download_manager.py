@@ -1,5 +1,5 @@
-from asyncio import Future, gather, get_event_loop, sleep
-from unittest.mock import Mock
+from asyncio import Future, ensure_future, gather, get_event_loop, sleep
+from unittest.mock import Mock, patch
 
 from ipv8.util import succeed
 
@@ -7,11 +7,18 @@ from libtorrent import bencode
 
 import pytest
 
-from tribler_common.simpledefs import DLSTATUS_SEEDING
+from tribler_common.simpledefs import DLSTATUS_DOWNLOADING, DLSTATUS_SEEDING, DLSTATUS_STOPPED
 
-from tribler_core.components.libtorrent.download_manager.download_manager import DownloadManager
+from tribler_core.components.libtorrent.download_manager.download_config import DownloadConfig
+from tribler_core.components.libtorrent.download_manager.download_manager import (
+    CHECKPOINT_BACKUP_DIRNAME,
+    DownloadManager,
+)
+from tribler_core.components.libtorrent.download_manager.metainfo_request_queue import METAINFO_PRIORITY_BACKGROUND
+from tribler_core.components.libtorrent.download_manager.resume_store import ResumeStore
 from tribler_core.components.libtorrent.settings import LibtorrentSettings
 from tribler_core.components.libtorrent.torrentdef import TorrentDef, TorrentDefNoMetainfo
+from tribler_core.components.libtorrent.utils.libtorrent_helper import libtorrent as lt
 from tribler_core.tests.tools.common import TESTS_DATA_DIR, TORRENT_UBUNTU_FILE
 from tribler_core.utilities.path_util import Path
 from tribler_core.utilities.unicode import hexlify
@@ -122,6 +129,56 @@ async def test_get_metainfo_duplicate_request(fake_dlmgr):
     assert results == [metainfo, metainfo]
     fake_dlmgr.start_download.assert_called_once()
     fake_dlmgr.remove_download.assert_called_once()
+    assert fake_dlmgr.metainfo_cache.get_stats()['joined_requests'] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_metainfo_queue(fake_dlmgr):
+    """
+    Test whether metainfo lookups beyond the maximum wait in the queue until another lookup finishes
+    """
+    downloads = {}
+
+    def mock_start_download(tdef, **_):
+        downloads[tdef.get_infohash()] = Mock(future_metainfo=Future(), tdef=Mock(get_metainfo=lambda: None))
+        return downloads[tdef.get_infohash()]
+
+    fake_dlmgr.initialize()
+    fake_dlmgr.metainfo_queue.max_active = 1
+    fake_dlmgr.start_download = mock_start_download
+    fake_dlmgr.remove_download = Mock(return_value=succeed(None))
+
+    first = ensure_future(fake_dlmgr.get_metainfo(b'a' * 20, priority=METAINFO_PRIORITY_BACKGROUND))
+    second = ensure_future(fake_dlmgr.get_metainfo(b'b' * 20, priority=METAINFO_PRIORITY_BACKGROUND))
+    await sleep(.01)
+    assert list(downloads) == [b'a' * 20]
+
+    downloads[b'a' * 20].future_metainfo.set_result({b'info': {}})
+    assert await first == {b'info': {}}
+    await sleep(.01)
+    assert list(downloads) == [b'a' * 20, b'b' * 20]
+    downloads[b'b' * 20].future_metainfo.set_result({b'info': {}})
+    await second
+    assert fake_dlmgr.metainfo_queue.get_stats()['completed'] == 2
+
+
+@pytest.mark.asyncio
+async def test_get_metainfo_release_slot(fake_dlmgr):
+    """
+    Testing whether the slot of a metainfo lookup is released if the lookup fails to start or to finish
+    """
+    fake_dlmgr.initialize()
+    fake_dlmgr.start_download = Mock(side_effect=ValueError)
+    with pytest.raises(ValueError):
+        await fake_dlmgr.get_metainfo(b'a' * 20, priority=METAINFO_PRIORITY_BACKGROUND)
+    assert not fake_dlmgr.metainfo_queue.active
+
+    fake_dlmgr.start_download = Mock(return_value=Mock(tdef=Mock(get_metainfo=lambda: {b'info': {}})))
+    fake_dlmgr.remove_download = Mock(side_effect=RuntimeError)
+    with pytest.raises(RuntimeError):
+        await fake_dlmgr.get_metainfo(b'a' * 20, priority=METAINFO_PRIORITY_BACKGROUND)
+    assert not fake_dlmgr.metainfo_queue.active
+    assert not fake_dlmgr.metainfo_requests
 
 
 @pytest.mark.asyncio
@@ -130,9 +187,10 @@ async def test_get_metainfo_cache(fake_dlmgr):
     Testing whether cached metainfo is returned, if available
     """
     fake_dlmgr.initialize()
-    fake_dlmgr.metainfo_cache[b"a" * 20] = {'meta_info': 'test', 'time': 0}
+    fake_dlmgr.metainfo_cache.put(b"a" * 20, {b'info': {b'name': b'test'}})
 
-    assert await fake_dlmgr.get_metainfo(b"a" * 20) == "test"
+    assert await fake_dlmgr.get_metainfo(b"a" * 20) == {b'info': {b'name': b'test'}}
+    assert fake_dlmgr.metainfo_cache.get_stats()['hits'] == 1
 
 
 @pytest.mark.asyncio
@@ -163,7 +221,7 @@ async def test_start_download_while_getting_metainfo(fake_dlmgr):
     infohash = b"a" * 20
 
     metainfo_session = Mock()
-    metainfo_session.get_torrents = lambda: []
+    metainfo_session.find_torrent = lambda _: Mock(is_valid=lambda: False)
 
     metainfo_dl = Mock()
     metainfo_dl.get_def = lambda: Mock(get_infohash=lambda: infohash)
@@ -201,7 +259,7 @@ async def test_start_download(fake_dlmgr):
                                                            category=lambda _: None))()
 
     mock_ltsession = Mock()
-    mock_ltsession.get_torrents = lambda: []
+    mock_ltsession.find_torrent = lambda _: Mock(is_valid=lambda: False)
     mock_ltsession.async_add_torrent = lambda _: fake_dlmgr.register_task('post_alert',
                                                                           fake_dlmgr.process_alert,
                                                                           mock_alert, delay=0.1)
@@ -254,7 +312,7 @@ async def test_start_download_existing_handle(fake_dlmgr):
     mock_handle.is_valid = lambda: True
 
     mock_ltsession = Mock()
-    mock_ltsession.get_torrents = lambda: [mock_handle]
+    mock_ltsession.find_torrent = lambda _: mock_handle
 
     fake_dlmgr.get_session = lambda *_: mock_ltsession
 
@@ -346,6 +404,70 @@ def test_payout_on_disconnect(fake_dlmgr):
     fake_dlmgr.payout_manager.do_payout.is_called_with(b'a' * 20)
 
 
+def test_alert_subscriptions(fake_dlmgr):
+    """
+    Test whether subscribed alert categories are only added to the alert mask while they are subscribed to
+    """
+    mock_lt_session = Mock()
+    fake_dlmgr.ltsessions[0] = mock_lt_session
+    category = lt.alert.category_t.piece_progress_notification
+    assert not fake_dlmgr.get_alert_mask(0) & category
+
+    fake_dlmgr.subscribe_alerts(category)
+    fake_dlmgr.subscribe_alerts(category)
+    mock_lt_session.set_alert_mask.assert_called_once_with(fake_dlmgr.default_alert_mask | category)
+    assert not fake_dlmgr.get_alert_mask(1) & category
+
+    fake_dlmgr.unsubscribe_alerts(category)
+    assert fake_dlmgr.get_alert_mask(0) & category
+    fake_dlmgr.unsubscribe_alerts(category)
+    fake_dlmgr.unsubscribe_alerts(category)
+    mock_lt_session.set_alert_mask.assert_called_with(fake_dlmgr.default_alert_mask)
+    assert fake_dlmgr.get_alert_mask(0) == fake_dlmgr.default_alert_mask
+
+
+def test_alert_infohash_cache(fake_dlmgr):
+    """
+    Test whether the infohash of the torrent handle of an alert is only converted once
+    """
+    handle = Mock(is_valid=lambda: True, info_hash=Mock(return_value=hexlify(b'a' * 20)))
+    fake_dlmgr.downloads[b'a' * 20] = download = Mock(handle=handle)
+
+    fake_dlmgr.process_alert(Mock(handle=handle), hops=0)
+    fake_dlmgr.process_alert(Mock(handle=handle), hops=0)
+    assert download.process_alert.call_count == 2
+    handle.info_hash.assert_called_once()
+
+    fake_dlmgr.process_alert(type('torrent_removed_alert', (object,), dict(handle=handle))(), hops=0)
+    assert handle not in fake_dlmgr.handle_infohashes
+    fake_dlmgr.downloads.pop(b'a' * 20)
+
+
+@pytest.mark.asyncio
+async def test_process_alerts_time_slice(fake_dlmgr):
+    """
+    Test whether processing alerts yields to the event loop once the time slice is used up
+    """
+    alerts = [Mock() for _ in range(10)]
+    mock_lt_session = Mock(pop_alerts=Mock(side_effect=[alerts, []]))
+    fake_dlmgr.ltsessions[0] = mock_lt_session
+    fake_dlmgr._alert_notify_loop = get_event_loop()
+    processed = []
+    fake_dlmgr.process_alert = lambda alert, hops: processed.append(alert)
+
+    with patch('tribler_core.components.libtorrent.download_manager.download_manager.ALERT_PROCESSING_TIME_SLICE', -1):
+        fake_dlmgr._task_process_alerts()
+        assert processed == alerts[:1]
+        await sleep(0)
+    assert processed == alerts[:2]
+    mock_lt_session.pop_alerts.assert_called_once()
+
+    # Without a time limit, the remaining alerts are processed before new alerts are popped
+    fake_dlmgr._task_process_alerts()
+    assert processed == alerts
+    assert mock_lt_session.pop_alerts.call_count == 2
+
+
 @pytest.mark.asyncio
 async def test_post_session_stats(fake_dlmgr):
     """
@@ -399,23 +521,106 @@ def test_load_empty_checkpoint(fake_dlmgr, tmpdir):
 
 
 @pytest.mark.asyncio
-async def test_load_checkpoints(fake_dlmgr, tmpdir):
+async def test_load_checkpoints(fake_dlmgr):
     """
-    Test whether we are resuming downloads after loading checkpoints
+    Test whether we are resuming downloads after loading checkpoints, and whether checkpoint files are migrated
     """
-    def mocked_load_checkpoint(filename):
-        assert str(filename).endswith('abcd.conf')
-        mocked_load_checkpoint.called = True
+    fake_dlmgr.resume_store = ResumeStore(fake_dlmgr.state_dir / 'resume.db')
+    fake_dlmgr.get_checkpoint_dir = lambda: fake_dlmgr.state_dir
+    filename = fake_dlmgr.state_dir / '13a25451c761b1482d3e85432f07c4be05ca8a56.conf'
+    filename.write_bytes((TESTS_DATA_DIR / 'config_files' / filename.name).read_bytes())
+    (fake_dlmgr.state_dir / 'corrupt.conf').write_bytes(b"hi")
+    fake_dlmgr.start_download = Mock()
 
-    mocked_load_checkpoint.called = False
-    fake_dlmgr.get_checkpoint_dir = lambda: Path(tmpdir)
+    await fake_dlmgr.load_checkpoints()
+    tdef = fake_dlmgr.start_download.call_args.kwargs['tdef']
+    assert hexlify(tdef.get_infohash()) == filename.stem
+    assert tdef.get_infohash() in fake_dlmgr.resume_store
+    assert not filename.exists()
+    assert (fake_dlmgr.state_dir / CHECKPOINT_BACKUP_DIRNAME / filename.name).exists()
+    assert (fake_dlmgr.state_dir / 'corrupt.conf').exists()
+
+    # The migrated checkpoint is loaded from the resume store the next time
+    fake_dlmgr.start_download.reset_mock()
+    await fake_dlmgr.load_checkpoints()
+    assert fake_dlmgr.start_download.call_args.kwargs['tdef'].get_infohash() == tdef.get_infohash()
 
-    with open(fake_dlmgr.get_checkpoint_dir() / 'abcd.conf', 'wb') as state_file:
-        state_file.write(b"hi")
 
-    fake_dlmgr.load_checkpoint = mocked_load_checkpoint
-    await fake_dlmgr.load_checkpoints()
-    assert mocked_load_checkpoint.called
+@pytest.mark.asyncio
+async def test_load_checkpoints_batches(fake_dlmgr):
+    """
+    Test whether all checkpoints are parsed in batches and resumed
+    """
+    fake_dlmgr.resume_store = ResumeStore(fake_dlmgr.state_dir / 'resume.db')
+    fake_dlmgr.get_checkpoint_dir = lambda: fake_dlmgr.state_dir
+    for index in range(5):
+        fake_dlmgr.resume_store.save(bytes([index]) * 20, b'', b'de', b'de')
+    fake_dlmgr.parse_checkpoint = lambda infohash, *_: (infohash[0], None)
+    fake_dlmgr.resume_checkpoint = Mock()
+
+    with patch('tribler_core.components.libtorrent.download_manager.download_manager.CHECKPOINT_BATCH_SIZE', 2):
+        await fake_dlmgr.load_checkpoints()
+    loaded = sorted(call.args[0] for call in fake_dlmgr.resume_checkpoint.call_args_list)
+    assert loaded == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize('user_stopped,resume_data,lazy', [(True, {b'a': 1}, True),
+                                                            (True, {}, False),
+                                                            (False, {b'a': 1}, False)])
+def test_load_checkpoint_lazy(fake_dlmgr, user_stopped, resume_data, lazy):
+    """
+    Test whether only downloads that are stopped by the user, and have resume data, are loaded lazily
+    """
+    config = DownloadConfig()
+    config.set_dest_dir(Path('/'))
+    config.set_user_stopped(user_stopped)
+    config.set_engineresumedata(resume_data)
+    fake_dlmgr.start_download = Mock()
+    fake_dlmgr.resume_checkpoint(config, TorrentDefNoMetainfo(b'a' * 20, 'name'))
+    assert fake_dlmgr.start_download.call_args.kwargs['lazy'] == lazy
+
+
+@pytest.mark.asyncio
+async def test_start_download_lazy(fake_dlmgr):
+    """
+    Test whether a lazy download is only added to libtorrent once it is resumed
+    """
+    fake_dlmgr.start_handle = Mock()
+    config = DownloadConfig()
+    config.set_user_stopped(True)
+    download = fake_dlmgr.start_download(tdef=TorrentDefNoMetainfo(b'a' * 20, 'name'), config=config,
+                                         checkpoint_disabled=True, lazy=True)
+    fake_dlmgr.start_handle.assert_not_called()
+
+    download.resume()
+    download.resume()
+    fake_dlmgr.start_handle.assert_called_once()
+    assert not download.config.get_user_stopped()
+    fake_dlmgr.downloads.clear()
+    await download.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_remove_lazy_download_content(fake_dlmgr):
+    """
+    Test whether libtorrent removes the content of a lazy download, after the download is added to it
+    """
+    metainfo = {b'info': {b'name': b'torrent', b'piece length': 16384, b'pieces': b'\x00' * 20,
+                          b'files': [{b'path': [b'a.txt'], b'length': 1}]}}
+    handle = Mock(is_valid=lambda: True, torrent_file=lambda: None)
+    ltsession = Mock()
+    fake_dlmgr.get_session = lambda *_: ltsession
+    fake_dlmgr.start_handle = Mock(side_effect=lambda d, _: d.post_alert('add_torrent_alert', dict(handle=handle)))
+    ltsession.remove_torrent = Mock(side_effect=lambda *_: download.post_alert('torrent_removed_alert'))
+
+    config = DownloadConfig()
+    config.set_user_stopped(True)
+    download = fake_dlmgr.start_download(tdef=TorrentDef(metainfo=metainfo, ignore_validation=True), config=config,
+                                         checkpoint_disabled=True, lazy=True)
+    await fake_dlmgr.remove_download(download, remove_content=True)
+
+    fake_dlmgr.start_handle.assert_called_once()
+    ltsession.remove_torrent.assert_called_once_with(handle, 1)
 
 
 @pytest.mark.asyncio
@@ -447,6 +652,38 @@ def test_get_downloads_by_name(fake_dlmgr):
     assert fake_dlmgr.get_downloads_by_name("ubuntu-15.04-desktop-amd64.iso", channels_only=True)
 
 
+
+@pytest.mark.asyncio
+async def test_download_state_listeners(fake_dlmgr):
+    """
+    Test whether the download state listeners are only invoked when a download is added, removed, or changes its
+    status or hop count
+    """
+    listener = Mock()
+    fake_dlmgr.add_download_state_listener(listener)
+    fake_dlmgr.get_session = lambda *_: Mock(find_torrent=lambda _: Mock(is_valid=lambda: False))
+    download = fake_dlmgr.start_download(torrent_file=TORRENT_UBUNTU_FILE, checkpoint_disabled=True)
+    listener.assert_called_once_with(download, DLSTATUS_STOPPED)
+
+    download.update_lt_status(Mock(paused=False, state=3, error=None))
+    download.update_lt_status(Mock(paused=False, state=3, error=None))
+    listener.assert_called_with(download, DLSTATUS_DOWNLOADING)
+    assert listener.call_count == 2
+
+    download.config.set_hops(2)
+    download.update_lt_status(Mock(paused=False, state=3, error=None))
+    assert listener.call_count == 3
+
+    download.future_removed = succeed(None)
+    download.handle = None
+    await fake_dlmgr.remove_download(download)
+    listener.assert_called_with(download, None)
+
+    fake_dlmgr.remove_download_state_listener(listener)
+    fake_dlmgr.start_download(torrent_file=TORRENT_UBUNTU_FILE, checkpoint_disabled=True)
+    assert listener.call_count == 4
+
+
 @pytest.mark.asyncio
 async def test_check_for_dht_ready(fake_dlmgr):
     fake_dlmgr.get_session = Mock()
@@ -54,13 +54,15 @@ def test_getters_setters_2(mock_download, mock_lt_status):
     assert download_state.get_seeding_ratio() == 0.5
     assert download_state.get_eta() == 0.25
     assert download_state.get_num_seeds_peers() == (5, 5)
-    assert download_state.get_pieces_complete() == []
+    assert list(download_state.get_pieces_complete()) == []
     assert download_state.get_pieces_total_complete() == (0, 0)
     assert download_state.get_seeding_time() == 10
 
+    # The pieces are converted once per state
     mock_lt_status.num_pieces = 6
     mock_lt_status.pieces = [1, 1, 1, 0, 0, 0]
-    assert download_state.get_pieces_complete() == [1, 1, 1, 0, 0, 0]
+    download_state = DownloadState(mock_download, mock_lt_status, None)
+    assert list(download_state.get_pieces_complete()) == [1, 1, 1, 0, 0, 0]
     assert download_state.get_pieces_total_complete() == (6, 3)
 
     mock_download.config.get_selected_files = lambda: ['test']
@@ -68,6 +70,22 @@ def test_getters_setters_2(mock_download, mock_lt_status):
     assert download_state.get_progress() == 0.75
 
 
+def test_getters_resume_data(mock_download):
+    """
+    Testing whether the getters fall back to the resume data of a download that is not in libtorrent
+    """
+    mock_download.config.get_engineresumedata = lambda: {b'total_uploaded': 100, b'total_downloaded': 200,
+                                                         b'finished_time': 10, b'pieces': b'\x01\x03\x00\x02'}
+    download_state = DownloadState(mock_download, None, None)
+
+    assert list(download_state.get_pieces_complete()) == [1, 1, 0, 0]
+    assert download_state.get_progress() == 0.5
+    assert download_state.get_total_transferred(UPLOAD) == 100
+    assert download_state.get_total_transferred(DOWNLOAD) == 200
+    assert download_state.get_seeding_ratio() == 100 / (0.5 * 43)
+    assert download_state.get_seeding_time() == 10
+
+
 def test_get_files_completion(mock_download, mock_tdef):
     """
     Testing whether the right completion of files is returned
@@ -101,6 +119,7 @@ def test_get_availability(mock_download):
     """
     mock_ltstate = Mock()
     mock_ltstate.pieces = [True]
+    mock_download.handle = None
     download_state = DownloadState(mock_download, mock_ltstate, 0.6)
     download_state.get_peerlist = lambda: []
 
@@ -109,7 +128,7 @@ def test_get_availability(mock_download):
     assert download_state.get_availability() == 1.0
     download_state.get_peerlist = lambda: [{'completed': 0.6}]
     assert download_state.get_availability() == 0.0
-    download_state.lt_status.pieces = [0, 0, 0, 0, 0]
+    download_state = DownloadState(mock_download, Mock(pieces=[0, 0, 0, 0, 0]), 0.6)
     download_state.get_peerlist = lambda: [{'completed': 0}, {'have': [1, 1, 1, 1, 0]}]
     assert download_state.get_availability() == 0.8
 
@@ -117,3 +136,20 @@ def test_get_availability(mock_download):
     download_state.get_peerlist = lambda: [{'completed': 0.5, 'have': [1, 0]},
                                            {'completed': 0.9, 'have': [1, 0, 1]}]
     assert download_state.get_availability() == 0.0
+
+
+def test_get_availability_from_handle(mock_download):
+    """
+    Testing whether the availability is computed from the piece availability of libtorrent, if it has it
+    """
+    mock_download.handle.piece_availability = lambda: [2, 3, 2, 4, 2]
+    download_state = DownloadState(mock_download, Mock(pieces=[0, 0, 0, 0, 0]), None)
+    download_state.get_peerlist = Mock()
+
+    assert download_state.get_availability() == 2.4
+    download_state.get_peerlist.assert_not_called()
+
+    # While seeding, libtorrent does not keep track of the piece availability
+    mock_download.handle.piece_availability = lambda: []
+    download_state.get_peerlist = lambda: [{'completed': 1.0}]
+    assert download_state.get_availability() == 1.0
@@ -0,0 +1,154 @@
+import os
+import time
+
+import pytest
+
+from tribler_core.components.libtorrent.download_manager.metainfo_cache import MetainfoCache, SPILL_SUFFIX
+from tribler_core.components.libtorrent.utils.libtorrent_helper import libtorrent as lt
+
+
+def create_metainfo(index, size=1000):
+    return {b'info': {b'name': f'torrent {index}'.encode(), b'pieces': bytes([index]) * size}}
+
+
+async def create_metainfo_cache(*args, **kwargs):
+    metainfo_cache = MetainfoCache(*args, **kwargs)
+    if metainfo_cache.spill_dir:
+        await metainfo_cache.load_spilled()
+    return metainfo_cache
+
+
+async def wait_for_spill(metainfo_cache):
+    """
+    Wait until the evicted metainfo has been written, and the pending file operations are done.
+    """
+    await metainfo_cache.wait_for_tasks()
+    await metainfo_cache.run_io(lambda: None)
+
+
+@pytest.fixture
+async def metainfo_cache(tmp_path):
+    metainfo_cache = await create_metainfo_cache(5000, 60, spill_dir=tmp_path / 'metainfo_cache',
+                                                 max_spill_size=100000)
+    yield metainfo_cache
+    await metainfo_cache.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_get_put(metainfo_cache):
+    """
+    Test whether cached metainfo is returned, and whether hits and misses are counted
+    """
+    metainfo_cache.put(b'a' * 20, create_metainfo(1))
+    assert await metainfo_cache.get(b'a' * 20) == create_metainfo(1)
+    assert await metainfo_cache.get(b'b' * 20) is None
+    assert metainfo_cache.size == len(lt.bencode(create_metainfo(1)))
+    stats = metainfo_cache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 1, 0.5)
+
+
+@pytest.mark.asyncio
+async def test_evict_least_recently_used(metainfo_cache):
+    """
+    Test whether the least recently used metainfo is spilled to disk once the cache is full, and loaded again from disk
+    """
+    for index in range(4):
+        metainfo_cache.put(bytes([index]) * 20, create_metainfo(index))
+    await metainfo_cache.get(bytes([0]) * 20)
+    metainfo_cache.put(bytes([4]) * 20, create_metainfo(4))
+    metainfo_cache.put(bytes([5]) * 20, create_metainfo(5))
+    await wait_for_spill(metainfo_cache)
+
+    assert list(metainfo_cache.entries) == [bytes([index]) * 20 for index in (3, 0, 4, 5)]
+    assert list(metainfo_cache.spilled) == [bytes([1]) * 20, bytes([2]) * 20]
+    assert metainfo_cache.size <= 5000
+    assert len(list(metainfo_cache.spill_dir.iterdir())) == 2
+
+    assert await metainfo_cache.get(bytes([1]) * 20) == create_metainfo(1)
+    assert bytes([1]) * 20 in metainfo_cache.entries
+    assert metainfo_cache.get_stats()['spill_hits'] == 1
+    await wait_for_spill(metainfo_cache)
+    assert not metainfo_cache.get_spill_path(bytes([1]) * 20).exists()
+
+
+@pytest.mark.asyncio
+async def test_get_while_spilling(metainfo_cache):
+    """
+    Test whether metainfo that is being spilled is still served from memory, and its spill file is removed
+    """
+    metainfo_cache.put(b'a' * 20, create_metainfo(1))
+    metainfo_cache.evict(b'a' * 20, metainfo_cache.entries.pop(b'a' * 20))
+    assert await metainfo_cache.get(b'a' * 20) == create_metainfo(1)
+    await wait_for_spill(metainfo_cache)
+
+    assert b'a' * 20 in metainfo_cache.entries
+    assert not metainfo_cache.spilling
+    assert not metainfo_cache.spilled
+    assert not list(metainfo_cache.spill_dir.iterdir())
+
+
+@pytest.mark.asyncio
+async def test_spill_limit(tmp_path):
+    """
+    Test whether the oldest spilled metainfo is removed once the spill directory is full
+    """
+    metainfo_cache = await create_metainfo_cache(0, 60, spill_dir=tmp_path, max_spill_size=300)
+    for index in range(10):
+        metainfo_cache.put(bytes([index]) * 20, create_metainfo(index))
+    await wait_for_spill(metainfo_cache)
+    assert 0 < metainfo_cache.spill_size <= 300
+    assert bytes([0]) * 20 not in metainfo_cache
+    assert sum(path.stat().st_size for path in tmp_path.iterdir()) == metainfo_cache.spill_size
+    await metainfo_cache.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_expire(metainfo_cache):
+    """
+    Test whether unused metainfo is evicted from memory after max_age seconds
+    """
+    metainfo_cache.put(b'a' * 20, create_metainfo(1))
+    metainfo_cache.expire()
+    assert b'a' * 20 in metainfo_cache.entries
+
+    metainfo_cache.max_age = -1
+    metainfo_cache.expire()
+    await wait_for_spill(metainfo_cache)
+    assert not metainfo_cache.entries
+    assert b'a' * 20 in metainfo_cache.spilled
+
+
+@pytest.mark.asyncio
+async def test_load_spilled(metainfo_cache, tmp_path):
+    """
+    Test whether metainfo that was spilled by a previous session is found
+    """
+    metainfo_cache.put(b'a' * 20, create_metainfo(1))
+    metainfo_cache.evict(b'a' * 20, metainfo_cache.entries.pop(b'a' * 20))
+    await wait_for_spill(metainfo_cache)
+
+    other_cache = await create_metainfo_cache(5000, 60, spill_dir=tmp_path / 'metainfo_cache', max_spill_size=100000)
+    assert await other_cache.get(b'a' * 20) == create_metainfo(1)
+    await other_cache.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_load_spilled_prune(metainfo_cache, tmp_path):
+    """
+    Test whether stale spilled files, and the oldest spilled files beyond the size limit, are removed when loading
+    """
+    for index in range(3):
+        metainfo_cache.put(bytes([index]) * 20, create_metainfo(index))
+        metainfo_cache.evict(bytes([index]) * 20, metainfo_cache.entries.pop(bytes([index]) * 20))
+        await wait_for_spill(metainfo_cache)
+    spill_dir = tmp_path / 'metainfo_cache'
+    old_path = metainfo_cache.get_spill_path(bytes([0]) * 20)
+    os.utime(old_path, (time.time() - 120, time.time() - 120))
+    (spill_dir / ('invalid' + SPILL_SUFFIX)).write_bytes(b'')
+
+    other_cache = await create_metainfo_cache(5000, 60, spill_dir=spill_dir,
+                                              max_spill_size=metainfo_cache.spilled[bytes([2]) * 20], max_spill_age=60)
+    await wait_for_spill(other_cache)
+    assert list(other_cache.spilled) == [bytes([2]) * 20]
+    assert [path.name for path in spill_dir.iterdir()] == [other_cache.get_spill_path(bytes([2]) * 20).name]
+    await other_cache.shutdown()
@@ -0,0 +1,99 @@
+from asyncio import TimeoutError, ensure_future, sleep, wait_for
+
+import pytest
+
+from tribler_core.components.libtorrent.download_manager.metainfo_request_queue import MetainfoRequestQueue
+
+
+@pytest.mark.asyncio
+async def test_acquire_release():
+    """
+    Test whether infohashes wait for a slot, and get it in order of priority
+    """
+    queue = MetainfoRequestQueue(1)
+    await queue.acquire(b'a', 2)
+    low = ensure_future(queue.acquire(b'b', 2))
+    high = ensure_future(queue.acquire(b'c', 1))
+    await sleep(.01)
+    assert queue.get_stats()['queued'] == 2
+
+    queue.release(b'a')
+    await sleep(.01)
+    assert high.done() and not low.done()
+    assert queue.active == {b'c'}
+
+    queue.release(b'c')
+    await sleep(.01)
+    assert low.done()
+
+
+@pytest.mark.asyncio
+async def test_acquire_same_infohash():
+    """
+    Test whether requests for an infohash that has a slot, or is waiting for one, share that slot
+    """
+    queue = MetainfoRequestQueue(1)
+    await queue.acquire(b'a', 1)
+    await queue.acquire(b'a', 1)
+    first = ensure_future(queue.acquire(b'b', 2))
+    second = ensure_future(queue.acquire(b'b', 1))
+    await sleep(.01)
+    assert queue.waiting[b'b'][1:3] == [2, 1]
+
+    queue.release(b'a')
+    await sleep(.01)
+    assert first.done() and second.done()
+    assert queue.active == {b'b'}
+
+
+@pytest.mark.asyncio
+async def test_acquire_urgent():
+    """
+    Test whether urgent requests get a slot right away, also for an infohash that is waiting for one
+    """
+    queue = MetainfoRequestQueue(1)
+    await queue.acquire(b'a', 1)
+    await queue.acquire(b'b', 0)
+    waiting = ensure_future(queue.acquire(b'c', 2))
+    await sleep(.01)
+    await queue.acquire(b'c', 0)
+    await sleep(.01)
+    assert waiting.done()
+    assert queue.active == {b'a', b'b', b'c'}
+
+    # Slots are only given to waiting infohashes once the number of active infohashes is below the maximum
+    queue.release(b'a')
+    waiting = ensure_future(queue.acquire(b'd', 2))
+    await sleep(.01)
+    assert not waiting.done()
+    queue.release(b'b')
+    queue.release(b'c')
+    await sleep(.01)
+    assert waiting.done()
+
+
+@pytest.mark.asyncio
+async def test_acquire_timeout():
+    """
+    Test whether an infohash stops waiting once all of its requests time out
+    """
+    queue = MetainfoRequestQueue(1)
+    await queue.acquire(b'a', 1)
+    with pytest.raises(TimeoutError):
+        await wait_for(queue.acquire(b'b', 1), 0.01)
+    assert not queue.waiting
+
+    queue.release(b'a')
+    assert not queue.active
+
+
+def test_stats():
+    """
+    Test whether the latency of requests is reported
+    """
+    queue = MetainfoRequestQueue(1)
+    for latency in range(1, 101):
+        queue.add_latency(latency, latency <= 90)
+    stats = queue.get_stats()
+    assert (stats['completed'], stats['failed']) == (90, 10)
+    assert (stats['latency_median'], stats['latency_95th_percentile']) == (51, 96)
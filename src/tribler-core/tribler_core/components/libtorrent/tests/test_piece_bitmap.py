@@ -0,0 +1,22 @@
+from tribler_core.components.libtorrent.download_manager.piece_bitmap import PieceBitmap
+
+
+def test_from_pieces():
+    """
+    Test whether piece lists are converted into one byte per piece
+    """
+    bitmap = PieceBitmap.from_pieces([True, False, 16, 0])
+    assert bitmap == b'\x01\x00\x01\x00'
+    assert bitmap[0] and not bitmap[1]
+    assert bitmap.num_complete() == 2
+    assert not bitmap.all_complete()
+    assert PieceBitmap.from_pieces([True] * 3).all_complete()
+
+
+def test_to_base64():
+    """
+    Test whether the bitmap is packed into bits with the first piece in the most significant bit
+    """
+    assert PieceBitmap.from_pieces([]).to_base64() == b''
+    assert PieceBitmap.from_pieces([True, False, True, False, False]).to_base64() == b'oA=='
+    assert PieceBitmap.from_pieces([True] * 8 + [False] * 7 + [True]).to_base64() == b'/wE='
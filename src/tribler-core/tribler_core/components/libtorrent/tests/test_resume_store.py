@@ -0,0 +1,102 @@
+from asyncio import get_event_loop, sleep
+
+import pytest
+
+from tribler_core.components.libtorrent.download_manager.resume_store import ResumeStore
+
+
+@pytest.fixture
+def resume_store(tmp_path):
+    store = ResumeStore(tmp_path / 'resume.db')
+    yield store
+    store.close()
+
+
+def test_save_flush(resume_store, tmp_path):
+    """
+    Test whether checkpoints are only written to the database when the store is flushed
+    """
+    resume_store.save(b'a' * 20, b'config', b'resume', b'metainfo')
+    assert b'a' * 20 in resume_store
+    other_store = ResumeStore(tmp_path / 'resume.db')
+    assert not other_store.get_checkpoints()
+
+    resume_store.flush()
+    assert other_store.get_checkpoints() == [(b'a' * 20, b'config', b'resume', b'metainfo')]
+    other_store.close()
+
+
+def test_remove(resume_store):
+    """
+    Test whether removed checkpoints are deleted, together with their metainfo
+    """
+    resume_store.save(b'a' * 20, b'config', b'resume', b'metainfo')
+    resume_store.flush()
+    resume_store.remove(b'a' * 20)
+    assert b'a' * 20 not in resume_store
+
+    resume_store.flush()
+    assert not resume_store.get_checkpoints()
+    assert not resume_store.connection.execute("SELECT * FROM metainfo").fetchall()
+
+
+def test_metainfo_written_once(resume_store):
+    """
+    Test whether the metainfo of a torrent is only written again when it changes
+    """
+    resume_store.save(b'a' * 20, b'config', b'resume', b'metainfo')
+    resume_store.flush()
+    resume_store.save(b'a' * 20, b'config', b'resume2', b'metainfo')
+    assert not resume_store.pending_metainfo
+    resume_store.save(b'a' * 20, b'config', b'resume3', b'metainfo2')
+    assert resume_store.pending_metainfo == {b'a' * 20: b'metainfo2'}
+    assert resume_store.get_checkpoints() == [(b'a' * 20, b'config', b'resume3', b'metainfo2')]
+
+
+def test_compact(resume_store):
+    """
+    Test whether the database is vacuumed once most of it is unused
+    """
+    for index in range(100):
+        resume_store.save(bytes([index]) * 20, b'config', b'resume' * 1000, b'metainfo' * 1000)
+    resume_store.flush()
+    for index in range(90):
+        resume_store.remove(bytes([index]) * 20)
+    resume_store.flush()
+    assert resume_store.connection.execute("PRAGMA freelist_count").fetchone()[0] > 0
+
+    resume_store.compact()
+    assert resume_store.connection.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert len(resume_store.get_checkpoints()) == 10
+
+
+def test_save_new(resume_store, tmp_path):
+    """
+    Test whether saving a checkpoint tells whether the store already had a checkpoint of the download
+    """
+    assert resume_store.save(b'a' * 20, b'config', b'resume', b'metainfo')
+    assert not resume_store.save(b'a' * 20, b'config', b'resume2', b'metainfo')
+    resume_store.flush()
+
+    other_store = ResumeStore(tmp_path / 'resume.db')
+    assert b'a' * 20 in other_store
+    assert not other_store.save(b'a' * 20, b'config', b'resume3', b'metainfo')
+    other_store.remove(b'a' * 20)
+    assert other_store.save(b'a' * 20, b'config', b'resume4', b'metainfo')
+    other_store.close()
+
+
+@pytest.mark.asyncio
+async def test_flush_threaded(resume_store):
+    """
+    Test whether checkpoints can be saved while another thread uses the database
+    """
+    resume_store.save(b'a' * 20, b'config', b'resume', b'metainfo')
+    with resume_store.db_lock:
+        flush_future = get_event_loop().run_in_executor(None, resume_store.flush)
+        await sleep(0.1)
+        resume_store.save(b'b' * 20, b'config', b'resume', b'metainfo')
+    await flush_future
+
+    assert not resume_store.pending
+    assert len(resume_store.get_checkpoints()) == 2
@@ -0,0 +1,186 @@
+from unittest.mock import Mock
+
+import pytest
+
+from tribler_core.components.libtorrent.download_manager.download_config import DownloadConfig
+from tribler_core.components.libtorrent.download_manager.stream import (
+    DEADLINE_PRIO_MAP,
+    NotStreamingError,
+    Stream,
+    StreamChunk,
+)
+from tribler_core.tests.tools.common import TESTS_DATA_DIR
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(20)
+async def test_stream_read(download_manager, video_seeder, video_tdef, tmp_path):
+    """
+    Test whether a stream chunk reads the pieces of a file as soon as they are downloaded from a seeder
+    """
+    dscfg = DownloadConfig()
+    dscfg.set_dest_dir(tmp_path)
+    download = download_manager.start_download(tdef=video_tdef, config=dscfg)
+    download.add_stream()
+    download.add_peer(("127.0.0.1", video_seeder.libtorrent_port))
+    await download.stream.enable(0, 0)
+
+    with open(TESTS_DATA_DIR / 'video.avi', "rb") as f:
+        expected = f.read()
+
+    startpos = download.stream.piecelen
+    async with StreamChunk(download.stream, startpos) as chunk:
+        data = await chunk.read()
+
+    assert data == expected[startpos:startpos + download.stream.piecelen]
+    assert not download.piece_futures
+
+
+class MockStreamDownload:
+    """
+    Keeps the piece priorities and deadlines that a stream sets, in place of a libtorrent handle.
+    """
+
+    def __init__(self, num_pieces):
+        self.pieces_complete = [False] * num_pieces
+        self.priorities = [4] * num_pieces
+        self.deadlines = {}
+        self.set_piece_priorities = Mock(wraps=self._set_piece_priorities)
+        self.set_piece_deadline = Mock(wraps=self.deadlines.__setitem__)
+        self.reset_piece_deadline = Mock(wraps=lambda piece: self.deadlines.pop(piece, None))
+
+    def _set_piece_priorities(self, priorities):
+        if priorities and isinstance(priorities[0], tuple):
+            for piece, prio in priorities:
+                self.priorities[piece] = prio
+        else:
+            self.priorities[:len(priorities)] = priorities
+
+
+@pytest.fixture(name="stream_download")
+def fixture_stream_download():
+    return MockStreamDownload(100)
+
+
+@pytest.fixture(name="stream")
+def fixture_stream(stream_download):
+    stream = Stream(Mock())
+    stream._Stream__prepare_coro.close()  # pylint: disable=protected-access
+    stream.infohash = b'a' * 20
+    stream.fileindex = 0
+    stream.firstpiece = 0
+    stream.lastpiece = 99
+    stream.headerpieces = [0, 1]
+    stream.footerpieces = [99]
+    stream._Stream__lt_state = lambda: Mock(get_pieces_complete=lambda: stream_download.pieces_complete)
+    stream._Stream__getpieceprios = lambda: list(stream_download.priorities)
+    stream._Stream__setpieceprios = stream_download.set_piece_priorities
+    stream._Stream__setdeadline = stream_download.set_piece_deadline
+    stream._Stream__resetdeadline = stream_download.reset_piece_deadline
+    return stream
+
+
+@pytest.mark.asyncio
+async def test_updateprios_static_buffer(stream, stream_download):
+    """
+    Test whether only the static buffer pieces are downloaded until the static buffer is complete
+    """
+    stream.cursorpiecemap[0] = [False, [10, 11, 12]]
+    await stream.updateprios()
+
+    assert stream_download.priorities == [7, 7] + [0] * 97 + [7]
+    assert stream_download.deadlines == {0: 10, 1: 10, 99: 0}
+
+
+@pytest.mark.asyncio
+async def test_updateprios_dynamic_buffer(stream, stream_download):
+    """
+    Test whether the pieces in the buffers of the chunks get a deadline, and the closest chunk decides the deadline
+    """
+    for piece in stream.headerpieces + stream.footerpieces:
+        stream_download.pieces_complete[piece] = True
+    stream.cursorpiecemap[0] = [False, [10, 11, 12]]
+    stream.cursorpiecemap[1] = [False, [11, 12, 13]]
+    stream.cursorpiecemap[2] = [True, [50, 51]]
+    await stream.updateprios()
+
+    expected = [4, 4] + [1] * 8 + [DEADLINE_PRIO_MAP[0]] * 2 + DEADLINE_PRIO_MAP[1:3] + [1] * 85 + [4]
+    assert stream_download.priorities == expected
+    assert stream_download.deadlines == {10: 0, 11: 0, 12: 10, 13: 20}
+
+
+@pytest.mark.asyncio
+async def test_updateprios_diff(stream, stream_download):
+    """
+    Test whether only the changed priorities and deadlines are pushed to libtorrent
+    """
+    for piece in stream.headerpieces + stream.footerpieces:
+        stream_download.pieces_complete[piece] = True
+    stream.cursorpiecemap[0] = [False, [10, 11, 12]]
+    await stream.updateprios()
+    stream_download.set_piece_priorities.reset_mock()
+    stream_download.set_piece_deadline.reset_mock()
+
+    await stream.updateprios()
+    stream_download.set_piece_priorities.assert_not_called()
+    stream_download.set_piece_deadline.assert_not_called()
+
+    # The chunk moves one piece forward
+    stream_download.pieces_complete[10] = True
+    stream.cursorpiecemap[0] = [False, [11, 12, 13]]
+    await stream.updateprios()
+    stream_download.set_piece_priorities.assert_called_once_with([(11, DEADLINE_PRIO_MAP[0]),
+                                                                  (13, DEADLINE_PRIO_MAP[2])])
+    assert stream_download.deadlines == {10: 0, 11: 0, 12: 10, 13: 20}
+
+
+def test_resetprios(stream, stream_download):
+    """
+    Test whether resetting the priorities of some pieces only affects those pieces
+    """
+    stream.piecedeadlines = {10: 0, 11: 1}
+    stream.resetprios([10, 11], 1)
+    assert stream_download.priorities == [4] * 10 + [1, 1] + [4] * 88
+    assert not stream.piecedeadlines
+
+
+@pytest.mark.asyncio
+async def test_updateprios_leave_buffer(stream, stream_download):
+    """
+    Test whether the pieces that leave the dynamic buffers get the minimum priority and lose their deadline
+    """
+    for piece in stream.headerpieces + stream.footerpieces:
+        stream_download.pieces_complete[piece] = True
+    stream.cursorpiecemap[0] = [False, [10, 11, 12]]
+    await stream.updateprios()
+    assert stream.dynamicbuffering
+
+    stream.cursorpiecemap[0][0] = True
+    await stream.updateprios()
+    assert stream_download.priorities == [4, 4] + [1] * 97 + [4]
+    assert not stream_download.deadlines
+    assert not stream.piecedeadlines
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_chunk_open_disabled(stream, tmp_path):
+    """
+    Test whether opening a chunk fails, rather than spins, if the stream is disabled before its file exists
+    """
+    stream.filename = tmp_path / 'video.mp4'
+    chunk = StreamChunk(stream)
+    stream.fileindex = None
+    with pytest.raises(NotStreamingError):
+        await chunk.open()
+
+
+def test_disable_piece_alerts(stream):
+    """
+    Test whether disabling the stream lets the download unsubscribe from the piece alerts
+    """
+    stream._Stream__setselectedfiles = Mock()  # pylint: disable=protected-access
+    stream._Stream__updatepiecealerts = Mock()  # pylint: disable=protected-access
+    stream.disable()
+    assert not stream.enabled
+    stream._Stream__updatepiecealerts.assert_called_once()  # pylint: disable=protected-access
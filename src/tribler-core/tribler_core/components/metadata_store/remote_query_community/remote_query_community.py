@@ -20,6 +20,7 @@ from tribler_core.components.metadata_store.utils import RequestTimeoutException
 from tribler_core.utilities.unicode import hexlify
 
 BINARY_FIELDS = ("infohash", "channel_pk")
+BINARY_SET_FIELDS = ("infohash_set",)
 
 
 def sanitize_query(query_dict, cap=100):
@@ -38,6 +39,12 @@ def sanitize_query(query_dict, cap=100):
         if value is not None:
             sanitized_dict[field] = unhexlify(value)
 
+    # convert lists of hex values to sets of binary values
+    for field in BINARY_SET_FIELDS:
+        value = sanitized_dict.get(field)
+        if value is not None:
+            sanitized_dict[field] = {unhexlify(item) for item in value[:cap]}
+
     return sanitized_dict
 
 
@@ -52,6 +59,11 @@ def convert_to_json(parameters):
         if value is not None:
             sanitized[field] = hexlify(value)
 
+    for field in BINARY_SET_FIELDS:
+        value = parameters.get(field)
+        if value is not None:
+            sanitized[field] = [hexlify(item) for item in value]
+
     if "origin_id" in parameters:
         sanitized["origin_id"] = int(parameters["origin_id"])
 
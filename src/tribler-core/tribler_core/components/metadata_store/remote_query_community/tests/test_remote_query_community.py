@@ -3,7 +3,7 @@ import string
 from asyncio import sleep
 from binascii import unhexlify
 from datetime import datetime
-from json import dumps
+from json import dumps, loads
 from operator import attrgetter
 from os import urandom
 from time import time
@@ -22,6 +22,7 @@ from tribler_core.components.metadata_store.db.serialization import CHANNEL_THUM
 from tribler_core.components.metadata_store.db.store import MetadataStore
 from tribler_core.components.metadata_store.remote_query_community.remote_query_community import (
     RemoteQueryCommunity,
+    convert_to_json,
     sanitize_query,
 )
 from tribler_core.components.metadata_store.remote_query_community.settings import RemoteQueryCommunitySettings
@@ -329,6 +330,32 @@ class TestRemoteQueryCommunity(TestBase):
             field_in_hex = hexlify(field_in_b)
             assert sanitize_query({field: field_in_hex})[field] == field_in_b
 
+    def test_sanitize_query_binary_set_fields(self):
+        infohash_set = {b'0' * 20, b'1' * 20}
+        query = loads(convert_to_json({"infohash_set": infohash_set}))
+        assert sanitize_query(query)["infohash_set"] == infohash_set
+
+        # The number of infohashes in the set is capped
+        query = {"infohash_set": [hexlify(random_infohash()) for _ in range(10)]}
+        assert len(sanitize_query(query, cap=5)["infohash_set"]) == 5
+
+    async def test_remote_select_infohash_set(self):
+        """
+        Test querying metadata entries by a set of infohashes
+        """
+        mds0 = self.nodes[0].overlay.mds
+        mds1 = self.nodes[1].overlay.mds
+
+        with db_session:
+            infohashes = {mds0.TorrentMetadata(infohash=random_infohash()).infohash for _ in range(5)}
+            mds0.TorrentMetadata(infohash=random_infohash())
+
+        self.nodes[1].overlay.send_remote_select(self.nodes[0].my_peer, infohash_set=infohashes, last=len(infohashes))
+        await self.deliver_messages(timeout=0.5)
+
+        with db_session:
+            assert {t.infohash for t in mds1.TorrentMetadata.select()} == infohashes
+
     async def test_unknown_query_attribute(self):
         rqc_node1 = self.nodes[0].overlay
         rqc_node2 = self.nodes[1].overlay
@@ -1,6 +1,8 @@
-import heapq
 import random
+import time
 from binascii import unhexlify
+from collections import OrderedDict
+from distutils.version import LooseVersion
 
 from ipv8.lazy_community import lazy_wrapper
 
@@ -27,6 +29,14 @@ class PopularityCommunity(RemoteQueryCommunity, VersionCommunityMixin):
     GOSSIP_POPULAR_TORRENT_COUNT = 10
     GOSSIP_RANDOM_TORRENT_COUNT = 10
 
+    # Infohashes we asked a peer to resolve are not asked for again during this period
+    RESOLVE_NEGATIVE_CACHE_TTL = 300  # seconds
+    RESOLVE_NEGATIVE_CACHE_SIZE = 10000
+
+    # Peers running older versions do not understand infohash_set queries, so we resolve infohashes one at a time
+    INFOHASH_SET_MIN_VERSION = "7.11.0"
+    PEER_VERSIONS_SIZE = 1000
+
     community_id = unhexlify('9aca62f878969c437da9844cba29a134917e1648')
 
     def __init__(self, *args, torrent_checker=None, **kwargs):
@@ -34,6 +44,11 @@ class PopularityCommunity(RemoteQueryCommunity, VersionCommunityMixin):
         super().__init__(*args, **kwargs)
         self.torrent_checker = torrent_checker
 
+        # infohash -> the time we last asked a peer to resolve it, ordered by time
+        self.resolve_negative_cache = {}
+        # peer mid -> whether the peer supports infohash_set queries (None while its version is being requested)
+        self.infohash_set_support = OrderedDict()
+
         self.add_message_handler(TorrentsHealthPayload, self.on_torrents_health)
 
         self.logger.info('Popularity Community initialized (peer mid %s)',
@@ -46,42 +61,6 @@ class PopularityCommunity(RemoteQueryCommunity, VersionCommunityMixin):
         # Init version community message handlers
         self.init_version_community()
 
-    @staticmethod
-    def select_torrents_to_gossip(torrents, include_popular=True, include_random=True) -> (set, set):
-        """ Select torrents to gossip.
-
-        Select top 5 popular torrents, and 5 random torrents.
-
-        Args:
-            torrents: set of tuples (infohash, seeders, leechers, last_check)
-            include_popular: If True, popular torrents based on seeder count are selected
-            include_random: If True, torrents are randomly selected
-
-        Returns:
-            tuple (set(popular), set(random))
-
-        """
-        # select the torrents that have seeders
-        alive = {(_, seeders, *rest) for (_, seeders, *rest) in torrents
-                 if seeders > 0}
-        if not alive:
-            return {}, {}
-
-        popular, rand = set(), set()
-
-        # select most popular from alive torrents, using `seeders` as a key
-        if include_popular:
-            count = PopularityCommunity.GOSSIP_POPULAR_TORRENT_COUNT
-            popular = set(heapq.nlargest(count, alive, key=lambda t: t[1]))
-
-        # select random torrents from the rest of the list
-        if include_random:
-            rest = alive - popular
-            count = min(PopularityCommunity.GOSSIP_RANDOM_TORRENT_COUNT, len(rest))
-            rand = set(random.sample(list(rest), count))
-
-        return popular, rand
-
     def _gossip_torrents_health(self, include_popular=True, include_random=True):
         """
         Gossip torrent health information to another peer.
@@ -93,9 +72,9 @@ class PopularityCommunity(RemoteQueryCommunity, VersionCommunityMixin):
         if not checked:
             return
 
-        popular, rand = PopularityCommunity.select_torrents_to_gossip(checked,
-                                                                      include_popular=include_popular,
-                                                                      include_random=include_random)
+        popular = checked.popular(self.GOSSIP_POPULAR_TORRENT_COUNT) if include_popular else set()
+        rand = checked.random(self.GOSSIP_RANDOM_TORRENT_COUNT,
+                              include_popular=not include_popular) if include_random else set()
         if not popular and not rand:
             self.logger.debug(f'No torrents to gossip. Checked torrents count: '
                              f'{len(checked)}')
@@ -129,9 +108,64 @@ class PopularityCommunity(RemoteQueryCommunity, VersionCommunityMixin):
 
         torrents = payload.random_torrents + payload.torrents_checked
 
-        for infohash in await self.mds.run_threaded(self.process_torrents_health, torrents):
+        new_infohashes = await self.mds.run_threaded(self.process_torrents_health, torrents)
+        infohashes = self.filter_infohashes_to_resolve(new_infohashes)
+        if not infohashes:
+            return
+
+        if self.supports_infohash_set(peer):
+            # Resolve all the unknown infohashes of this gossip message with a single query
+            self.send_remote_select(peer=peer, infohash_set=infohashes, last=len(infohashes),
+                                    processing_callback=self.on_infohashes_resolved)
+            return
+
+        for infohash in infohashes:
             # Get a single result per infohash to avoid duplicates
-            self.send_remote_select(peer=peer, infohash=infohash, last=1)
+            self.send_remote_select(peer=peer, infohash=infohash, last=1,
+                                    processing_callback=self.on_infohashes_resolved)
+
+    def supports_infohash_set(self, peer):
+        """
+        Check whether a peer is known to support infohash_set queries. If we do not know yet, ask for its version.
+        """
+        if peer.mid not in self.infohash_set_support:
+            self.infohash_set_support[peer.mid] = None
+            if len(self.infohash_set_support) > self.PEER_VERSIONS_SIZE:
+                self.infohash_set_support.popitem(last=False)
+            self.send_version_request(peer)
+        return bool(self.infohash_set_support[peer.mid])
+
+    def process_version_response(self, peer, version, platform):
+        try:
+            supported = LooseVersion(version) >= LooseVersion(self.INFOHASH_SET_MIN_VERSION)
+        except TypeError:
+            # The version cannot be compared to ours, e.g., because it is not a release version
+            supported = False
+        if peer.mid in self.infohash_set_support:
+            self.infohash_set_support[peer.mid] = supported
+
+    def filter_infohashes_to_resolve(self, infohashes):
+        """
+        Drop the infohashes that were recently asked for and were not resolved yet (negative cache).
+        The remaining infohashes are added to the negative cache.
+        """
+        now = time.time()
+        cache = self.resolve_negative_cache
+        # The cache is ordered by insertion time, so the expired entries are at the front
+        while cache:
+            oldest = next(iter(cache))
+            if cache[oldest] > now - self.RESOLVE_NEGATIVE_CACHE_TTL and len(cache) < self.RESOLVE_NEGATIVE_CACHE_SIZE:
+                break
+            cache.pop(oldest)
+
+        to_resolve = {infohash for infohash in infohashes if infohash not in cache}
+        for infohash in to_resolve:
+            cache[infohash] = now
+        return to_resolve
+
+    def on_infohashes_resolved(self, _, processing_results):
+        for result in processing_results:
+            self.resolve_negative_cache.pop(getattr(result.md_obj, 'infohash', None), None)
 
     @db_session
     def process_torrents_health(self, torrent_healths):
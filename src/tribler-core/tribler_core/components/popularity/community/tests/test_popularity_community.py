@@ -5,6 +5,7 @@ from types import SimpleNamespace
 from unittest.mock import Mock
 
 from ipv8.keyvault.crypto import default_eccrypto
+from ipv8.peer import Peer
 from ipv8.test.base import TestBase
 from ipv8.test.mocking.ipv8 import MockIPv8
 
@@ -13,8 +14,10 @@ from pony.orm import db_session
 import pytest
 
 from tribler_core.components.metadata_store.db.store import MetadataStore
+from tribler_core.components.metadata_store.remote_query_community.remote_query_community import RemoteSelectPayload
 from tribler_core.components.metadata_store.remote_query_community.settings import RemoteQueryCommunitySettings
 from tribler_core.components.popularity.community.popularity_community import PopularityCommunity
+from tribler_core.components.torrent_checker.torrent_checker.torrents_checked_pool import TorrentsCheckedPool
 from tribler_core.tests.tools.base_test import MockObject
 from tribler_core.utilities.path_util import Path
 from tribler_core.utilities.utilities import random_infohash
@@ -40,7 +43,7 @@ class TestPopularityCommunity(TestBase):
                             default_eccrypto.generate_key("curve25519"))
         self.metadata_store_set.add(mds)
         torrent_checker = MockObject()
-        torrent_checker.torrents_checked = set()
+        torrent_checker.torrents_checked = TorrentsCheckedPool()
 
         self.count += 1
 
@@ -58,7 +61,7 @@ class TestPopularityCommunity(TestBase):
                 infohash=str(torrent_ind).encode() * 20, seeders=torrent_ind + 1, last_check=last_check)
 
     async def init_first_node_and_gossip(self, checked_torrent_info, deliver_timeout=.1):
-        self.nodes[0].overlay.torrent_checker.torrents_checked.add(checked_torrent_info)
+        self.nodes[0].overlay.torrent_checker.torrents_checked.update(*checked_torrent_info)
         await self.introduce_nodes()
 
         self.nodes[0].overlay.gossip_random_torrents_health()
@@ -109,7 +112,7 @@ class TestPopularityCommunity(TestBase):
             assert node1_db.select().count() == 0
 
         for torrent_info in all_checked_torrents:
-            self.nodes[0].overlay.torrent_checker.torrents_checked.add(torrent_info)
+            self.nodes[0].overlay.torrent_checker.torrents_checked.update(*torrent_info)
 
         await self.introduce_nodes()
 
@@ -180,52 +183,68 @@ class TestPopularityCommunity(TestBase):
         await self.init_first_node_and_gossip((infohash, 200, 0, int(time.time())))
         self.nodes[1].overlay.send_remote_select.assert_not_called()
 
+    async def test_unknown_torrents_query_back_single_request(self):
+        # Test that all the unknown infohashes from a single gossip message are resolved with a single query
+        infohashes = [random_infohash() for _ in range(PopularityCommunity.GOSSIP_RANDOM_TORRENT_COUNT)]
+        with db_session:
+            for infohash in infohashes:
+                self.nodes[0].overlay.mds.TorrentMetadata(infohash=infohash)
+        for infohash in infohashes:
+            self.nodes[0].overlay.torrent_checker.torrents_checked.update(infohash, 200, 0, int(time.time()))
+
+        self.nodes[0].overlay.on_remote_select = Mock(wraps=self.nodes[0].overlay.on_remote_select)
+        self.nodes[0].overlay.decode_map[RemoteSelectPayload.msg_id] = self.nodes[0].overlay.on_remote_select
+        self.nodes[1].overlay.infohash_set_support[self.nodes[0].my_peer.mid] = True
+        await self.introduce_nodes()
+        self.nodes[0].overlay.gossip_random_torrents_health()
+        await self.deliver_messages(timeout=0.5)
 
-@pytest.mark.asyncio
-async def test_select_torrents_to_gossip_small_list():
-    torrents = [
-        # infohash, seeders, leechers, last_check
-        (b'0' * 20, 0, 0, None),
-        (b'1' * 20, 1, 0, None),
-        (b'1' * 20, 2, 0, None),
-    ]
-
-    popular, rand = PopularityCommunity.select_torrents_to_gossip(set(torrents))
-    assert torrents[1] in popular
-    assert torrents[2] in popular
-    assert not rand
-
-
-@pytest.mark.asyncio
-async def test_select_torrents_to_gossip_big_list():
-    # torrent structure is (infohash, seeders, leechers, last_check)
-    dead_torrents = {(random_infohash(), 0, randint(1, 10), None)
-                     for _ in range(10)}
-
-    alive_torrents = {(random_infohash(), randint(1, 10), randint(1, 10), None)
-                      for _ in range(10)}
-
-    top5_popular_torrents = {(random_infohash(), randint(11, 100), randint(1, 10), None)
-                             for _ in range(PopularityCommunity.GOSSIP_POPULAR_TORRENT_COUNT)}
-
-    all_torrents = dead_torrents | alive_torrents | top5_popular_torrents
-
-    popular, rand = PopularityCommunity.select_torrents_to_gossip(all_torrents)
-    assert len(popular) <= PopularityCommunity.GOSSIP_POPULAR_TORRENT_COUNT
-    assert popular == top5_popular_torrents
+        assert self.nodes[0].overlay.on_remote_select.call_count == 1
+        with db_session:
+            assert self.nodes[1].overlay.mds.TorrentMetadata.select().count() == len(infohashes)
+        assert not self.nodes[1].overlay.resolve_negative_cache
 
-    assert len(rand) <= PopularityCommunity.GOSSIP_RANDOM_TORRENT_COUNT
-    assert rand <= alive_torrents
+    async def test_unknown_torrents_query_back_old_peer(self):
+        # Test that the unknown infohashes are resolved one at a time, if the peer may not support infohash_set
+        self.nodes[1].overlay.send_remote_select = Mock()
+        self.nodes[1].overlay.send_version_request = Mock()
+        await self.init_first_node_and_gossip((b'1' * 20, 200, 0, int(time.time())))
+
+        self.nodes[1].overlay.send_remote_select.assert_called_once()
+        assert self.nodes[1].overlay.send_remote_select.call_args.kwargs['infohash'] == b'1' * 20
+        self.nodes[1].overlay.send_version_request.assert_called_once()
+
+    def test_infohash_set_support(self):
+        # Test that infohash_set queries are only sent to peers that run a version that supports them
+        community = self.nodes[0].overlay
+        community.send_version_request = Mock()
+        peers = [self.nodes[1].my_peer, Peer(default_eccrypto.generate_key("curve25519")),
+                 Peer(default_eccrypto.generate_key("curve25519"))]
+        assert not any(community.supports_infohash_set(peer) for peer in peers)
+        assert community.send_version_request.call_count == 3
+
+        for peer, version in zip(peers, ["7.10.0", community.INFOHASH_SET_MIN_VERSION, "7.11.1"]):
+            community.process_version_response(peer, version, "linux")
+        assert [community.supports_infohash_set(peer) for peer in peers] == [False, True, True]
+        assert community.send_version_request.call_count == 3
+
+    async def test_unresolved_torrent_negative_cache(self):
+        # Test that we don't ask again for an infohash that the peer could not resolve
+        self.nodes[1].overlay.send_remote_select = Mock()
+        await self.init_first_node_and_gossip((b'1' * 20, 200, 0, int(time.time())))
+        self.nodes[0].overlay.gossip_random_torrents_health()
+        await self.deliver_messages(timeout=0.1)
 
+        self.nodes[1].overlay.send_remote_select.assert_called_once()
+        assert b'1' * 20 in self.nodes[1].overlay.resolve_negative_cache
 
-@pytest.mark.asyncio
-async def test_no_alive_torrents():
-    torrents = {(random_infohash(), 0, randint(1, 10), None)
-                for _ in range(10)}
+    def test_negative_cache_expiration(self):
+        community = self.nodes[0].overlay
+        community.resolve_negative_cache[b'1' * 20] = time.time() - community.RESOLVE_NEGATIVE_CACHE_TTL - 1
+        community.resolve_negative_cache[b'2' * 20] = time.time()
 
-    popular, rand = PopularityCommunity.select_torrents_to_gossip(torrents)
-    assert not popular
-    assert not rand
+        assert community.filter_infohashes_to_resolve({b'1' * 20, b'2' * 20}) == {b'1' * 20}
+        assert set(community.resolve_negative_cache) == {b'1' * 20, b'2' * 20}
 
 
 # pylint: disable=super-init-not-called
@@ -250,17 +269,17 @@ async def test_gossip_torrents_health_returns():
     assert not community.is_ez_send_has_been_called
 
     community.torrent_checker = SimpleNamespace()
-    community.torrent_checker.torrents_checked = None
+    community.torrent_checker.torrents_checked = TorrentsCheckedPool()
     community.gossip_random_torrents_health()
     assert not community.is_ez_send_has_been_called
 
-    community.torrent_checker.torrents_checked = {(b'0' * 20, 0, 0, None),
-                                                  (b'1' * 20, 0, 0, None)}
+    community.torrent_checker.torrents_checked.update(b'0' * 20, 0, 0, int(time.time()))
+    community.torrent_checker.torrents_checked.update(b'1' * 20, 0, 0, int(time.time()))
 
     community.gossip_random_torrents_health()
     assert not community.is_ez_send_has_been_called
 
-    community.torrent_checker.torrents_checked = {(b'0' * 20, 1, 0, None),
-                                                  (b'1' * 20, 1, 0, None)}
+    community.torrent_checker.torrents_checked.update(b'0' * 20, 1, 0, int(time.time()))
+    community.torrent_checker.torrents_checked.update(b'1' * 20, 1, 0, int(time.time()))
     community.gossip_random_torrents_health()
     assert community.is_ez_send_has_been_called
@@ -86,8 +86,8 @@ class DebugEndpoint(RESTEndpoint):
     async def get_circuit_slots(self, request):
         return RESTResponse({
             "slots": {
-                "random": self.tunnel_community.random_slots,
-                "competing": self.tunnel_community.competing_slots
+                "random": self.tunnel_community.random_slots.get_slots(),
+                "competing": self.tunnel_community.competing_slots.get_slots()
             }
         })
 
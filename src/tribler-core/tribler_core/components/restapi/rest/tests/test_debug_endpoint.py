@@ -11,6 +11,7 @@ from tribler_core.components.resource_monitor.settings import ResourceMonitorSet
 from tribler_core.components.restapi.rest.base_api_test import do_request
 from tribler_core.components.restapi.rest.debug_endpoint import DebugEndpoint
 from tribler_core.components.restapi.rest.rest_manager import error_middleware
+from tribler_core.components.tunnel.community.slots import CompetingSlots, RandomSlots
 
 
 @pytest.fixture
@@ -50,10 +51,13 @@ async def test_get_slots(rest_api, mock_tunnel_community):
     Test whether we can get slot information from the API
     """
 
-    mock_tunnel_community.random_slots = [None, None, None, 12345]
-    mock_tunnel_community.competing_slots = [(0, None), (12345, 12345)]
+    mock_tunnel_community.random_slots = RandomSlots(4)
+    mock_tunnel_community.random_slots.take(12345)
+    mock_tunnel_community.competing_slots = CompetingSlots(2)
+    mock_tunnel_community.competing_slots.take(12345, 12345)
     response_json = await do_request(rest_api, 'debug/circuits/slots', expected_code=200)
     assert len(response_json["slots"]["random"]) == 4
+    assert response_json["slots"]["competing"] == [[12345, 12345], [0, None]]
 
 
 async def test_get_open_files(rest_api, tmp_path):
@@ -36,7 +36,9 @@ from tribler_core.components.restapi.rest.statistics_endpoint import StatisticsE
 from tribler_core.components.restapi.rest.trustview_endpoint import TrustViewEndpoint
 from tribler_core.components.tag.restapi.tags_endpoint import TagsEndpoint
 from tribler_core.components.tag.tag_component import TagComponent
+from tribler_core.components.torrent_checker.restapi.trackers_endpoint import TrackersEndpoint
 from tribler_core.components.torrent_checker.torrent_checker_component import TorrentCheckerComponent
+from tribler_core.components.tunnel.restapi.tunnel_endpoint import TunnelEndpoint
 from tribler_core.components.tunnel.tunnel_component import TunnelsComponent
 from tribler_core.utilities.unicode import hexlify
 
@@ -113,6 +115,8 @@ class RESTComponent(Component):
         self.maybe_add('/search', SearchEndpoint, metadata_store_component.mds, tags_db=tag_component.tags_db)
         self.maybe_add('/remote_query', RemoteQueryEndpoint, gigachannel_component.community,
                        metadata_store_component.mds)
+        self.maybe_add('/trackers', TrackersEndpoint, torrent_checker)
+        self.maybe_add('/tunnel', TunnelEndpoint, tunnel_community)
         self.maybe_add('/tags', TagsEndpoint, db=tag_component.tags_db, community=tag_component.community)
 
         # pylint: enable=C0301
@@ -47,7 +47,9 @@ class Socks5Connection(Protocol):
 
         self.udp_connection = None
         self.state = ConnectionState.BEFORE_METHOD_REQUEST
-        self.buffer = b''
+        # Bytes that were received, but not yet consumed. Consumed bytes are deleted from the front of the bytearray,
+        # which only moves its start, so parsing a request does not copy the bytes that follow it.
+        self.buffer = bytearray()
 
         self.destinations = {}
 
@@ -55,8 +57,8 @@ class Socks5Connection(Protocol):
         self.transport = transport
 
     def data_received(self, data):
-        self.buffer = self.buffer + data
-        while len(self.buffer) > 0:
+        self.buffer += data
+        while self.buffer:
             # We are at the initial state, so we expect a handshake request.
             if self.state == ConnectionState.BEFORE_METHOD_REQUEST:
                 if not self._try_handshake():
@@ -69,11 +71,11 @@ class Socks5Connection(Protocol):
             elif self.connect_to:
                 if self.socksserver.output_stream is not None:
                     # Swallow the data in case the tunnel community has not started yet
-                    self.socksserver.output_stream.on_socks5_tcp_data(self, self.connect_to, self.buffer)
-                self.buffer = b''
+                    self.socksserver.output_stream.on_socks5_tcp_data(self, self.connect_to, bytes(self.buffer))
+                self.buffer.clear()
             else:
                 self._logger.error("Throwing away buffer, not in CONNECTED or BEFORE_METHOD_REQUEST state")
-                self.buffer = b''
+                self.buffer.clear()
 
     def _try_handshake(self):
         """
@@ -88,12 +90,12 @@ class Socks5Connection(Protocol):
             return False
 
         # Consume the buffer
-        self.buffer = self.buffer[offset:]
+        del self.buffer[:offset]
 
         # Only accept NO AUTH
         if request.version != SOCKS_VERSION or 0x00 not in request.methods:
             self._logger.error("Client has sent INVALID METHOD REQUEST")
-            self.buffer = ''
+            self.buffer.clear()
             self.close()
         else:
             self._logger.info("Client has sent METHOD REQUEST")
@@ -126,7 +128,7 @@ class Socks5Connection(Protocol):
         except PackError:
             return False
 
-        self.buffer = self.buffer[offset:]
+        del self.buffer[:offset]
 
         self.state = ConnectionState.PROXY_REQUEST_RECEIVED
 
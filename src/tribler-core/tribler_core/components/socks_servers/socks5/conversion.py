@@ -2,10 +2,11 @@
 import logging
 import socket
 import struct
+from functools import lru_cache
 
 from ipv8.messaging.interfaces.udp.endpoint import DomainAddress, UDPv4Address
 from ipv8.messaging.lazy_payload import VariablePayload, vp_compile
-from ipv8.messaging.serialization import DefaultStruct, ListOf, Serializer
+from ipv8.messaging.serialization import DefaultStruct, ListOf, PackError, Serializer
 
 SOCKS_VERSION = 0x05
 
@@ -16,6 +17,9 @@ ADDRESS_TYPE_IPV4 = 0x01
 ADDRESS_TYPE_DOMAIN_NAME = 0x03
 ADDRESS_TYPE_IPV6 = 0x04
 
+# The number of UDP packet headers that are kept by pack_udp_header
+UDP_HEADER_CACHE_SIZE = 4096
+
 REQ_CMD_CONNECT = 0x01
 REQ_CMD_BIND = 0x02
 REQ_CMD_UDP_ASSOCIATE = 0x03
@@ -115,3 +119,37 @@ class IPv6AddressError(NotImplementedError):
 socks5_serializer = Serializer()
 socks5_serializer.add_packer('list_of_chars', ListOf(DefaultStruct('>B')))
 socks5_serializer.add_packer('socks5_address', Socks5Address())
+
+
+@lru_cache(maxsize=UDP_HEADER_CACHE_SIZE)
+def pack_udp_header(address):
+    """
+    Pack the header of a UDP packet from or to the given address. The header of a UdpPacket only depends on its
+    address, so UdpPacket(0, 0, address, data) can be packed as pack_udp_header(address) + data.
+    """
+    return socks5_serializer.pack_serializable(UdpPacket(0, 0, address, b''))
+
+
+def unpack_udp_packet(data):
+    """
+    Unpack a UDP packet without copying its data. This is equivalent to unpacking a UdpPacket with the
+    socks5_serializer, except that the data of the returned UdpPacket is a memoryview of the given datagram.
+    """
+    try:
+        rsv, frag, address_type = struct.unpack_from('>HBB', data)
+        if address_type == ADDRESS_TYPE_IPV4:
+            port, = struct.unpack_from('>H', data, 8)
+            destination = UDPv4Address(socket.inet_ntoa(data[4:8]), port)
+            offset = 10
+        elif address_type == ADDRESS_TYPE_DOMAIN_NAME:
+            domain_length = data[4]
+            port, = struct.unpack_from('>H', data, 5 + domain_length)
+            destination = DomainAddress(data[5:5 + domain_length].decode(), port)
+            offset = 7 + domain_length
+        elif address_type == ADDRESS_TYPE_IPV6:
+            raise IPv6AddressError()
+        else:
+            raise InvalidAddressException(f'Could not unpack address type {address_type}')
+    except (struct.error, IndexError, UnicodeDecodeError, IPv6AddressError, InvalidAddressException) as e:
+        raise PackError(f'Could not unpack UDP packet: {e}') from e
+    return UdpPacket(rsv, frag, destination, memoryview(data)[offset:])
@@ -123,3 +123,18 @@ def test_invalid_methods(connection):
     """
     connection.data_received(unhexlify('0501'))
     assert len(connection.buffer) == 2  # We are still waiting for data
+
+
+def test_split_requests(connection):
+    """
+    Test whether requests that are split over, or share, TCP segments are parsed
+    """
+    connection.data_received(unhexlify('0501'))
+    connection.data_received(unhexlify('00050200010000'))
+    assert connection.state == ConnectionState.CONNECTED
+    assert connection.buffer == unhexlify('050200010000')
+
+    connection.data_received(unhexlify('0000263f'))
+    assert len(connection.transport.written_data) == 2
+    assert connection.state == ConnectionState.PROXY_REQUEST_ACCEPTED
+    assert not connection.buffer
@@ -9,7 +9,9 @@ from tribler_core.components.socks_servers.socks5.conversion import (
     CommandRequest,
     CommandResponse,
     UdpPacket,
+    pack_udp_header,
     socks5_serializer,
+    unpack_udp_packet,
 )
 
 
@@ -34,6 +36,40 @@ def test_encode_decode_udp_packet():
     assert address == decoded.destination
 
 
+def test_pack_udp_header():
+    """
+    Test whether a packed header followed by the data is the same as a packed UDP packet
+    """
+    for address in [("1.2.3.4", 5), DomainAddress('tracker1.good-tracker.com', 8084)]:
+        packet = socks5_serializer.pack_serializable(UdpPacket(0, 0, address, b'data'))
+        assert pack_udp_header(address) + b'data' == packet
+
+
+def test_unpack_udp_packet():
+    """
+    Test whether UDP packets are unpacked like the serializer does, with a view on the data of the packet
+    """
+    for address in [("1.2.3.4", 5), DomainAddress('tracker1.good-tracker.com', 8084)]:
+        packet = socks5_serializer.pack_serializable(UdpPacket(0, 0, address, b'data'))
+        expected, _ = socks5_serializer.unpack_serializable(UdpPacket, packet)
+        unpacked = unpack_udp_packet(packet)
+        assert (unpacked.rsv, unpacked.frag, unpacked.destination) == (expected.rsv, expected.frag, address)
+        assert type(unpacked.destination) is type(expected.destination)
+        assert isinstance(unpacked.data, memoryview) and unpacked.data.obj is packet
+        assert unpacked.data == b'data'
+
+
+def test_unpack_udp_packet_fail():
+    """
+    Test whether invalid UDP packets raise a PackError
+    """
+    for packet in [b'\x00\x00\x00\x03 tracker1.invalid-tracker\xc4\xe95\x11$\x00\x1f\x940x000',
+                   b'\x00\x00\x00\x01\x01\x02', b'\x00\x00\x00\x03\x05ab', b'\x00\x00\x00\x04', b'\x00\x00\x00\x05',
+                   b'\x00\x00']:
+        with pytest.raises(PackError):
+            unpack_udp_packet(packet)
+
+
 def test_decode_udp_packet_fail():
     # try decoding badly encoded udp packet, should raise an exception in Python3
     badly_encoded_packet = b'\x00\x00\x00\x03 tracker1.invalid-tracker\xc4\xe95\x11$\x00\x1f\x940x000'
@@ -0,0 +1,49 @@
+from unittest.mock import Mock
+
+from aiohttp.web_app import Application
+
+import pytest
+
+from tribler_core.components.restapi.rest.base_api_test import do_request
+from tribler_core.components.restapi.rest.rest_manager import error_middleware
+from tribler_core.components.torrent_checker.restapi.trackers_endpoint import TrackersEndpoint
+from tribler_core.components.torrent_checker.torrent_checker.tracker_manager import TrackerManager
+
+
+@pytest.fixture
+def tracker_manager(tmp_path, metadata_store):
+    return TrackerManager(state_dir=tmp_path, metadata_store=metadata_store)
+
+
+@pytest.fixture
+def rest_api(loop, aiohttp_client, tracker_manager):  # pylint: disable=unused-argument
+    endpoint = TrackersEndpoint(Mock(tracker_manager=tracker_manager))
+    app = Application(middlewares=[error_middleware])
+    app.add_subapp('/trackers', endpoint.app)
+    return loop.run_until_complete(aiohttp_client(app))
+
+
+async def test_get_trackers_empty(rest_api):
+    """
+    Test whether no trackers are returned when no tracker has been checked yet
+    """
+    response_dict = await do_request(rest_api, 'trackers', expected_code=200)
+    assert response_dict == {"trackers": []}
+
+
+async def test_get_trackers(rest_api, tracker_manager):
+    """
+    Test whether the statistics of the checked trackers are returned, best scoring trackers first
+    """
+    for tracker_url, latency in [("http://slow.com/announce", 12), ("http://fast.com/announce", 0.2)]:
+        session = Mock(tracker_url=tracker_url, is_failed=False, is_timed_out=False,
+                       infohash_list=[b'a' * 20] * 4, answered_infohashes=4)
+        tracker_manager.update_tracker_stats(session, latency)
+
+    response_dict = await do_request(rest_api, 'trackers', expected_code=200)
+    trackers = response_dict["trackers"]
+    assert [tracker["url"] for tracker in trackers] == ["http://fast.com/announce", "http://slow.com/announce"]
+    assert trackers[0]["requests"] == 1
+    assert trackers[0]["scrape_yield"] == 4
+    assert trackers[0]["latency_histogram"]["0.25"] == 1
+    assert trackers[1]["latency_histogram"]["30"] == 1
@@ -0,0 +1,57 @@
+from aiohttp import web
+
+from aiohttp_apispec import docs
+
+from ipv8.REST.schema import schema
+
+from marshmallow.fields import Float, Integer, String
+
+from tribler_core.components.restapi.rest.rest_endpoint import RESTEndpoint, RESTResponse
+from tribler_core.components.torrent_checker.torrent_checker.torrent_checker import TorrentChecker
+from tribler_core.utilities.utilities import froze_it
+
+
+@froze_it
+class TrackersEndpoint(RESTEndpoint):
+    """
+    Endpoint for getting the response time and success statistics of the trackers checked by the torrent checker.
+    """
+
+    def __init__(self, torrent_checker: TorrentChecker):
+        super().__init__()
+        self.torrent_checker = torrent_checker
+
+    def setup_routes(self):
+        self.app.add_routes([web.get('', self.get_trackers)])
+
+    @docs(
+        tags=["Trackers"],
+        summary="Return the statistics of the trackers checked by the torrent checker, best scoring trackers first.",
+        responses={
+            200: {
+                "schema": schema(TrackersResponse={
+                    'trackers': [schema(Tracker={
+                        'url': String,
+                        'requests': Integer,
+                        'failures': Integer,
+                        'timeouts': Integer,
+                        'timeout_rate': Float,
+                        'mean_latency': Float,
+                        'latency_histogram': schema(LatencyHistogram={}),
+                        'requested_infohashes': Integer,
+                        'answered_infohashes': Integer,
+                        'scrape_yield': Float,
+                        'score': Float,
+                    })]
+                })
+            }
+        }
+    )
+    async def get_trackers(self, _):
+        if not self.torrent_checker:
+            return RESTResponse({"trackers": []})
+
+        tracker_stats = self.torrent_checker.tracker_manager.tracker_stats
+        trackers = [{'url': url, **stats.to_dict()}
+                    for url, stats in sorted(tracker_stats.items(), key=lambda item: item[1].score, reverse=True)]
+        return RESTResponse({"trackers": trackers})
@@ -0,0 +1,146 @@
+"""
+Incremental decoder for bencoded HTTP tracker scrape responses.
+
+Scrape responses are fed to the decoder chunk by chunk, as they are read from the network. Entries of the
+``files`` dictionary are decoded one at a time, and entries of infohashes that we did not ask for are dropped
+right away. This way, a tracker that ignores our ``info_hash`` parameters and returns a full scrape does not
+make us buffer and decode the whole response.
+"""
+
+
+class IncompleteData(Exception):
+    """
+    The buffered data ends in the middle of a bencoded value.
+    """
+
+
+class InvalidData(ValueError):
+    """
+    The data is not a valid bencoded scrape response.
+    """
+
+
+def decode_value(data, pos):
+    """
+    Decode a single bencoded value from data, starting at pos.
+    :return: A tuple of the decoded value and the position right after it.
+    """
+    if pos >= len(data):
+        raise IncompleteData
+    token = data[pos:pos + 1]
+    if token == b'i':
+        end = data.find(b'e', pos)
+        if end < 0:
+            raise IncompleteData
+        try:
+            return int(data[pos + 1:end]), end + 1
+        except ValueError as e:
+            raise InvalidData(f"invalid integer at position {pos}") from e
+    if token.isdigit():
+        colon = data.find(b':', pos)
+        if colon < 0:
+            raise IncompleteData
+        try:
+            end = colon + 1 + int(data[pos:colon])
+        except ValueError as e:
+            raise InvalidData(f"invalid string length at position {pos}") from e
+        if end > len(data):
+            raise IncompleteData
+        return bytes(data[colon + 1:end]), end
+    if token in (b'l', b'd'):
+        items = []
+        pos += 1
+        while True:
+            if pos >= len(data):
+                raise IncompleteData
+            if data[pos:pos + 1] == b'e':
+                break
+            item, pos = decode_value(data, pos)
+            items.append(item)
+        if token == b'l':
+            return items, pos + 1
+        if len(items) % 2:
+            raise InvalidData("dictionary without a value for its last key")
+        return dict(zip(items[::2], items[1::2])), pos + 1
+    raise InvalidData(f"unexpected token {token!r} at position {pos}")
+
+
+class ScrapeResponseDecoder:
+    """
+    Decodes a bencoded scrape response that arrives in chunks.
+
+    Usage: call ``feed`` for every chunk of the response and ``close`` at the end of the response.
+    Afterwards, ``files`` maps the requested infohashes to their (dictionary) entries in the response, and
+    ``fields`` contains the other top-level fields of the response, such as ``failure reason``.
+    """
+
+    def __init__(self, infohashes=None):
+        """
+        :param infohashes: The infohashes to keep the entries of. If None, all entries are kept.
+        """
+        self.infohashes = set(infohashes) if infohashes is not None else None
+        self.files = {}
+        self.fields = {}
+        self.has_files = False  # Whether the response contains a files dictionary
+
+        self._buffer = bytearray()
+        self._pos = 0
+        self._started = False
+        self._in_files = False
+        self._finished = False
+
+    def feed(self, chunk):
+        """
+        Decode as much of the response as possible, given the next chunk of data.
+        """
+        if self._finished:
+            return
+        self._buffer += chunk
+        try:
+            self._decode()
+        except IncompleteData:
+            pass
+        # Drop the data that we have decoded already
+        del self._buffer[:self._pos]
+        self._pos = 0
+
+    def close(self):
+        """
+        Signal the end of the response.
+        """
+        if not self._finished:
+            raise InvalidData("truncated response")
+
+    def _decode(self):
+        data = self._buffer
+        if not self._started:
+            if data[self._pos:self._pos + 1] != b'd':
+                raise InvalidData("response is not a dictionary") if data else IncompleteData
+            self._started = True
+            self._pos += 1
+
+        while not self._finished:
+            if self._pos >= len(data):
+                raise IncompleteData
+            if self._in_files:
+                if data[self._pos:self._pos + 1] == b'e':
+                    self._in_files = False
+                    self._pos += 1
+                    continue
+                infohash, pos = decode_value(data, self._pos)
+                entry, self._pos = decode_value(data, pos)
+                if self.infohashes is None or infohash in self.infohashes:
+                    self.files[infohash] = entry
+                continue
+
+            if data[self._pos:self._pos + 1] == b'e':
+                self._finished = True
+                self._pos += 1
+                return
+            key, pos = decode_value(data, self._pos)
+            if key == b'files' and data[pos:pos + 1] == b'd':
+                # Decode the entries of the files dictionary one by one
+                self._in_files = self.has_files = True
+                self._pos = pos + 1
+                continue
+            self.fields[key], self._pos = decode_value(data, pos)
@@ -0,0 +1,66 @@
+import pytest
+
+from libtorrent import bencode
+
+from tribler_core.components.torrent_checker.torrent_checker.scrape_response import (
+    InvalidData,
+    ScrapeResponseDecoder,
+    decode_value,
+)
+
+RESPONSE = bencode({b'files': {b'a' * 20: {b'complete': 10, b'downloaded': 3, b'incomplete': 5},
+                               b'b' * 20: {b'complete': 1, b'downloaded': 0, b'incomplete': 0},
+                               b'c' * 20: {b'complete': 0, b'downloaded': 1, b'incomplete': 2}},
+                    b'flags': {b'min_request_interval': 900}})
+
+
+def test_decode_value():
+    assert decode_value(b'i42e', 0) == (42, 4)
+    assert decode_value(b'4:spam', 0) == (b'spam', 6)
+    assert decode_value(b'l4:spami-3ee', 0) == ([b'spam', -3], 12)
+    assert decode_value(b'd3:cow3:mooe', 0) == ({b'cow': b'moo'}, 12)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, len(RESPONSE)])
+def test_decode_chunked(chunk_size):
+    """
+    Test whether a response is decoded correctly, independent of how it is split into chunks
+    """
+    decoder = ScrapeResponseDecoder([b'a' * 20, b'c' * 20])
+    for index in range(0, len(RESPONSE), chunk_size):
+        decoder.feed(RESPONSE[index:index + chunk_size])
+    decoder.close()
+
+    assert decoder.has_files
+    assert decoder.files == {b'a' * 20: {b'complete': 10, b'downloaded': 3, b'incomplete': 5},
+                             b'c' * 20: {b'complete': 0, b'downloaded': 1, b'incomplete': 2}}
+    assert decoder.fields == {b'flags': {b'min_request_interval': 900}}
+
+
+def test_decode_all_files():
+    decoder = ScrapeResponseDecoder()
+    decoder.feed(RESPONSE)
+    decoder.close()
+    assert len(decoder.files) == 3
+
+
+def test_decode_failure_reason():
+    decoder = ScrapeResponseDecoder()
+    decoder.feed(bencode({b'failure reason': b'test'}))
+    decoder.close()
+    assert not decoder.has_files
+    assert decoder.fields == {b'failure reason': b'test'}
+
+
+def test_decode_invalid():
+    with pytest.raises(InvalidData):
+        ScrapeResponseDecoder().feed(b'<html></html>')
+    with pytest.raises(InvalidData):
+        ScrapeResponseDecoder().feed(b'd5:filesd20:' + b'a' * 20 + b'x')
+
+
+def test_decode_truncated():
+    decoder = ScrapeResponseDecoder()
+    decoder.feed(RESPONSE[:-1])
+    with pytest.raises(InvalidData):
+        decoder.close()
@@ -117,33 +117,36 @@ async def test_load_torrents_check_from_db(torrent_checker):  # pylint: disable=
     before_threshold = freshness_threshold - 100  # considered not-fresh
     after_threshold = freshness_threshold + 100  # considered fresh
 
+    def reload_torrents_checked():
+        torrent_checker._torrents_checked = None  # pylint: disable=protected-access
+        return torrent_checker.torrents_checked
+
     # Case 1: Save random 10 non-self checked torrents
     # Expected: empty set, since only self checked torrents are considered.
     save_random_torrent_state(last_checked=now, self_checked=False, count=10)
-    assert not torrent_checker.torrents_checked
+    assert not reload_torrents_checked()
 
     # Case 2: Save 10 self checked torrent but not within the freshness period
     # Expected: empty set, since only self checked fresh torrents are considered.
     save_random_torrent_state(last_checked=before_threshold, self_checked=True, count=10)
-    assert not torrent_checker.torrents_checked
+    assert not reload_torrents_checked()
 
     # Case 3: Save 10 self checked fresh torrents
     # Expected: 10 torrents, since there are 10 self checked and fresh torrents
     save_random_torrent_state(last_checked=after_threshold, self_checked=True, count=10)
-    assert len(torrent_checker.torrents_checked) == 10
+    assert len(reload_torrents_checked()) == 10
 
     # Case 4: Save some more self checked fresh torrents
-    # Expected: 10 torrents, since torrent_checked set should already be initialized above.
+    # Expected: 10 torrents, since torrent_checked pool is only loaded from the database once.
     save_random_torrent_state(last_checked=after_threshold, self_checked=True, count=10)
     assert len(torrent_checker.torrents_checked) == 10
 
-    # Case 5: Clear the torrent_checked set (private variable),
+    # Case 5: Clear the torrent_checked pool,
     # and save freshly self checked torrents more than max return size (10 more).
     # Expected: max (return size) torrents, since limit is placed on how many to load.
-    torrent_checker._torrents_checked = dict()  # pylint: disable=protected-access
     return_size = torrent_checker_module.TORRENTS_CHECKED_RETURN_SIZE
     save_random_torrent_state(last_checked=after_threshold, self_checked=True, count=return_size + 10)
-    assert len(torrent_checker.torrents_checked) == return_size
+    assert len(reload_torrents_checked()) == return_size
 
 
 @pytest.mark.asyncio
@@ -213,6 +216,34 @@ async def test_tracker_test_error_resolve(torrent_checker):
     assert len(torrent_checker._session_list) == 1
 
 
+@pytest.mark.asyncio
+async def test_connect_to_tracker_stats(torrent_checker):
+    """
+    Test whether both successful and failed tracker requests are recorded in the tracker statistics
+    """
+    async def fail():
+        session.is_failed = True
+        raise ValueError("HTTP tracker failed")
+
+    torrent_checker.tracker_manager.add_tracker("http://localhost/announce")
+    session = HttpTrackerSession("http://localhost/announce", ("localhost", 80), "/announce", 5, None)
+    session.add_infohash(b'a' * 20)
+    session.connect_to_tracker = lambda: succeed({session.tracker_url: []})
+    torrent_checker._session_list[session.tracker_url] = [session]
+    await torrent_checker.connect_to_tracker(session)
+
+    session = HttpTrackerSession("http://localhost/announce", ("localhost", 80), "/announce", 5, None)
+    session.add_infohash(b'a' * 20)
+    session.connect_to_tracker = fail
+    torrent_checker._session_list[session.tracker_url] = [session]
+    with pytest.raises(ValueError):
+        await torrent_checker.connect_to_tracker(session)
+
+    stats = torrent_checker.tracker_manager.tracker_stats["http://localhost/announce"]
+    assert stats.requests == 2
+    assert stats.failures == 1
+
+
 @pytest.mark.asyncio
 async def test_tracker_no_infohashes(torrent_checker):
     """
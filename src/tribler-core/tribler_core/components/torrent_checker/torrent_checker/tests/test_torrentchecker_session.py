@@ -3,6 +3,7 @@ import struct
 from asyncio import CancelledError, DatagramProtocol, Future, ensure_future, get_event_loop, sleep, start_server
 from unittest.mock import Mock
 
+from aiohttp import web
 from aiohttp.web_exceptions import HTTPBadRequest
 
 from ipv8.util import succeed
@@ -11,9 +12,11 @@ from libtorrent import bencode
 
 import pytest
 
+from tribler_core.components.torrent_checker.torrent_checker import torrentchecker_session
 from tribler_core.components.torrent_checker.torrent_checker.torrentchecker_session import (
     FakeBep33DHTSession,
     FakeDHTSession,
+    HttpSessionPool,
     HttpTrackerSession,
     UdpSocketManager,
     UdpTrackerSession,
@@ -122,6 +125,111 @@ async def test_httpsession_timeout():
     server.close()
 
 
+@pytest.mark.asyncio
+async def test_httpsession_scrape_urls(monkeypatch):
+    """
+    Test whether the infohashes of a HTTP session are split over scrape URLs of limited length
+    """
+    monkeypatch.setattr(torrentchecker_session, 'MAX_SCRAPE_URL_LENGTH', 512)
+    session = HttpTrackerSession("localhost", ("localhost", 8475), "/announce?passkey=abc", 5, None)
+    infohashes = [bytes([i]) * 20 for i in range(40)]
+    for infohash in infohashes:
+        session.add_infohash(infohash)
+
+    requests = session.get_scrape_requests()
+    assert len(requests) > 1
+    assert all(len(url) <= 512 for url, _ in requests)
+    assert all(url.startswith("http://localhost:8475/scrape?") and "passkey=abc" in url for url, _ in requests)
+    assert all(url.count("info_hash=") == len(batch) for url, batch in requests)
+    assert sum((batch for _, batch in requests), []) == infohashes
+    await session.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_httpsession_scrape_pooled(monkeypatch):
+    """
+    Test scraping a (local) HTTP tracker over a pooled session, with the infohashes split over several requests
+    """
+    monkeypatch.setattr(torrentchecker_session, 'MAX_SCRAPE_URL_LENGTH', 512)
+    requested = []
+
+    async def scrape(request):
+        infohashes = [infohash.encode('latin-1') for infohash in request.query.getall('info_hash')]
+        requested.append(infohashes)
+        files = {infohash: {b'complete': infohash[0], b'incomplete': 1} for infohash in infohashes[1:]}
+        return web.Response(body=bencode({b'files': files}))
+
+    app = web.Application()
+    app.add_routes([web.get('/scrape', scrape)])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, 'localhost', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # pylint: disable=protected-access
+
+    pool = HttpSessionPool()
+    infohashes = [bytes([i + 1]) * 20 for i in range(20)]
+    session = HttpTrackerSession("http://localhost/announce", ("localhost", port), "/announce", 5, None,
+                                 session_pool=pool)
+    for infohash in infohashes:
+        session.add_infohash(infohash)
+    result = await session.connect_to_tracker()
+    await session.cleanup()
+
+    assert len(requested) > 1
+    assert sorted(sum(requested, [])) == infohashes
+    results = {item['infohash']: item for item in result["http://localhost/announce"]}
+    assert len(results) == len(infohashes)
+    assert results[hexlify(infohashes[-1])]['seeders'] == 20
+    assert session.answered_infohashes == len(infohashes) - len(requested)
+
+    # The pooled session is kept open for the next tracker sessions
+    assert pool.get_session(None) is session._session
+    assert not session._session.closed
+
+    await pool.close()
+    assert session._session.closed
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_httpsession_scrape_partial_failure(monkeypatch):
+    """
+    Test whether the results of the scrapes that succeeded are kept if a later scrape of the session fails
+    """
+    monkeypatch.setattr(torrentchecker_session, 'MAX_SCRAPE_URL_LENGTH', 512)
+    requested = []
+
+    async def scrape(request):
+        infohashes = [infohash.encode('latin-1') for infohash in request.query.getall('info_hash')]
+        requested.append(infohashes)
+        if len(requested) > 1:
+            raise web.HTTPInternalServerError()
+        # The tracker also reports an infohash that was requested by another scrape
+        files = {infohash: {b'complete': 1, b'incomplete': 1} for infohash in infohashes + [b'\x14' * 20]}
+        return web.Response(body=bencode({b'files': files}))
+
+    app = web.Application()
+    app.add_routes([web.get('/scrape', scrape)])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, 'localhost', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # pylint: disable=protected-access
+
+    session = HttpTrackerSession("http://localhost/announce", ("localhost", port), "/announce", 5, None)
+    for infohash in [bytes([i + 1]) * 20 for i in range(20)]:
+        session.add_infohash(infohash)
+    result = await session.connect_to_tracker()
+    await session.cleanup()
+    await runner.cleanup()
+
+    assert len(requested) == 2
+    results = {item['infohash']: item for item in result["http://localhost/announce"]}
+    assert sorted(results) == sorted(hexlify(infohash) for infohash in requested[0])
+    assert session.answered_infohashes == len(requested[0])
+
+
 @pytest.mark.asyncio
 async def test_udpsession_timeout(fake_udp_socket_manager):
     sleep_future = Future()
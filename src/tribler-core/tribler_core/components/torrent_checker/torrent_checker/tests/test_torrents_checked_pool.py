@@ -0,0 +1,100 @@
+import time
+from random import randint
+
+import pytest
+
+from tribler_core.components.torrent_checker.torrent_checker.torrents_checked_pool import TorrentsCheckedPool
+from tribler_core.utilities.utilities import random_infohash
+
+
+@pytest.fixture(name="pool")
+def fixture_pool():
+    return TorrentsCheckedPool(popular_count=5, random_pool_size=20)
+
+
+def fill_pool(pool, torrents):
+    for torrent in torrents:
+        pool.update(*torrent)
+
+
+def test_select_small_list(pool):
+    now = int(time.time())
+    torrents = [
+        # infohash, seeders, leechers, last_check
+        (b'0' * 20, 0, 0, now),
+        (b'1' * 20, 1, 0, now),
+        (b'2' * 20, 2, 0, now),
+    ]
+    fill_pool(pool, torrents)
+
+    assert len(pool) == 2
+    assert pool.popular() == set(torrents[1:])
+    assert pool.random(10) == set(torrents[1:])
+    assert not pool.random(10, include_popular=False)
+
+
+def test_select_big_list(pool):
+    now = int(time.time())
+    dead_torrents = {(random_infohash(), 0, randint(1, 10), now) for _ in range(10)}
+    alive_torrents = {(random_infohash(), randint(1, 10), randint(1, 10), now) for _ in range(10)}
+    popular_torrents = {(random_infohash(), randint(11, 100), randint(1, 10), now) for _ in range(5)}
+    fill_pool(pool, dead_torrents | alive_torrents | popular_torrents)
+
+    assert pool.popular() == popular_torrents
+    assert len(pool.popular(3)) == 3
+
+    rand = pool.random(5, include_popular=False)
+    assert len(rand) == 5
+    assert rand <= alive_torrents
+
+
+def test_no_alive_torrents(pool):
+    fill_pool(pool, {(random_infohash(), 0, randint(1, 10), int(time.time())) for _ in range(10)})
+
+    assert not pool
+    assert not pool.popular()
+    assert not pool.random(10)
+
+
+def test_update_popularity(pool):
+    now = int(time.time())
+    torrents = [(random_infohash(), seeders, 0, now) for seeders in range(1, 11)]
+    fill_pool(pool, torrents)
+    assert pool.popular() == set(torrents[5:])
+
+    # A torrent from the reservoir becomes the most popular one
+    pool.update(torrents[0][0], 100, 0, now)
+    assert pool.get(torrents[0][0]) in pool.popular(1)
+
+    # A popular torrent loses its seeders and is replaced by the best torrent from the reservoir
+    pool.update(torrents[9][0], 1, 0, now)
+    assert pool.popular() == {pool.get(torrents[0][0])} | set(torrents[5:9])
+
+    # A popular torrent dies and is replaced by the best torrent from the reservoir
+    pool.update(torrents[8][0], 0, 0, now)
+    assert torrents[8][0] not in pool
+    assert pool.popular() == {pool.get(torrents[0][0]), torrents[4]} | set(torrents[5:8])
+
+
+def test_pool_is_bounded(pool):
+    now = int(time.time())
+    fill_pool(pool, [(random_infohash(), randint(1, 100), 0, now) for _ in range(1000)])
+
+    assert len(pool) == pool.popular_count + pool.random_pool_size
+    assert len(pool.popular()) == pool.popular_count
+    assert len(pool.random(10)) == 10
+
+
+def test_stale_torrents_removed(pool):
+    stale = time.time() - pool.freshness_seconds - 1
+    now = int(time.time())
+    fresh_torrents = [(random_infohash(), seeders, 0, now) for seeders in range(1, 6)]
+    fill_pool(pool, fresh_torrents)
+    pool.update(b'0' * 20, 100, 0, stale)
+    pool.update(b'1' * 20, 1, 0, stale)
+
+    assert pool.popular() == set(fresh_torrents)
+    assert b'0' * 20 not in pool
+
+    assert pool.random(10) == set(fresh_torrents)
+    assert b'1' * 20 not in pool
@@ -1,6 +1,8 @@
+from unittest.mock import Mock
+
 import pytest
 
-from tribler_core.components.torrent_checker.torrent_checker.tracker_manager import TrackerManager
+from tribler_core.components.torrent_checker.torrent_checker.tracker_manager import TrackerManager, TrackerStats
 
 
 @pytest.fixture
@@ -79,6 +81,61 @@ def test_get_tracker_for_check_blacklist(tracker_manager):
     assert not tracker_manager.get_next_tracker_for_auto_check()
 
 
+def test_get_tracker_for_check_best_score(tracker_manager):
+    """
+    Test whether the best scoring tracker is returned for the auto check, and whether unknown trackers go first
+    """
+    for tracker_url in ["http://slow.com/announce", "http://fast.com/announce", "http://new.com/announce"]:
+        tracker_manager.add_tracker(tracker_url)
+
+    slow = Mock(tracker_url="http://slow.com/announce", is_failed=False, is_timed_out=False,
+                infohash_list=[b'a' * 20] * 10, answered_infohashes=10)
+    fast = Mock(tracker_url="http://fast.com/announce", is_failed=False, is_timed_out=False,
+                infohash_list=[b'a' * 20] * 10, answered_infohashes=10)
+    tracker_manager.update_tracker_stats(slow, 20)
+    tracker_manager.update_tracker_stats(fast, 0.2)
+    assert tracker_manager.get_next_tracker_for_auto_check().url == "http://new.com/announce"
+
+    tracker_manager.blacklist.append("http://new.com/announce")
+    assert tracker_manager.get_next_tracker_for_auto_check().url == "http://fast.com/announce"
+
+
+def test_update_tracker_stats(tracker_manager):
+    """
+    Test whether the results of finished tracker sessions are recorded per tracker
+    """
+    session = Mock(tracker_url="http://test1.com:80/announce", is_failed=False, is_timed_out=False,
+                   infohash_list=[b'a' * 20, b'b' * 20], answered_infohashes=1)
+    tracker_manager.update_tracker_stats(session, 0.3)
+    session.is_failed = session.is_timed_out = True
+    tracker_manager.update_tracker_stats(session, 40)
+    tracker_manager.update_tracker_stats(Mock(tracker_url="DHT"), 1)
+
+    assert list(tracker_manager.tracker_stats) == ["http://test1.com/announce"]
+    stats = tracker_manager.tracker_stats["http://test1.com/announce"]
+    assert stats.requests == 2
+    assert stats.timeout_rate == 0.5
+    assert stats.scrape_yield == 1
+    assert stats.latency_histogram == [0, 0, 1, 0, 0, 0, 0, 0, 1]
+
+    tracker_manager.remove_tracker("http://test1.com:80/announce")
+    assert not tracker_manager.tracker_stats
+
+
+def test_tracker_stats_score():
+    """
+    Test whether fast, high-yield trackers score better than slow and failing ones
+    """
+    assert TrackerStats().score == float('inf')
+    assert TrackerStats().to_dict()['score'] is None
+
+    fast, slow, failing = TrackerStats(), TrackerStats(), TrackerStats()
+    fast.record(0.1, True, requested=10, answered=10)
+    slow.record(10, True, requested=10, answered=10)
+    failing.record(0.1, False, requested=10)
+    assert fast.score > slow.score > failing.score == 0
+
+
 def test_load_blacklist_from_file_none(tracker_manager):
     """
     Test if we correctly load a blacklist without entries
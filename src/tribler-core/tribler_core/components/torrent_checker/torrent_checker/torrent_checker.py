@@ -17,9 +17,11 @@ from tribler_core.components.metadata_store.db.store import MetadataStore
 from tribler_core.components.torrent_checker.torrent_checker.torrentchecker_session import (
     FakeBep33DHTSession,
     FakeDHTSession,
+    HttpSessionPool,
     UdpSocketManager,
     create_tracker_session,
 )
+from tribler_core.components.torrent_checker.torrent_checker.torrents_checked_pool import TorrentsCheckedPool
 from tribler_core.components.torrent_checker.torrent_checker.tracker_manager import MAX_TRACKER_FAILURES, TrackerManager
 from tribler_core.config.tribler_config import TriblerConfig
 from tribler_core.notifier import Notifier
@@ -33,6 +35,7 @@ USER_CHANNEL_TORRENT_SELECTION_INTERVAL = 15  # The interval for checking the he
 MIN_TORRENT_CHECK_INTERVAL = 900  # How much time we should wait before checking a torrent again
 TORRENT_CHECK_RETRY_INTERVAL = 30  # Interval when the torrent was successfully checked for the last time
 MAX_TORRENTS_CHECKED_PER_SESSION = 50
+MAX_TORRENTS_CHECKED_PER_HTTP_SESSION = 200  # HTTP trackers are scraped for many torrents at once
 
 TORRENT_SELECTION_POOL_SIZE = 2  # How many torrents to check (popular or random) during periodic check
 USER_CHANNEL_TORRENT_SELECTION_POOL_SIZE = 5  # How many torrents to check from user's channel during periodic check
@@ -65,9 +68,13 @@ class TorrentChecker(TaskManager):
         self.socket_mgr = UdpSocketManager()
         self.udp_transport = None
 
+        # HTTP tracker sessions share a keep-alive aiohttp session per proxy
+        self.http_session_pool = HttpSessionPool()
+
         # We keep track of the results of popular torrents checked by you.
         # The popularity community gossips this information around.
-        self._torrents_checked = dict()
+        # The pool is warmed up from the database on first access.
+        self._torrents_checked = None
 
     async def initialize(self):
         self.register_task("tracker_check", self.check_random_tracker, interval=TRACKER_SELECTION_INTERVAL)
@@ -106,6 +113,7 @@ class TorrentChecker(TaskManager):
             self.udp_transport = None
 
         await self.shutdown_task_manager()
+        await self.http_session_pool.close()
 
     async def check_random_tracker(self):
         """
@@ -132,7 +140,9 @@ class TorrentChecker(TaskManager):
                 self.update_tracker_info(tracker.url, False)
                 return False
             torrents = select(ts for ts in tracker.torrents if ts.last_check + dynamic_interval < int(time.time()))
-            infohashes = [t.infohash for t in torrents[:MAX_TORRENTS_CHECKED_PER_SESSION]]
+            max_torrents = MAX_TORRENTS_CHECKED_PER_HTTP_SESSION if tracker.url.startswith('http') \
+                else MAX_TORRENTS_CHECKED_PER_SESSION
+            infohashes = [t.infohash for t in torrents[:max_torrents]]
 
         if len(infohashes) == 0:
             # We have no torrent to recheck for this tracker. Still update the last_check for this tracker.
@@ -164,24 +174,28 @@ class TorrentChecker(TaskManager):
             return False
 
     async def connect_to_tracker(self, session):
+        start_time = time.time()
         try:
             info_dict = await session.connect_to_tracker()
+            self.tracker_manager.update_tracker_stats(session, time.time() - start_time)
             return await self._on_result_from_session(session, info_dict)
         except CancelledError:
             self._logger.info("Tracker session is being cancelled (url %s)", session.tracker_url)
             await self.clean_session(session)
         except Exception as e:
             self._logger.warning("Got session error for URL %s: %s", session.tracker_url, str(e).replace('\n]', ']'))
+            self.tracker_manager.update_tracker_stats(session, time.time() - start_time)
             await self.clean_session(session)
             self.tracker_manager.update_tracker_info(session.tracker_url, False)
             e.tracker_url = session.tracker_url
             raise e
 
     @property
-    def torrents_checked(self):
-        if not self._torrents_checked:
+    def torrents_checked(self) -> TorrentsCheckedPool:
+        if self._torrents_checked is None:
+            self._torrents_checked = TorrentsCheckedPool(freshness_seconds=HEALTH_FRESHNESS_SECONDS)
             self.load_torrents_checked_from_db()
-        return self._torrents_checked.values()
+        return self._torrents_checked
 
     @db_session
     def load_torrents_checked_from_db(self):
@@ -192,8 +206,7 @@ class TorrentChecker(TaskManager):
                                 .limit(TORRENTS_CHECKED_RETURN_SIZE))
 
         for torrent in checked_torrents:
-            self._torrents_checked[torrent.infohash] = (torrent.infohash, torrent.seeders, torrent.leechers,
-                                                        torrent.last_check)
+            self._torrents_checked.update(torrent.infohash, torrent.seeders, torrent.leechers, torrent.last_check)
 
     @db_session
     def torrents_to_check(self):
@@ -284,14 +297,11 @@ class TorrentChecker(TaskManager):
 
     def update_torrents_checked(self, new_result):
         """
-        Update the set with torrents that we have checked ourselves.
+        Update the pool with torrents that we have checked ourselves.
+        Torrents without seeders are removed from the pool.
         """
-        infohash = new_result['infohash']
-        seeders = new_result['seeders']
-        new_result_tuple = (infohash, seeders, new_result['leechers'], new_result['last_check'])
-
-        if seeders > 0:
-            self._torrents_checked[infohash] = new_result_tuple
+        self.torrents_checked.update(new_result['infohash'], new_result['seeders'], new_result['leechers'],
+                                     new_result['last_check'])
 
     def on_torrent_health_check_completed(self, infohash, result):
         final_response = {}
@@ -395,7 +405,8 @@ class TorrentChecker(TaskManager):
             # Proxies never started, dropping the request
             return None
         proxy = ('127.0.0.1', self.socks_listen_ports[hops - 1]) if hops > 0 else None
-        session = create_tracker_session(tracker_url, timeout, proxy, self.socket_mgr)
+        session = create_tracker_session(tracker_url, timeout, proxy, self.socket_mgr,
+                                         http_session_pool=self.http_session_pool)
 
         if tracker_url not in self._session_list:
             self._session_list[tracker_url] = []
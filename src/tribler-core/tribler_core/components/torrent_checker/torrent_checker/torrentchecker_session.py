@@ -6,18 +6,19 @@ import sys
 import time
 from abc import ABCMeta, abstractmethod
 from asyncio import DatagramProtocol, Future, TimeoutError, ensure_future, get_event_loop
+from urllib.parse import quote_plus
 
-from aiohttp import ClientResponseError, ClientSession, ClientTimeout
+from aiohttp import ClientResponseError, ClientSession, ClientTimeout, TCPConnector
 
 import async_timeout
 
 from ipv8.taskmanager import TaskManager
+from tribler_core.components.libtorrent.download_manager.metainfo_request_queue import METAINFO_PRIORITY_BACKGROUND
 from tribler_core.components.socks_servers.socks5.aiohttp_connector import Socks5Connector
 from tribler_core.components.socks_servers.socks5.client import Socks5Client
-
+from tribler_core.components.torrent_checker.torrent_checker.scrape_response import InvalidData, ScrapeResponseDecoder
 from tribler_core.utilities.tracker_utils import add_url_params, parse_tracker_url
 from tribler_core.utilities.unicode import hexlify
-from tribler_core.utilities.utilities import bdecode_compat
 
 # Although these are the actions for UDP trackers, they can still be used as
 # identifiers.
@@ -30,25 +31,60 @@ MAX_INT32 = 2 ** 16 - 1
 UDP_TRACKER_INIT_CONNECTION_ID = 0x41727101980
 
 MAX_INFOHASHES_IN_SCRAPE = 60
+MAX_INFOHASHES_IN_HTTP_SCRAPE = 200  # HTTP scrapes are split over several URLs, so they can hold more infohashes
+
+# The maximum length of an HTTP scrape URL. Most HTTP servers accept URLs of up to 8 KB.
+MAX_SCRAPE_URL_LENGTH = 4096
+SCRAPE_RESPONSE_CHUNK_SIZE = 16 * 1024
+HTTP_KEEPALIVE_TIMEOUT = 30
 
 
-def create_tracker_session(tracker_url, timeout, proxy, socket_manager):
+def create_tracker_session(tracker_url, timeout, proxy, socket_manager, http_session_pool=None):
     """
     Creates a tracker session with the given tracker URL.
     :param tracker_url: The given tracker URL.
     :param timeout: The timeout for the session.
+    :param http_session_pool: The HttpSessionPool that HTTP tracker sessions take their aiohttp session from.
     :return: The tracker session.
     """
     tracker_type, tracker_address, announce_page = parse_tracker_url(tracker_url)
 
     if tracker_type == 'udp':
         return UdpTrackerSession(tracker_url, tracker_address, announce_page, timeout, proxy, socket_manager)
-    return HttpTrackerSession(tracker_url, tracker_address, announce_page, timeout, proxy)
+    return HttpTrackerSession(tracker_url, tracker_address, announce_page, timeout, proxy,
+                              session_pool=http_session_pool)
+
+
+class HttpSessionPool:
+    """
+    Keeps a single keep-alive aiohttp session per proxy, that is shared by all HTTP tracker sessions.
+    This way, subsequent scrapes of a tracker reuse the TCP (and SOCKS5) connection of the previous scrape.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+
+    def get_session(self, proxy=None):
+        session = self._sessions.get(proxy)
+        if session is None or session.closed:
+            connector_class = Socks5Connector if proxy else TCPConnector
+            connector_args = (proxy,) if proxy else ()
+            connector = connector_class(*connector_args, keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT)
+            session = self._sessions[proxy] = ClientSession(connector=connector, raise_for_status=True)
+        return session
+
+    async def close(self):
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            await session.close()
 
 
 class TrackerSession(TaskManager):
     __meta__ = ABCMeta
 
+    max_infohashes = MAX_INFOHASHES_IN_SCRAPE
+
     def __init__(self, tracker_type, tracker_url, tracker_address, announce_page, timeout):
         super().__init__()
 
@@ -67,6 +103,10 @@ class TrackerSession(TaskManager):
         self.is_initiated = False  # you cannot add requests to a session if it has been initiated
         self.is_finished = False
         self.is_failed = False
+        self.is_timed_out = False
+
+        # The number of infohashes the tracker returned health information for
+        self.answered_infohashes = 0
 
     def __str__(self):
         return f"Tracker[{self.tracker_type}, {self.tracker_url}]"
@@ -85,7 +125,7 @@ class TrackerSession(TaskManager):
         """
         assert not self.is_initiated, "Must not add request to an initiated session."
         assert not self.has_infohash(infohash), "Must not add duplicate requests"
-        if len(self.infohash_list) < MAX_INFOHASHES_IN_SCRAPE:
+        if len(self.infohash_list) < self.max_infohashes:
             self.infohash_list.append(infohash)
 
     def failed(self, msg=None):
@@ -106,86 +146,140 @@ class TrackerSession(TaskManager):
 
 
 class HttpTrackerSession(TrackerSession):
-    def __init__(self, tracker_url, tracker_address, announce_page, timeout, proxy):
+    max_infohashes = MAX_INFOHASHES_IN_HTTP_SCRAPE
+
+    def __init__(self, tracker_url, tracker_address, announce_page, timeout, proxy, session_pool=None):
         super().__init__('http', tracker_url, tracker_address, announce_page, timeout)
-        self._session = ClientSession(connector=Socks5Connector(proxy) if proxy else None,
-                                      raise_for_status=True,
-                                      timeout=ClientTimeout(total=self.timeout))
+        # Sessions taken from the pool are shared with other tracker sessions, so we must not close them
+        self._owns_session = session_pool is None
+        if session_pool is None:
+            self._session = ClientSession(connector=Socks5Connector(proxy) if proxy else None,
+                                          raise_for_status=True)
+        else:
+            self._session = session_pool.get_session(proxy)
 
-    async def connect_to_tracker(self):
-        # create the HTTP GET message
+    def get_scrape_requests(self):
+        """
+        Split the infohashes of this session over as few scrape URLs as possible, while keeping every URL
+        shorter than MAX_SCRAPE_URL_LENGTH.
+        :return: A list of (URL, infohashes) tuples, with the infohashes that are scraped by each URL.
+        """
         # Note: some trackers have strange URLs, e.g.,
         #       http://moviezone.ws/announce.php?passkey=8ae51c4b47d3e7d0774a720fa511cc2a
         #       which has some sort of 'key' as parameter, so we need to use the add_url_params
         #       utility function to handle such cases.
+        base_url = "http://%s:%s%s" % (self.tracker_address[0], self.tracker_address[1],
+                                       self.announce_page.replace('announce', 'scrape'))
+        base_length = len(add_url_params(base_url, {}))
 
-        url = add_url_params("http://%s:%s%s" %
-                             (self.tracker_address[0], self.tracker_address[1],
-                              self.announce_page.replace('announce', 'scrape')),
-                             {"info_hash": self.infohash_list})
+        requests = []
+        batch = []
+        length = base_length
+        for infohash in self.infohash_list:
+            param_length = len('&info_hash=') + len(quote_plus(infohash))
+            if batch and length + param_length > MAX_SCRAPE_URL_LENGTH:
+                requests.append((add_url_params(base_url, {"info_hash": batch}), batch))
+                batch = []
+                length = base_length
+            batch.append(infohash)
+            length += param_length
+        requests.append((add_url_params(base_url, {"info_hash": batch}), batch))
+        return requests
 
+    async def connect_to_tracker(self):
         # no more requests can be appended to this session
         self.is_initiated = True
         self.last_contact = int(time.time())
 
+        results = []
+        error = None
         try:
-            self._logger.debug("%s HTTP SCRAPE message sent: %s", self, url)
-            async with self._session:
-                async with self._session.get(url.encode('ascii').decode('utf-8')) as response:
-                    body = await response.read()
+            # The scrapes are sent one after another, so they can all use the same kept-alive connection
+            for url, infohashes in self.get_scrape_requests():
+                self._logger.debug("%s HTTP SCRAPE message sent: %s", self, url)
+                decoder = ScrapeResponseDecoder(infohashes)
+                async with self._session.get(url.encode('ascii').decode('utf-8'),
+                                             timeout=ClientTimeout(total=self.timeout)) as response:
+                    async for chunk in response.content.iter_chunked(SCRAPE_RESPONSE_CHUNK_SIZE):
+                        decoder.feed(chunk)
+                decoder.close()
+                results.append((decoder, infohashes))
         except UnicodeEncodeError as e:
             raise e
         except ClientResponseError as e:
             self._logger.warning("%s HTTP SCRAPE error response code %s", self, e.status)
-            self.failed(msg=f"error code {e.status}")
+            error = f"error code {e.status}"
+        except TimeoutError:
+            self.is_timed_out = True
+            error = 'request timed out'
+        except InvalidData:
+            error = "no valid response"
         except Exception as e:
-            self.failed(msg=str(e))
-
-        return self._process_scrape_response(body)
+            error = str(e)
+        finally:
+            if self._owns_session:
+                await self._session.close()
+
+        if error:
+            if not results:
+                self.failed(msg=error)
+            # The infohashes of the scrapes that did succeed are still reported, the others are left out
+            self._logger.warning("%s HTTP SCRAPE failed after %d successful requests (error: %s)",
+                                 self, len(results), error)
+        return self._process_scrape_results(results)
 
     def _process_scrape_response(self, body):
         """
-        This function handles the response body of a HTTP tracker,
+        This function handles the (complete) response body of a HTTP tracker,
         parsing the results.
         """
-        # parse the retrieved results
         if body is None:
             self.failed(msg="no response body")
 
-        response_dict = bdecode_compat(body)
-        if not response_dict:
+        decoder = ScrapeResponseDecoder(self.infohash_list)
+        try:
+            decoder.feed(body)
+            decoder.close()
+        except InvalidData:
             self.failed(msg="no valid response")
+        return self._process_scrape_results([(decoder, self.infohash_list)])
 
+    def _process_scrape_results(self, results):
+        """
+        This function handles the decoded responses of a HTTP tracker to the scrape requests of this session.
+        :param results: A list of (decoder, infohashes) tuples, with the decoded response to each scrape request and
+        the infohashes that it requested.
+        """
         response_list = []
-
-        unprocessed_infohash_list = self.infohash_list[:]
-        if b'files' in response_dict and isinstance(response_dict[b'files'], dict):
-            for infohash in response_dict[b'files']:
-                complete = 0
-                incomplete = 0
-                if isinstance(response_dict[b'files'][infohash], dict):
-                    complete = response_dict[b'files'][infohash].get(b'complete', 0)
-                    incomplete = response_dict[b'files'][infohash].get(b'incomplete', 0)
-
+        requested_infohashes = [infohash for _, infohashes in results for infohash in infohashes]
+        unprocessed_infohashes = set(requested_infohashes)
+        for decoder, _ in results:
+            if not decoder.has_files and not decoder.fields:
+                self.failed(msg="no valid response")
+
+            if b'failure reason' in decoder.fields:
+                failure_reason = decoder.fields[b'failure reason']
+                self._logger.info("%s Failure as reported by tracker [%s]", self, repr(failure_reason))
+                self.failed(msg=repr(failure_reason))
+
+            for infohash, entry in decoder.files.items():
                 # Sow complete as seeders. "complete: number of peers with the entire file, i.e. seeders (integer)"
                 #  - https://wiki.theory.org/BitTorrentSpecification#Tracker_.27scrape.27_Convention
-                seeders = complete
-                leechers = incomplete
+                seeders = entry.get(b'complete', 0) if isinstance(entry, dict) else 0
+                leechers = entry.get(b'incomplete', 0) if isinstance(entry, dict) else 0
 
                 # Store the information in the dictionary
                 response_list.append({'infohash': hexlify(infohash), 'seeders': seeders, 'leechers': leechers})
 
                 # remove this infohash in the infohash list of this session
-                if infohash in unprocessed_infohash_list:
-                    unprocessed_infohash_list.remove(infohash)
-
-        elif b'failure reason' in response_dict:
-            self._logger.info("%s Failure as reported by tracker [%s]", self, repr(response_dict[b'failure reason']))
-            self.failed(msg=repr(response_dict[b'failure reason']))
+                if infohash in unprocessed_infohashes:
+                    unprocessed_infohashes.remove(infohash)
+                    self.answered_infohashes += 1
 
         # handle the infohashes with no result (seeders/leechers = 0/0)
-        for infohash in unprocessed_infohash_list:
-            response_list.append({'infohash': hexlify(infohash), 'seeders': 0, 'leechers': 0})
+        for infohash in requested_infohashes:
+            if infohash in unprocessed_infohashes:
+                response_list.append({'infohash': hexlify(infohash), 'seeders': 0, 'leechers': 0})
 
         self.is_finished = True
         return {self.tracker_url: response_list}
@@ -195,7 +289,8 @@ class HttpTrackerSession(TrackerSession):
         Cleans the session by cancelling all deferreds and closing sockets.
         :return: A deferred that fires once the cleanup is done.
         """
-        await self._session.close()
+        if self._owns_session:
+            await self._session.close()
         await super().cleanup()
 
 
@@ -331,6 +426,7 @@ class UdpTrackerSession(TrackerSession):
                 await self.connect()
                 return await self.scrape()
         except TimeoutError:
+            self.is_timed_out = True
             self.failed(msg='request timed out')
         except socket.gaierror as e:
             self.failed(msg=str(e))
@@ -420,6 +516,7 @@ class UdpTrackerSession(TrackerSession):
         self.remove_transaction_id()
         self.last_contact = int(time.time())
         self.is_finished = True
+        self.answered_infohashes = len(self.infohash_list)
 
         return {self.tracker_url: response_list}
 
@@ -455,7 +552,8 @@ class FakeDHTSession(TrackerSession):
         Fakely connects to a tracker.
         :return: A deferred that fires with the health information.
         """
-        metainfo = await self.dlmgr.get_metainfo(self.infohash, timeout=self.timeout)
+        metainfo = await self.dlmgr.get_metainfo(self.infohash, timeout=self.timeout,
+                                                 priority=METAINFO_PRIORITY_BACKGROUND)
         if not metainfo:
             raise RuntimeError("Metainfo lookup error")
 
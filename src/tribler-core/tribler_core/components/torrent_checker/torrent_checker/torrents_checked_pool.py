@@ -0,0 +1,169 @@
+"""
+In-memory pool of torrents that were health-checked by us.
+
+The popularity community gossips entries from this pool, so selecting the popular and random torrents
+should not depend on the total number of torrents we have checked.
+"""
+import heapq
+import random
+import time
+
+POPULAR_TORRENTS_COUNT = 10  # The number of the most popular torrents the pool keeps track of
+RANDOM_POOL_SIZE = 1000  # The maximum number of other (non-popular) torrents the pool keeps
+FRESHNESS_SECONDS = 4 * 3600  # Entries that were checked longer ago than this are removed from the pool
+
+
+class TorrentsCheckedPool:
+    """
+    A bounded pool of (infohash, seeders, leechers, last_check) tuples of alive torrents.
+
+    The most popular torrents (by seeders count) are kept in a min-heap of fixed size. Every other torrent
+    goes through a reservoir sample of fixed size, so the pool gives every checked torrent an equal chance
+    to be gossiped without growing unbounded. Stale entries are aged out lazily during selection.
+    """
+
+    def __init__(self, popular_count=POPULAR_TORRENTS_COUNT, random_pool_size=RANDOM_POOL_SIZE,
+                 freshness_seconds=FRESHNESS_SECONDS):
+        self.popular_count = popular_count
+        self.random_pool_size = random_pool_size
+        self.freshness_seconds = freshness_seconds
+
+        self._entries = {}  # infohash -> (infohash, seeders, leechers, last_check)
+
+        # Min-heap of (seeders, infohash) of the most popular torrents
+        self._popular = []
+        # Reservoir of infohashes of the other torrents, with the index of each infohash in the reservoir
+        self._pool = []
+        self._pool_index = {}
+        self._offered_to_pool = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(list(self._entries.values()))
+
+    def __contains__(self, infohash):
+        return infohash in self._entries
+
+    def get(self, infohash):
+        return self._entries.get(infohash)
+
+    def update(self, infohash, seeders, leechers, last_check):
+        """
+        Add or update the health of a checked torrent. Dead torrents are removed from the pool.
+        """
+        if seeders <= 0:
+            self.remove(infohash)
+            return
+
+        old_entry = self._entries.get(infohash)
+        self._entries[infohash] = (infohash, seeders, leechers, last_check)
+        if old_entry is None:
+            self._add(infohash, seeders)
+            return
+
+        if infohash in self._pool_index:
+            if self._popular and (seeders, infohash) > self._popular[0]:
+                self._swap_into_popular(infohash)
+            return
+
+        # The entry is one of the popular torrents: fix its key in the heap
+        self._popular = [(seeders if i == infohash else s, i) for s, i in self._popular]
+        heapq.heapify(self._popular)
+        if seeders < old_entry[1] and self._pool:
+            # Some torrent in the reservoir might be more popular now
+            best = max(self._pool, key=lambda i: (self._entries[i][1], i))
+            if (self._entries[best][1], best) > self._popular[0]:
+                self._swap_into_popular(best)
+
+    def remove(self, infohash):
+        if self._entries.pop(infohash, None) is None:
+            return
+        if infohash in self._pool_index:
+            self._remove_from_pool(infohash)
+        else:
+            self._popular = [(s, i) for s, i in self._popular if i != infohash]
+            heapq.heapify(self._popular)
+            self._refill_popular()
+
+    def popular(self, count=None):
+        """
+        Return a set of the most popular fresh torrents.
+        """
+        # Removing a stale popular torrent can promote a stale torrent from the reservoir
+        while self._remove_stale([infohash for _, infohash in self._popular]):
+            pass
+        largest = heapq.nlargest(count or self.popular_count, self._popular)
+        return {self._entries[infohash] for _, infohash in largest}
+
+    def random(self, count, include_popular=True):
+        """
+        Return a set of at most `count` randomly selected fresh torrents.
+        :param include_popular: if False, the most popular torrents are not selected.
+        """
+        candidates_count = len(self._pool) + (len(self._popular) if include_popular else 0)
+        indices = random.sample(range(candidates_count), min(count, candidates_count))
+        selected = [self._pool[i] if i < len(self._pool) else self._popular[i - len(self._pool)][1] for i in indices]
+        self._remove_stale(selected)
+        return {self._entries[infohash] for infohash in selected if infohash in self._entries}
+
+    def _add(self, infohash, seeders):
+        if len(self._popular) < self.popular_count:
+            heapq.heappush(self._popular, (seeders, infohash))
+            return
+        if (seeders, infohash) > self._popular[0]:
+            _, infohash = heapq.heapreplace(self._popular, (seeders, infohash))
+        self._offer_to_pool(infohash)
+
+    def _offer_to_pool(self, infohash):
+        """
+        Reservoir sampling (algorithm R) over the stream of torrents that did not make it into the popular heap.
+        """
+        self._offered_to_pool += 1
+        if len(self._pool) < self.random_pool_size:
+            self._pool_index[infohash] = len(self._pool)
+            self._pool.append(infohash)
+            return
+
+        index = random.randrange(self._offered_to_pool)
+        if index < self.random_pool_size:
+            evicted = self._pool[index]
+            del self._pool_index[evicted]
+            del self._entries[evicted]
+            self._pool[index] = infohash
+            self._pool_index[infohash] = index
+        else:
+            del self._entries[infohash]
+
+    def _swap_into_popular(self, infohash):
+        """
+        Move a torrent from the reservoir to the popular heap, in exchange for the least popular torrent of the heap.
+        """
+        self._remove_from_pool(infohash)
+        _, demoted = heapq.heapreplace(self._popular, (self._entries[infohash][1], infohash))
+        self._pool_index[demoted] = len(self._pool)
+        self._pool.append(demoted)
+
+    def _remove_from_pool(self, infohash):
+        index = self._pool_index.pop(infohash)
+        last = self._pool.pop()
+        if last != infohash:
+            self._pool[index] = last
+            self._pool_index[last] = index
+
+    def _refill_popular(self):
+        """
+        Move the most popular torrents from the reservoir to the popular heap until the heap is full again.
+        """
+        while len(self._popular) < self.popular_count and self._pool:
+            infohash = max(self._pool, key=lambda i: self._entries[i][1])
+            self._remove_from_pool(infohash)
+            heapq.heappush(self._popular, (self._entries[infohash][1], infohash))
+
+    def _remove_stale(self, infohashes):
+        last_fresh_time = time.time() - self.freshness_seconds
+        stale = [infohash for infohash in infohashes if self._entries[infohash][3] < last_fresh_time]
+        for infohash in stale:
+            self.remove(infohash)
+        return stale
@@ -1,3 +1,4 @@
+import bisect
 import logging
 import time
 from pathlib import Path
@@ -9,6 +10,80 @@ from tribler_core.utilities.tracker_utils import get_uniformed_tracker_url
 
 MAX_TRACKER_FAILURES = 5  # if a tracker fails this amount of times in a row, its 'is_alive' will be marked as 0 (dead).
 TRACKER_RETRY_INTERVAL = 60    # A "dead" tracker will be retired every 60 seconds
+TRACKER_SELECTION_CANDIDATES = 10  # The number of least recently checked trackers to choose the best scoring one from
+
+# Upper bounds (in seconds) of the tracker response time histogram buckets. The last bucket has no upper bound.
+LATENCY_HISTOGRAM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class TrackerStats:
+    """
+    Compact response time and success statistics of a single tracker.
+    """
+    __slots__ = ('requests', 'failures', 'timeouts', 'requested_infohashes', 'answered_infohashes',
+                 'total_latency', 'latency_histogram')
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.requested_infohashes = 0
+        self.answered_infohashes = 0
+        self.total_latency = 0.0
+        self.latency_histogram = [0] * (len(LATENCY_HISTOGRAM_BUCKETS) + 1)
+
+    def record(self, latency, is_successful, is_timed_out=False, requested=0, answered=0):
+        self.requests += 1
+        self.failures += 0 if is_successful else 1
+        self.timeouts += 1 if is_timed_out else 0
+        self.requested_infohashes += requested
+        self.answered_infohashes += answered
+        self.total_latency += latency
+        self.latency_histogram[bisect.bisect_left(LATENCY_HISTOGRAM_BUCKETS, latency)] += 1
+
+    @property
+    def mean_latency(self):
+        return self.total_latency / self.requests if self.requests else 0.0
+
+    @property
+    def timeout_rate(self):
+        return self.timeouts / self.requests if self.requests else 0.0
+
+    @property
+    def success_rate(self):
+        return 1 - self.failures / self.requests if self.requests else 0.0
+
+    @property
+    def scrape_yield(self):
+        """
+        The average number of infohashes answered per request.
+        """
+        return self.answered_infohashes / self.requests if self.requests else 0.0
+
+    @property
+    def score(self):
+        """
+        The number of infohashes this tracker is expected to answer per second spent on checking it.
+        Trackers that were never checked get the highest score, so they are tried first.
+        """
+        if not self.requests:
+            return float('inf')
+        return self.success_rate * self.scrape_yield / (1 + self.mean_latency)
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'timeout_rate': self.timeout_rate,
+            'mean_latency': self.mean_latency,
+            'latency_histogram': dict(zip([str(bound) for bound in LATENCY_HISTOGRAM_BUCKETS] + ['inf'],
+                                          self.latency_histogram)),
+            'requested_infohashes': self.requested_infohashes,
+            'answered_infohashes': self.answered_infohashes,
+            'scrape_yield': self.scrape_yield,
+            'score': self.score if self.requests else None,
+        }
 
 
 class TrackerManager:
@@ -18,6 +93,9 @@ class TrackerManager:
         self.state_dir = state_dir
         self.tracker_store = metadata_store.TrackerState
 
+        # Map from the sanitized tracker URL to its TrackerStats
+        self.tracker_stats = {}
+
         self.blacklist = []
         self.load_blacklist()
 
@@ -91,6 +169,8 @@ class TrackerManager:
             for option in options[:]:
                 option.delete()
 
+        self.tracker_stats.pop(sanitized_tracker_url, None)
+
     @db_session
     def update_tracker_info(self, tracker_url, is_successful):
         """
@@ -118,18 +198,43 @@ class TrackerManager:
         tracker.failures = failures
         tracker.alive = is_alive
 
+    def update_tracker_stats(self, session, latency):
+        """
+        Record the response time and the results of a finished tracker session.
+        :param session: The finished TrackerSession.
+        :param latency: The time (in seconds) the session took.
+        """
+        if session.tracker_url == "DHT":
+            return
+
+        sanitized_tracker_url = get_uniformed_tracker_url(session.tracker_url)
+        if sanitized_tracker_url is None:
+            return
+
+        stats = self.tracker_stats.get(sanitized_tracker_url)
+        if stats is None:
+            stats = self.tracker_stats[sanitized_tracker_url] = TrackerStats()
+        stats.record(latency, not session.is_failed, is_timed_out=session.is_timed_out,
+                     requested=len(session.infohash_list or []), answered=session.answered_infohashes)
+
+    def get_tracker_score(self, tracker_url):
+        stats = self.tracker_stats.get(tracker_url)
+        return stats.score if stats else float('inf')
+
     @db_session
     def get_next_tracker_for_auto_check(self):
         """
         Gets the next tracker for automatic tracker-checking.
+        From the least recently checked trackers, the tracker with the best score is selected.
         :return: The next tracker for automatic tracker-checking.
         """
-        tracker = self.tracker_store.select(lambda g: str(g.url)
-                                            and g.alive
-                                            and g.last_check + TRACKER_RETRY_INTERVAL <= int(time.time())
-                                            and str(g.url) not in self.blacklist)\
-            .order_by(self.tracker_store.last_check).limit(1)
+        trackers = self.tracker_store.select(lambda g: str(g.url)
+                                             and g.alive
+                                             and g.last_check + TRACKER_RETRY_INTERVAL <= int(time.time())
+                                             and str(g.url) not in self.blacklist)\
+            .order_by(self.tracker_store.last_check).limit(TRACKER_SELECTION_CANDIDATES)
 
-        if not tracker:
+        if not trackers:
             return None
-        return tracker[0]
+        # max() returns the first of the best scoring trackers, i.e. the least recently checked one
+        return max(trackers, key=lambda tracker: self.get_tracker_score(tracker.url))
@@ -1,3 +1,4 @@
+import time
 from asyncio import Future
 
 from ipv8.requestcache import NumberCache, RandomNumberCache
@@ -17,19 +18,56 @@ class BalanceRequestCache(NumberCache):
 
 class HTTPRequestCache(RandomNumberCache):
 
-    def __init__(self, community, circuit_id):
+    def __init__(self, community, circuit_id, on_data=None):
         super().__init__(community.request_cache, "http-request")
         self.circuit_id = circuit_id
-        self.response = {}
+        # Parts that arrived before one of the parts that precede them
+        self.parts = {}
+        self.next_part = 0
+        # The value of next_part that we last acknowledged to the exit node
+        self.acked_part = 0
+        self.total = None
+        # If set, the parts of the response are passed to this function in order, instead of being joined
+        self.on_data = on_data
+        self.response = []
         self.response_future = Future()
         self.register_future(self.response_future)
 
     def add_response(self, payload):
-        self.response[payload.part] = payload.response
-        if len(self.response) == payload.total:
-            self.response_future.set_result(b''.join([t[1] for t in sorted(self.response.items())]))
+        """
+        Add a part of the response. Parts that carry a total of 0 parts do not change the total.
+        :return: True if the response is complete.
+        """
+        if payload.total:
+            self.total = payload.total
+        if payload.part >= self.next_part:
+            self.parts[payload.part] = payload.response
+        while self.next_part in self.parts:
+            data = self.parts.pop(self.next_part)
+            self.next_part += 1
+            if self.on_data:
+                self.on_data(data)
+            else:
+                self.response.append(data)
+        if self.total is not None and self.next_part >= self.total:
+            self.response_future.set_result(None if self.on_data else b''.join(self.response))
             return True
         return False
 
     def on_timeout(self):
         pass
+
+
+class CircuitPingRequestCache(RandomNumberCache):
+    """
+    This request cache keeps track of a ping over a circuit, to measure the round-trip time and the loss of the circuit.
+    """
+
+    def __init__(self, community, circuit_id):
+        super().__init__(community.request_cache, "ping")
+        self.community = community
+        self.circuit_id = circuit_id
+        self.sent_at = time.time()
+
+    def on_timeout(self):
+        self.community.dispatcher.scheduler.on_ping_lost(self.circuit_id)
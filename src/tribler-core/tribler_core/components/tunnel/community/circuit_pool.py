@@ -0,0 +1,115 @@
+import time
+from asyncio import FIRST_COMPLETED, wait
+from collections import defaultdict, deque
+
+from ipv8.messaging.anonymization.tunnel import CIRCUIT_STATE_EXTENDING
+
+# Period (in seconds) over which we count how often we needed a circuit with a given number of hops and exit flag
+DEMAND_WINDOW = 10 * 60
+# Interval (in seconds) at which the pool is refilled
+REFILL_INTERVAL = 1
+# The number of times that we wait for a circuit to be created, when we need a circuit and none is ready
+MAX_CREATE_ATTEMPTS = 3
+
+
+class CircuitPool:
+    """
+    This class keeps data circuits ready for the numbers of hops and exit flags that we recently needed a circuit for,
+    so that anonymous downloads and HTTP requests do not have to wait for a circuit to be created.
+
+    The demand for circuits with a number of hops and an exit flag is predicted from the number of times that such a
+    circuit was needed during the last DEMAND_WINDOW seconds, for instance the number of anonymous downloads that were
+    started. The pool keeps that many circuits ready or in the making, up to the size of the pool.
+    """
+
+    def __init__(self, tunnels, size):
+        self.tunnels = tunnels
+        self.size = size
+        # The times at which we needed a circuit, per (hops, exit flag) tuple
+        self.demand = defaultdict(deque)
+        # The (hops, exit flag) tuple of the circuits that we are creating, by circuit id
+        self.pending = {}
+
+    def add_demand(self, hops, exit_flag, now=None):
+        """
+        Register that we need a circuit with the given number of hops and exit flag, and refill the pool.
+        """
+        self.demand[(hops, exit_flag)].append(time.time() if now is None else now)
+        self.refill(now)
+
+    def get_target(self, hops, exit_flag, now=None):
+        """
+        Get the number of circuits that we should keep ready for the given number of hops and exit flag.
+        """
+        now = time.time() if now is None else now
+        times = self.demand.get((hops, exit_flag))
+        while times and times[0] + DEMAND_WINDOW <= now:
+            times.popleft()
+        if not times:
+            self.demand.pop((hops, exit_flag), None)
+            return 0
+        return min(len(times), self.size)
+
+    def get_ready_circuits(self, hops, exit_flag):
+        return self.tunnels.find_circuits(hops=hops, exit_flags=[exit_flag])
+
+    def get_pending_circuits(self, hops, exit_flag):
+        # The exit flags of a circuit are only known once it is ready, so we keep track of them while creating it
+        return [self.tunnels.circuits[circuit_id] for circuit_id, key in self.pending.items()
+                if key == (hops, exit_flag) and circuit_id in self.tunnels.circuits
+                and self.tunnels.circuits[circuit_id].state == CIRCUIT_STATE_EXTENDING]
+
+    def create_circuit(self, hops, exit_flag):
+        circuit = self.tunnels.create_circuit(hops, exit_flags=[exit_flag])
+        if circuit:
+            self.pending[circuit.circuit_id] = (hops, exit_flag)
+            circuit.ready.add_done_callback(lambda _, circuit_id=circuit.circuit_id: self.pending.pop(circuit_id, None))
+        return circuit
+
+    def refill(self, now=None):
+        """
+        Create circuits for the numbers of hops and exit flags that have fewer circuits ready or in the making than
+        predicted by the demand.
+        """
+        for hops, exit_flag in list(self.demand):
+            missing = self.get_target(hops, exit_flag, now) - len(self.get_ready_circuits(hops, exit_flag)) \
+                - len(self.get_pending_circuits(hops, exit_flag))
+            for _ in range(missing):
+                if not self.create_circuit(hops, exit_flag):
+                    break
+
+    def take_pending_circuit(self, hops, exit_flag):
+        """
+        Take the circuit that is closest to being ready from the circuits that we are creating for the pool. The pool
+        creates another circuit to replace it when it is refilled.
+        :return: the circuit, or None if we are not creating any circuits with the given number of hops and exit flag.
+        """
+        circuits = self.get_pending_circuits(hops, exit_flag)
+        if not circuits:
+            return None
+        circuit = max(circuits, key=lambda c: len(c.hops))
+        del self.pending[circuit.circuit_id]
+        return circuit
+
+    async def get_circuit(self, hops, exit_flag):
+        """
+        Get a ready circuit with the given number of hops and exit flag. If there is none, we wait for the first one of
+        the circuits that are being created.
+        :return: the circuit, or None if we could not create such a circuit.
+        """
+        self.add_demand(hops, exit_flag)
+        for _ in range(MAX_CREATE_ATTEMPTS):
+            circuits = self.get_ready_circuits(hops, exit_flag)
+            if circuits:
+                return circuits[0]
+
+            pending = self.get_pending_circuits(hops, exit_flag)
+            if not pending:
+                circuit = self.create_circuit(hops, exit_flag)
+                if not circuit:
+                    return None
+                pending = [circuit]
+            await wait([circuit.ready for circuit in pending], return_when=FIRST_COMPLETED)
+
+        circuits = self.get_ready_circuits(hops, exit_flag)
+        return circuits[0] if circuits else None
@@ -0,0 +1,142 @@
+import random
+
+# Weight of a new sample in the moving averages of the round-trip time, ping loss and goodput of a circuit
+RTT_ALPHA = 0.25
+LOSS_ALPHA = 0.25
+GOODPUT_ALPHA = 0.5
+
+# A circuit is degraded if its goodput per destination is below this fraction of the best circuit,
+MIN_RELATIVE_GOODPUT = 0.25
+# if it did not return any data for this many samples while data was sent over it,
+MAX_STALLED_SAMPLES = 2
+# or if it loses more than this fraction of the pings.
+MAX_PING_LOSS = 0.5
+# Number of samples during which a degraded circuit is avoided, if it does not degrade further
+DEGRADED_SAMPLES = 6
+
+
+class CircuitLoad:
+    """
+    The load and the performance of a circuit, as seen by the originator of the circuit.
+    """
+    __slots__ = ('destinations', 'active_destinations', 'rtt', 'loss', 'goodput', 'bytes_up', 'bytes_down',
+                 'stalled', 'degraded')
+
+    def __init__(self):
+        self.destinations = set()
+        self.active_destinations = set()
+        self.rtt = None
+        self.loss = 0.0
+        self.goodput = 0.0
+        self.bytes_up = self.bytes_down = 0
+        self.stalled = 0
+        self.degraded = 0
+
+    @property
+    def goodput_per_destination(self):
+        return self.goodput / max(1, len(self.active_destinations))
+
+
+class CircuitScheduler:
+    """
+    This class assigns destinations to circuits, based on the load and the performance of every circuit.
+
+    New destinations are assigned to the ready circuit with the fewest destinations, preferring circuits with a lower
+    round-trip time, and avoiding degraded circuits. The goodput of every circuit is sampled periodically, and the
+    destinations that were active on a degraded circuit are moved to other circuits. Moving a destination changes the
+    IP address that the peer at that destination sees, so this is only done for circuits that perform far worse than
+    the others.
+    """
+
+    def __init__(self):
+        self.loads = {}
+
+    def get_load(self, circuit_id):
+        load = self.loads.get(circuit_id)
+        if load is None:
+            load = self.loads[circuit_id] = CircuitLoad()
+        return load
+
+    def select(self, circuits):
+        """
+        Select the least loaded circuit from a list of ready circuits.
+        """
+        circuits = list(circuits)
+        random.shuffle(circuits)
+        return min(circuits, key=self.get_sort_key, default=None)
+
+    def get_sort_key(self, circuit):
+        load = self.get_load(circuit.circuit_id)
+        return bool(load.degraded), len(load.destinations), load.rtt if load.rtt is not None else float('inf')
+
+    def assign(self, circuit_id, destination):
+        self.get_load(circuit_id).destinations.add(destination)
+
+    def unassign(self, circuit_id, destination):
+        load = self.loads.get(circuit_id)
+        if load:
+            load.destinations.discard(destination)
+            load.active_destinations.discard(destination)
+
+    def remove(self, circuit_id):
+        self.loads.pop(circuit_id, None)
+
+    def on_data_sent(self, circuit_id, destination):
+        self.get_load(circuit_id).active_destinations.add(destination)
+
+    def on_rtt(self, circuit_id, rtt):
+        # Only track circuits that carry data, and do not bring back the load of a removed circuit
+        load = self.loads.get(circuit_id)
+        if not load:
+            return
+        load.rtt = rtt if load.rtt is None else (1 - RTT_ALPHA) * load.rtt + RTT_ALPHA * rtt
+        load.loss *= 1 - LOSS_ALPHA
+
+    def on_ping_lost(self, circuit_id):
+        load = self.loads.get(circuit_id)
+        if load:
+            load.loss = (1 - LOSS_ALPHA) * load.loss + LOSS_ALPHA
+
+    def sample(self, circuits, interval):
+        """
+        Update the goodput of the given circuits with the bytes they transferred since the previous sample, and
+        determine which of them are degraded.
+        :return: a dictionary of the degraded circuit ids and the destinations that were active on them.
+        """
+        loads = []
+        for circuit in circuits:
+            load = self.get_load(circuit.circuit_id)
+            bytes_up, bytes_down = circuit.bytes_up - load.bytes_up, circuit.bytes_down - load.bytes_down
+            load.bytes_up, load.bytes_down = circuit.bytes_up, circuit.bytes_down
+            load.goodput = (1 - GOODPUT_ALPHA) * load.goodput + GOODPUT_ALPHA * bytes_down / interval
+            load.stalled = load.stalled + 1 if bytes_up and not bytes_down else 0
+            if load.active_destinations:
+                loads.append(load)
+
+        best_goodput = max((load.goodput_per_destination for load in loads), default=0)
+        for load in loads:
+            if (load.stalled >= MAX_STALLED_SAMPLES or load.loss > MAX_PING_LOSS
+                    or load.goodput_per_destination < MIN_RELATIVE_GOODPUT * best_goodput):
+                load.degraded = DEGRADED_SAMPLES
+            elif load.degraded:
+                load.degraded -= 1
+
+        moves = {}
+        healthy = any(not self.loads[circuit.circuit_id].degraded for circuit in circuits)
+        for circuit in circuits:
+            load = self.loads[circuit.circuit_id]
+            if load.active_destinations:
+                if load.degraded and healthy:
+                    moves[circuit.circuit_id] = load.active_destinations
+                load.active_destinations = set()
+            elif load.degraded:
+                load.degraded -= 1
+        return moves
+
+    def get_stats(self):
+        return {circuit_id: {'destinations': len(load.destinations),
+                             'rtt': load.rtt,
+                             'loss': load.loss,
+                             'goodput': load.goodput,
+                             'degraded': bool(load.degraded)}
+                for circuit_id, load in self.loads.items()}
@@ -0,0 +1,98 @@
+import logging
+from asyncio import get_event_loop
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from ipv8.messaging.anonymization.tunnelcrypto import CryptoException
+
+
+def process_cells(jobs):
+    """
+    Run the crypto of a batch of cells, on a worker thread.
+    :return: The encrypted or decrypted messages, with None for the cells that could not be decrypted.
+    """
+    results = []
+    for function, args, _ in jobs:
+        try:
+            results.append(function(*args))
+        except (CryptoException, ValueError):
+            results.append(None)
+    return results
+
+
+class CellCryptoPipeline:
+    """
+    This class encrypts and decrypts the cells of relayed and exit traffic on worker threads, so that the event loop
+    does not spend its time on their crypto.
+
+    The cells that are submitted during an iteration of the event loop are processed as one batch per worker. Every
+    circuit is assigned to the same worker, which has a single thread, so the callbacks of the cells of a circuit are
+    called on the event loop in the order in which the cells were submitted. The session key counters are incremented
+    by the caller on the event loop, the workers only run the AEAD operations, during which libsodium releases the GIL.
+    """
+
+    def __init__(self, crypto, num_workers):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.crypto = crypto
+        self.workers = [ThreadPoolExecutor(1, thread_name_prefix=f'CellCrypto{index}') for index in range(num_workers)]
+        self.pending = [[] for _ in self.workers]
+        self.flush_scheduled = False
+        self.running = True
+        self.stats = Counter()
+
+    def encrypt(self, circuit_id, message, key, salt, salt_explicit, callback):
+        """
+        Encrypt a message with the given session keys, and call the callback with the encrypted message.
+        """
+        self.submit(circuit_id, (self.crypto.encrypt_str, (message, key, salt, salt_explicit), callback))
+
+    def decrypt(self, circuit_id, message, key, salt, callback):
+        """
+        Decrypt a message with the given session keys, and call the callback with the decrypted message, or with None
+        if the message could not be decrypted.
+        """
+        self.submit(circuit_id, (self.crypto.decrypt_str, (message, key, salt), callback))
+
+    def submit(self, circuit_id, job):
+        if not self.running:
+            # The workers are gone, so the job would never complete
+            return
+        self.pending[circuit_id % len(self.workers)].append(job)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            get_event_loop().call_soon(self.flush)
+
+    def flush(self):
+        self.flush_scheduled = False
+        loop = get_event_loop()
+        for index, jobs in enumerate(self.pending):
+            if jobs:
+                self.pending[index] = []
+                self.stats['batches'] += 1
+                self.stats['cells'] += len(jobs)
+                future = loop.run_in_executor(self.workers[index], process_cells, jobs)
+                future.add_done_callback(partial(self.on_cells_processed, jobs))
+
+    def on_cells_processed(self, jobs, future):
+        if future.cancelled() or not self.running:
+            return
+        for (_, _, callback), result in zip(jobs, future.result()):
+            if result is None:
+                self.stats['failed'] += 1
+            try:
+                callback(result)
+            except Exception:  # pylint: disable=broad-except
+                self._logger.exception("Error while handling a processed cell")
+
+    def get_stats(self):
+        return {'workers': len(self.workers),
+                'cells': self.stats['cells'],
+                'batches': self.stats['batches'],
+                'failed': self.stats['failed']}
+
+    def shutdown(self):
+        self.running = False
+        self.pending = [[] for _ in self.workers]
+        for worker in self.workers:
+            worker.shutdown(wait=False)
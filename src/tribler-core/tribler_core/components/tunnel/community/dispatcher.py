@@ -1,4 +1,4 @@
-import random
+from asyncio import get_event_loop
 from collections import defaultdict
 
 from ipv8.messaging.anonymization.tunnel import (
@@ -7,10 +7,15 @@ from ipv8.messaging.anonymization.tunnel import (
     CIRCUIT_TYPE_DATA,
     CIRCUIT_TYPE_RP_DOWNLOADER,
     CIRCUIT_TYPE_RP_SEEDER,
+    PEER_FLAG_EXIT_BT,
 )
 from ipv8.taskmanager import TaskManager, task
 
-from tribler_core.components.socks_servers.socks5.conversion import UdpPacket, socks5_serializer
+from tribler_core.components.socks_servers.socks5.conversion import pack_udp_header
+from tribler_core.components.tunnel.community.circuit_scheduler import CircuitScheduler
+
+# Interval (in seconds) at which the goodput of the circuits is sampled and destinations are moved off degraded circuits
+BALANCE_INTERVAL = 5
 
 
 class TunnelDispatcher(TaskManager):
@@ -30,7 +35,16 @@ class TunnelDispatcher(TaskManager):
         # Map to keep track of the circuit id to UDP connection.
         self.cid_to_con = {}
 
+        # Map from circuit id to the (destination, data) tuples that are sent over that circuit when the queues
+        # are flushed, at the end of this iteration of the event loop.
+        self.send_queues = {}
+        self.flush_scheduled = False
+
+        # Keeps track of the load of the circuits, to decide which circuit a new destination is assigned to.
+        self.scheduler = CircuitScheduler()
+
         self.register_task('check_connections', self.check_connections, interval=30)
+        self.register_task('balance_circuits', self.balance_circuits, interval=BALANCE_INTERVAL)
 
     def set_socks_servers(self, socks_servers):
         self.socks_servers = socks_servers
@@ -48,17 +62,18 @@ class TunnelDispatcher(TaskManager):
             session_hops = circuit.goal_hops if circuit.ctype != CIRCUIT_TYPE_RP_DOWNLOADER else circuit.goal_hops - 1
             if session_hops > len(self.socks_servers) or not self.socks_servers[session_hops - 1].sessions:
                 self._logger.error("No connection found for %d hops", session_hops)
+                self.tunnels.metrics.on_drop(circuit.circuit_id, 'no_connection')
                 return False
             connection = next((s for s in self.socks_servers[session_hops - 1].sessions
                                if s.udp_connection and s.udp_connection.remote_udp_address), None)
 
         if connection is None or connection.udp_connection is None:
             self._logger.error("Connection has closed or has not gotten an UDP associate")
+            self.tunnels.metrics.on_drop(circuit.circuit_id, 'no_connection')
             self.connection_dead(connection)
             return False
 
-        packet = socks5_serializer.pack_serializable(UdpPacket(0, 0, origin, data))
-        connection.udp_connection.send_datagram(packet)
+        connection.udp_connection.send_datagram(pack_udp_header(origin) + data)
         return True
 
     def on_socks5_udp_data(self, udp_connection, request):
@@ -72,29 +87,60 @@ class TunnelDispatcher(TaskManager):
         except KeyError:
             circuit = self.select_circuit(connection, request)
             if circuit is None:
+                self.tunnels.metrics.on_drop(None, 'no_circuit')
                 return False
 
         if circuit.state != CIRCUIT_STATE_READY:
             self._logger.debug("Circuit not ready, dropping %d bytes to %s", len(request.data), request.destination)
+            self.tunnels.metrics.on_drop(circuit.circuit_id, 'circuit_not_ready')
             return False
 
-        self._logger.debug("Sending data over circuit %d destined for %r:%r", circuit.circuit_id, *request.destination)
-        self.tunnels.send_data(circuit.peer, circuit.circuit_id, request.destination, ('0.0.0.0', 0), request.data)
+        self._logger.debug("Queueing data for circuit %d destined for %r:%r", circuit.circuit_id, *request.destination)
+        self.send_queues.setdefault(circuit.circuit_id, []).append((request.destination, request.data))
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            get_event_loop().call_soon(self.flush_send_queues)
         return True
 
+    def flush_send_queues(self):
+        """
+        Send the data that was queued during this iteration of the event loop, circuit by circuit. The data of a
+        circuit is sent in the order in which it was received.
+        """
+        self.flush_scheduled = False
+        send_queues, self.send_queues = self.send_queues, {}
+        send_data = self.tunnels.send_data
+        metrics = self.tunnels.metrics
+        for circuit_id, queue in send_queues.items():
+            circuit = self.tunnels.circuits.get(circuit_id)
+            if not circuit or circuit.state != CIRCUIT_STATE_READY:
+                self._logger.debug("Circuit %d is gone, dropping %d packets", circuit_id, len(queue))
+                metrics.on_drop(None, 'circuit_not_ready', len(queue))
+                continue
+            metrics.on_queue_depth(circuit_id, len(queue))
+            peer = circuit.peer
+            active_destinations = self.scheduler.get_load(circuit_id).active_destinations
+            for destination, data in queue:
+                active_destinations.add(destination)
+                send_data(peer, circuit_id, destination, ('0.0.0.0', 0), data)
+
     @task
     async def on_socks5_tcp_data(self, tcp_connection, destination, request):
         self._logger.debug("Got request for %s: %s", destination, request)
         hops = self.socks_servers.index(tcp_connection.socksserver) + 1
+
+        def on_data(data):
+            # The response is written to the SOCKS5 client while it arrives
+            if not tcp_connection.transport.is_closing():
+                tcp_connection.transport.write(data)
+
         try:
-            response = await self.tunnels.perform_http_request(destination, request, hops)
-            self._logger.debug('Got response from %s: %s', destination, response)
+            await self.tunnels.perform_http_request(destination, request, hops, on_data=on_data)
+            self._logger.debug('Got response from %s', destination)
         except RuntimeError as e:
             self._logger.info('Failed to get HTTP response using tunnels: %s', e)
             return
 
-        if response:
-            tcp_connection.transport.write(response)
         tcp_connection.transport.close()
 
     def select_circuit(self, connection, request):
@@ -105,16 +151,16 @@ class TunnelDispatcher(TaskManager):
                 return circuit
 
         hops = self.socks_servers.index(connection.socksserver) + 1
-        options = [c for c in self.tunnels.circuits.values()
-                   if c.goal_hops == hops and c.state == CIRCUIT_STATE_READY and c.ctype == CIRCUIT_TYPE_DATA
-                   and self.cid_to_con.get(c.circuit_id, connection) == connection]
+        options = self.get_circuit_options(connection, hops)
         if not options:
-            # We allow each connection to claim at least 1 circuit. If no such circuit exists we'll create one.
+            # We allow each connection to claim at least 1 circuit. If no such circuit exists we'll take one that the
+            # circuit pool is creating, or create one.
             if connection in self.cid_to_con.values():
                 self._logger.debug("No circuit for sending data to %s", request.destination)
                 return None
 
-            circuit = self.tunnels.create_circuit(goal_hops=hops)
+            circuit = self.tunnels.circuit_pool.take_pending_circuit(hops, PEER_FLAG_EXIT_BT) \
+                or self.tunnels.create_circuit(goal_hops=hops)
             if circuit is None:
                 self._logger.debug("Failed to create circuit for data to %s", request.destination)
                 return None
@@ -124,17 +170,57 @@ class TunnelDispatcher(TaskManager):
                                             self.on_socks5_udp_data(c, r) if f.result() else None)
             return None
 
-        circuit = random.choice(options)
-        self.cid_to_con[circuit.circuit_id] = connection
-        self.con_to_cir[connection][request.destination] = circuit
+        circuit = self.scheduler.select(options)
+        self.assign_circuit(connection, request.destination, circuit)
         self._logger.debug("Select circuit %d for %s", circuit.circuit_id, request.destination)
         return circuit
 
+    def get_circuit_options(self, connection, hops):
+        """
+        Get the ready data circuits with the given number of hops that are not claimed by another connection.
+        """
+        return [c for c in self.tunnels.circuits.values()
+                if c.goal_hops == hops and c.state == CIRCUIT_STATE_READY and c.ctype == CIRCUIT_TYPE_DATA
+                and self.cid_to_con.get(c.circuit_id, connection) == connection]
+
+    def assign_circuit(self, connection, destination, circuit):
+        self.cid_to_con[circuit.circuit_id] = connection
+        self.con_to_cir[connection][destination] = circuit
+        self.scheduler.assign(circuit.circuit_id, destination)
+
+    def balance_circuits(self):
+        """
+        Sample the goodput of the data circuits, and move the destinations that were active on degraded circuits to
+        the least loaded circuits of their connection.
+        """
+        circuits_per_hops = defaultdict(list)
+        for circuit in self.tunnels.circuits.values():
+            if circuit.state == CIRCUIT_STATE_READY and circuit.ctype == CIRCUIT_TYPE_DATA:
+                circuits_per_hops[circuit.goal_hops].append(circuit)
+
+        for hops, circuits in circuits_per_hops.items():
+            for circuit_id, destinations in self.scheduler.sample(circuits, BALANCE_INTERVAL).items():
+                connection = self.cid_to_con.get(circuit_id)
+                if connection is None:
+                    continue
+                options = [c for c in self.get_circuit_options(connection, hops) if c.circuit_id != circuit_id]
+                if not options:
+                    continue
+                destination_to_circuit = self.con_to_cir.get(connection, {})
+                moved = [d for d in destinations
+                         if getattr(destination_to_circuit.get(d), 'circuit_id', None) == circuit_id]
+                for destination in moved:
+                    self.scheduler.unassign(circuit_id, destination)
+                    self.assign_circuit(connection, destination, self.scheduler.select(options))
+                self._logger.info("Moved %d destinations off degraded circuit %d", len(moved), circuit_id)
+
     def circuit_dead(self, broken_circuit):
         """
         When a circuit dies, we update the destinations dictionary and remove all peers that are affected.
         """
         con = self.cid_to_con.pop(broken_circuit.circuit_id, None)
+        self.send_queues.pop(broken_circuit.circuit_id, None)
+        self.scheduler.remove(broken_circuit.circuit_id)
 
         destinations = set()
         destination_to_circuit = self.con_to_cir.get(con, {})
@@ -147,7 +233,8 @@ class TunnelDispatcher(TaskManager):
         return destinations
 
     def connection_dead(self, connection):
-        self.con_to_cir.pop(connection, None)
+        for destination, circuit in self.con_to_cir.pop(connection, {}).items():
+            self.scheduler.unassign(circuit.circuit_id, destination)
         for cid, con in list(self.cid_to_con.items()):
             if con == connection:
                 self.cid_to_con.pop(cid, None)
@@ -0,0 +1,295 @@
+import logging
+import time
+from asyncio import Event, TimeoutError as AsyncTimeoutError, open_connection, wait_for
+from collections import OrderedDict
+
+from tribler_core.utilities.bencodecheck import BencodeStreamChecker
+
+# Number of idle keep-alive connections that are kept per host, and in total
+MAX_IDLE_CONNECTIONS_PER_HOST = 2
+MAX_IDLE_CONNECTIONS = 32
+# Idle connections are closed after this number of seconds
+IDLE_TIMEOUT = 30
+
+# Maximum size of the headers and of the body of a response
+MAX_HEADER_SIZE = 64 * 1024
+MAX_BODY_SIZE = 1024 ** 2
+# Number of bytes that are read from the upstream connection at once. The next read waits until the previous data has
+# been sent, so this also bounds the number of bytes that the exit buffers per response.
+READ_SIZE = 64 * 1024
+
+# Number of parts that the exit sends ahead of the last part acknowledged by the downloader
+HTTP_WINDOW_SIZE = 32
+# The downloader acknowledges the parts it received after every this many parts
+HTTP_ACK_INTERVAL = 8
+# Number of seconds that the exit waits for an acknowledgement, before it assumes that the acknowledgement got lost
+HTTP_ACK_TIMEOUT = 1
+
+
+class HTTPResponseNotAllowed(Exception):
+    pass
+
+
+def is_single_request(request):
+    """
+    Check whether the request consists of exactly one HTTP request, followed by a body of its Content-Length, if any.
+    Any other bytes could be a second request, whose response would be read by the next user of the connection.
+    """
+    header_end = request.find(b'\r\n\r\n')
+    if header_end == -1:
+        return False
+    header = request[:header_end]
+    if header.count(b'\n') != header.count(b'\r\n'):
+        # Some servers also accept lines that end with a bare newline
+        return False
+
+    content_lengths = []
+    for line in header.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        if name == b'transfer-encoding':
+            return False
+        if name == b'content-length':
+            content_lengths.append(value.strip())
+    if len(content_lengths) > 1:
+        return False
+    try:
+        content_length = int(content_lengths[0]) if content_lengths else 0
+    except ValueError:
+        return False
+    return content_length >= 0 and len(request) == header_end + 4 + content_length
+
+
+class HTTPResponseStream:
+    """
+    This class reads an HTTP response from the upstream connection, checks it, and forwards it in cells.
+
+    Exit nodes only forward bencoded responses and redirects. The body is checked while it arrives, and only the part
+    that has been checked is forwarded. All parts but the last carry a total of 0 parts. The last part carries the
+    total, and is only sent once the complete body turned out to be bencoded, so that a downloader never completes a
+    response that is not allowed.
+
+    The exit sends at most HTTP_WINDOW_SIZE parts ahead of the last part acknowledged by the downloader, and does not
+    read from the upstream connection while it waits for the window to open. Older downloaders do not acknowledge
+    parts, so if the first window is not acknowledged in time, the rest of the response is sent without flow control.
+    """
+
+    def __init__(self, send_cell, cell_size):
+        """
+        :param send_cell: the function that sends a part of the response, called with the part number, the total
+                          number of parts (or 0 if the part is not the last one) and the data of the part.
+        :param cell_size: the maximum number of bytes of the response that is sent per cell.
+        """
+        self.send_cell = send_cell
+        self.cell_size = cell_size
+        self.header = b''
+        # The checked bytes of the response that have not been sent yet
+        self.pending = bytearray()
+        self.part = 0
+        # The number of parts that the downloader acknowledged, or None if it does not acknowledge parts
+        self.acked = 0
+        self.ack_received = False
+        self.ack_event = Event()
+        self.received = 0
+        self.status = None
+        self.content_length = None
+        self.keep_alive = False
+        self.body_received = 0
+        self.checker = None
+
+    @property
+    def complete(self):
+        return self.content_length is not None and self.body_received >= self.content_length
+
+    async def read_from(self, reader):
+        """
+        Read the response from the reader, and forward it.
+        :return: whether the connection can be used for another request.
+        """
+        while not self.complete:
+            await self.send_cells()
+            data = await reader.read(READ_SIZE)
+            if not data:
+                if not self.received:
+                    raise ConnectionResetError('Connection closed before the response')
+                if self.status is None or self.content_length is not None:
+                    raise HTTPResponseNotAllowed('Response is truncated')
+                break
+            self.received += len(data)
+            self.feed(data)
+        await self.finish()
+        return self.keep_alive and self.body_received == self.content_length
+
+    def feed(self, data):
+        if self.status is None:
+            self.header += data
+            header_end = self.header.find(b'\r\n\r\n')
+            if header_end == -1:
+                if len(self.header) > MAX_HEADER_SIZE:
+                    raise HTTPResponseNotAllowed('Header is too large')
+                return
+            header, data = self.header[:header_end + 4], self.header[header_end + 4:]
+            self.header = b''
+            self.parse_header(header)
+            self.pending += header
+
+        self.body_received += len(data)
+        if self.body_received > MAX_BODY_SIZE:
+            raise HTTPResponseNotAllowed('Body is too large')
+        if self.content_length is not None and self.body_received > self.content_length:
+            # The response is followed by other data, so the connection cannot be reused
+            self.keep_alive = False
+            data = data[:len(data) - (self.body_received - self.content_length)]
+            self.body_received = self.content_length
+        if self.checker and not self.checker.feed(data):
+            raise HTTPResponseNotAllowed('Body is not bencoded')
+        self.pending += data
+
+    def parse_header(self, header):
+        lines = header.split(b'\r\n')
+        try:
+            version, status = lines[0].split(b' ', 2)[:2]
+            self.status = int(status)
+            fields = {}
+            for line in lines[1:]:
+                if line:
+                    name, _, value = line.partition(b':')
+                    fields[name.strip().lower()] = value.strip().lower()
+            if b'content-length' in fields:
+                self.content_length = int(fields[b'content-length'])
+        except ValueError as e:
+            raise HTTPResponseNotAllowed('Invalid response header') from e
+
+        if self.status in (204, 304) or 100 <= self.status < 200:
+            self.content_length = 0
+        if b'transfer-encoding' in fields:
+            raise HTTPResponseNotAllowed('Body is not bencoded')
+        self.keep_alive = version == b'HTTP/1.1' and fields.get(b'connection') != b'close' \
+            and self.content_length is not None
+        # Redirects are forwarded without checking their body
+        if self.status != 307:
+            self.checker = BencodeStreamChecker()
+
+    async def finish(self):
+        if self.checker and not self.checker.is_bencoded():
+            raise HTTPResponseNotAllowed('Body is not bencoded')
+        await self.send_cells(final=True)
+
+    async def send_cells(self, final=False):
+        """
+        Send the pending bytes in cells. Unless this is the final call, the last (partial) cell is kept, so that the
+        last part, which carries the total, can be sent after the body is checked.
+        """
+        while len(self.pending) > self.cell_size or final and self.pending:
+            await self.wait_for_window()
+            data = bytes(self.pending[:self.cell_size])
+            del self.pending[:self.cell_size]
+            self.send_cell(self.part, self.part + 1 if final and not self.pending else 0, data)
+            self.part += 1
+
+    async def wait_for_window(self):
+        while self.acked is not None and self.part - self.acked >= HTTP_WINDOW_SIZE:
+            self.ack_event.clear()
+            try:
+                await wait_for(self.ack_event.wait(), HTTP_ACK_TIMEOUT)
+            except AsyncTimeoutError:
+                # Acknowledgements can get lost, so we send another window instead of stalling the response
+                self.acked = self.part if self.ack_received else None
+
+    def on_ack(self, next_part):
+        """
+        Process an acknowledgement of the downloader, which has received all parts before next_part.
+        """
+        self.ack_received = True
+        self.acked = max(self.acked or 0, next_part)
+        self.ack_event.set()
+
+
+class HTTPConnectionPool:
+    """
+    This class keeps the upstream connections of the HTTP requests that an exit node performs for other peers open,
+    so that the next request to the same host does not have to set up a new TCP connection. The pool is bounded
+    per host and in total, and the connections that were idle for the longest time are closed first.
+
+    Only connections that carried a single request, of which the response was read completely, are kept open. Other
+    requests, such as pipelined requests, get a connection of their own that is closed after the response.
+    """
+
+    def __init__(self):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        # Maps (host, port, connection number) to (reader, writer, time of release), in order of release
+        self.idle = OrderedDict()
+        self.counter = 0
+
+    async def acquire(self, target):
+        """
+        Get an idle connection to the target, or open a new one.
+        :return: a tuple of the reader, the writer, and whether the connection was idle in the pool.
+        """
+        self.remove_expired()
+        for key in reversed(self.idle):
+            if key[:2] == tuple(target):
+                reader, writer, _ = self.idle.pop(key)
+                if not reader.at_eof():
+                    return reader, writer, True
+                writer.close()
+        reader, writer = await open_connection(*target)
+        return reader, writer, False
+
+    def release(self, target, reader, writer):
+        """
+        Return a connection to the pool, after its response has been read completely.
+        """
+        self.counter += 1
+        self.idle[(*target, self.counter)] = (reader, writer, time.time())
+        keys = [key for key in self.idle if key[:2] == tuple(target)]
+        for key in keys[:-MAX_IDLE_CONNECTIONS_PER_HOST]:
+            self.close_connection(key)
+        while len(self.idle) > MAX_IDLE_CONNECTIONS:
+            self.close_connection(next(iter(self.idle)))
+
+    def remove_expired(self):
+        expired = time.time() - IDLE_TIMEOUT
+        for key in [key for key, (_, _, released) in self.idle.items() if released < expired]:
+            self.close_connection(key)
+
+    def close_connection(self, key):
+        _, writer, _ = self.idle.pop(key)
+        writer.close()
+
+    async def request(self, target, request, stream):
+        """
+        Send a request to the target, over an idle connection if possible, and read the response into the stream.
+        If an idle connection turns out to be closed by the host, the request is sent over a new connection.
+        """
+        reusable = is_single_request(request)
+        while True:
+            if reusable:
+                reader, writer, reused = await self.acquire(target)
+            else:
+                (reader, writer), reused = await open_connection(*target), False
+            try:
+                writer.write(request)
+                keep_alive = await stream.read_from(reader)
+            except ConnectionResetError:
+                writer.close()
+                if reused and not stream.received:
+                    self._logger.debug("Idle connection to %s was closed, retrying", target)
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+
+            if keep_alive and reusable:
+                self.release(target, reader, writer)
+            else:
+                writer.close()
+            return
+
+    def get_num_idle(self, target=None):
+        return sum(1 for key in self.idle if target is None or key[:2] == tuple(target))
+
+    def close(self):
+        for key in list(self.idle):
+            self.close_connection(key)
@@ -0,0 +1,232 @@
+from collections import Counter, deque
+from time import perf_counter_ns, time
+
+# Number of samples that the histograms keep, the oldest sample is overwritten by a new one
+HISTOGRAM_SIZE = 1024
+# Only one in this many cells is timed, to keep the overhead of timing low
+TIMING_INTERVAL = 8
+# Interval (in seconds) at which the byte counters of the circuits are sampled
+SAMPLE_INTERVAL = 1
+# Number of samples over which the throughput of a circuit is computed
+THROUGHPUT_WINDOW = 10
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Histogram:
+    """
+    A fixed-size ring buffer of the most recent samples (in nanoseconds) of a duration, from which the quantiles are
+    computed when they are requested. The number and the sum of all samples are kept as well.
+
+    Samples are added without a lock. If they are added from multiple threads, such as the workers of the
+    CellCryptoPipeline, a sample is occasionally lost, which does not matter for these statistics.
+    """
+
+    def __init__(self, size=HISTOGRAM_SIZE):
+        self.samples = [0] * size
+        self.count = 0
+        self.total = 0
+
+    def add(self, value):
+        self.samples[self.count % len(self.samples)] = value
+        self.count += 1
+        self.total += value
+
+    def get_window(self):
+        samples = list(self.samples)
+        return sorted(samples[:self.count] if self.count < len(samples) else samples)
+
+    def get_stats(self):
+        """
+        Get the number and the mean of all samples, and the quantiles and the maximum of the samples in the buffer,
+        in seconds.
+        """
+        window = self.get_window()
+        stats = {'count': self.count,
+                 'mean': self.total / self.count / 1e9 if self.count else 0.0,
+                 'max': window[-1] / 1e9 if window else 0.0}
+        for quantile in QUANTILES:
+            stats[f'p{int(quantile * 100)}'] = window[int(quantile * (len(window) - 1))] / 1e9 if window else 0.0
+        return stats
+
+
+class TimedTunnelCrypto:
+    """
+    A wrapper around the crypto of the tunnel community, which adds the duration of one in TIMING_INTERVAL
+    encryptions and decryptions of cells to a histogram. All other attributes are those of the wrapped crypto.
+    """
+
+    def __init__(self, crypto, histogram):
+        self.crypto = crypto
+        self.histogram = histogram
+        self.calls = 0
+
+    def __getattr__(self, name):
+        return getattr(self.crypto, name)
+
+    def encrypt_str(self, content, key, salt, salt_explicit):
+        self.calls += 1
+        if self.calls % TIMING_INTERVAL:
+            return self.crypto.encrypt_str(content, key, salt, salt_explicit)
+        start_time = perf_counter_ns()
+        try:
+            return self.crypto.encrypt_str(content, key, salt, salt_explicit)
+        finally:
+            self.histogram.add(perf_counter_ns() - start_time)
+
+    def decrypt_str(self, content, key, salt):
+        self.calls += 1
+        if self.calls % TIMING_INTERVAL:
+            return self.crypto.decrypt_str(content, key, salt)
+        start_time = perf_counter_ns()
+        try:
+            return self.crypto.decrypt_str(content, key, salt)
+        finally:
+            self.histogram.add(perf_counter_ns() - start_time)
+
+
+class CircuitMetrics:
+    """
+    The metrics of a circuit, relay or exit socket.
+    """
+    __slots__ = ('circuit_type', 'samples', 'rtt', 'queue_depth', 'max_queue_depth', 'dropped')
+
+    def __init__(self, circuit_type=None):
+        self.circuit_type = circuit_type
+        # The (time, bytes_up, bytes_down) of the most recent samples
+        self.samples = deque(maxlen=THROUGHPUT_WINDOW + 1)
+        self.rtt = None
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.dropped = 0
+
+    def get_throughput(self):
+        """
+        Get the upload and download rate (in bytes per second) over the samples in the window.
+        """
+        if len(self.samples) < 2:
+            return 0.0, 0.0
+        (first_time, first_up, first_down), (last_time, last_up, last_down) = self.samples[0], self.samples[-1]
+        duration = max(last_time - first_time, 1e-9)
+        return (last_up - first_up) / duration, (last_down - first_down) / duration
+
+
+class TunnelMetrics:
+    """
+    This class collects the performance metrics of the tunnel community: the throughput, round-trip time, queue depth
+    and dropped cells of every circuit, histograms of the time that is spent on handling cells and on their crypto, and
+    a histogram of the time that it takes to create a circuit.
+
+    Everything is kept in fixed-size buffers, so that the metrics can always be collected. They are only aggregated when
+    they are requested.
+    """
+
+    def __init__(self):
+        # The number of incoming cells, of which one in TIMING_INTERVAL is timed
+        self.cells = 0
+        self.circuits = {}
+        self.drops = Counter()
+        self.cell_handling = Histogram()
+        self.crypto = Histogram()
+        self.rtt = Histogram()
+        self.circuit_ready = Histogram()
+
+    def get_circuit(self, circuit_id):
+        metrics = self.circuits.get(circuit_id)
+        if metrics is None:
+            metrics = self.circuits[circuit_id] = CircuitMetrics()
+        return metrics
+
+    def sample(self, tunnel_objects, now=None):
+        """
+        Sample the byte counters of the given circuits, relays and exit sockets, and forget the metrics of the ones
+        that no longer exist.
+        :param tunnel_objects: a dictionary of circuit ids and (type, tunnel object) tuples.
+        """
+        now = time() if now is None else now
+        circuits = {}
+        for circuit_id, (circuit_type, tunnel_object) in tunnel_objects.items():
+            metrics = circuits[circuit_id] = self.get_circuit(circuit_id)
+            metrics.circuit_type = circuit_type
+            metrics.samples.append((now, tunnel_object.bytes_up, tunnel_object.bytes_down))
+            metrics.queue_depth, metrics.max_queue_depth = metrics.max_queue_depth, 0
+        self.circuits = circuits
+
+    def on_rtt(self, circuit_id, rtt):
+        self.get_circuit(circuit_id).rtt = rtt
+        self.rtt.add(int(rtt * 1e9))
+
+    def on_circuit_ready(self, latency):
+        self.circuit_ready.add(int(latency * 1e9))
+
+    def on_queue_depth(self, circuit_id, depth):
+        metrics = self.get_circuit(circuit_id)
+        metrics.max_queue_depth = max(metrics.max_queue_depth, depth)
+
+    def on_drop(self, circuit_id, reason, count=1):
+        self.drops[reason] += count
+        if circuit_id is not None:
+            self.get_circuit(circuit_id).dropped += count
+
+    def get_circuit_stats(self):
+        stats = []
+        for circuit_id, metrics in self.circuits.items():
+            if metrics.circuit_type is None:
+                continue
+            upload_rate, download_rate = metrics.get_throughput()
+            stats.append({'circuit_id': circuit_id,
+                          'type': metrics.circuit_type,
+                          'upload_rate': upload_rate,
+                          'download_rate': download_rate,
+                          'rtt': metrics.rtt,
+                          'queue_depth': metrics.queue_depth,
+                          'dropped': metrics.dropped})
+        return stats
+
+    def get_stats(self):
+        return {'circuits': self.get_circuit_stats(),
+                'drops': dict(self.drops),
+                'cell_handling': self.cell_handling.get_stats(),
+                'crypto': self.crypto.get_stats(),
+                'rtt': self.rtt.get_stats(),
+                'circuit_ready': self.circuit_ready.get_stats()}
+
+    def to_prometheus(self):
+        """
+        Export the metrics in the Prometheus text format.
+        """
+        lines = []
+
+        def add_metric(name, metric_type, description, samples):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for suffix, labels, value in samples:
+                label_str = ','.join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f'{name}{suffix}{{{label_str}}} {value}' if label_str else f'{name}{suffix} {value}')
+
+        def add_summary(name, description, histogram):
+            stats = histogram.get_stats()
+            samples = [('', {'quantile': str(quantile)}, stats[f'p{int(quantile * 100)}']) for quantile in QUANTILES]
+            samples += [('_sum', {}, histogram.total / 1e9), ('_count', {}, histogram.count)]
+            add_metric(name, 'summary', description, samples)
+
+        add_summary('tribler_tunnel_cell_handling_seconds', 'Time spent on handling an incoming cell.',
+                    self.cell_handling)
+        add_summary('tribler_tunnel_crypto_seconds', 'Time spent on encrypting or decrypting a cell.', self.crypto)
+        add_summary('tribler_tunnel_rtt_seconds', 'Round-trip time of the pings over our circuits.', self.rtt)
+        add_summary('tribler_tunnel_circuit_ready_seconds', 'Time between creating a circuit and it being ready.',
+                    self.circuit_ready)
+        add_metric('tribler_tunnel_dropped_cells_total', 'counter', 'Number of cells that were dropped.',
+                   [('', {'reason': reason}, count) for reason, count in sorted(self.drops.items())])
+
+        circuits = self.get_circuit_stats()
+        for name, key, metric_type, description in (
+                ('upload_bytes_per_second', 'upload_rate', 'gauge', 'Rolling upload rate of the circuit.'),
+                ('download_bytes_per_second', 'download_rate', 'gauge', 'Rolling download rate of the circuit.'),
+                ('rtt_seconds', 'rtt', 'gauge', 'Latest round-trip time of the pings over the circuit.'),
+                ('queue_depth', 'queue_depth', 'gauge', 'Largest send queue of the circuit in the last sample.'),
+                ('dropped_cells_total', 'dropped', 'counter', 'Number of cells of the circuit that were dropped.')):
+            add_metric(f'tribler_tunnel_circuit_{name}', metric_type, description,
+                       [('', {'circuit_id': circuit['circuit_id'], 'type': circuit['type']}, circuit[key])
+                        for circuit in circuits if circuit[key] is not None])
+        return '\n'.join(lines) + '\n'
@@ -74,3 +74,10 @@ class HTTPResponsePayload(VariablePayload):
     msg_id = 29
     format_list = ['I', 'I', 'H', 'H', 'varlenH']
     names = ['circuit_id', 'identifier', 'part', 'total', 'response']
+
+
+@vp_compile
+class HTTPResponseAckPayload(VariablePayload):
+    msg_id = 35
+    format_list = ['I', 'I', 'H']
+    names = ['circuit_id', 'identifier', 'next_part']
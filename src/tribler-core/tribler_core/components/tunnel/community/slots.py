@@ -0,0 +1,128 @@
+class RandomSlots:
+    """
+    The slots that are given to the first circuits that ask for one, regardless of their token balance.
+    """
+
+    def __init__(self, num_slots):
+        self.num_slots = num_slots
+        self.circuit_ids = set()
+
+    def __contains__(self, circuit_id):
+        return circuit_id in self.circuit_ids
+
+    def take(self, circuit_id):
+        """
+        Give a free slot to a circuit.
+        :return: True if the circuit got a slot, False if all slots are taken.
+        """
+        if len(self.circuit_ids) >= self.num_slots:
+            return False
+        self.circuit_ids.add(circuit_id)
+        return True
+
+    def release(self, circuit_id):
+        self.circuit_ids.discard(circuit_id)
+
+    def get_slots(self):
+        """
+        Get the circuit id in every slot, with None for the free slots.
+        """
+        return list(self.circuit_ids) + [None] * (self.num_slots - len(self.circuit_ids))
+
+
+class CompetingSlots:
+    """
+    The slots that circuits compete for with the token balance of their initiator. When all slots are taken, a circuit
+    takes the slot of the circuit with the lowest balance, if its own balance is higher.
+
+    The taken slots are kept in a binary min-heap of [balance, circuit_id] entries, and an index from circuit id to
+    the position of its entry in the heap, so that taking and releasing a slot takes O(log n) time.
+    """
+
+    def __init__(self, num_slots):
+        self.num_slots = num_slots
+        self.heap = []
+        self.positions = {}
+
+    def __contains__(self, circuit_id):
+        return circuit_id in self.positions
+
+    def __len__(self):
+        return len(self.heap)
+
+    def get_lowest_balance(self):
+        return self.heap[0][0] if self.heap else None
+
+    def take(self, circuit_id, balance):
+        """
+        Give a slot to a circuit, if there is a free slot or if the balance is higher than the lowest balance.
+        :return: a tuple of whether the circuit got a slot, and the id of the circuit that lost its slot (or None).
+        """
+        if circuit_id in self.positions:
+            return True, None
+
+        if len(self.heap) < self.num_slots:
+            self.positions[circuit_id] = len(self.heap)
+            self.heap.append([balance, circuit_id])
+            self.sift_up(len(self.heap) - 1)
+            return True, None
+
+        if not self.heap or balance <= self.heap[0][0]:
+            return False, None
+
+        # Replace the entry with the lowest balance
+        kicked_circuit_id = self.heap[0][1]
+        del self.positions[kicked_circuit_id]
+        self.heap[0] = [balance, circuit_id]
+        self.positions[circuit_id] = 0
+        self.sift_down(0)
+        return True, kicked_circuit_id
+
+    def release(self, circuit_id):
+        position = self.positions.pop(circuit_id, None)
+        if position is None:
+            return
+        last = self.heap.pop()
+        if position < len(self.heap):
+            self.heap[position] = last
+            self.positions[last[1]] = position
+            self.sift_down(position)
+            self.sift_up(position)
+
+    def sift_up(self, position):
+        heap, positions = self.heap, self.positions
+        entry = heap[position]
+        while position > 0:
+            parent = (position - 1) >> 1
+            if heap[parent][0] <= entry[0]:
+                break
+            heap[position] = heap[parent]
+            positions[heap[position][1]] = position
+            position = parent
+        heap[position] = entry
+        positions[entry[1]] = position
+
+    def sift_down(self, position):
+        heap, positions = self.heap, self.positions
+        entry = heap[position]
+        size = len(heap)
+        while True:
+            child = 2 * position + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1][0] < heap[child][0]:
+                child += 1
+            if entry[0] <= heap[child][0]:
+                break
+            heap[position] = heap[child]
+            positions[heap[position][1]] = position
+            position = child
+        heap[position] = entry
+        positions[entry[1]] = position
+
+    def get_slots(self):
+        """
+        Get the (balance, circuit id) tuple of every slot, with (0, None) for the free slots.
+        """
+        return [(balance, circuit_id) for balance, circuit_id in self.heap] \
+            + [(0, None)] * (self.num_slots - len(self.heap))
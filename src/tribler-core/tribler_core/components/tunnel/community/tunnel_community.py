@@ -1,11 +1,11 @@
 import hashlib
-import math
-import sys
 import time
-from asyncio import Future, TimeoutError as AsyncTimeoutError, open_connection
+from asyncio import Future, TimeoutError as AsyncTimeoutError, get_event_loop
 from binascii import unhexlify
-from collections import Counter
+from collections import Counter, defaultdict, deque
 from distutils.version import LooseVersion
+from functools import partial
+from struct import pack
 from typing import List
 
 import async_timeout
@@ -13,15 +13,24 @@ import async_timeout
 from ipv8.messaging.anonymization.caches import CreateRequestCache
 from ipv8.messaging.anonymization.community import unpack_cell
 from ipv8.messaging.anonymization.hidden_services import HiddenTunnelCommunity
-from ipv8.messaging.anonymization.payload import EstablishIntroPayload, NO_CRYPTO_PACKETS
+from ipv8.messaging.anonymization.payload import (
+    CellPayload,
+    EstablishIntroPayload,
+    NO_CRYPTO_PACKETS,
+    PingPayload,
+    PongPayload,
+)
 from ipv8.messaging.anonymization.tunnel import (
     CIRCUIT_STATE_CLOSING,
+    CIRCUIT_STATE_EXTENDING,
     CIRCUIT_STATE_READY,
     CIRCUIT_TYPE_DATA,
     CIRCUIT_TYPE_IP_SEEDER,
     CIRCUIT_TYPE_RP_DOWNLOADER,
     CIRCUIT_TYPE_RP_SEEDER,
     EXIT_NODE,
+    EXIT_NODE_SALT,
+    ORIGINATOR,
     PEER_FLAG_EXIT_BT,
     PEER_FLAG_EXIT_IPV8,
     RelayRoute,
@@ -36,19 +45,38 @@ from tribler_common.simpledefs import DLSTATUS_DOWNLOADING, DLSTATUS_METADATA, D
 
 from tribler_core.components.bandwidth_accounting.db.transaction import BandwidthTransactionData
 from tribler_core.components.socks_servers.socks5.server import Socks5Server
-from tribler_core.components.tunnel.community.caches import BalanceRequestCache, HTTPRequestCache
+from tribler_core.components.tunnel.community.caches import (
+    BalanceRequestCache,
+    CircuitPingRequestCache,
+    HTTPRequestCache,
+)
+from tribler_core.components.tunnel.community.circuit_pool import CircuitPool, REFILL_INTERVAL
+from tribler_core.components.tunnel.community.crypto_pipeline import CellCryptoPipeline
 from tribler_core.components.tunnel.community.discovery import GoldenRatioStrategy
 from tribler_core.components.tunnel.community.dispatcher import TunnelDispatcher
+from tribler_core.components.tunnel.community.http_proxy import (
+    HTTPConnectionPool,
+    HTTP_ACK_INTERVAL,
+    HTTPResponseNotAllowed,
+    HTTPResponseStream,
+)
+from tribler_core.components.tunnel.community.metrics import (
+    SAMPLE_INTERVAL,
+    TIMING_INTERVAL,
+    TimedTunnelCrypto,
+    TunnelMetrics,
+)
 from tribler_core.components.tunnel.community.payload import (
     BalanceRequestPayload,
     BalanceResponsePayload,
     BandwidthTransactionPayload,
     HTTPRequestPayload,
+    HTTPResponseAckPayload,
     HTTPResponsePayload,
     RelayBalanceRequestPayload,
     RelayBalanceResponsePayload,
 )
-from tribler_core.utilities.bencodecheck import is_bencoded
+from tribler_core.components.tunnel.community.slots import CompetingSlots, RandomSlots
 from tribler_core.utilities.unicode import hexlify
 
 DESTROY_REASON_BALANCE = 65535
@@ -57,6 +85,15 @@ PEER_FLAG_EXIT_HTTP = 32768
 
 MAX_HTTP_PACKET_SIZE = 1400
 
+# The maximum number of HTTP requests that an exit node handles at the same time for a single circuit
+MAX_HTTP_REQUESTS_PER_CIRCUIT = 5
+
+# The states of the anonymous downloads that we need circuits and a hidden swarm for
+ACTIVE_DOWNLOAD_STATES = [DLSTATUS_DOWNLOADING, DLSTATUS_SEEDING, DLSTATUS_METADATA]
+
+# The minimum time between two checks whether an active download without peers should announce itself to the DHT
+ANNOUNCE_CHECK_INTERVAL = 60
+
 
 class TriblerTunnelCommunity(HiddenTunnelCommunity):
     """
@@ -84,12 +121,35 @@ class TriblerTunnelCommunity(HiddenTunnelCommunity):
             self.settings.peer_flags.add(PEER_FLAG_EXIT_HTTP)
 
         self.bittorrent_peers = {}
+        # Collects the throughput, round-trip times and drops of the circuits, and the time spent on cells
+        self.metrics = TunnelMetrics()
+        self.crypto = TimedTunnelCrypto(self.crypto, self.metrics.crypto)
         self.dispatcher = TunnelDispatcher(self)
+        # Keeps circuits ready for the numbers of hops and exit flags that we recently needed a circuit for
+        self.circuit_pool = CircuitPool(self, self.config.circuit_pool_size)
+        # The status, hop count and Download of the anonymous downloads, by the infohash used for looking up
+        # introduction points. These are updated by the state changes that the download manager publishes.
         self.download_states = {}
-        self.competing_slots = [(0, None)] * num_competing_slots  # 1st tuple item = token balance, 2nd = circuit id
-        self.random_slots = [None] * num_random_slots
+        self.download_hops = {}
+        self.anonymous_downloads = {}
+        self.active_downloads_per_hop = Counter()
+        self.seeding_downloads = set()
+        self.competing_slots = CompetingSlots(num_competing_slots)
+        self.random_slots = RandomSlots(num_random_slots)
+        # The number of HTTP requests that we are handling as an exit node, per circuit id
+        self.http_requests = Counter()
+        # The responses that we are forwarding as an exit node, by circuit id and request identifier
+        self.http_streams = {}
         self.reject_callback = None  # This callback is invoked with a tuple (time, balance) when we reject a circuit
-        self.last_forced_announce = {}
+        # The last time that we checked whether an active download should announce itself to the DHT, and the
+        # queues of (time, lookup info hash) tuples of these checks per hop count, in the order in which they are due
+        self.last_announce_check = {}
+        self.announce_checks = defaultdict(deque)
+        # Keeps the upstream connections of the HTTP requests that we exit open for the next request
+        self.http_pool = HTTPConnectionPool()
+        # Runs the crypto of relayed and exit cells on worker threads, if enabled
+        self.crypto_pipeline = CellCryptoPipeline(self.crypto, self.config.crypto_workers) \
+            if self.config.crypto_workers > 0 else None
 
         if self.socks_servers:
             self.dispatcher.set_socks_servers(self.socks_servers)
@@ -104,24 +164,19 @@ class TriblerTunnelCommunity(HiddenTunnelCommunity):
         self.add_cell_handler(RelayBalanceResponsePayload, self.on_relay_balance_response_cell)
         self.add_cell_handler(HTTPRequestPayload, self.on_http_request)
         self.add_cell_handler(HTTPResponsePayload, self.on_http_response)
+        self.add_cell_handler(HTTPResponseAckPayload, self.on_http_response_ack)
 
         NO_CRYPTO_PACKETS.extend([BalanceRequestPayload.msg_id, BalanceResponsePayload.msg_id])
 
         if self.exitnode_cache is not None:
             self.restore_exitnodes_from_disk()
         if self.dlmgr is not None:
-            downloads_polling_interval = 1.0
-            self.register_task('Poll download manager for new or changed downloads',
-                               self._poll_download_manager,
-                               interval=downloads_polling_interval)
-
-    async def _poll_download_manager(self):
-        # This must run in all circumstances, so catch all exceptions
-        try:
-            dl_states = self.dlmgr.get_last_download_states()
-            self.monitor_downloads(dl_states)
-        except Exception as e:  # pylint: disable=broad-except
-            self.logger.error("Error on polling Download Manager: %s", e)
+            self.dlmgr.add_download_state_listener(self.on_download_state)
+            for download in self.dlmgr.get_downloads():
+                self.on_download_state(download, download.get_state().get_status())
+            self.register_task('maintain_downloads', self.maintain_downloads, interval=1.0)
+        self.register_task('sample_metrics', self.sample_metrics, interval=SAMPLE_INTERVAL)
+        self.register_task('refill_circuit_pool', self.circuit_pool.refill, interval=REFILL_INTERVAL)
 
     def get_available_strategies(self):
         return super().get_available_strategies().update({'GoldenRatioStrategy': GoldenRatioStrategy})
@@ -165,29 +220,16 @@ class TriblerTunnelCommunity(HiddenTunnelCommunity):
 
         cache = self.request_cache.pop("balance-request", circuit_id)
 
-        lowest_balance = sys.maxsize
-        lowest_index = -1
-        for ind, tup in enumerate(self.competing_slots):
-            if not tup[1]:
-                # The slot is empty, take it
-                self.competing_slots[ind] = (balance, circuit_id)
-                cache.balance_future.set_result(True)
-                return
-
-            if tup[0] < lowest_balance:
-                lowest_balance = tup[0]
-                lowest_index = ind
-
-        if balance > lowest_balance:
+        lowest_balance = self.competing_slots.get_lowest_balance()
+        taken, old_circuit_id = self.competing_slots.take(circuit_id, balance)
+        if old_circuit_id is not None:
             # We kick this user out
-            old_circuit_id = self.competing_slots[lowest_index][1]
             self.logger.info("Kicked out circuit %s (balance: %s) in favor of %s (balance: %s)",
                              old_circuit_id, lowest_balance, circuit_id, balance)
-            self.competing_slots[lowest_index] = (balance, circuit_id)
-
             self.remove_relay(old_circuit_id, destroy=DESTROY_REASON_BALANCE)
             self.remove_exit_socket(old_circuit_id, destroy=DESTROY_REASON_BALANCE)
 
+        if taken:
             cache.balance_future.set_result(True)
         else:
             # We can't compete with the balances in the existing slots
@@ -209,10 +251,8 @@ class TriblerTunnelCommunity(HiddenTunnelCommunity):
             return succeed(False)
 
         # Check whether we have a random open slot, if so, allocate this to this request.
-        for index, slot in enumerate(self.random_slots):
-            if not slot:
-                self.random_slots[index] = circuit_id
-                return succeed(True)
+        if self.random_slots.take(circuit_id):
+            return succeed(True)
 
         # No random slots but this user might be allocated a competing slot.
         # Next, we request the token balance of the circuit initiator.
@@ -313,15 +353,18 @@ class TriblerTunnelCommunity(HiddenTunnelCommunity):
         """
         self.logger.info("Sending payout of %d (base: %d) to %s (cid: %s)", amount, base_amount, peer, circuit_id)
 
+        # We sign the transaction right away, since the payout has to reach the peer before the circuit is destroyed.
+        # Since we are the payer, the transaction is written to the database before we send it.
         tx = self.bandwidth_community.construct_signed_transaction(peer, amount)
-        self.bandwidth_community.database.BandwidthTransaction.insert(tx)
+        self.bandwidth_community.database.queue_transaction(tx)
         payload = BandwidthTransactionPayload.from_transaction(tx, circuit_id, base_amount)
         packet = self._ez_pack(self._prefix, 30, [payload], False)
         self.send_packet(peer, packet)
 
-    def on_payout(self, source_address: Address, data: bytes) -> None:
+    async def on_payout(self, source_address: Address, data: bytes) -> None:
         """
-        We received a payout from another peer.
+        We received a payout from another peer. Unless we have to relay the payout, the signatures of the transaction
+        are verified and created on a worker thread. The transaction is queued to be written to the database.
         :param source_address: The address of the peer that sent us this payout.
         :param data: The serialized, raw data.
         """
@@ -331,44 +374,55 @@ class TriblerTunnelCommunity(HiddenTunnelCommunity):
 
         payload = self._ez_unpack_noauth(BandwidthTransactionPayload, data, global_time=False)
         tx = BandwidthTransactionData.from_payload(payload)
+        relay = self.relay_from_to.get(payload.circuit_id)
 
-        if not tx.is_valid():
+        # The circuit is destroyed right after the payout, so a relay has to send the next payout before it processes
+        # the destroy cell. Otherwise, the next node no longer knows where to send its payout to.
+        valid = tx.is_valid() if relay else await get_event_loop().run_in_executor(None, tx.is_valid)
+        if not valid:
             self.logger.info("Received invalid bandwidth transaction in tunnel community - ignoring it")
             return
 
+        # Send the next payout
+        if relay and tx.amount > payload.base_amount:
+            self._logger.info("Sending next payout to peer %s", relay.peer)
+            self.do_payout(relay.peer, relay.circuit_id, payload.base_amount * 2, payload.base_amount)
+
         from_peer = Peer(payload.public_key_a, source_address)
         my_pk = self.my_peer.public_key.key_to_bin()
-        latest_tx = self.bandwidth_community.database.get_latest_transaction(
-            self.my_peer.public_key.key_to_bin(), from_peer.public_key.key_to_bin())
+        database = self.bandwidth_community.database
+        latest_tx = database.get_latest_transaction(tx.public_key_a, tx.public_key_b)
         if payload.circuit_id != 0 and tx.public_key_b == my_pk and (not latest_tx or latest_tx.amount < tx.amount):
             # Sign it and send it back
-            tx.sign(self.my_peer.key, as_a=False)
-            self.bandwidth_community.database.BandwidthTransaction.insert(tx)
-
-            response_payload = BandwidthTransactionPayload.from_transaction(tx, 0, payload.base_amount)
-            packet = self._ez_pack(self._prefix, 30, [response_payload], False)
-            self.send_packet(from_peer, packet)
+            await get_event_loop().run_in_executor(None, tx.sign, self.my_peer.key, False)
+            # While signing, we could have received a later transaction from the same peer
+            if database.queue_transaction(tx):
+                response_payload = BandwidthTransactionPayload.from_transaction(tx, 0, payload.base_amount)
+                packet = self._ez_pack(self._prefix, 30, [response_payload], False)
+                self.send_packet(from_peer, packet)
         elif payload.circuit_id == 0 and tx.public_key_a == my_pk:
             if not latest_tx or (latest_tx and latest_tx.amount >= tx.amount):
-                self.bandwidth_community.database.BandwidthTransaction.insert(tx)
-
-        # Send the next payout
-        if payload.circuit_id in self.relay_from_to and tx.amount > payload.base_amount:
-            relay = self.relay_from_to[payload.circuit_id]
-            self._logger.info("Sending next payout to peer %s", relay.peer)
-            self.do_payout(relay.peer, relay.circuit_id, payload.base_amount * 2, payload.base_amount)
+                database.queue_transaction(tx)
 
     def clean_from_slots(self, circuit_id):
         """
         Clean a specific circuit from the allocated slots.
         """
-        for ind, slot in enumerate(self.random_slots):
-            if slot == circuit_id:
-                self.random_slots[ind] = None
-
-        for ind, tup in enumerate(self.competing_slots):
-            if tup[1] == circuit_id:
-                self.competing_slots[ind] = (0, None)
+        self.random_slots.release(circuit_id)
+        self.competing_slots.release(circuit_id)
+
+    def create_circuit(self, goal_hops, ctype=CIRCUIT_TYPE_DATA, exit_flags=None, required_exit=None, info_hash=None):
+        circuit = super().create_circuit(goal_hops, ctype=ctype, exit_flags=exit_flags, required_exit=required_exit,
+                                         info_hash=info_hash)
+        if circuit:
+            circuit.ready.add_done_callback(lambda f, c=circuit: self.on_circuit_ready(c, f))
+        return circuit
+
+    def on_circuit_ready(self, circuit, ready):
+        # The ready future is cancelled if a task that awaits it is cancelled, and has no result if circuit creation
+        # failed.
+        if not ready.cancelled() and ready.result():
+            self.metrics.on_circuit_ready(time.time() - circuit.creation_time)
 
     def remove_circuit(self, circuit_id, additional_info='', remove_now=False, destroy=False):
         if circuit_id not in self.circuits:
@@ -436,6 +490,100 @@ class TriblerTunnelCommunity(HiddenTunnelCommunity):
         return super().remove_exit_socket(circuit_id, additional_info=additional_info,
                                           remove_now=remove_now, destroy=destroy)
 
+    def on_cell(self, source_address, data):
+        metrics = self.metrics
+        metrics.cells += 1
+        if metrics.cells % TIMING_INTERVAL:
+            self.handle_cell(source_address, data)
+            return
+        start_time = time.perf_counter_ns()
+        self.handle_cell(source_address, data)
+        metrics.cell_handling.add(time.perf_counter_ns() - start_time)
+
+    def handle_cell(self, source_address, data):
+        if not self.crypto_pipeline:
+            super().on_cell(source_address, data)
+            return
+
+        cell = CellPayload.from_bin(data)
+        circuit_id = cell.circuit_id
+        relay_session_keys = self.relay_session_keys.get(circuit_id)
+        if circuit_id not in self.exit_sockets or circuit_id in self.circuits or cell.plaintext \
+                or not relay_session_keys:
+            super().on_cell(source_address, data)
+            return
+
+        # We are the exit node of this circuit: decrypt the cell on a worker, and handle it afterwards
+        self.crypto_pipeline.decrypt(circuit_id, cell.message, relay_session_keys[EXIT_NODE],
+                                     relay_session_keys[EXIT_NODE_SALT],
+                                     partial(self.on_exit_cell_decrypted, source_address, cell))
+
+    def on_exit_cell_decrypted(self, source_address, cell, message):
+        if message is None:
+            self.logger.debug("Could not decrypt cell for exit circuit %d", cell.circuit_id)
+            self.metrics.on_drop(cell.circuit_id, 'decrypt')
+            return
+        cell.message = message
+
+        if (not cell.relay_early and cell.message[0] == 4) or self.settings.max_relay_early <= 0:
+            self.logger.info('Dropping cell (missing or unexpected relay_early flag)')
+            self.metrics.on_drop(cell.circuit_id, 'relay_early')
+            return
+        self.on_packet_from_circuit(source_address, cell.unwrap(self._prefix), cell.circuit_id)
+
+    def relay_cell(self, cell):
+        next_relay = self.relay_from_to[cell.circuit_id]
+        direction = self.directions.get(cell.circuit_id)
+        if not self.crypto_pipeline or next_relay.rendezvous_relay or cell.plaintext \
+                or direction not in (ORIGINATOR, EXIT_NODE):
+            super().relay_cell(cell)
+            return
+        if cell.relay_early and next_relay.relay_early_count >= self.settings.max_relay_early:
+            self.logger.warning('Dropping cell (too many relay_early cells)')
+            self.metrics.on_drop(cell.circuit_id, 'relay_early')
+            return
+
+        relay_session_keys = self.relay_session_keys[cell.circuit_id]
+        callback = partial(self.on_relay_cell_processed, cell)
+        if direction == ORIGINATOR:
+            self.crypto_pipeline.encrypt(cell.circuit_id, cell.message,
+                                         *self.crypto.get_session_keys(relay_session_keys, ORIGINATOR), callback)
+        else:
+            self.crypto_pipeline.decrypt(cell.circuit_id, cell.message, relay_session_keys[EXIT_NODE],
+                                         relay_session_keys[EXIT_NODE_SALT], callback)
+
+    def on_relay_cell_processed(self, cell, message):
+        next_relay = self.relay_from_to.get(cell.circuit_id)
+        if message is None or not next_relay:
+            self.logger.warning("Dropping cell for circuit %d (decryption failed or relay removed)", cell.circuit_id)
+            self.metrics.on_drop(cell.circuit_id, 'decrypt')
+            return
+
+        cell.message = message
+        cell.circuit_id = next_relay.circuit_id
+        packet = cell.to_bin(self._prefix)
+        next_relay.bytes_up += self.send_packet(next_relay.peer, packet)
+        next_relay.relay_early_count += 1
+
+    def send_cell(self, peer, payload):
+        circuit_id = payload.circuit_id
+        relay_session_keys = self.relay_session_keys.get(circuit_id)
+        if not self.crypto_pipeline or circuit_id not in self.exit_sockets or circuit_id in self.circuits \
+                or payload.msg_id in NO_CRYPTO_PACKETS or not relay_session_keys:
+            super().send_cell(peer, payload)
+            return
+
+        # We are the exit node of this circuit: encrypt the cell towards the originator on a worker
+        message = pack('!B', payload.msg_id) + self.serializer.pack_serializable(payload)[4:]
+        cell = CellPayload(circuit_id, message)
+        self.crypto_pipeline.encrypt(circuit_id, message,
+                                     *self.crypto.get_session_keys(relay_session_keys, ORIGINATOR),
+                                     partial(self.on_exit_cell_encrypted, peer, cell))
+
+    def on_exit_cell_encrypted(self, peer, cell, message):
+        cell.message = message
+        self.send_packet(peer, cell.to_bin(self._prefix))
+
     def _ours_on_created_extended(self, circuit, payload):
         super()._ours_on_created_extended(circuit, payload)
 
@@ -446,60 +594,141 @@ class TriblerTunnelCommunity(HiddenTunnelCommunity):
     def on_raw_data(self, circuit, origin, data):
         self.dispatcher.on_incoming_from_tunnel(self, circuit, origin, data)
 
-    def monitor_downloads(self, dslist):
-        # Monitor downloads with anonymous flag set, and build rendezvous/introduction points when needed.
-        new_states = {}
-        hops = {}
-        active_downloads_per_hop = {}
-
-        for ds in dslist:
-            download = ds.get_download()
-            hop_count = download.config.get_hops()
-            if hop_count > 0:
-                # Convert the real infohash to the infohash used for looking up introduction points
-                real_info_hash = download.get_def().get_infohash()
-                info_hash = self.get_lookup_info_hash(real_info_hash)
-                hops[info_hash] = hop_count
-                new_states[info_hash] = ds.get_status()
-
-                if download.get_state().get_status() in [DLSTATUS_DOWNLOADING, DLSTATUS_SEEDING, DLSTATUS_METADATA]:
-                    active_downloads_per_hop[hop_count] = active_downloads_per_hop.get(hop_count, 0) + 1
-
-                    # Ugly work-around for the libtorrent DHT not making any requests
-                    # after a period of having no circuits
-                    if self.last_forced_announce.get(info_hash, 0) + 60 <= time.time() \
-                            and self.find_circuits(hops=hop_count) \
-                            and not ds.get_peerlist():
-                        download.force_dht_announce()
-                        self.last_forced_announce[info_hash] = time.time()
+    def do_ping(self, exclude=None):
+        # Ping circuits, keeping track of the circuit and the time of every ping to measure the round-trip times.
+        # Like HiddenTunnelCommunity.do_ping, which this replaces, we do not ping pending e2e circuits.
+        exclude = [] if exclude is None else list(exclude)
+        exclude += [c.circuit_id for c in self.circuits.values()
+                    if (c.ctype == CIRCUIT_TYPE_RP_SEEDER) or (c.ctype == CIRCUIT_TYPE_RP_DOWNLOADER and not c.e2e)]
+        for circuit in list(self.circuits.values()):
+            if circuit.state in [CIRCUIT_STATE_READY, CIRCUIT_STATE_EXTENDING] \
+                    and circuit.circuit_id not in exclude \
+                    and circuit.hops:
+                cache = CircuitPingRequestCache(self, circuit.circuit_id)
+                self.request_cache.add(cache)
+                self.send_cell(circuit.peer, PingPayload(circuit.circuit_id, cache.number))
+
+    @unpack_cell(PongPayload)
+    def on_pong(self, source_address, payload, _):
+        if not self.request_cache.has("ping", payload.identifier):
+            self.logger.warning("Invalid ping circuit_id")
+            return
+
+        cache = self.request_cache.pop("ping", payload.identifier)
+        rtt = time.time() - cache.sent_at
+        self.dispatcher.scheduler.on_rtt(cache.circuit_id, rtt)
+        self.metrics.on_rtt(cache.circuit_id, rtt)
+        self.logger.debug("Got pong from %s", source_address)
+
+    def sample_metrics(self):
+        tunnel_objects = {circuit_id: ('relay', relay) for circuit_id, relay in self.relay_from_to.items()}
+        tunnel_objects.update((circuit_id, ('exit', exit_socket))
+                              for circuit_id, exit_socket in self.exit_sockets.items())
+        tunnel_objects.update((circuit_id, ('circuit', circuit)) for circuit_id, circuit in self.circuits.items())
+        self.metrics.sample(tunnel_objects)
+
+    def on_download_state(self, download, status):
+        """
+        Called by the download manager when a download is added, removed (status None), or changes its status or
+        hop count.
+        """
+        info_hash = self.get_lookup_info_hash(download.get_def().get_infohash())
+        hop_count = download.config.get_hops()
+        if status is not None and hop_count > 0:
+            self.anonymous_downloads[info_hash] = download
+            self.update_download_state(info_hash, status, hop_count)
+        elif self.anonymous_downloads.get(info_hash, download) is download:
+            self.update_download_state(info_hash, None, hop_count)
+
+    def update_download_state(self, info_hash, new_state, hop_count):
+        # Update the state of an anonymous download, and build rendezvous/introduction points when needed.
+        old_state = self.download_states.get(info_hash, None)
+        old_hop_count = self.download_hops.get(info_hash, None)
+        state_changed = new_state != old_state
+        if not state_changed and (new_state is None or hop_count == old_hop_count):
+            return
+
+        if old_state in ACTIVE_DOWNLOAD_STATES:
+            self.active_downloads_per_hop[old_hop_count] -= 1
+            if self.active_downloads_per_hop[old_hop_count] <= 0:
+                del self.active_downloads_per_hop[old_hop_count]
+        if new_state in ACTIVE_DOWNLOAD_STATES:
+            self.active_downloads_per_hop[hop_count] += 1
+
+        if new_state is None:
+            self.download_states.pop(info_hash, None)
+            self.download_hops.pop(info_hash, None)
+            self.anonymous_downloads.pop(info_hash, None)
+        else:
+            self.download_states[info_hash] = new_state
+            self.download_hops[info_hash] = hop_count
+
+        if new_state == DLSTATUS_SEEDING:
+            self.seeding_downloads.add(info_hash)
+        else:
+            self.seeding_downloads.discard(info_hash)
+
+        if new_state not in ACTIVE_DOWNLOAD_STATES:
+            self.last_announce_check.pop(info_hash, None)
+        elif old_state not in ACTIVE_DOWNLOAD_STATES or hop_count != old_hop_count:
+            self.schedule_announce_check(info_hash, hop_count, time.time())
 
         # Request 1 circuit per download while ensuring that the total number of circuits requested per hop count
         # stays within min_circuits and max_circuits.
-        self.circuits_needed = {hop_count: min(max(download_count, self.settings.min_circuits),
-                                               self.settings.max_circuits)
-                                for hop_count, download_count in active_downloads_per_hop.items()}
-
-        ip_counter = Counter([c.info_hash for c in list(self.circuits.values()) if c.ctype == CIRCUIT_TYPE_IP_SEEDER])
-        for info_hash in set(list(new_states) + list(self.download_states)):
-            new_state = new_states.get(info_hash, None)
-            old_state = self.download_states.get(info_hash, None)
-            state_changed = new_state != old_state
-
-            # Join/leave hidden swarm as needed.
-            if state_changed and new_state in [DLSTATUS_DOWNLOADING, DLSTATUS_SEEDING, DLSTATUS_METADATA]:
-                if old_state != DLSTATUS_METADATA or new_state != DLSTATUS_DOWNLOADING:
-                    self.join_swarm(info_hash, hops[info_hash], seeding=new_state == DLSTATUS_SEEDING,
-                                    callback=lambda addr, ih=info_hash: self.on_e2e_finished(addr, ih))
-            elif state_changed and new_state in [DLSTATUS_STOPPED, None]:
-                self.leave_swarm(info_hash)
-
-            # Ensure we have enough introduction points for this infohash. Currently, we only create 1.
-            if new_state == DLSTATUS_SEEDING:
-                for _ in range(1 - ip_counter.get(info_hash, 0)):
-                    self.logger.info('Create introducing circuit for %s', hexlify(info_hash))
-                    self.create_introduction_point(info_hash)
-
-        self.download_states = new_states
+        self.circuits_needed = {hops: min(max(download_count, self.settings.min_circuits), self.settings.max_circuits)
+                                for hops, download_count in self.active_downloads_per_hop.items()}
+
+        # Join/leave hidden swarm as needed. When a download becomes active, we also keep circuits ready for the
+        # next download with this hop count.
+        if state_changed and new_state in ACTIVE_DOWNLOAD_STATES:
+            if old_state not in ACTIVE_DOWNLOAD_STATES:
+                self.circuit_pool.add_demand(hop_count, PEER_FLAG_EXIT_BT)
+            if old_state != DLSTATUS_METADATA or new_state != DLSTATUS_DOWNLOADING:
+                self.join_swarm(info_hash, hop_count, seeding=new_state == DLSTATUS_SEEDING,
+                                callback=lambda addr, ih=info_hash: self.on_e2e_finished(addr, ih))
+        elif state_changed and new_state in [DLSTATUS_STOPPED, None]:
+            self.leave_swarm(info_hash)
+
+        if new_state == DLSTATUS_SEEDING:
+            self.create_introduction_points([info_hash])
+
+    def create_introduction_points(self, info_hashes):
+        # Ensure we have enough introduction points for these infohashes. Currently, we only create 1.
+        ip_info_hashes = {c.info_hash for c in list(self.circuits.values()) if c.ctype == CIRCUIT_TYPE_IP_SEEDER}
+        for info_hash in info_hashes:
+            if info_hash not in ip_info_hashes:
+                self.logger.info('Create introducing circuit for %s', hexlify(info_hash))
+                self.create_introduction_point(info_hash)
+
+    def schedule_announce_check(self, info_hash, hop_count, now):
+        self.last_announce_check[info_hash] = now
+        self.announce_checks[hop_count].append((now, info_hash))
+
+    def maintain_downloads(self):
+        """
+        Recreate the introduction points of seeding downloads that have lost them, and announce active downloads
+        without peers to the DHT.
+        """
+        if self.seeding_downloads:
+            self.create_introduction_points(self.seeding_downloads)
+
+        # Ugly work-around for the libtorrent DHT not making any requests after a period of having no circuits.
+        # Getting the peers of a download is expensive, so we only check the downloads for which the last check was
+        # at least an interval ago, and only while there are circuits.
+        now = time.time()
+        for hop_count, checks in self.announce_checks.items():
+            if not checks or not self.find_circuits(hops=hop_count):
+                continue
+            while checks and checks[0][0] + ANNOUNCE_CHECK_INTERVAL <= now:
+                check_time, info_hash = checks.popleft()
+                # Skip the checks of downloads that have stopped or changed their hop count since
+                if self.last_announce_check.get(info_hash) != check_time \
+                        or self.download_hops.get(info_hash) != hop_count:
+                    continue
+                self.schedule_announce_check(info_hash, hop_count, now)
+                download = self.anonymous_downloads.get(info_hash)
+                if download and not download.get_peerlist():
+                    download.force_dht_announce()
 
     def on_e2e_finished(self, address, info_hash):
         dl = self.get_download(info_hash)
@@ -534,6 +763,8 @@ class TriblerTunnelCommunity(HiddenTunnelCommunity):
         if not self.dlmgr:
             return None
 
+        if lookup_info_hash in self.anonymous_downloads:
+            return self.anonymous_downloads[lookup_info_hash]
         for download in self.dlmgr.get_downloads():
             if lookup_info_hash == self.get_lookup_info_hash(download.get_def().get_infohash()):
                 return download
@@ -562,7 +793,14 @@ class TriblerTunnelCommunity(HiddenTunnelCommunity):
         await super().create_introduction_point(info_hash, required_ip=required_ip)
 
     async def unload(self):
+        # Stop refilling the circuit pool, since all circuits are about to be removed
+        self.cancel_pending_task('refill_circuit_pool')
+        if self.dlmgr is not None:
+            self.dlmgr.remove_download_state_listener(self.on_download_state)
         await self.dispatcher.shutdown_task_manager()
+        if self.crypto_pipeline:
+            self.crypto_pipeline.shutdown()
+        self.http_pool.close()
 
         if self.exitnode_cache is not None:
             self.cache_exitnodes_to_disk()
@@ -577,49 +815,33 @@ class TriblerTunnelCommunity(HiddenTunnelCommunity):
         if circuit_id not in self.exit_sockets:
             self.logger.warning("Received unexpected http-request")
             return
-        if len([cache for cache in self.request_cache._identifiers.values()
-                if isinstance(cache, HTTPRequestCache) and cache.circuit_id == circuit_id]) > 5:
-            self.logger.warning("Too many HTTP requests coming from circuit %s")
+        if self.http_requests[circuit_id] >= MAX_HTTP_REQUESTS_PER_CIRCUIT:
+            self.logger.warning("Too many HTTP requests coming from circuit %s", circuit_id)
             return
 
         self.logger.debug("Got http-request from %s", source_address)
+        self.http_requests[circuit_id] += 1
+
+        def send_response_cell(part, total, data):
+            self.send_cell(source_address, HTTPResponsePayload(circuit_id, payload.identifier, part, total, data))
 
-        writer = None
+        stream = HTTPResponseStream(send_response_cell, MAX_HTTP_PACKET_SIZE)
+        self.http_streams[(circuit_id, payload.identifier)] = stream
         try:
             async with async_timeout.timeout(10):
-                self.logger.debug("Opening TCP connection to %s", payload.target)
-                reader, writer = await open_connection(*payload.target)
-                writer.write(payload.request)
-                response = b''
-                while True:
-                    line = await reader.readline()
-                    response += line
-                    if not line.strip():
-                        # Read HTTP response body (1MB max)
-                        response += await reader.read(1024**2)
-                        break
+                self.logger.debug("Sending request to %s", payload.target)
+                await self.http_pool.request(payload.target, payload.request, stream)
         except OSError:
             self.logger.warning('Tunnel HTTP request failed')
-            return
         except AsyncTimeoutError:
             self.logger.warning('Tunnel HTTP request timed out')
-            return
+        except HTTPResponseNotAllowed as e:
+            self.logger.warning('Tunnel HTTP request not allowed: %s', e)
         finally:
-            if writer:
-                writer.close()
-
-        if not response.startswith(b'HTTP/1.1 307'):
-            _, _, bencoded_data = response.partition(b'\r\n\r\n')
-
-            if not is_bencoded(bencoded_data):
-                self.logger.warning('Tunnel HTTP request not allowed')
-                return
-
-        num_cells = math.ceil(len(response) / MAX_HTTP_PACKET_SIZE)
-        for i in range(num_cells):
-            self.send_cell(source_address,
-                           HTTPResponsePayload(circuit_id, payload.identifier, i, num_cells,
-                                               response[i*MAX_HTTP_PACKET_SIZE:(i+1)*MAX_HTTP_PACKET_SIZE]))
+            self.http_streams.pop((circuit_id, payload.identifier), None)
+            self.http_requests[circuit_id] -= 1
+            if not self.http_requests[circuit_id]:
+                del self.http_requests[circuit_id]
 
     @unpack_cell(HTTPResponsePayload)
     def on_http_response(self, source_address, payload, circuit_id):
@@ -634,24 +856,37 @@ class TriblerTunnelCommunity(HiddenTunnelCommunity):
         self.logger.debug("Got http-response from %s", source_address)
         if cache.add_response(payload):
             self.request_cache.pop("http-request", payload.identifier)
+        elif cache.next_part - cache.acked_part >= HTTP_ACK_INTERVAL:
+            self.send_http_response_ack(cache)
+
+    def send_http_response_ack(self, cache):
+        circuit = self.circuits.get(cache.circuit_id)
+        if circuit:
+            cache.acked_part = cache.next_part
+            self.send_cell(circuit.peer, HTTPResponseAckPayload(circuit.circuit_id, cache.number, cache.next_part))
+
+    @unpack_cell(HTTPResponseAckPayload)
+    def on_http_response_ack(self, source_address, payload, circuit_id):
+        stream = self.http_streams.get((circuit_id, payload.identifier))
+        if not stream:
+            self.logger.debug("Received unexpected http-response-ack")
+            return
+        stream.on_ack(payload.next_part)
 
-    async def perform_http_request(self, destination, request, hops=1):
+    async def perform_http_request(self, destination, request, hops=1, on_data=None):
+        """
+        Perform an HTTP request through a circuit with an HTTP exit.
+        :param on_data: if given, the parts of the response are passed to this function as soon as they arrive, and
+                        None is returned.
+        :return: the response, or None if no (complete) response was received in time.
+        """
         # We need a circuit that supports HTTP requests, meaning that the circuit will have to end
         # with a node that has the PEER_FLAG_EXIT_HTTP flag set.
-        circuits = self.find_circuits(exit_flags=[PEER_FLAG_EXIT_HTTP])
-        if circuits:
-            circuit = circuits[0]
-        else:
-            # Try to create a circuit. Attempt at most 3 times.
-            for _ in range(3):
-                circuit = self.create_circuit(hops, exit_flags=[PEER_FLAG_EXIT_HTTP])
-                if circuit and await circuit.ready:
-                    break
-
+        circuit = await self.circuit_pool.get_circuit(hops, PEER_FLAG_EXIT_HTTP)
         if not circuit:
             raise RuntimeError('No HTTP circuit available')
 
-        cache = self.request_cache.add(HTTPRequestCache(self, circuit.circuit_id))
+        cache = self.request_cache.add(HTTPRequestCache(self, circuit.circuit_id, on_data))
         self.send_cell(circuit.peer, HTTPRequestPayload(circuit.circuit_id, cache.number, destination, request))
         return await cache.response_future
 
@@ -0,0 +1,64 @@
+from aiohttp import web
+
+from aiohttp_apispec import docs
+
+from ipv8.REST.schema import schema
+
+from marshmallow.fields import Dict, List
+
+from tribler_core.components.restapi.rest.rest_endpoint import HTTP_NOT_FOUND, RESTEndpoint, RESTResponse
+from tribler_core.components.restapi.rest.schema import HandledErrorSchema
+from tribler_core.components.tunnel.community.tunnel_community import TriblerTunnelCommunity
+from tribler_core.utilities.utilities import froze_it
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+@froze_it
+class TunnelEndpoint(RESTEndpoint):
+    """
+    This endpoint is responsible for handing requests for the performance metrics of the tunnel community.
+    """
+
+    def __init__(self, tunnel_community: TriblerTunnelCommunity):
+        super().__init__()
+        self.tunnel_community = tunnel_community
+
+    def setup_routes(self) -> None:
+        self.app.add_routes([web.get('/metrics', self.get_metrics)])
+
+    @docs(
+        tags=["Tunnels"],
+        summary="Return the throughput, round-trip time, queue depth and dropped cells of every circuit, and "
+                "statistics of the time that is spent on handling cells and on their crypto (in seconds).",
+        parameters=[{
+            'in': 'query',
+            'name': 'format',
+            'description': 'Return the metrics in the Prometheus text format instead of JSON',
+            'enum': ['json', 'prometheus'],
+            'type': 'string',
+            'required': False
+        }],
+        responses={
+            200: {
+                "schema": schema(TunnelMetricsResponse={
+                    'metrics': schema(TunnelMetrics={
+                        'circuits': List(Dict),
+                        'drops': Dict,
+                        'cell_handling': Dict,
+                        'crypto': Dict,
+                        'rtt': Dict,
+                        'circuit_ready': Dict
+                    })
+                })
+            },
+            HTTP_NOT_FOUND: {'schema': HandledErrorSchema, 'example': {"error": "Tunnel community not found"}},
+        }
+    )
+    async def get_metrics(self, request) -> RESTResponse:
+        if not self.tunnel_community:
+            return RESTResponse({"error": "Tunnel community not found"}, status=HTTP_NOT_FOUND)
+        metrics = self.tunnel_community.metrics
+        if request.query.get('format') == 'prometheus':
+            return RESTResponse(metrics.to_prometheus(), headers={'Content-Type': PROMETHEUS_CONTENT_TYPE})
+        return RESTResponse({'metrics': metrics.get_stats()})
@@ -9,6 +9,10 @@ class TunnelCommunitySettings(TriblerConfigSection):
     exitnode_enabled: bool = False
     random_slots: int = 5
     competing_slots: int = 15
+    # The number of worker threads that encrypt and decrypt relayed and exit cells, 0 to use the event loop
+    crypto_workers: int = 0
     testnet: bool = Field(default=False, env='TUNNEL_TESTNET')
     min_circuits: int = 3
     max_circuits: int = 10
+    # The maximum number of circuits that we keep ready per number of hops and exit flag
+    circuit_pool_size: int = 2
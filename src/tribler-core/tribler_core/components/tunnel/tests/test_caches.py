@@ -0,0 +1,37 @@
+from unittest.mock import Mock
+
+import pytest
+
+from tribler_core.components.tunnel.community.caches import HTTPRequestCache
+from tribler_core.components.tunnel.community.payload import HTTPResponsePayload
+
+
+def create_community():
+    return Mock(request_cache=Mock(has=lambda *_: False))
+
+
+@pytest.mark.asyncio
+async def test_http_request_cache_stream():
+    """
+    Test whether the parts of a streamed response are passed on in order
+    """
+    received = []
+    cache = HTTPRequestCache(create_community(), 1, on_data=received.append)
+    assert not cache.add_response(HTTPResponsePayload(1, cache.number, 1, 0, b'b'))
+    assert not received
+    assert not cache.add_response(HTTPResponsePayload(1, cache.number, 0, 0, b'a'))
+    assert received == [b'a', b'b']
+    assert cache.add_response(HTTPResponsePayload(1, cache.number, 2, 3, b'c'))
+    assert received == [b'a', b'b', b'c']
+    assert await cache.response_future is None
+
+
+@pytest.mark.asyncio
+async def test_http_request_cache():
+    """
+    Test whether a response of which every part has the total number of parts is joined
+    """
+    cache = HTTPRequestCache(create_community(), 1)
+    assert not cache.add_response(HTTPResponsePayload(1, cache.number, 1, 2, b'b'))
+    assert cache.add_response(HTTPResponsePayload(1, cache.number, 0, 2, b'a'))
+    assert await cache.response_future == b'ab'
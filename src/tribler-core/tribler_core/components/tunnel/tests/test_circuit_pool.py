@@ -0,0 +1,120 @@
+from asyncio import Future, ensure_future, sleep
+from unittest.mock import Mock
+
+from ipv8.messaging.anonymization.tunnel import CIRCUIT_STATE_EXTENDING, CIRCUIT_STATE_READY, PEER_FLAG_EXIT_BT
+
+import pytest
+
+from tribler_core.components.tunnel.community.circuit_pool import CircuitPool, DEMAND_WINDOW
+
+
+class MockTunnels:
+    """
+    Creates circuits that stay in the extending state until they are made ready.
+    """
+
+    def __init__(self):
+        self.circuits = {}
+        self.can_create = True
+
+    def create_circuit(self, goal_hops, exit_flags=None):
+        if not self.can_create:
+            return None
+        circuit = Mock(circuit_id=len(self.circuits) + 1, goal_hops=goal_hops, state=CIRCUIT_STATE_EXTENDING,
+                       ready=Future(), hops=(), exit_flags=exit_flags)
+        self.circuits[circuit.circuit_id] = circuit
+        return circuit
+
+    def find_circuits(self, hops=None, exit_flags=None):
+        return [c for c in self.circuits.values()
+                if c.state == CIRCUIT_STATE_READY and c.goal_hops == hops and set(exit_flags) <= set(c.exit_flags)]
+
+    def make_ready(self, circuit):
+        circuit.state = CIRCUIT_STATE_READY
+        circuit.ready.set_result(circuit)
+
+
+@pytest.fixture(name='tunnels')
+def fixture_tunnels():
+    return MockTunnels()
+
+
+@pytest.mark.asyncio
+async def test_refill(tunnels):
+    """
+    Test whether the pool keeps as many circuits as were recently needed, up to its size
+    """
+    pool = CircuitPool(tunnels, 2)
+    pool.add_demand(1, PEER_FLAG_EXIT_BT, now=0)
+    assert pool.get_target(1, PEER_FLAG_EXIT_BT, now=0) == 1
+    assert len(pool.pending) == 1
+
+    # Circuits that are ready or in the making are not created again
+    tunnels.make_ready(tunnels.circuits[1])
+    await sleep(0)
+    pool.add_demand(1, PEER_FLAG_EXIT_BT, now=1)
+    pool.add_demand(1, PEER_FLAG_EXIT_BT, now=2)
+    assert pool.get_target(1, PEER_FLAG_EXIT_BT, now=2) == 2
+    assert len(tunnels.circuits) == 2
+    assert list(pool.pending) == [2]
+
+    # Circuits are no longer kept ready when the demand is older than the window
+    tunnels.circuits.clear()
+    pool.refill(now=DEMAND_WINDOW + 2)
+    assert not tunnels.circuits
+    assert not pool.demand
+
+
+@pytest.mark.asyncio
+async def test_take_pending_circuit(tunnels):
+    """
+    Test whether a circuit that the pool is creating can be taken, after which it is replaced on the next refill
+    """
+    pool = CircuitPool(tunnels, 1)
+    assert not pool.take_pending_circuit(1, PEER_FLAG_EXIT_BT)
+    pool.add_demand(1, PEER_FLAG_EXIT_BT, now=0)
+
+    circuit = pool.take_pending_circuit(1, PEER_FLAG_EXIT_BT)
+    assert circuit is tunnels.circuits[1]
+    assert not pool.pending
+
+    pool.refill(now=0)
+    assert list(pool.pending) == [2]
+
+
+@pytest.mark.asyncio
+async def test_get_circuit(tunnels):
+    """
+    Test whether getting a circuit waits for a circuit of the pool to be ready
+    """
+    pool = CircuitPool(tunnels, 1)
+    future = ensure_future(pool.get_circuit(1, PEER_FLAG_EXIT_BT))
+    await sleep(0)
+    assert not future.done()
+
+    tunnels.make_ready(tunnels.circuits[1])
+    assert await future is tunnels.circuits[1]
+    assert not pool.pending
+
+    # A ready circuit is returned right away
+    assert await pool.get_circuit(1, PEER_FLAG_EXIT_BT) is tunnels.circuits[1]
+
+
+@pytest.mark.asyncio
+async def test_get_circuit_failed(tunnels):
+    """
+    Test whether getting a circuit gives up if circuits can not be created, or are never ready
+    """
+    pool = CircuitPool(tunnels, 0)
+    tunnels.can_create = False
+    assert await pool.get_circuit(1, PEER_FLAG_EXIT_BT) is None
+
+    tunnels.can_create = True
+    future = ensure_future(pool.get_circuit(1, PEER_FLAG_EXIT_BT))
+    for circuit_id in range(1, 4):
+        while circuit_id not in tunnels.circuits:
+            await sleep(0)
+        circuit = tunnels.circuits[circuit_id]
+        circuit.state = None
+        circuit.ready.set_result(None)
+    assert await future is None
@@ -0,0 +1,94 @@
+from unittest.mock import Mock
+
+from tribler_core.components.tunnel.community.circuit_scheduler import CircuitScheduler, DEGRADED_SAMPLES
+
+
+def create_circuit(circuit_id, bytes_up=0, bytes_down=0):
+    return Mock(circuit_id=circuit_id, bytes_up=bytes_up, bytes_down=bytes_down)
+
+
+def test_select_least_loaded():
+    """
+    Test whether new destinations are assigned to the circuit with the fewest destinations and the lowest RTT
+    """
+    scheduler = CircuitScheduler()
+    circuits = [create_circuit(1), create_circuit(2), create_circuit(3)]
+    scheduler.assign(1, ('1.1.1.1', 1))
+    assert scheduler.select(circuits)
+    scheduler.on_rtt(2, 0.5)
+    scheduler.on_rtt(3, 0.1)
+    assert scheduler.select(circuits).circuit_id == 3
+
+    scheduler.assign(3, ('2.2.2.2', 2))
+    assert scheduler.select(circuits).circuit_id == 2
+    assert scheduler.select([]) is None
+
+
+def test_rtt_and_loss():
+    """
+    Test whether the RTT and the ping loss of a circuit are averaged
+    """
+    scheduler = CircuitScheduler()
+    scheduler.on_rtt(1, 1.0)
+    assert not scheduler.get_stats()
+
+    scheduler.assign(1, ('1.1.1.1', 1))
+    scheduler.on_rtt(1, 1.0)
+    scheduler.on_rtt(1, 2.0)
+    scheduler.on_ping_lost(1)
+    stats = scheduler.get_stats()[1]
+    assert stats['rtt'] == 1.25
+    assert stats['loss'] == 0.25
+
+    scheduler.remove(1)
+    scheduler.on_rtt(1, 1.0)
+    scheduler.on_ping_lost(1)
+    assert not scheduler.get_stats()
+
+
+def test_sample_degraded():
+    """
+    Test whether the active destinations of a circuit with a low goodput are moved, and whether the circuit is
+    avoided afterwards
+    """
+    scheduler = CircuitScheduler()
+    slow, fast = create_circuit(1), create_circuit(2)
+    for destination in [('1.1.1.1', 1), ('2.2.2.2', 2)]:
+        scheduler.assign(1, destination)
+        scheduler.on_data_sent(1, destination)
+    scheduler.assign(2, ('3.3.3.3', 3))
+    scheduler.on_data_sent(2, ('3.3.3.3', 3))
+
+    slow.bytes_up, slow.bytes_down = 1000, 100
+    fast.bytes_up, fast.bytes_down = 1000, 10000
+    moves = scheduler.sample([slow, fast], 1)
+    assert moves == {1: {('1.1.1.1', 1), ('2.2.2.2', 2)}}
+    assert scheduler.get_stats()[1]['degraded']
+    assert scheduler.get_stats()[2]['goodput'] == 5000
+
+    # The degraded circuit has fewer destinations, but it is avoided until it recovers
+    scheduler.unassign(1, ('1.1.1.1', 1))
+    scheduler.unassign(1, ('2.2.2.2', 2))
+    assert scheduler.select([slow, fast]) is fast
+    for _ in range(DEGRADED_SAMPLES):
+        assert not scheduler.sample([slow, fast], 1)
+    assert scheduler.select([slow, fast]) is slow
+
+
+def test_sample_stalled():
+    """
+    Test whether a circuit that does not return any data is degraded, unless no other circuit is healthy
+    """
+    scheduler = CircuitScheduler()
+    circuit = create_circuit(1)
+    scheduler.on_data_sent(1, ('1.1.1.1', 1))
+    for bytes_up in [100, 200]:
+        circuit.bytes_up = bytes_up
+        scheduler.on_data_sent(1, ('1.1.1.1', 1))
+        assert not scheduler.sample([circuit], 1)
+    assert scheduler.get_stats()[1]['degraded']
+
+    other = create_circuit(2)
+    circuit.bytes_up = 300
+    scheduler.on_data_sent(1, ('1.1.1.1', 1))
+    assert scheduler.sample([circuit, other], 1) == {1: {('1.1.1.1', 1)}}
@@ -0,0 +1,64 @@
+import os
+from asyncio import Future
+
+import pytest
+
+from ipv8.messaging.anonymization.tunnelcrypto import TunnelCrypto
+
+from tribler_core.components.tunnel.community.crypto_pipeline import CellCryptoPipeline
+
+
+@pytest.fixture
+def pipeline():
+    pipeline = CellCryptoPipeline(TunnelCrypto(), 2)
+    yield pipeline
+    pipeline.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_encrypt_decrypt_order(pipeline):
+    """
+    Test whether the cells of a circuit are processed, and handed back in the order in which they were submitted
+    """
+    key, salt = os.urandom(32), os.urandom(4)
+    results = []
+    done = Future()
+
+    def on_decrypted(message):
+        results.append(message)
+        if len(results) == 100:
+            done.set_result(None)
+
+    for index in range(100):
+        message = index.to_bytes(2, 'big') * 100
+        pipeline.encrypt(index % 3, message, key, salt, index,
+                         lambda encrypted, circuit_id=index % 3: pipeline.decrypt(circuit_id, encrypted, key, salt,
+                                                                                  on_decrypted))
+    await done
+
+    for circuit_id in range(3):
+        messages = [message for message in results if int.from_bytes(message[:2], 'big') % 3 == circuit_id]
+        assert messages == sorted(messages)
+    assert pipeline.get_stats()['cells'] == 200
+
+
+@pytest.mark.asyncio
+async def test_decrypt_invalid(pipeline):
+    """
+    Test whether the callback gets None for a cell that cannot be decrypted
+    """
+    result = Future()
+    pipeline.decrypt(1, os.urandom(100), os.urandom(32), os.urandom(4), result.set_result)
+    assert await result is None
+    assert pipeline.get_stats()['failed'] == 1
+
+
+@pytest.mark.asyncio
+async def test_submit_after_shutdown(pipeline):
+    """
+    Test whether cells that are submitted after a shutdown are dropped, rather than passed to the stopped workers
+    """
+    pipeline.shutdown()
+    pipeline.decrypt(1, os.urandom(100), os.urandom(32), os.urandom(4), lambda _: None)
+    assert not pipeline.flush_scheduled
+    assert not any(pipeline.pending)
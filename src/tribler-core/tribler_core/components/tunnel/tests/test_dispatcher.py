@@ -1,4 +1,5 @@
-from unittest.mock import Mock
+from asyncio import sleep
+from unittest.mock import Mock, call
 
 from ipv8.messaging.anonymization.tunnel import CIRCUIT_STATE_EXTENDING, CIRCUIT_STATE_READY, CIRCUIT_TYPE_DATA
 from ipv8.util import succeed
@@ -50,8 +51,8 @@ def test_on_tunnel_in(dispatcher):
     assert not dispatcher.on_incoming_from_tunnel(dispatcher.tunnels, mock_circuit, origin, b'a')
 
     mock_session.udp_connection = Mock()
-    mock_session.udp_connection.send_datagram = lambda _: True
     assert dispatcher.on_incoming_from_tunnel(dispatcher.tunnels, mock_circuit, origin, b'a')
+    mock_session.udp_connection.send_datagram.assert_called_once_with(b'\x00\x00\x00\x01\x00\x00\x00\x00\x04\x00a')
 
 
 def test_on_socks_in_udp(dispatcher, mock_circuit):
@@ -63,6 +64,7 @@ def test_on_socks_in_udp(dispatcher, mock_circuit):
     mock_udp_connection = Mock()
     dispatcher.set_socks_servers([mock_udp_connection.socksconnection.socksserver])
     dispatcher.tunnels.create_circuit = lambda **_: None
+    dispatcher.tunnels.circuit_pool.take_pending_circuit = lambda *_: None
     dispatcher.tunnels.circuits = {}
 
     # No circuit is selected
@@ -79,21 +81,90 @@ def test_on_socks_in_udp(dispatcher, mock_circuit):
     assert dispatcher.on_socks5_udp_data(mock_udp_connection, mock_request)
 
 
+@pytest.mark.asyncio
+async def test_flush_send_queues(dispatcher, mock_circuit):
+    """
+    Test whether data is sent at the end of the event loop iteration, in order per circuit
+    """
+    mock_circuit.state = CIRCUIT_STATE_READY
+    closed_circuit = Mock(circuit_id=4, state=CIRCUIT_STATE_EXTENDING)
+    dispatcher.tunnels.circuits = {3: mock_circuit, 4: closed_circuit}
+    dispatcher.tunnels.send_data = Mock()
+    connection = Mock()
+    dispatcher.con_to_cir[connection] = {("1.1.1.1", 1): mock_circuit, ("2.2.2.2", 2): closed_circuit}
+
+    closed_circuit.state = CIRCUIT_STATE_READY
+    for destination, data in [(("1.1.1.1", 1), b'a'), (("2.2.2.2", 2), b'b'), (("1.1.1.1", 1), b'c')]:
+        assert dispatcher.on_socks5_udp_data(Mock(socksconnection=connection), Mock(destination=destination,
+                                                                                     data=data))
+    closed_circuit.state = CIRCUIT_STATE_EXTENDING
+    dispatcher.tunnels.send_data.assert_not_called()
+
+    await sleep(0)
+    assert dispatcher.tunnels.send_data.call_args_list == [
+        call(mock_circuit.peer, 3, ("1.1.1.1", 1), ('0.0.0.0', 0), b'a'),
+        call(mock_circuit.peer, 3, ("1.1.1.1", 1), ('0.0.0.0', 0), b'c')
+    ]
+    assert not dispatcher.send_queues
+
+
+def test_select_circuit_least_loaded(dispatcher):
+    """
+    Test whether new destinations are assigned to the circuit with the fewest destinations
+    """
+    circuits = [Mock(circuit_id=i, goal_hops=1, state=CIRCUIT_STATE_READY, ctype=CIRCUIT_TYPE_DATA) for i in range(3)]
+    dispatcher.tunnels.circuits = {c.circuit_id: c for c in circuits}
+    connection = Mock()
+    dispatcher.set_socks_servers([connection.socksserver])
+
+    selected = [dispatcher.select_circuit(connection, Mock(destination=("1.1.1.1", port))) for port in range(6)]
+    assert sorted(c.circuit_id for c in selected) == [0, 0, 1, 1, 2, 2]
+    assert dispatcher.con_to_cir[connection][("1.1.1.1", 5)] is selected[5]
+
+
+def test_balance_circuits(dispatcher):
+    """
+    Test whether the active destinations of a degraded circuit are moved to another circuit of the connection
+    """
+    slow, fast = [Mock(circuit_id=i, goal_hops=1, state=CIRCUIT_STATE_READY, ctype=CIRCUIT_TYPE_DATA,
+                       bytes_up=0, bytes_down=0) for i in range(2)]
+    dispatcher.tunnels.circuits = {0: slow, 1: fast}
+    connection = Mock()
+    dispatcher.set_socks_servers([connection.socksserver])
+    dispatcher.assign_circuit(connection, ("1.1.1.1", 1), slow)
+    dispatcher.assign_circuit(connection, ("2.2.2.2", 2), slow)
+    dispatcher.assign_circuit(connection, ("3.3.3.3", 3), fast)
+    for destination in [("1.1.1.1", 1), ("3.3.3.3", 3)]:
+        dispatcher.scheduler.on_data_sent(dispatcher.con_to_cir[connection][destination].circuit_id, destination)
+    slow.bytes_up, slow.bytes_down = 1000, 10
+    fast.bytes_up, fast.bytes_down = 1000, 10000
+
+    dispatcher.balance_circuits()
+    assert dispatcher.con_to_cir[connection] == {("1.1.1.1", 1): fast, ("2.2.2.2", 2): slow, ("3.3.3.3", 3): fast}
+    assert dispatcher.scheduler.get_stats()[1]['destinations'] == 2
+
+
 @pytest.mark.asyncio
 async def test_on_socks_in_tcp(dispatcher):
     """
     Test whether TCP connect request are correctly dispatched to the TunnelCommunity
     """
     tcp_connection = Mock()
+    tcp_connection.transport.is_closing = lambda: False
     dispatcher.set_socks_servers([tcp_connection.socksserver])
 
     dispatcher.tunnels.perform_http_request = Mock(return_value=succeed(None))
     await dispatcher.on_socks5_tcp_data(tcp_connection, ("0.0.0.0", 1024), b'')
     tcp_connection.transport.write.assert_not_called()
+    tcp_connection.transport.close.assert_called_once()
+
+    async def perform_http_request(*_, on_data):
+        on_data(b'te')
+        on_data(b'st')
 
-    dispatcher.tunnels.perform_http_request = Mock(return_value=succeed(b'test'))
+    dispatcher.tunnels.perform_http_request = perform_http_request
     await dispatcher.on_socks5_tcp_data(tcp_connection, ("0.0.0.0", 1024), b'')
-    tcp_connection.transport.write.assert_called_once_with(b'test')
+    assert tcp_connection.transport.write.call_args_list == [call(b'te'), call(b'st')]
 
 
 def test_circuit_dead(dispatcher, mock_circuit):
@@ -112,6 +183,7 @@ def test_circuit_dead(dispatcher, mock_circuit):
     assert len(res) == 3
     assert len(dispatcher.con_to_cir[connection]) == 0
     assert mock_circuit.circuit_id not in dispatcher.cid_to_con
+    assert mock_circuit.circuit_id not in dispatcher.scheduler.get_stats()
 
 
 def test_check_connections(dispatcher, mock_circuit):
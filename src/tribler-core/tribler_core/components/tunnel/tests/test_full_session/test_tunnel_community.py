@@ -90,7 +90,7 @@ async def hidden_seeder_comm(proxy_factory, video_tdef):
         The callback of the seeder download. For now, this only logs the state of the download that's seeder and is
         useful for debugging purposes.
         """
-        comm.monitor_downloads([ds])
+        comm.on_download_state(ds.get_download(), ds.get_status())
         d = ds.get_download()
         print(f"seeder: {repr(d.get_def().get_name())} {dlstatus_strings[ds.get_status()]} {ds.get_progress()}")
         return 2
@@ -275,7 +275,7 @@ async def test_hidden_services(proxy_factory, hidden_seeder_comm, video_tdef, lo
     progress = Future()
 
     def download_state_callback(ds):
-        leecher_comm.monitor_downloads([ds])
+        leecher_comm.on_download_state(ds.get_download(), ds.get_status())
         logger.info("Time: %s, status: %s, progress: %s", time.time(), ds.get_status(), ds.get_progress())
         if ds.get_progress():
             progress.set_result(None)
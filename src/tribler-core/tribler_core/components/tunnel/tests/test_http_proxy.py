@@ -0,0 +1,226 @@
+from asyncio import StreamReader, ensure_future, sleep
+from unittest.mock import Mock, patch
+
+from ipv8.util import succeed
+
+import pytest
+
+from tribler_core.components.tunnel.community.http_proxy import (
+    HTTPConnectionPool,
+    HTTPResponseNotAllowed,
+    HTTPResponseStream,
+    HTTP_WINDOW_SIZE,
+    MAX_IDLE_CONNECTIONS_PER_HOST,
+    is_single_request,
+)
+
+TORRENT = b'd8:announce9:localhost4:infod6:lengthi1234e4:name4:test6:pieces20:aaaaaaaaaaaaaaaaaaaaee'
+
+
+def create_reader(*chunks, eof=True):
+    reader = StreamReader()
+    for chunk in chunks:
+        reader.feed_data(chunk)
+    if eof:
+        reader.feed_eof()
+    return reader
+
+
+def create_stream():
+    cells = []
+    stream = HTTPResponseStream(lambda *cell: cells.append(cell), 16)
+    return stream, cells
+
+
+@pytest.mark.asyncio
+async def test_stream_response():
+    """
+    Test whether a bencoded response is sent in cells, of which only the last one carries the total number of parts
+    """
+    response = b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n' % len(TORRENT) + TORRENT
+    stream, cells = create_stream()
+    keep_alive = await stream.read_from(create_reader(response[:30], response[30:], eof=False))
+    assert keep_alive
+    assert b''.join(cell[2] for cell in cells) == response
+    assert [cell[1] for cell in cells] == [0] * (len(cells) - 1) + [len(cells)]
+    assert [cell[0] for cell in cells] == list(range(len(cells)))
+
+
+@pytest.mark.asyncio
+async def test_stream_response_while_reading():
+    """
+    Test whether the checked part of a response is forwarded before the rest of the response has arrived
+    """
+    response = b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n' % len(TORRENT) + TORRENT
+    reader = create_reader(response[:-10], eof=False)
+    stream, cells = create_stream()
+    task = ensure_future(stream.read_from(reader))
+    await sleep(0)
+    assert cells
+    assert not any(cell[1] for cell in cells)
+    assert response.startswith(b''.join(cell[2] for cell in cells))
+
+    reader.feed_data(response[-10:])
+    assert await task
+    assert b''.join(cell[2] for cell in cells) == response
+
+
+@pytest.mark.asyncio
+async def test_stream_response_until_eof():
+    """
+    Test whether a response without a content length is read until the connection closes
+    """
+    response = b'HTTP/1.0 200 OK\r\n\r\n' + TORRENT
+    stream, cells = create_stream()
+    assert not await stream.read_from(create_reader(response))
+    assert b''.join(cell[2] for cell in cells) == response
+
+
+@pytest.mark.asyncio
+async def test_stream_response_not_allowed():
+    """
+    Test whether responses that are not bencoded are never completed, and their unchecked part is not forwarded
+    """
+    for response in [b'HTTP/1.1 200 OK\r\n\r\n<html>' + b'a' * 100,
+                     b'HTTP/1.1 200 OK\r\n\r\n' + TORRENT[:-1],
+                     b'HTTP/1.1 200 OK\r\nContent-Length: 1000\r\n\r\n' + TORRENT,
+                     b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n10\r\n',
+                     b'NOT HTTP\r\n\r\n']:
+        stream, cells = create_stream()
+        with pytest.raises(HTTPResponseNotAllowed):
+            await stream.read_from(create_reader(response))
+        assert not any(cell[1] for cell in cells)
+        assert len(b''.join(cell[2] for cell in cells)) <= len(response.partition(b'\r\n\r\n')[0]) + 4 + len(TORRENT)
+
+
+@pytest.mark.asyncio
+async def test_stream_redirect():
+    """
+    Test whether redirects are forwarded without checking their body
+    """
+    response = b'HTTP/1.1 307 Temporary Redirect\r\nLocation: http://localhost\r\nContent-Length: 4\r\n\r\nmove'
+    stream, cells = create_stream()
+    assert await stream.read_from(create_reader(response))
+    assert b''.join(cell[2] for cell in cells) == response
+
+
+@pytest.mark.asyncio
+async def test_stream_closed():
+    """
+    Test whether a connection that is closed before the response raises a ConnectionResetError
+    """
+    stream, cells = create_stream()
+    with pytest.raises(ConnectionResetError):
+        await stream.read_from(create_reader())
+    assert not cells
+
+
+@pytest.mark.asyncio
+async def test_stream_flow_control():
+    """
+    Test whether a stream sends at most a window of parts ahead of the last acknowledgement
+    """
+    body = b'd6:pieces1000:' + b'a' * 1000 + b'e'
+    response = b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n' % len(body) + body
+    stream, cells = create_stream()
+    task = ensure_future(stream.read_from(create_reader(response)))
+    await sleep(0.01)
+    assert len(cells) == HTTP_WINDOW_SIZE
+
+    stream.on_ack(10)
+    await sleep(0.01)
+    assert len(cells) == HTTP_WINDOW_SIZE + 10
+
+    stream.on_ack(len(response))
+    assert await task
+    assert b''.join(cell[2] for cell in cells) == response
+
+
+@pytest.mark.asyncio
+async def test_stream_ack_timeout():
+    """
+    Test whether a stream continues to send parts if acknowledgements get lost, or if the downloader does not send any
+    """
+    body = b'd6:pieces1000:' + b'a' * 1000 + b'e'
+    response = b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n' % len(body) + body
+    for ack in [True, False]:
+        stream, cells = create_stream()
+        if ack:
+            stream.on_ack(0)
+        with patch('tribler_core.components.tunnel.community.http_proxy.HTTP_ACK_TIMEOUT', 0.01):
+            await stream.read_from(create_reader(response))
+        assert b''.join(cell[2] for cell in cells) == response
+        assert (stream.acked is not None) == ack
+
+
+def test_pool_release():
+    """
+    Test whether the pool keeps a bounded number of idle connections per host
+    """
+    pool = HTTPConnectionPool()
+    writers = [Mock() for _ in range(MAX_IDLE_CONNECTIONS_PER_HOST + 1)]
+    for writer in writers:
+        pool.release(('1.2.3.4', 80), Mock(), writer)
+    pool.release(('5.6.7.8', 80), Mock(), Mock())
+    assert pool.get_num_idle(('1.2.3.4', 80)) == MAX_IDLE_CONNECTIONS_PER_HOST
+    assert pool.get_num_idle() == MAX_IDLE_CONNECTIONS_PER_HOST + 1
+    writers[0].close.assert_called_once()
+
+    pool.close()
+    assert not pool.get_num_idle()
+    writers[-1].close.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_pool_acquire():
+    """
+    Test whether idle connections are reused, unless they are closed or expired
+    """
+    pool = HTTPConnectionPool()
+    reader, writer = Mock(at_eof=lambda: False), Mock()
+    pool.release(('1.2.3.4', 80), reader, writer)
+    assert await pool.acquire(('1.2.3.4', 80)) == (reader, writer, True)
+
+    new_connection = (Mock(), Mock())
+    with patch('tribler_core.components.tunnel.community.http_proxy.open_connection',
+               Mock(return_value=succeed(new_connection))):
+        pool.release(('1.2.3.4', 80), Mock(at_eof=lambda: True), Mock())
+        assert await pool.acquire(('1.2.3.4', 80)) == (*new_connection, False)
+
+        pool.release(('1.2.3.4', 80), reader, writer)
+        with patch('time.time', lambda: 1e12):
+            assert await pool.acquire(('1.2.3.4', 80)) == (*new_connection, False)
+        writer.close.assert_called_once()
+
+
+def test_is_single_request():
+    """
+    Test whether only requests that consist of exactly one HTTP request are recognized as such
+    """
+    assert is_single_request(b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    assert is_single_request(b'POST / HTTP/1.1\r\nContent-Length: 4\r\n\r\nbody')
+    assert not is_single_request(b'GET / HTTP/1.1\r\nHost: localhost')
+    assert not is_single_request(b'GET / HTTP/1.1\r\n\r\nGET /other HTTP/1.1\r\n\r\n')
+    assert not is_single_request(b'GET / HTTP/1.1\nHost: localhost\n\nGET /other HTTP/1.1\r\n\r\n')
+    assert not is_single_request(b'POST / HTTP/1.1\r\nContent-Length: 0\r\nContent-Length: 4\r\n\r\nbody')
+    assert not is_single_request(b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n0\r\n\r\n')
+    assert not is_single_request(b'POST / HTTP/1.1\r\nContent-Length: x\r\n\r\n')
+
+
+@pytest.mark.asyncio
+async def test_pool_pipelined_request():
+    """
+    Test whether a request that is followed by another request gets a connection of its own, which is not reused
+    """
+    response = b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n' % len(TORRENT) + TORRENT
+    pool = HTTPConnectionPool()
+    pool.release(('1.2.3.4', 80), Mock(at_eof=lambda: False), Mock())
+    writer = Mock()
+    with patch('tribler_core.components.tunnel.community.http_proxy.open_connection',
+               Mock(return_value=succeed((create_reader(response, eof=False), writer)))):
+        stream, cells = create_stream()
+        await pool.request(('1.2.3.4', 80), b'GET / HTTP/1.1\r\n\r\nGET /other HTTP/1.1\r\n\r\n', stream)
+
+    assert cells
+    writer.close.assert_called_once()
+    assert pool.get_num_idle() == 1
@@ -0,0 +1,106 @@
+from unittest.mock import Mock
+
+from ipv8.messaging.anonymization.tunnelcrypto import CryptoException, TunnelCrypto
+
+import pytest
+
+from tribler_core.components.tunnel.community.metrics import (
+    Histogram,
+    TIMING_INTERVAL,
+    TimedTunnelCrypto,
+    TunnelMetrics,
+)
+
+
+def test_histogram():
+    """
+    Test whether the histogram keeps the most recent samples, and the number and the sum of all samples
+    """
+    histogram = Histogram(size=4)
+    assert histogram.get_stats() == {'count': 0, 'mean': 0.0, 'max': 0.0, 'p50': 0.0, 'p90': 0.0, 'p99': 0.0}
+
+    for value in [10, 1, 2, 3, 4]:
+        histogram.add(value * 10 ** 9)
+    stats = histogram.get_stats()
+    assert stats['count'] == 5
+    assert stats['mean'] == 4.0
+    assert stats['max'] == 4.0
+    assert stats['p50'] == 2.0
+    assert stats['p99'] == 3.0
+
+
+def test_timed_tunnel_crypto():
+    """
+    Test whether one in TIMING_INTERVAL encryptions and decryptions of cells is timed, also when it fails
+    """
+    histogram = Histogram()
+    crypto = TimedTunnelCrypto(TunnelCrypto(), histogram)
+    key, salt = b'k' * 32, b's' * 4
+    for salt_explicit in range(TIMING_INTERVAL - 1):
+        crypto.decrypt_str(crypto.encrypt_str(b'data', key, salt, salt_explicit), key, salt)
+    assert histogram.count == 1
+
+    crypto.calls = TIMING_INTERVAL - 1
+    with pytest.raises(CryptoException):
+        crypto.decrypt_str(b'data', key, salt)
+    assert histogram.count == 2
+
+
+def test_timed_tunnel_crypto_wrapper():
+    """
+    Test whether the timed crypto passes all other calls on to the crypto that it wraps
+    """
+    wrapped = Mock(encrypt_str=Mock(return_value=b'encrypted'))
+    crypto = TimedTunnelCrypto(wrapped, Histogram())
+    assert crypto.encrypt_str(b'data', b'k' * 32, b's' * 4, 1) == b'encrypted'
+    assert crypto.generate_session_keys is wrapped.generate_session_keys
+
+
+def test_circuit_metrics():
+    """
+    Test whether the throughput, RTT, queue depth and drops of the circuits are collected
+    """
+    metrics = TunnelMetrics()
+    circuit, exit_socket = Mock(bytes_up=0, bytes_down=0), Mock(bytes_up=0, bytes_down=0)
+    metrics.sample({1: ('circuit', circuit), 2: ('exit', exit_socket)}, now=0)
+    circuit.bytes_up, circuit.bytes_down = 1000, 4000
+    metrics.on_rtt(1, 0.5)
+    metrics.on_circuit_ready(1.5)
+    metrics.on_queue_depth(1, 3)
+    metrics.on_queue_depth(1, 2)
+    metrics.on_drop(2, 'decrypt')
+    metrics.on_drop(None, 'no_circuit', 2)
+    metrics.sample({1: ('circuit', circuit), 2: ('exit', exit_socket)}, now=2)
+
+    stats = metrics.get_stats()
+    assert stats['circuits'] == [
+        {'circuit_id': 1, 'type': 'circuit', 'upload_rate': 500, 'download_rate': 2000, 'rtt': 0.5,
+         'queue_depth': 3, 'dropped': 0},
+        {'circuit_id': 2, 'type': 'exit', 'upload_rate': 0, 'download_rate': 0, 'rtt': None,
+         'queue_depth': 0, 'dropped': 1}
+    ]
+    assert stats['drops'] == {'decrypt': 1, 'no_circuit': 2}
+    assert stats['rtt']['count'] == 1
+    assert stats['circuit_ready']['p50'] == 1.5
+
+    # The metrics of circuits that are gone are removed
+    metrics.sample({2: ('exit', exit_socket)}, now=3)
+    assert [c['circuit_id'] for c in metrics.get_stats()['circuits']] == [2]
+
+
+def test_to_prometheus():
+    """
+    Test whether the metrics are exported in the Prometheus text format
+    """
+    metrics = TunnelMetrics()
+    metrics.sample({1: ('relay', Mock(bytes_up=0, bytes_down=0))}, now=0)
+    metrics.cell_handling.add(2000)
+    metrics.on_drop(1, 'relay_early')
+
+    lines = metrics.to_prometheus().splitlines()
+    assert '# TYPE tribler_tunnel_cell_handling_seconds summary' in lines
+    assert 'tribler_tunnel_cell_handling_seconds{quantile="0.5"} 2e-06' in lines
+    assert 'tribler_tunnel_cell_handling_seconds_count 1' in lines
+    assert 'tribler_tunnel_dropped_cells_total{reason="relay_early"} 1' in lines
+    assert 'tribler_tunnel_circuit_dropped_cells_total{circuit_id="1",type="relay"} 1' in lines
+    assert not any(line.startswith('tribler_tunnel_circuit_rtt_seconds') for line in lines)
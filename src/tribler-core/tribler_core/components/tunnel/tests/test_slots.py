@@ -0,0 +1,82 @@
+import random
+
+from tribler_core.components.tunnel.community.slots import CompetingSlots, RandomSlots
+
+
+def test_random_slots():
+    """
+    Test whether random slots are given to the first circuits, until they are released
+    """
+    slots = RandomSlots(2)
+    assert slots.take(1)
+    assert slots.take(2)
+    assert not slots.take(3)
+    assert sorted(slots.get_slots()) == [1, 2]
+
+    slots.release(1)
+    slots.release(4)
+    assert 1 not in slots
+    assert slots.get_slots() == [2, None]
+    assert slots.take(3)
+
+
+def test_competing_slots():
+    """
+    Test whether a circuit takes a free competing slot, or the slot of the circuit with the lowest balance
+    """
+    slots = CompetingSlots(2)
+    assert slots.take(1, 10) == (True, None)
+    assert slots.get_slots() == [(10, 1), (0, None)]
+    assert slots.take(2, 5) == (True, None)
+    assert slots.get_lowest_balance() == 5
+
+    assert slots.take(3, 5) == (False, None)
+    assert slots.take(3, 6) == (True, 2)
+    assert 2 not in slots
+    assert slots.get_lowest_balance() == 6
+
+    slots.release(3)
+    assert slots.get_slots() == [(10, 1), (0, None)]
+    assert slots.take(4, -1) == (True, None)
+    assert slots.get_lowest_balance() == -1
+
+
+def test_competing_slots_no_slots():
+    """
+    Test whether no circuit gets a competing slot if there are none
+    """
+    slots = CompetingSlots(0)
+    assert slots.take(1, 10) == (False, None)
+    assert slots.get_lowest_balance() is None
+
+
+def test_competing_slots_churn():
+    """
+    Test whether the heap of competing slots gives the same result as scanning a list of slots, during churn
+    """
+    rng = random.Random(42)
+    slots = CompetingSlots(20)
+    expected = {}
+    for circuit_id in range(2000):
+        if expected and rng.random() < 0.4:
+            released = rng.choice(list(expected))
+            slots.release(released)
+            del expected[released]
+            continue
+
+        balance = rng.randint(-100, 100)
+        taken, kicked = slots.take(circuit_id, balance)
+        lowest = min(expected.values(), default=None)
+        if len(expected) < 20:
+            assert (taken, kicked) == (True, None)
+        elif balance > lowest:
+            assert taken
+            assert expected.pop(kicked) == lowest
+        else:
+            assert (taken, kicked) == (False, None)
+        if taken:
+            expected[circuit_id] = balance
+
+        assert len(slots) == len(expected)
+        assert slots.get_lowest_balance() == min(expected.values(), default=None)
+        assert all(slots.heap[slots.positions[cid]] == [bal, cid] for cid, bal in expected.items())
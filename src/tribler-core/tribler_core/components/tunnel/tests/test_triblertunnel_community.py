@@ -1,8 +1,9 @@
 import os
-from asyncio import Future, TimeoutError as AsyncTimeoutError, sleep, wait_for
+import time
+from asyncio import Future, TimeoutError as AsyncTimeoutError, ensure_future, sleep, wait_for
 from collections import defaultdict
 from random import random
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 from ipv8.messaging.anonymization.payload import EstablishIntroPayload
 from ipv8.messaging.anonymization.tunnel import (
@@ -10,6 +11,7 @@ from ipv8.messaging.anonymization.tunnel import (
     CIRCUIT_TYPE_RP_DOWNLOADER,
     CIRCUIT_TYPE_RP_SEEDER,
     PEER_FLAG_EXIT_BT,
+    PEER_FLAG_SPEED_TEST,
 )
 from ipv8.peer import Peer
 from ipv8.test.base import TestBase
@@ -20,13 +22,22 @@ from ipv8.test.mocking.ipv8 import MockIPv8
 from ipv8.util import succeed
 
 from tribler_common.network_utils import NetworkUtils
+from tribler_common.simpledefs import DLSTATUS_DOWNLOADING, DLSTATUS_SEEDING, DLSTATUS_STOPPED
 
 from tribler_core.components.bandwidth_accounting.community.bandwidth_accounting_community \
     import BandwidthAccountingCommunity
 from tribler_core.components.bandwidth_accounting.db.database import BandwidthDatabase
 from tribler_core.components.bandwidth_accounting.settings import BandwidthAccountingSettings
-from tribler_core.components.tunnel.community.tunnel_community import PEER_FLAG_EXIT_HTTP, TriblerTunnelCommunity
+from tribler_core.components.tunnel.community.crypto_pipeline import CellCryptoPipeline
+from tribler_core.components.tunnel.community.http_proxy import HTTPResponseStream
+from tribler_core.components.tunnel.community.tunnel_community import (
+    ANNOUNCE_CHECK_INTERVAL,
+    MAX_HTTP_REQUESTS_PER_CIRCUIT,
+    PEER_FLAG_EXIT_HTTP,
+    TriblerTunnelCommunity,
+)
 from tribler_core.components.tunnel.community.payload import BandwidthTransactionPayload
+from tribler_core.components.tunnel.community.slots import CompetingSlots, RandomSlots
 from tribler_core.components.tunnel.settings import TunnelCommunitySettings
 from tribler_core.tests.tools.base_test import MockObject
 from tribler_core.tests.tools.tracker.http_tracker import HTTPTracker
@@ -83,6 +94,17 @@ class TestTriblerTunnelCommunity(TestBase):  # pylint: disable=too-many-public-m
             for circuit_id in exit_sockets:
                 exit_sockets[circuit_id] = MockTunnelExitSocket(exit_sockets[circuit_id])
 
+    def set_competing_slots(self, node_nr, slots):
+        """
+        Remove the random slots of a node, and give it the (balance, circuit id) competing slots.
+        """
+        overlay = self.nodes[node_nr].overlay
+        overlay.random_slots = RandomSlots(0)
+        overlay.competing_slots = CompetingSlots(len(slots))
+        for balance, circuit_id in slots:
+            if circuit_id is not None:
+                overlay.competing_slots.take(circuit_id, balance)
+
     async def assign_exit_node(self, node_nr):
         """
         Give a node a dedicated exit node to play with.
@@ -158,34 +180,80 @@ class TestTriblerTunnelCommunity(TestBase):  # pylint: disable=too-many-public-m
         self.nodes[0].overlay.circuits[0] = mock_circuit
         self.nodes[0].overlay.join_swarm(b'a', 1)
         self.nodes[0].overlay.download_states[b'a'] = 3
-        self.nodes[0].overlay.monitor_downloads([])
+        self.nodes[0].overlay.update_download_state(b'a', None, 1)
         self.nodes[0].overlay.remove_circuit.assert_called_with(0, 'leaving hidden swarm', destroy=5)
 
     def test_monitor_downloads_recreate_ip(self):
         """
         Test whether an old introduction point is recreated
         """
-        mock_state = MockObject()
-        mock_download = MockObject()
-        mock_tdef = MockObject()
-        mock_tdef.get_infohash = lambda: b'a'
-        mock_download.get_def = lambda: mock_tdef
-        mock_download.add_peer = lambda _: succeed(None)
-        mock_download.get_state = lambda: mock_state
-        mock_download.config = MockObject()
-        mock_download.config.get_hops = lambda: 1
-        mock_download.apply_ip_filter = lambda _: None
-        mock_state.get_status = lambda: 4
-        mock_state.get_download = lambda: mock_download
-
-        def mock_create_ip(*_, **__):
-            mock_create_ip.called = True
-        mock_create_ip.called = False
-        self.nodes[0].overlay.create_introduction_point = mock_create_ip
+        mock_download = Mock()
+        mock_download.get_def().get_infohash.return_value = b'a'
+        mock_download.config.get_hops.return_value = 1
+        self.nodes[0].overlay.create_introduction_point = Mock()
 
-        self.nodes[0].overlay.download_states[b'a'] = 3
-        self.nodes[0].overlay.monitor_downloads([mock_state])
-        self.assertTrue(mock_create_ip.called)
+        self.nodes[0].overlay.on_download_state(mock_download, DLSTATUS_SEEDING)
+        self.nodes[0].overlay.create_introduction_point.assert_called_once()
+
+        self.nodes[0].overlay.maintain_downloads()
+        self.assertEqual(self.nodes[0].overlay.create_introduction_point.call_count, 2)
+
+    def test_monitor_downloads_circuits_needed(self):
+        """
+        Test whether the number of circuits needed is updated with the active downloads per hop count
+        """
+        overlay = self.nodes[0].overlay
+        overlay.settings.min_circuits = 0
+        overlay.settings.max_circuits = 10
+        downloads = [Mock() for _ in range(3)]
+        for index, (download, hops) in enumerate(zip(downloads, [1, 1, 2])):
+            download.get_def().get_infohash.return_value = bytes([index])
+            download.config.get_hops.return_value = hops
+            overlay.on_download_state(download, DLSTATUS_DOWNLOADING)
+        self.assertEqual(overlay.circuits_needed, {1: 2, 2: 1})
+
+        overlay.on_download_state(downloads[0], DLSTATUS_STOPPED)
+        overlay.on_download_state(downloads[2], None)
+        self.assertEqual(overlay.circuits_needed, {1: 1})
+        self.assertEqual(overlay.download_states, {overlay.get_lookup_info_hash(b'\x00'): DLSTATUS_STOPPED,
+                                                   overlay.get_lookup_info_hash(b'\x01'): DLSTATUS_DOWNLOADING})
+
+    async def test_circuit_pool_download_start(self):
+        """
+        Test whether a circuit is kept ready for the next download, when an anonymous download starts
+        """
+        self.add_node_to_experiment(self.create_node())
+        self.nodes[1].overlay.settings.peer_flags.add(PEER_FLAG_EXIT_BT)
+        await self.introduce_nodes()
+
+        mock_download = Mock()
+        mock_download.get_def().get_infohash.return_value = b'a'
+        mock_download.config.get_hops.return_value = 1
+        self.nodes[0].overlay.on_download_state(mock_download, DLSTATUS_DOWNLOADING)
+        self.assertEqual(len(self.nodes[0].overlay.circuit_pool.pending), 1)
+
+        await self.deliver_messages()
+        self.assertFalse(self.nodes[0].overlay.circuit_pool.pending)
+        self.assertTrue(self.nodes[0].overlay.circuit_pool.get_ready_circuits(1, PEER_FLAG_EXIT_BT))
+
+    def test_maintain_downloads_announce(self):
+        """
+        Test whether active downloads without peers are announced to the DHT, at most once per interval
+        """
+        overlay = self.nodes[0].overlay
+        overlay.find_circuits = lambda **_: [Mock()]
+        mock_download = Mock()
+        mock_download.get_def().get_infohash.return_value = b'a'
+        mock_download.config.get_hops.return_value = 1
+        mock_download.get_peerlist.return_value = []
+        overlay.on_download_state(mock_download, DLSTATUS_DOWNLOADING)
+        overlay.maintain_downloads()
+        mock_download.force_dht_announce.assert_not_called()
+
+        with patch('time.time', return_value=time.time() + ANNOUNCE_CHECK_INTERVAL):
+            overlay.maintain_downloads()
+            overlay.maintain_downloads()
+        mock_download.force_dht_announce.assert_called_once()
 
     def test_monitor_downloads_leave_swarm(self):
         """
@@ -193,7 +261,7 @@ class TestTriblerTunnelCommunity(TestBase):  # pylint: disable=too-many-public-m
         """
         self.nodes[0].overlay.swarms[b'a'] = None
         self.nodes[0].overlay.download_states[b'a'] = 3
-        self.nodes[0].overlay.monitor_downloads([])
+        self.nodes[0].overlay.update_download_state(b'a', None, 1)
         self.assertNotIn(b'a', self.nodes[0].overlay.swarms)
 
     def test_monitor_downloads_intro(self):
@@ -217,7 +285,7 @@ class TestTriblerTunnelCommunity(TestBase):  # pylint: disable=too-many-public-m
         self.nodes[0].overlay.join_swarm(b'a', 1)
         self.nodes[0].overlay.swarms[b'a'].add_connection(mock_circuit, None)
         self.nodes[0].overlay.download_states[b'a'] = 3
-        self.nodes[0].overlay.monitor_downloads([])
+        self.nodes[0].overlay.update_download_state(b'a', None, 1)
         self.assertEqual(mocked_remove_circuit.circuit_id, 0)
 
     def test_monitor_downloads_stop_all(self):
@@ -240,7 +308,7 @@ class TestTriblerTunnelCommunity(TestBase):  # pylint: disable=too-many-public-m
         self.nodes[0].overlay.circuits[0] = mock_circuit
         self.nodes[0].overlay.join_swarm(b'a', 1)
         self.nodes[0].overlay.download_states[b'a'] = 3
-        self.nodes[0].overlay.monitor_downloads([])
+        self.nodes[0].overlay.update_download_state(b'a', None, 1)
         self.assertEqual(mocked_remove_circuit.circuit_id, 0)
 
     def test_update_ip_filter(self):
@@ -413,8 +481,7 @@ class TestTriblerTunnelCommunity(TestBase):  # pylint: disable=too-many-public-m
         self.add_node_to_experiment(self.create_node())
         self.nodes[1].overlay.settings.peer_flags.add(PEER_FLAG_EXIT_BT)
         await self.introduce_nodes()
-        self.nodes[1].overlay.random_slots = []
-        self.nodes[1].overlay.competing_slots = [(1000, 1234)]
+        self.set_competing_slots(1, [(1000, 1234)])
         self.nodes[0].overlay.build_tunnels(1)
         await self.deliver_messages()
 
@@ -428,8 +495,7 @@ class TestTriblerTunnelCommunity(TestBase):  # pylint: disable=too-many-public-m
         self.add_node_to_experiment(self.create_node())
         self.nodes[1].overlay.settings.peer_flags.add(PEER_FLAG_EXIT_BT)
         await self.introduce_nodes()
-        self.nodes[1].overlay.random_slots = []
-        self.nodes[1].overlay.competing_slots = [(-1000, 1234)]
+        self.set_competing_slots(1, [(-1000, 1234)])
         self.nodes[0].overlay.build_tunnels(1)
         await self.deliver_messages()
 
@@ -443,8 +509,7 @@ class TestTriblerTunnelCommunity(TestBase):  # pylint: disable=too-many-public-m
         self.add_node_to_experiment(self.create_node())
         self.nodes[1].overlay.settings.peer_flags.add(PEER_FLAG_EXIT_BT)
         await self.introduce_nodes()
-        self.nodes[1].overlay.random_slots = []
-        self.nodes[1].overlay.competing_slots = [(0, None)]
+        self.set_competing_slots(1, [(0, None)])
         self.nodes[0].overlay.build_tunnels(1)
         await self.deliver_messages()
 
@@ -459,8 +524,7 @@ class TestTriblerTunnelCommunity(TestBase):  # pylint: disable=too-many-public-m
         self.add_node_to_experiment(self.create_node())
         self.nodes[2].overlay.settings.peer_flags.add(PEER_FLAG_EXIT_BT)
         await self.introduce_nodes()
-        self.nodes[2].overlay.random_slots = []
-        self.nodes[2].overlay.competing_slots = [(-1000, 1234)]
+        self.set_competing_slots(2, [(-1000, 1234)])
         self.nodes[0].overlay.build_tunnels(2)
         await self.deliver_messages()
 
@@ -475,8 +539,7 @@ class TestTriblerTunnelCommunity(TestBase):  # pylint: disable=too-many-public-m
         self.add_node_to_experiment(self.create_node())
         self.nodes[2].overlay.settings.peer_flags.add(PEER_FLAG_EXIT_BT)
         await self.introduce_nodes()
-        self.nodes[1].overlay.random_slots = []
-        self.nodes[1].overlay.competing_slots = [(-1000, 1234)]
+        self.set_competing_slots(1, [(-1000, 1234)])
         self.nodes[0].overlay.build_tunnels(2)
         await self.deliver_messages()
 
@@ -495,8 +558,7 @@ class TestTriblerTunnelCommunity(TestBase):  # pylint: disable=too-many-public-m
         # Make sure that there's a token disbalance between node 0 and 1
         await self.nodes[0].overlay.bandwidth_community.do_payout(self.nodes[1].my_peer, 1024 * 1024)
 
-        self.nodes[2].overlay.random_slots = []
-        self.nodes[2].overlay.competing_slots = [(0, None)]
+        self.set_competing_slots(2, [(0, None)])
         self.nodes[0].overlay.build_tunnels(1)
         await self.deliver_messages()
 
@@ -552,8 +614,7 @@ class TestTriblerTunnelCommunity(TestBase):  # pylint: disable=too-many-public-m
         self.nodes[1].overlay.reject_callback = on_reject
 
         # Initialize the slots
-        self.nodes[1].overlay.random_slots = []
-        self.nodes[1].overlay.competing_slots = [(100000000, 12345)]
+        self.set_competing_slots(1, [(100000000, 12345)])
 
         self.nodes[0].overlay.build_tunnels(1)
         await self.deliver_messages()
@@ -563,6 +624,82 @@ class TestTriblerTunnelCommunity(TestBase):  # pylint: disable=too-many-public-m
         # Node 0 should be rejected and the reject callback should be invoked by node 1
         await reject_future
 
+    async def test_crypto_pipeline(self):
+        """
+        Test whether cells that are relayed and exited can be encrypted and decrypted by the crypto pipeline
+        """
+        self.add_node_to_experiment(self.create_node())
+        self.add_node_to_experiment(self.create_node())
+        self.nodes[2].overlay.settings.peer_flags.add(PEER_FLAG_SPEED_TEST)
+        for node in self.nodes[1:]:
+            node.overlay.crypto_pipeline = CellCryptoPipeline(node.overlay.crypto, 2)
+        await self.introduce_nodes()
+        circuit = self.nodes[0].overlay.create_circuit(2, exit_flags=[PEER_FLAG_SPEED_TEST])
+        await circuit.ready
+
+        data, _ = await self.nodes[0].overlay.send_test_request(circuit, 3, 6)
+        self.assertEqual(len(data), 6)
+        for node in self.nodes[1:]:
+            self.assertGreater(node.overlay.crypto_pipeline.get_stats()['cells'], 0)
+
+    async def test_ping_rtt(self):
+        """
+        Test whether the round-trip times of the pings over a circuit are passed to the circuit scheduler
+        """
+        self.add_node_to_experiment(self.create_node())
+        self.nodes[1].overlay.settings.peer_flags.add(PEER_FLAG_SPEED_TEST)
+        await self.introduce_nodes()
+        circuit = self.nodes[0].overlay.create_circuit(1, exit_flags=[PEER_FLAG_SPEED_TEST])
+        await circuit.ready
+        # The scheduler tracks the circuit once it has been considered for carrying data
+        self.nodes[0].overlay.dispatcher.scheduler.select([circuit])
+
+        self.nodes[0].overlay.do_ping()
+        await self.deliver_messages()
+        self.assertIsNotNone(self.nodes[0].overlay.dispatcher.scheduler.get_stats()[circuit.circuit_id]['rtt'])
+
+    async def test_ping_exclude_rp_circuits(self):
+        """
+        Test whether rendezvous circuits that are not end-to-end yet are not pinged
+        """
+        self.add_node_to_experiment(self.create_node())
+        self.nodes[1].overlay.settings.peer_flags.add(PEER_FLAG_SPEED_TEST)
+        await self.introduce_nodes()
+        circuit = self.nodes[0].overlay.create_circuit(1, exit_flags=[PEER_FLAG_SPEED_TEST])
+        await circuit.ready
+
+        self.nodes[0].overlay.send_cell = Mock()
+        circuit.ctype = CIRCUIT_TYPE_RP_DOWNLOADER
+        self.nodes[0].overlay.do_ping()
+        self.nodes[0].overlay.send_cell.assert_not_called()
+
+        circuit.e2e = True
+        self.nodes[0].overlay.do_ping()
+        self.nodes[0].overlay.send_cell.assert_called_once()
+
+    async def test_metrics(self):
+        """
+        Test whether the metrics of the circuits and the time spent on cells are collected
+        """
+        self.add_node_to_experiment(self.create_node())
+        self.nodes[1].overlay.settings.peer_flags.add(PEER_FLAG_SPEED_TEST)
+        await self.introduce_nodes()
+        circuit = self.nodes[0].overlay.create_circuit(1, exit_flags=[PEER_FLAG_SPEED_TEST])
+        await circuit.ready
+
+        self.nodes[0].overlay.do_ping()
+        await self.deliver_messages()
+        for node in self.nodes:
+            node.overlay.sample_metrics()
+
+        stats = self.nodes[0].overlay.metrics.get_stats()
+        self.assertEqual([(circuit.circuit_id, 'circuit')], [(c['circuit_id'], c['type']) for c in stats['circuits']])
+        self.assertIsNotNone(stats['circuits'][0]['rtt'])
+        self.assertEqual(stats['circuit_ready']['count'], 1)
+        self.assertGreater(self.nodes[0].overlay.metrics.cells, 0)
+        self.assertGreater(self.nodes[0].overlay.crypto.calls, 0)
+        self.assertEqual(['exit'], [c['type'] for c in self.nodes[1].overlay.metrics.get_stats()['circuits']])
+
     async def test_perform_http_request(self):
         """
         Test whether we can make a http request through a circuit
@@ -604,6 +741,35 @@ class TestTriblerTunnelCommunity(TestBase):  # pylint: disable=too-many-public-m
                          (await http_tracker.handle_scrape_request(Mock(query={'info_hash': '0'}))).body)
         await http_tracker.stop()
 
+    async def test_perform_http_request_stream(self):
+        """
+        Test whether a streamed HTTP response arrives in order and is acknowledged, and whether the exit reuses its
+        upstream connection
+        """
+        self.add_node_to_experiment(self.create_node())
+        self.nodes[1].overlay.settings.peer_flags.add(PEER_FLAG_EXIT_HTTP)
+        await self.introduce_nodes()
+
+        http_port = TestTriblerTunnelCommunity.get_free_port()
+        http_tracker = HTTPTracker(http_port)
+        http_tracker.tracker_info.add_info_about_infohash('0', 0, 0)
+        http_tracker.tracker_info.infohashes['0']['downloaded'] = os.urandom(100000)
+        await http_tracker.start()
+        expected = (await http_tracker.handle_scrape_request(Mock(query={'info_hash': '0'}))).body
+        with patch.object(HTTPResponseStream, 'on_ack', autospec=True, side_effect=HTTPResponseStream.on_ack) as on_ack:
+            for _ in range(2):
+                parts = []
+                response = await self.nodes[0].overlay.perform_http_request(('127.0.0.1', http_tracker.port),
+                                                                            b'GET /scrape?info_hash=0 HTTP/1.1\r\n\r\n',
+                                                                            on_data=parts.append)
+                self.assertIsNone(response)
+                self.assertGreater(len(parts), 1)
+                self.assertEqual(b''.join(parts).split(b'\r\n\r\n')[1], expected)
+                self.assertEqual(self.nodes[1].overlay.http_pool.get_num_idle(), 1)
+        self.assertTrue(on_ack.called)
+        self.assertFalse(self.nodes[1].overlay.http_streams)
+        await http_tracker.stop()
+
     async def test_perform_http_request_not_allowed(self):
         """
         Test whether we can make HTTP requests that don't have a bencoded response
@@ -621,6 +787,36 @@ class TestTriblerTunnelCommunity(TestBase):  # pylint: disable=too-many-public-m
                            timeout=.3)
         await http_tracker.stop()
 
+    async def test_perform_http_request_limit(self):
+        """
+        Test whether an exit node limits the number of HTTP requests that it handles at the same time for a circuit
+        """
+        self.add_node_to_experiment(self.create_node())
+        self.nodes[1].overlay.settings.peer_flags.add(PEER_FLAG_EXIT_HTTP)
+        await self.introduce_nodes()
+        circuit = self.nodes[0].overlay.create_circuit(1, exit_flags=[PEER_FLAG_EXIT_HTTP])
+        await circuit.ready
+
+        release = Future()
+        requests = []
+
+        async def request(*_):
+            requests.append(None)
+            await release
+
+        self.nodes[1].overlay.http_pool.request = request
+        tasks = [ensure_future(self.nodes[0].overlay.perform_http_request(('127.0.0.1', 0), b'GET / HTTP/1.1\r\n\r\n'))
+                 for _ in range(MAX_HTTP_REQUESTS_PER_CIRCUIT + 1)]
+        await self.deliver_messages()
+        self.assertEqual(len(requests), MAX_HTTP_REQUESTS_PER_CIRCUIT)
+        self.assertEqual(list(self.nodes[1].overlay.http_requests.values()), [MAX_HTTP_REQUESTS_PER_CIRCUIT])
+
+        release.set_result(None)
+        await self.deliver_messages()
+        self.assertFalse(self.nodes[1].overlay.http_requests)
+        for task in tasks:
+            task.cancel()
+
     async def test_perform_http_request_no_http_exits(self):
         """
         Test whether we can make HTTP requests when we have no exits
@@ -0,0 +1,52 @@
+from unittest.mock import Mock
+
+import pytest
+
+from tribler_core.components.restapi.rest.base_api_test import do_request
+from tribler_core.components.tunnel.community.metrics import TunnelMetrics
+from tribler_core.components.tunnel.restapi.tunnel_endpoint import TunnelEndpoint
+
+pytestmark = pytest.mark.asyncio
+
+
+# pylint: disable=redefined-outer-name
+@pytest.fixture
+def metrics():
+    metrics = TunnelMetrics()
+    metrics.sample({1: ('circuit', Mock(bytes_up=0, bytes_down=0))}, now=0)
+    metrics.on_rtt(1, 0.25)
+    return metrics
+
+
+@pytest.fixture
+async def tunnel_client(metrics, aiohttp_client):
+    endpoint = TunnelEndpoint(Mock(metrics=metrics))
+    return await aiohttp_client(endpoint.app)
+
+
+async def test_get_metrics(tunnel_client):
+    """
+    Testing whether the API returns the metrics of the tunnel community
+    """
+    response_dict = await do_request(tunnel_client, 'metrics', expected_code=200)
+    metrics = response_dict['metrics']
+    assert metrics['circuits'][0]['circuit_id'] == 1
+    assert metrics['circuits'][0]['rtt'] == 0.25
+    assert metrics['rtt']['count'] == 1
+
+
+async def test_get_metrics_prometheus(tunnel_client):
+    """
+    Testing whether the API returns the metrics of the tunnel community in the Prometheus text format
+    """
+    response = await do_request(tunnel_client, 'metrics?format=prometheus', expected_code=200, json_response=False)
+    assert b'tribler_tunnel_circuit_rtt_seconds{circuit_id="1",type="circuit"} 0.25\n' in response
+
+
+async def test_get_metrics_no_community(aiohttp_client):
+    """
+    Testing whether the API returns a 404 if there is no tunnel community, e.g. in GUI test mode
+    """
+    client = await aiohttp_client(TunnelEndpoint(None).app)
+    response_dict = await do_request(client, 'metrics', expected_code=404)
+    assert response_dict['error'] == 'Tunnel community not found'
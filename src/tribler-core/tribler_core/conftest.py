@@ -17,6 +17,7 @@ from tribler_common.simpledefs import DLSTATUS_SEEDING
 from tribler_core.components.libtorrent.download_manager.download import Download
 from tribler_core.components.libtorrent.download_manager.download_config import DownloadConfig
 from tribler_core.components.libtorrent.download_manager.download_manager import DownloadManager
+from tribler_core.components.libtorrent.download_manager.resume_store import ResumeStore
 from tribler_core.components.libtorrent.settings import LibtorrentSettings
 from tribler_core.components.libtorrent.torrentdef import TorrentDef
 from tribler_core.components.metadata_store.db.store import MetadataStore
@@ -87,9 +88,11 @@ def mock_dlmgr(state_dir):
     checkpoints_dir = state_dir / 'dlcheckpoints'
     checkpoints_dir.mkdir()
     dlmgr.get_checkpoint_dir = lambda: checkpoints_dir
+    dlmgr.resume_store = ResumeStore(checkpoints_dir / 'resume.db')
     dlmgr.state_dir = state_dir
     dlmgr.get_downloads = lambda: []
-    return dlmgr
+    yield dlmgr
+    dlmgr.resume_store.close()
 
 
 @pytest.fixture
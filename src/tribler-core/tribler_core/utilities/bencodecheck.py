@@ -91,3 +91,110 @@ class BencodeChecker:
 
 
 default_checker = BencodeChecker()
+
+
+class BencodeStreamChecker:
+    """
+    Checks bencoded data while it is being received, without keeping the data.
+
+    Feed the data to the checker in chunks of any size. The contents of strings are skipped, so checking a torrent
+    takes time proportional to the number of values in it, rather than to its size.
+    """
+
+    DIGITS = b'0123456789'
+
+    def __init__(self):
+        # For every open list 'l', for every open dict 'k' if a key is expected next or 'v' if a value is
+        self.containers = []
+        self.state = self.check_value
+        self.token = b''  # The digits of the current integer or string length
+        self.remaining = 0  # The number of bytes of the current string that were not received yet
+        self.valid = True
+        self.complete = False
+
+    def feed(self, data: bytes) -> bool:
+        """
+        Check the next chunk of data.
+        :return: False if the data that was fed so far is not the start of a valid bencoded string.
+        """
+        pos = 0
+        try:
+            while self.valid and pos < len(data):
+                pos = self.state(data, pos)
+        except ValueError:
+            self.valid = False
+        return self.valid
+
+    def is_bencoded(self) -> bool:
+        return self.valid and self.complete
+
+    def end_value(self):
+        if not self.containers:
+            self.complete = True
+            self.state = self.check_end
+        else:
+            if self.containers[-1] != 'l':
+                self.containers[-1] = 'v' if self.containers[-1] == 'k' else 'k'
+            self.state = self.check_value
+
+    def check_end(self, data: bytes, pos: int) -> int:
+        # Bytes after the end of the bencoded string
+        raise ValueError
+
+    def check_value(self, data: bytes, pos: int) -> int:
+        char = data[pos:pos + 1]
+        container = self.containers[-1] if self.containers else None
+        if char == b'e':
+            if container not in ('l', 'k'):
+                raise ValueError  # No open list or dict, or a dict key without a value
+            self.containers.pop()
+            self.end_value()
+        elif container == 'k' and char not in self.DIGITS:
+            raise ValueError  # Dict keys are strings
+        elif char == b'i':
+            self.token = b''
+            self.state = self.check_int
+        elif char in self.DIGITS:
+            self.token = char
+            self.state = self.check_string_length
+        elif char == b'l':
+            self.containers.append('l')
+        elif char == b'd':
+            self.containers.append('k')
+        else:
+            raise ValueError
+        return pos + 1
+
+    def check_int(self, data: bytes, pos: int) -> int:
+        end = data.find(b'e', pos)
+        self.token += data[pos:] if end == -1 else data[pos:end]
+        digits = self.token[1:] if self.token[:1] == b'-' else self.token
+        if digits and not digits.isdigit():
+            raise ValueError
+        if end == -1:
+            return len(data)
+        if not digits or digits[:1] == b'0' and (len(digits) > 1 or self.token[:1] == b'-'):
+            raise ValueError
+        self.end_value()
+        return end + 1
+
+    def check_string_length(self, data: bytes, pos: int) -> int:
+        colon = data.find(b':', pos)
+        self.token += data[pos:] if colon == -1 else data[pos:colon]
+        if not self.token.isdigit() or self.token[:1] == b'0' and len(self.token) > 1:
+            raise ValueError
+        if colon == -1:
+            return len(data)
+        self.remaining = int(self.token)
+        if self.remaining:
+            self.state = self.check_string
+        else:
+            self.end_value()
+        return colon + 1
+
+    def check_string(self, data: bytes, pos: int) -> int:
+        skip = min(self.remaining, len(data) - pos)
+        self.remaining -= skip
+        if not self.remaining:
+            self.end_value()
+        return pos + skip
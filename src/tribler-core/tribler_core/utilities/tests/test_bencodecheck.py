@@ -1,6 +1,6 @@
 import pytest
 
-from tribler_core.utilities.bencodecheck import is_bencoded
+from tribler_core.utilities.bencodecheck import BencodeStreamChecker, is_bencoded
 
 
 def test_bencode_checker():
@@ -83,3 +83,36 @@ def test_bencode_checker():
     # invalid data
     assert not is_bencoded(b'hello')
     assert not is_bencoded(b'<?=#.')
+
+
+def check_stream(data, chunk_size):
+    checker = BencodeStreamChecker()
+    for i in range(0, len(data), chunk_size):
+        if not checker.feed(data[i:i + chunk_size]):
+            break
+    return checker
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 1000])
+def test_bencode_stream_checker(chunk_size):
+    valid = [b'0:', b'3:abc', b'i0e', b'i-12e', b'le', b'de', b'li1e3:abce', b'd3:abci1e1:xl1:yee',
+             b'd8:announce9:localhost4:infod6:lengthi1234e4:name4:test6:pieces20:aaaaaaaaaaaaaaaaaaaaee']
+    for data in valid:
+        checker = check_stream(data, chunk_size)
+        assert checker.is_bencoded() == is_bencoded(data)
+        assert checker.is_bencoded()
+
+    invalid = [b'3:abc3:abc', b'3:abce', b'03:abc', b'3abc', b'i-0e', b'i03e', b'ie', b'i1ae', b'e', b'd3:abce',
+               b'di1ei2ee', b'<html>', b'12a']
+    for data in invalid:
+        checker = check_stream(data, chunk_size)
+        assert not checker.valid
+        assert not checker.is_bencoded()
+
+
+def test_bencode_stream_checker_truncated():
+    checker = BencodeStreamChecker()
+    assert checker.feed(b'd4:infod6:pieces20:aaaaa')
+    assert not checker.is_bencoded()
+    assert checker.feed(b'aaaaaaaaaaaaaaaee')
+    assert checker.is_bencoded()